@@ -0,0 +1,289 @@
+"""
+Module containing a spatial index of airports, for finding the airports
+nearest a position, or within a distance of it, without asking the DB.
+
+Airports are loaded once, from the DB or an apt.dat file, and held as points
+on a unit sphere in a KD-tree, so that the straight line (chord) distance
+between points orders them the same way as the great circle distance does.
+The index can be saved to disk, and is cached between runs.
+"""
+import os
+import time
+import hashlib
+import numpy as np
+import PlaneReport as pr
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+EARTH_RADIUS = 6371000.0
+
+AIRPORT_CACHE_FILE = os.environ.get("PLANEREPORT_AIRPORT_CACHE",
+                                    os.path.join(os.path.expanduser("~"), ".cache", "planereport",
+                                                 "airports.npz"))
+#
+# How long, in seconds, airports read from the DB are cached for
+#
+AIRPORT_CACHE_AGE = 24 * 3600
+
+AIRPORT_COLS = ["icao", "iata", "name", "city", "country"]
+
+
+def unitVectors(lons, lats):
+    """Converts positions in degrees to an array of x, y, z rows on the unit sphere"""
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+def chordToMetres(chords):
+    """Converts chord lengths on the unit sphere to great circle distances in metres"""
+    return 2.0 * np.arcsin(np.clip(np.asarray(chords) / 2.0, 0.0, 1.0)) * EARTH_RADIUS
+
+
+def metresToChord(distance):
+    """Converts a great circle distance in metres to a chord length on the unit sphere"""
+    return 2.0 * np.sin(min(distance / EARTH_RADIUS, np.pi) / 2.0)
+
+
+def readAptAirports(fp):
+    """
+    Reads the airports in an apt.dat formatted file, as per loadaptdata.py,
+    without their runways. An airport's location is taken as the middle of
+    its first runway.
+
+    Args:
+        fp: file handle of the apt.dat file
+
+    Yields:
+        Airport objects
+    """
+    airport = None
+    for line in fp:
+        rec = line.split()
+        if not rec:
+            continue
+        if rec[0] in ("1", "16", "17") and len(rec) > 4:
+            airport = {"icao": rec[4], "name": " ".join(rec[5:]), "iata": "", "city": "",
+                       "country": "", "altitude": float(rec[1]) * pr.FEET_TO_METRES}
+        elif airport and rec[0] in ("100", "101", "102"):
+            if rec[0] == "100":
+                ends = [float(x) for x in (rec[9], rec[10], rec[18], rec[19])]
+            elif rec[0] == "101":
+                ends = [float(x) for x in (rec[4], rec[5], rec[7], rec[8])]
+            else:
+                ends = None
+                airport["lat"], airport["lon"] = float(rec[2]), float(rec[3])
+            if ends:
+                middle = unitVectors([ends[1], ends[3]], [ends[0], ends[2]]).sum(axis=0)
+                airport["lat"] = np.degrees(np.arctan2(middle[2], np.hypot(middle[0], middle[1])))
+                airport["lon"] = np.degrees(np.arctan2(middle[1], middle[0]))
+            yield pr.Airport(**airport)
+            airport = None
+
+
+class AirportIndex(object):
+    """
+    A spatial index of airports.
+
+    Args:
+        airports: list of Airport objects
+
+    Uses scipy's KD-tree where scipy is installed, otherwise compares a position
+    against every airport, which is still only a fraction of a millisecond.
+    """
+
+    def __init__(self, airports):
+        self.columns = {}
+        for col in AIRPORT_COLS:
+            self.columns[col] = np.array([str(getattr(a, col) or "") for a in airports], dtype=object)
+        self.altitude = np.array([float(a.altitude) for a in airports], dtype=np.float64)
+        self.lon = np.array([float(a.lon) for a in airports], dtype=np.float64)
+        self.lat = np.array([float(a.lat) for a in airports], dtype=np.float64)
+        self._build()
+
+    def _build(self):
+        self.points = unitVectors(self.lon, self.lat) if len(self.lon) else np.zeros((0, 3))
+        self.tree = cKDTree(self.points) if cKDTree is not None and len(self.points) else None
+        self.byIcao = dict((icao, i) for i, icao in enumerate(self.columns["icao"]))
+
+    def __len__(self):
+        return len(self.lon)
+
+    def airport(self, index):
+        """Returns the airport at a position in the index, as an Airport object"""
+        kwargs = dict((col, self.columns[col][index]) for col in AIRPORT_COLS)
+        return pr.Airport(altitude=self.altitude[index], lon=self.lon[index],
+                          lat=self.lat[index], **kwargs)
+
+    def lookup(self, icao):
+        """Returns the Airport with an ICAO code, or None"""
+        index = self.byIcao.get(icao)
+        return None if index is None else self.airport(index)
+
+    def _query(self, points, k):
+        if self.tree is not None:
+            chords, indices = self.tree.query(points, k=k)
+            return chords.reshape(len(points), k), indices.reshape(len(points), k)
+        chords = np.sqrt(np.maximum(2.0 - 2.0 * points.dot(self.points.T), 0.0))
+        indices = np.argsort(chords, axis=1)[:, :k]
+        return np.take_along_axis(chords, indices, axis=1), indices
+
+    def nearest(self, lon, lat, k=1, maxDistance=None):
+        """
+        Finds the airports nearest a position.
+
+        Args:
+            lon, lat: The position
+            k: Number of airports to find (optional)
+            maxDistance: Only airports within this many metres (optional)
+
+        Returns:
+            list of (Airport, distance in metres), nearest first
+        """
+        k = min(k, len(self))
+        if not k:
+            return []
+        chords, indices = self._query(unitVectors([lon], [lat]), k)
+        dists = chordToMetres(chords[0])
+        return [(self.airport(i), dist) for i, dist in zip(indices[0], dists)
+                if maxDistance is None or dist <= maxDistance]
+
+    def nearestBatch(self, lons, lats, maxDistance=None):
+        """
+        Finds the airport nearest each of an array of positions, such as those of
+        a ReportBatch.
+
+        Returns:
+            (numpy array of the ICAO codes, None where there's no airport within
+            maxDistance, numpy array of the distances in metres)
+        """
+        icaos = np.full(len(lons), None, dtype=object)
+        if not len(self) or not len(lons):
+            return icaos, np.full(len(lons), np.inf)
+        chords, indices = self._query(unitVectors(lons, lats), 1)
+        dists = chordToMetres(chords[:, 0])
+        found = np.ones(len(dists), dtype=bool) if maxDistance is None else dists <= maxDistance
+        icaos[found] = self.columns["icao"][indices[found, 0]]
+        return icaos, dists
+
+    def within(self, lon, lat, distance):
+        """
+        Finds the airports within a distance of a position.
+
+        Args:
+            lon, lat: The position
+            distance: in metres
+
+        Returns:
+            list of (Airport, distance in metres), nearest first
+        """
+        if not len(self):
+            return []
+        point = unitVectors([lon], [lat])[0]
+        radius = metresToChord(distance)
+        if self.tree is not None:
+            indices = np.array(self.tree.query_ball_point(point, radius), dtype=np.int64)
+        else:
+            indices = np.nonzero(np.sqrt(((self.points - point) ** 2).sum(axis=1)) <= radius)[0]
+        if not len(indices):
+            return []
+        dists = chordToMetres(np.sqrt(((self.points[indices] - point) ** 2).sum(axis=1)))
+        order = np.argsort(dists, kind="stable")
+        return [(self.airport(indices[i]), dists[i]) for i in order]
+
+    def save(self, filename):
+        """Saves the index to a numpy .npz file, written atomically"""
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmpname = filename + ".%d.tmp" % os.getpid()
+        with open(tmpname, "wb") as fp:
+            np.savez_compressed(fp, altitude=self.altitude, lon=self.lon, lat=self.lat,
+                                **dict((col, self.columns[col].astype(str)) for col in AIRPORT_COLS))
+        os.replace(tmpname, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads an index saved with save()"""
+        index = cls([])
+        with np.load(filename) as npz:
+            for col in AIRPORT_COLS:
+                index.columns[col] = npz[col].astype(object)
+            index.altitude, index.lon, index.lat = npz["altitude"], npz["lon"], npz["lat"]
+        index._build()
+        return index
+
+    @classmethod
+    def fromDB(cls, dbconn, printQuery=None):
+        """Builds an index of all the airports in the DB"""
+        return cls(pr.readAirport(dbconn, '%', printQuery=printQuery, numRecs=1000000) or [])
+
+    @classmethod
+    def fromAptFile(cls, filename):
+        """Builds an index of all the airports in an apt.dat formatted file"""
+        inputfile = pr.openFile(filename)
+        try:
+            return cls(list(readAptAirports(inputfile)))
+        finally:
+            inputfile.close()
+
+
+def airportCacheFile(cacheFile, dbconn=None, aptFile=None):
+    """
+    Returns the pathname the index of a source of airports is cached in, made from
+    cacheFile and a digest of the DB connection's host, port and database, or of the
+    apt.dat file's full path, size and modification time, so that indexes of
+    different sources aren't mixed up.
+    """
+    if aptFile:
+        st = os.stat(aptFile)
+        kind = "apt"
+        source = "%s:%d:%d" % (os.path.realpath(aptFile), st.st_size, int(st.st_mtime))
+    else:
+        kind = "db"
+        params = dbconn.get_dsn_parameters()
+        source = "%s:%s:%s" % (params.get("host"), params.get("port"), params.get("dbname"))
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+    return "%s-%s-%s.npz" % (os.path.splitext(cacheFile)[0], kind, digest)
+
+
+def loadAirportIndex(dbconn=None, aptFile=None, cacheFile=AIRPORT_CACHE_FILE,
+                     maxAge=AIRPORT_CACHE_AGE, debug=False):
+    """
+    Returns an AirportIndex of the airports in an apt.dat file, or the DB,
+    from the cache where it's up to date.
+
+    Args:
+        dbconn: psycopg2 DB connection, to read the airports from (optional)
+        aptFile: apt.dat file to read the airports from, rather than the DB (optional)
+        cacheFile: Where the index is cached, None to not cache it (optional)
+        maxAge: Seconds an index of the airports in the DB is cached for (optional)
+        debug: Print where the index came from (optional)
+
+    An index of an apt.dat file is cached until the file changes. Each DB and
+    apt.dat file has its own cache, named by airportCacheFile.
+    """
+    if cacheFile:
+        cacheFile = airportCacheFile(cacheFile, dbconn=dbconn, aptFile=aptFile)
+        try:
+            fresh = aptFile or time.time() - os.stat(cacheFile).st_mtime < maxAge
+            if fresh:
+                index = AirportIndex.load(cacheFile)
+                if debug:
+                    print("Read", len(index), "airports from", cacheFile)
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+    t1 = time.time()
+    if aptFile:
+        index = AirportIndex.fromAptFile(aptFile)
+    else:
+        index = AirportIndex.fromDB(dbconn, printQuery=debug)
+    if debug:
+        print("Read", len(index), "airports from", aptFile if aptFile else "the DB",
+              "in", time.time() - t1, "seconds")
+    if cacheFile:
+        index.save(cacheFile)
+    return index
@@ -0,0 +1,505 @@
+"""
+Module for reading airports & runways from X-Plane apt.dat formatted files.
+
+A full apt.dat holds tens of thousands of airports, so rather than reading
+through it to find one, an index of where each airport's record starts is
+built once (and cached), after which an airport is read with a single seek.
+Runway outlines are worked out for many runways at a time with pyproj's
+vectorised geodesic calculations, falling back to geographiclib a runway at
+a time where pyproj isn't installed, and cached on disk by the contents of
+the runway row, so reloading a file only works out the runways that changed.
+"""
+import os
+import re
+import io
+import json
+import mmap
+import bisect
+import hashlib
+import numpy as np
+import PlaneReport as pr
+from geographiclib.geodesic import Geodesic
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+APT_CACHE_DIR = os.environ.get("PLANEREPORT_APT_CACHE",
+                               os.path.join(os.path.expanduser("~"), ".cache", "planereport", "apt"))
+APT_INDEX_VERSION = 1
+RUNWAY_CACHE_FILE = os.path.join(APT_CACHE_DIR, "runways.npz")
+#
+# Bump this if runwayGeometry changes what it works out, to invalidate the cache
+#
+RUNWAY_GEOMETRY_VERSION = 1
+
+AIRPORT_ROWS = ("1", "16", "17")
+RUNWAY_ROWS = ("100", "101", "102")
+
+#
+# The start of an airport record - land, sea or heliport - capturing its ICAO code
+#
+AIRPORT_HEADER = re.compile(rb"^(?:1|16|17)[ \t]+\S+[ \t]+\S+[ \t]+\S+[ \t]+(\S+)", re.M)
+
+AIRPORT_OR_RUNWAY = re.compile(r"^(1|16|17|100|101|102)[ \t][^\r\n]*", re.M)
+
+#
+# Lengths of the airport table's columns
+#
+ICAO_LEN = 4
+NAME_LEN = 50
+
+
+def openAptData(filename):
+    """
+    Returns the contents of an apt.dat file as a bytes-like object - the file
+    mapped into memory, or, for compressed files, decompressed into memory.
+    """
+    with open(filename, "rb") as fp:
+        if pr.compressionType(fp.read(8)):
+            inputfile = pr.openFile(filename)
+            try:
+                return inputfile.read().encode("latin-1")
+            finally:
+                inputfile.close()
+        if os.fstat(fp.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class AptIndex(object):
+    """
+    An index of where each airport's record starts in an apt.dat file.
+
+    Args:
+        filename: Pathname of the apt.dat file
+        cacheDir: Where the index is cached between runs, None to not cache it (optional)
+        debug: Print where the index came from (optional)
+
+    The cached index is rebuilt whenever the file changes size or modification time.
+    """
+
+    def __init__(self, filename, cacheDir=APT_CACHE_DIR, debug=False):
+        self.filename = filename
+        self.data = openAptData(filename)
+        st = os.stat(filename)
+        self.key = {"filename": os.path.realpath(filename), "size": st.st_size,
+                    "mtime": st.st_mtime, "version": APT_INDEX_VERSION}
+        self.cacheFile = None
+        if cacheDir:
+            digest = hashlib.sha1(json.dumps(self.key, sort_keys=True).encode()).hexdigest()
+            self.cacheFile = os.path.join(cacheDir, "index-" + digest + ".json")
+        if not self.load():
+            self.build()
+            if debug:
+                print("Indexed", len(self.icaos), "airports in", filename)
+            if self.cacheFile:
+                self.save()
+        elif debug:
+            print("Read index of", len(self.icaos), "airports from", self.cacheFile)
+        self.byIcao = {}
+        for icao, offset in zip(self.icaos, self.offsets):
+            self.byIcao.setdefault(icao, offset)
+
+    def build(self):
+        self.offsets = []
+        self.icaos = []
+        for match in AIRPORT_HEADER.finditer(self.data):
+            self.offsets.append(match.start())
+            self.icaos.append(match.group(1).decode("latin-1"))
+
+    def load(self):
+        if not self.cacheFile:
+            return False
+        try:
+            with open(self.cacheFile) as fp:
+                index = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if index.get("key") != self.key:
+            return False
+        self.offsets = index["offsets"]
+        self.icaos = index["icaos"]
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+        tmpname = self.cacheFile + ".%d.tmp" % os.getpid()
+        with open(tmpname, "w") as fp:
+            json.dump({"key": self.key, "offsets": self.offsets, "icaos": self.icaos}, fp)
+        os.replace(tmpname, self.cacheFile)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def recordEnd(self, offset):
+        """Returns where the airport record starting at offset ends"""
+        i = bisect.bisect_right(self.offsets, offset)
+        return self.offsets[i] if i < len(self.offsets) else len(self.data)
+
+    def airportLines(self, icao):
+        """Returns the lines of an airport's record, or None if it isn't in the file"""
+        offset = self.byIcao.get(icao)
+        if offset is None:
+            return None
+        return self.data[offset:self.recordEnd(offset)].decode("latin-1").splitlines()
+
+    def chunks(self, numChunks):
+        """Splits the file into (start, end) byte ranges of whole airport records"""
+        if not self.offsets:
+            return []
+        step = max(1, -(-len(self.offsets) // numChunks))
+        starts = self.offsets[::step]
+        return list(zip(starts, starts[1:] + [len(self.data)]))
+
+
+def runwayEnds(rec):
+    """
+    Reads the ends of a runway from an apt.dat runway row, split into fields.
+    Helipads are given as their centre, heading & length instead.
+
+    Returns:
+        dict of name, width and lat1, lon1, lat2, lon2 or lat, lon, heading, length
+    """
+    if rec[0] == "100":
+        return {"name": " ".join([rec[8], rec[17]]), "width": float(rec[1]),
+                "lat1": float(rec[9]), "lon1": float(rec[10]),
+                "lat2": float(rec[18]), "lon2": float(rec[19])}
+    if rec[0] == "101":
+        return {"name": " ".join([rec[3], rec[6]]), "width": float(rec[1]),
+                "lat1": float(rec[4]), "lon1": float(rec[5]),
+                "lat2": float(rec[7]), "lon2": float(rec[8])}
+    return {"name": rec[1], "width": float(rec[6]), "lat": float(rec[2]), "lon": float(rec[3]),
+            "heading": float(rec[4]), "length": float(rec[5])}
+
+
+def geodesicInverse(lat1, lon1, lat2, lon2):
+    """Returns arrays of (initial bearing, distance) between arrays of points"""
+    if pyproj is not None:
+        az12, az21, dist = pyproj.Geod(ellps="WGS84").inv(lon1, lat1, lon2, lat2)
+        return np.asarray(az12), np.asarray(dist)
+    results = [Geodesic.WGS84.Inverse(*point) for point in zip(lat1, lon1, lat2, lon2)]
+    return (np.array([g["azi1"] for g in results]), np.array([g["s12"] for g in results]))
+
+
+def geodesicDirect(lat, lon, bearing, dist):
+    """Returns arrays of (lat, lon) of the points reached from arrays of starting points"""
+    if pyproj is not None:
+        lon2, lat2, az21 = pyproj.Geod(ellps="WGS84").fwd(lon, lat, bearing, dist)
+        return np.asarray(lat2), np.asarray(lon2)
+    results = [Geodesic.WGS84.Direct(*point) for point in zip(lat, lon, bearing, dist)]
+    return (np.array([g["lat2"] for g in results]), np.array([g["lon2"] for g in results]))
+
+
+def runwayGeometry(rows):
+    """
+    Works out the outline, middle and heading of runways, all at once.
+
+    Args:
+        rows: list of apt.dat runway rows (100, 101 or 102), as strings
+
+    Returns:
+        list of dicts, one per row, of name, poly (a list of four (lat, lon)
+        corners), lat, lon and heading, as loadaptdata.py has always made them
+    """
+    ends = [runwayEnds(row.split()) for row in rows]
+    if not ends:
+        return []
+    num = len(ends)
+    helipad = np.array(["heading" in end for end in ends])
+    width = np.array([end["width"] for end in ends])
+    lat1, lon1, lat2, lon2 = [np.array([end.get(col, 0.0) for end in ends])
+                              for col in ["lat1", "lon1", "lat2", "lon2"]]
+    #
+    # A helipad is drawn as a runway through its centre, along its heading
+    #
+    if helipad.any():
+        lat, lon, heading, length = [np.array([ends[i][col] for i in np.nonzero(helipad)[0]])
+                                     for col in ["lat", "lon", "heading", "length"]]
+        lat1[helipad], lon1[helipad] = geodesicDirect(lat, lon, heading, length / 2.0)
+        lat2[helipad], lon2[helipad] = geodesicDirect(lat, lon, (heading - 180.0) % 360.0, length / 2.0)
+    bearing, dist = geodesicInverse(lat1, lon1, lat2, lon2)
+    left = (bearing + 90.0) % 360.0
+    right = (bearing - 90.0) % 360.0
+    half = width / 2.0
+    corners = [geodesicDirect(lat1, lon1, left, half), geodesicDirect(lat1, lon1, right, half),
+               geodesicDirect(lat2, lon2, right, half), geodesicDirect(lat2, lon2, left, half)]
+    midlat, midlon = geodesicDirect(lat1, lon1, bearing, dist / 2.0)
+    runways = []
+    for i in range(num):
+        end = ends[i]
+        runway = {"name": end["name"].rstrip(),
+                  "poly": [(float(clat[i]), float(clon[i])) for clat, clon in corners]}
+        if helipad[i]:
+            runway["lat"], runway["lon"], runway["heading"] = end["lat"], end["lon"], end["heading"]
+        else:
+            runway["lat"], runway["lon"] = float(midlat[i]), float(midlon[i])
+            runway["heading"] = float(bearing[i])
+        runways.append(runway)
+    return runways
+
+
+class RunwayCache(object):
+    """
+    An on-disk cache of runway geometry, keyed by a hash of the runway's apt.dat row
+    (with its whitespace normalised), so an unchanged runway is never worked out twice.
+
+    Args:
+        cacheFile: numpy .npz file the cache is kept in (optional)
+
+    The file holds the sorted hashes, and an array of the corners, middle and
+    heading of each runway, so runways are looked up all at once with a binary
+    search. Only save() writes the file, so worker processes hand the entries
+    they add back to be saved by one process.
+    """
+
+    def __init__(self, cacheFile=RUNWAY_CACHE_FILE):
+        self.cacheFile = cacheFile
+        self.keys = None
+        self.values = None
+        self.unsaved = {}
+        self.added = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _read(self):
+        try:
+            with np.load(self.cacheFile) as npz:
+                return npz["keys"], npz["values"]
+        except (OSError, ValueError, KeyError):
+            return np.zeros(0, dtype="S20"), np.zeros((0, 11))
+
+    @staticmethod
+    def key(fields):
+        text = "%d %s" % (RUNWAY_GEOMETRY_VERSION, " ".join(fields))
+        return hashlib.sha1(text.encode("latin-1")).digest()
+
+    def geometry(self, rows):
+        """
+        Returns the geometry of runways, as per runwayGeometry, from the cache
+        where it's there, working out the rest all at once.
+        """
+        if self.keys is None:
+            self.keys, self.values = self._read()
+        fields = [row.split() for row in rows]
+        keys = np.array([self.key(f) for f in fields], dtype="S20")
+        values = np.zeros((len(rows), 11))
+        found = np.zeros(len(rows), dtype=bool)
+        if len(self.keys) and len(rows):
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = self.keys[pos] == keys
+            values[found] = self.values[pos[found]]
+        for i in np.nonzero(~found)[0]:
+            entry = self.unsaved.get(keys[i])
+            if entry is not None:
+                values[i] = entry
+                found[i] = True
+        missing = np.nonzero(~found)[0]
+        self.hits += len(rows) - len(missing)
+        self.misses += len(missing)
+        if len(missing):
+            computed = runwayGeometry([rows[i] for i in missing])
+            entries = {}
+            for i, runway in zip(missing, computed):
+                values[i] = [x for point in runway["poly"] for x in point] + \
+                    [runway["lat"], runway["lon"], runway["heading"]]
+                entries[keys[i]] = values[i].tolist()
+            self.update(entries)
+        runways = []
+        for f, value in zip(fields, values.tolist()):
+            runways.append({"name": runwayEnds(f)["name"].rstrip(),
+                            "poly": list(zip(value[0:8:2], value[1:8:2])),
+                            "lat": value[8], "lon": value[9], "heading": value[10]})
+        return runways
+
+    def update(self, entries):
+        """Adds entries (by key), such as those added by a worker process's cache"""
+        self.unsaved.update(entries)
+        self.added.update(entries)
+
+    def takeAdded(self):
+        """Returns, and forgets, the entries added since the last call"""
+        added, self.added = self.added, {}
+        return added
+
+    def hitRate(self):
+        total = self.hits + self.misses
+        return 100.0 * self.hits / total if total else 0.0
+
+    def save(self):
+        """Merges the new entries into the cache file (as it is now), written atomically"""
+        if not self.unsaved:
+            return
+        keys, values = self._read()
+        new_keys = np.array(list(self.unsaved.keys()), dtype="S20")
+        new_values = np.array(list(self.unsaved.values()), dtype=np.float64)
+        keys, first = np.unique(np.concatenate((new_keys, keys)), return_index=True)
+        values = np.concatenate((new_values, values))[first]
+        dirname = os.path.dirname(self.cacheFile)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmpname = self.cacheFile + ".%d.tmp" % os.getpid()
+        with open(tmpname, "wb") as fp:
+            np.savez(fp, keys=keys, values=values)
+        os.replace(tmpname, self.cacheFile)
+        self.keys, self.values = keys, values
+        self.unsaved = {}
+
+
+#
+# One cache per worker process, so the cache file is read once however many
+# chunks the process is given.
+#
+_runwayCaches = {}
+
+
+def getRunwayCache(cacheFile=RUNWAY_CACHE_FILE):
+    if cacheFile not in _runwayCaches:
+        _runwayCaches[cacheFile] = RunwayCache(cacheFile)
+    return _runwayCaches[cacheFile]
+
+
+def splitRecord(lines):
+    """
+    Splits the lines of an airport record into its header, split into fields,
+    and its runway rows.
+    """
+    header = lines[0].split()
+    rows = [line for line in lines[1:] if line.split()[:1] and line.split()[0] in RUNWAY_ROWS]
+    return header, rows
+
+
+def airportFromHeader(header):
+    return {"icao": str(header[4]), "name": " ".join(map(str, header[5:])),
+            "altitude": float(header[1]) * pr.FEET_TO_METRES, "city": "", "country": "", "iata": ""}
+
+
+def buildAirports(records, cache=None):
+    """
+    Builds the airports and runways of a list of airport records, working out
+    the runway outlines for all of them at once.
+
+    Args:
+        records: list of airport records, each a list of lines
+        cache: RunwayCache to take runway geometry from (optional)
+
+    Returns:
+        (list of airport dicts, list of runway dicts, list of the ICAO codes of
+        airports skipped for having no runways). An airport is located at the
+        middle of its first runway.
+    """
+    split = [splitRecord(lines) for lines in records]
+    rows = [row for header, airport_rows in split for row in airport_rows]
+    geometry = cache.geometry(rows) if cache is not None else runwayGeometry(rows)
+    airports, runways, skipped = [], [], []
+    pos = 0
+    for header, rows in split:
+        airport = airportFromHeader(header)
+        airport_runways = geometry[pos:pos + len(rows)]
+        pos += len(rows)
+        if not airport_runways:
+            skipped.append(airport["icao"])
+            continue
+        airport["lat"] = airport_runways[0]["lat"]
+        airport["lon"] = airport_runways[0]["lon"]
+        for runway in airport_runways:
+            runway["airport"] = airport["icao"]
+        airports.append(airport)
+        runways.extend(airport_runways)
+    return airports, runways, skipped
+
+
+def recordsIn(text):
+    """
+    Splits apt.dat text into airport records, keeping only the header and runway
+    rows, which are picked out with a regular expression rather than looking at
+    every line (most of a record is taxiways, signs and lights).
+    """
+    records = []
+    for match in AIRPORT_OR_RUNWAY.finditer(text):
+        line = match.group(0)
+        if match.group(1) in AIRPORT_ROWS:
+            if len(line.split()) > 4:
+                records.append([line])
+        elif records:
+            records[-1].append(line)
+    return records
+
+
+def parseChunk(chunk):
+    """
+    Worker function - reads the airports in a byte range of an apt.dat file.
+
+    Args:
+        chunk: (filename, start, end, cacheFile), start & end lying on airport
+               record boundaries, cacheFile that of the runway cache, or None
+
+    Returns:
+        as per buildAirports, plus a dict of the runway cache's hits, misses
+        and the entries added to it, for the parent process to save
+    """
+    filename, start, end, cacheFile = chunk
+    data = openAptData(filename)
+    cache = getRunwayCache(cacheFile) if cacheFile else None
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    airports, runways, skipped = buildAirports(recordsIn(data[start:end].decode("latin-1")), cache=cache)
+    stats = {"hits": 0, "misses": 0, "added": {}}
+    if cache:
+        stats = {"hits": cache.hits - hits, "misses": cache.misses - misses, "added": cache.takeAdded()}
+    return airports, runways, skipped, stats
+
+
+def copyAirports(dbconn, airports, runways, update=False, printQuery=False):
+    """
+    Bulk loads airports and runways into the DB with COPY. The caller commits,
+    so the whole load can be one transaction.
+
+    Args:
+        dbconn: psycopg2 DB connection
+        airports, runways: lists of dicts, as returned by buildAirports
+        update: Delete the existing entries for the airports first (optional)
+        printQuery: Print the SQL (optional)
+
+    Returns:
+        list of the ICAO codes of airports skipped for not fitting the airport table
+    """
+    skipped = sorted(set(a["icao"] for a in airports if len(a["icao"]) > ICAO_LEN))
+    if skipped:
+        airports = [a for a in airports if len(a["icao"]) <= ICAO_LEN]
+        runways = [r for r in runways if len(r["airport"]) <= ICAO_LEN]
+    cur = dbconn.cursor()
+    if update:
+        icaos = [a["icao"] for a in airports]
+        for sql in ["DELETE FROM runways WHERE airport = ANY(%s::bpchar[])",
+                    "DELETE FROM airport WHERE icao = ANY(%s::bpchar[])"]:
+            if printQuery:
+                print(cur.mogrify(sql, [icaos]))
+            cur.execute(sql, [icaos])
+
+    data = io.StringIO("".join(
+        "\t".join([pr.copyEscape(a["icao"]), pr.copyEscape(a["iata"]), pr.copyEscape(a["name"][:NAME_LEN]),
+                   pr.copyEscape(a["city"]), pr.copyEscape(a["country"]), str(int(round(a["altitude"]))),
+                   "SRID=4326;POINT(%r %r)" % (a["lon"], a["lat"])]) + "\n"
+        for a in airports))
+    sql = "COPY airport (icao, iata, name, city, country, altitude, location) FROM STDIN"
+    if printQuery:
+        print(sql)
+    cur.copy_expert(sql, data)
+
+    def polygon(points):
+        #
+        # WKT wants lon/lat (x/y) pairs, and the ring closed
+        #
+        points = list(points) + [points[0]]
+        return "SRID=4326;POLYGON((" + ", ".join("%r %r" % (lon, lat) for lat, lon in points) + "))"
+
+    data = io.StringIO("".join(
+        "\t".join([pr.copyEscape(r["airport"]), pr.copyEscape(r["name"]), repr(float(r["heading"])),
+                   "SRID=4326;POINT(%r %r)" % (r["lon"], r["lat"]), polygon(r["poly"])]) + "\n"
+        for r in runways))
+    sql = "COPY runways (airport, name, heading, location, runway_area) FROM STDIN"
+    if printQuery:
+        print(sql)
+    cur.copy_expert(sql, data)
+    cur.close()
+    return skipped
@@ -0,0 +1,172 @@
+"""
+Module containing an accumulator for the reception coverage of a Reporter -
+the furthest a plane has been seen in each direction, for bands of altitude,
+and a grid of how many reports came from each part of the sky.
+
+Coverage is built up a batch of reports at a time, and accumulators for
+different stretches of time (read in separate processes, say) can be merged,
+or saved to disk and merged later.
+"""
+import json
+import numpy as np
+from matplotlib.colors import LogNorm
+
+#
+# Altitude bands, in metres - the last band takes everything above
+#
+ALTITUDE_BANDS = [0, 3000, 6000, 9000, 12000]
+
+#
+# Positions further than this, in metres, from the reporter are taken
+# to be bad position reports, rather than remarkable reception.
+#
+MAX_RANGE = 600000.0
+
+
+class Coverage(object):
+    """
+    Reception coverage of a Reporter.
+
+    Args:
+        lon, lat: Location of the reporter
+        bearingBins: Number of bins the compass is divided into (optional)
+        altitudeBands: List of the altitudes, in metres, the bands start at (optional)
+        maxRange: Reports further away than this, in metres, are ignored (optional)
+        cellSize: Size in metres of the cells of the heatmap, which covers maxRange
+                  each way from the reporter (optional)
+    """
+
+    def __init__(self, lon, lat, bearingBins=360, altitudeBands=ALTITUDE_BANDS,
+                 maxRange=MAX_RANGE, cellSize=5000.0):
+        self.lon = float(lon)
+        self.lat = float(lat)
+        self.bearingBins = int(bearingBins)
+        self.altitudeBands = [float(alt) for alt in altitudeBands]
+        self.maxRange = float(maxRange)
+        self.cellSize = float(cellSize)
+        self.cells = 2 * int(np.ceil(self.maxRange / self.cellSize))
+        self.ranges = np.zeros((len(self.altitudeBands), self.bearingBins))
+        self.counts = np.zeros((len(self.altitudeBands), self.bearingBins), dtype=np.int64)
+        self.grid = np.zeros((self.cells, self.cells), dtype=np.int64)
+        self.firstTime = None
+        self.lastTime = None
+
+    def params(self):
+        """The parameters that have to match for two accumulators to be merged"""
+        return {"lon": self.lon, "lat": self.lat, "bearingBins": self.bearingBins,
+                "altitudeBands": self.altitudeBands, "maxRange": self.maxRange,
+                "cellSize": self.cellSize}
+
+    def add(self, batch):
+        """
+        Adds a ReportBatch of reports to the coverage.
+
+        Returns:
+            The number of reports used - those with a position within maxRange
+        """
+        dists = batch.distances(self.lon, self.lat)
+        used = (dists <= self.maxRange) & ~((batch.lon == 0.0) & (batch.lat == 0.0))
+        if not used.any():
+            return 0
+        dists = dists[used]
+        bearings = batch.bearings(self.lon, self.lat)[used]
+        bands = np.searchsorted(self.altitudeBands, batch.altitude[used], side='right') - 1
+        bands = np.clip(bands, 0, len(self.altitudeBands) - 1)
+        bins = (bearings * self.bearingBins / 360.0).astype(np.int64) % self.bearingBins
+        np.maximum.at(self.ranges, (bands, bins), dists)
+        self.counts += np.bincount(bands * self.bearingBins + bins,
+                                   minlength=self.counts.size).reshape(self.counts.shape)
+        #
+        # The heatmap is laid out in metres east & north of the reporter
+        #
+        rads = np.radians(bearings)
+        ix = np.floor(dists * np.sin(rads) / self.cellSize).astype(np.int64) + self.cells // 2
+        iy = np.floor(dists * np.cos(rads) / self.cellSize).astype(np.int64) + self.cells // 2
+        inside = (ix >= 0) & (ix < self.cells) & (iy >= 0) & (iy < self.cells)
+        self.grid += np.bincount(iy[inside] * self.cells + ix[inside],
+                                 minlength=self.grid.size).reshape(self.grid.shape)
+        times = batch.time[used]
+        self.firstTime = times.min() if self.firstTime is None else min(self.firstTime, times.min())
+        self.lastTime = times.max() if self.lastTime is None else max(self.lastTime, times.max())
+        return len(dists)
+
+    def merge(self, other):
+        """Adds the coverage of another accumulator, with the same parameters, to this one"""
+        if self.params() != other.params():
+            raise ValueError("Can't merge coverage with different parameters")
+        self.ranges = np.maximum(self.ranges, other.ranges)
+        self.counts += other.counts
+        self.grid += other.grid
+        for time in [other.firstTime, other.lastTime]:
+            if time is not None:
+                self.firstTime = time if self.firstTime is None else min(self.firstTime, time)
+                self.lastTime = time if self.lastTime is None else max(self.lastTime, time)
+        return self
+
+    def save(self, filename):
+        """Saves the accumulator to a numpy .npz file"""
+        with open(filename, "wb") as fp:
+            np.savez_compressed(fp, params=json.dumps(self.params()), ranges=self.ranges,
+                                counts=self.counts, grid=self.grid,
+                                times=np.array([np.nan if t is None else t
+                                                for t in [self.firstTime, self.lastTime]]))
+
+    @classmethod
+    def load(cls, filename):
+        """Reads an accumulator saved with save()"""
+        with np.load(filename) as npz:
+            coverage = cls(**json.loads(str(npz["params"])))
+            coverage.ranges = npz["ranges"]
+            coverage.counts = npz["counts"]
+            coverage.grid = npz["grid"]
+            first, last = npz["times"]
+        if not np.isnan(first):
+            coverage.firstTime, coverage.lastTime = float(first), float(last)
+        return coverage
+
+    def bandNames(self):
+        """Returns a label for each altitude band"""
+        names = []
+        for i, alt in enumerate(self.altitudeBands):
+            if i + 1 < len(self.altitudeBands):
+                names.append("%d-%dm" % (alt, self.altitudeBands[i + 1]))
+            else:
+                names.append("%dm+" % alt)
+        return names
+
+    def plotPolar(self, ax):
+        """
+        Draws the furthest reception in each direction, one line per altitude band,
+        on matplotlib polar axes.
+        """
+        ax.set_theta_zero_location('N')
+        ax.set_theta_direction(-1)
+        angles = np.radians((np.arange(self.bearingBins + 1) + 0.5) * 360.0 / self.bearingBins)
+        for ranges, name in zip(self.ranges, self.bandNames()):
+            if not ranges.any():
+                continue
+            #
+            # Directions nothing has been seen in are left as gaps
+            #
+            ranges = np.where(ranges > 0, ranges, np.nan)
+            ranges = np.append(ranges, ranges[0]) / 1000.0
+            ax.plot(angles, ranges, label=name, linewidth=1)
+        ax.set_rlabel_position(90)
+        ax.legend(loc='lower left', bbox_to_anchor=(-0.1, -0.1), fontsize='small')
+
+    def plotHeatmap(self, ax, cmap='YlOrRd'):
+        """
+        Draws the number of reports from each cell of the heatmap, on a log
+        scale, on matplotlib axes in km from the reporter.
+
+        Returns:
+            The image drawn, for adding a colour bar to
+        """
+        half = self.cells * self.cellSize / 2000.0
+        image = ax.imshow(np.ma.masked_equal(self.grid, 0), origin='lower', interpolation='nearest',
+                          cmap=cmap, norm=LogNorm(vmin=1, vmax=max(1, self.grid.max())),
+                          extent=(-half, half, -half, half))
+        ax.plot([0], [0], 'k+')
+        ax.set_xlabel("km East")
+        ax.set_ylabel("km North")
+        return image
@@ -0,0 +1,377 @@
+"""
+Module for detecting events at airports - takeoffs and landings - from a stream
+of reports as they arrive, rather than by querying the DB after the fact, as
+planeairport.py does.
+
+Each plane on a runway (inside the runway's outline, and below the committed
+height above the airport) has a small amount of state kept about its visit.
+Once it has left the runway for a few seconds, or not been heard from for a
+while, the visit is over, and is judged with the same rules as planeairport.py.
+"""
+import time
+import collections
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+import PlaneReport as pr
+import PlaneAirports as pa
+import PlaneAptDat as pad
+import PlaneRunways as prw
+
+#
+# How close, in degrees, a plane's track has to be to the runway's heading
+# for it to be using the runway, rather than crossing it
+#
+BEARING_SLOP = 4
+#
+# How far below the airport, in metres, a plane's altitude may be
+# (altimeters, and the official heights of airports, differ)
+#
+BELOW_AIRPORT = 150
+#
+# A visit is over once the plane has been off the runway this many seconds,
+# or not been heard from for STATE_TTL seconds
+#
+EXIT_GRACE = 15
+STATE_TTL = 60
+
+EVENT_NAMES = {"l": "landed at", "t": "took off at", "b": "bump & go at", "d": "dunno what to call this"}
+
+#
+# The parts of a report a visit needs - has the same names as PlaneReport's attributes,
+# so the same rules can be used on either
+#
+VisitReport = collections.namedtuple("VisitReport", ["time", "altitude", "track", "isGnd", "flight", "hex"])
+
+
+#
+# check to see if a given bearing is within a couple of degrees of another
+#
+def checkbearing(heading1, heading2, slop):
+    if heading1 == heading2:
+        return True
+    lowercheck = False
+    uppercheck = False
+
+    lowerbound = heading1 - slop
+    if lowerbound < 0:
+        if heading2 >= 0 or heading2 >= (lowerbound + 360):
+            lowercheck = True
+    else:
+        if heading2 >= lowerbound:
+            lowercheck = True
+
+    upperbound = heading1 + slop
+    if upperbound >= 360:
+        if heading2 <= (upperbound - 360):
+            uppercheck = True
+    else:
+        if heading2 <= upperbound:
+            uppercheck = True
+
+    return uppercheck and lowercheck
+
+
+def classifyEvent(eventlist, runway):
+    """
+    Works out whether a plane's visit to a runway was a takeoff or landing.
+
+    Args:
+        eventlist: A list of planereports (or VisitReports) on the runway, ordered by time
+        runway: The Runway
+
+    Returns:
+        A description of the event, as per EVENT_NAMES, or None if the plane
+        was crossing the runway, rather than using it
+    """
+    firstplane = eventlist[0]
+    lastplane = eventlist[-1]
+    middleplane = eventlist[int(len(eventlist) / 2)]
+    #
+    # Are we actually using this runway, or are we crossing it?
+    # Use runway heading and middleplane heading to find out.
+    #
+    otherheading = runway.heading - 180
+    if otherheading < 0:
+        otherheading += 360
+    if not checkbearing(middleplane.track, runway.heading, BEARING_SLOP) and \
+            not checkbearing(middleplane.track, otherheading, BEARING_SLOP):
+        return None
+    touchedgnd = False
+    for plane in eventlist:
+        if plane.isGnd:
+            touchedgnd = True
+    if firstplane.altitude >= lastplane.altitude:
+        return EVENT_NAMES["l"]
+    elif firstplane.altitude < lastplane.altitude:
+        if touchedgnd:
+            return EVENT_NAMES["b"]
+        return EVENT_NAMES["t"]
+    return EVENT_NAMES["d"]
+
+
+def printEvent(airport_event, printJSON=False):
+    """Prints an AirportDailyEvents, as planeairport.py always has"""
+    if printJSON:
+        print(airport_event.to_JSON())
+    else:
+        event = [name for name in EVENT_NAMES.values() if name[0] == airport_event.type_of_event][0]
+        print("Plane", airport_event.hex, "as flight", airport_event.flight, event,
+              time.strftime("%F %H:%M:%S", time.localtime(airport_event.event_time)),
+              "on runway", airport_event.runway)
+
+
+class RunwaySet(object):
+    """
+    The runways of a set of airports, for finding which runway (if any) reports are on.
+
+    Args:
+        airports: list of Airport objects
+        runways: list of Runway objects, with their runway_points
+    """
+
+    def __init__(self, airports, runways):
+        self.airports = dict((airport.icao, airport) for airport in airports)
+        self.tester = prw.RunwayHitTester([runway for runway in runways if runway.airport in self.airports])
+        self.altitudes = np.array([float(self.airports[runway.airport].altitude)
+                                   for runway in self.tester.runways])
+        self.positions = dict((id(runway), i) for i, runway in enumerate(self.tester.runways))
+
+    def __len__(self):
+        return len(self.tester)
+
+    def locate(self, batch, committedHeight=200):
+        """
+        Finds the runway each report of a ReportBatch is on - inside its outline,
+        and no more than committedHeight metres above the airport.
+
+        Returns:
+            numpy array of Runways, None where a report isn't on one
+        """
+        points, runways = self.tester.pairs(batch.lat, batch.lon)
+        altitudes = batch.altitude[points]
+        low = self.altitudes[runways] - BELOW_AIRPORT
+        keep = (altitudes >= low) & (altitudes <= self.altitudes[runways] + committedHeight)
+        points, runways = points[keep], runways[keep]
+        found = np.full(len(batch), None, dtype=object)
+        #
+        # Where runways cross, the first of them is taken
+        #
+        leading = np.ones(len(points), dtype=bool)
+        leading[1:] = points[1:] != points[:-1]
+        for point, runway in zip(points[leading], runways[leading]):
+            found[point] = self.tester.runways[runway]
+        return found
+
+    def onRunway(self, lat, lon, runway):
+        """Tests whether a position is inside the outline of one of the runways"""
+        return bool(self.tester.contains([lat], [lon], [self.positions[id(runway)]])[0])
+
+    @classmethod
+    def fromDB(cls, dbconn, airportCodes, printQuery=None):
+        """Reads the airports, and their runways, from the DB"""
+        airports, runways = [], []
+        for icao in airportCodes:
+            airports.extend(pr.readAirport(dbconn, icao, printQuery=printQuery) or [])
+        for airport_runways in pr.readRunwaysRegion(dbconn, airportCodes, printQuery=printQuery).values():
+            runways.extend(airport_runways)
+        return cls(airports, runways)
+
+    @classmethod
+    def fromAptFile(cls, filename, airportCodes):
+        """Reads the airports, and their runways, from an apt.dat formatted file"""
+        index = pad.AptIndex(filename)
+        records = [index.airportLines(icao) for icao in airportCodes]
+        airports, runways, skipped = pad.buildAirports([lines for lines in records if lines])
+        return cls([pr.Airport(**airport) for airport in airports],
+                   [pr.Runway(airport=runway["airport"], name=runway["name"], heading=runway["heading"],
+                              lat=runway["lat"], lon=runway["lon"], runway_points=runway["poly"])
+                    for runway in runways])
+
+
+class Visit(object):
+    """A plane's visit to a runway"""
+
+    def __init__(self, runway):
+        self.runway = runway
+        self.reports = []
+        self.lastSeen = 0
+        self.outsideSince = None
+
+
+class EventDetector(object):
+    """
+    Detects takeoffs and landings from batches of reports, in time order.
+
+    Args:
+        runwaySet: RunwaySet of the runways to watch
+        committedHeight: Height above the airport, in metres, below which a plane
+                         is taken to be interested in it (optional)
+        exitGrace: Seconds a plane has to be off the runway for its visit to be over (optional)
+        ttl: Seconds without a report after which a plane is forgotten, and
+             its visit over (optional)
+
+    Time is taken from the reports, rather than the clock, so archived reports
+    can be replayed through a detector just as live ones are.
+    """
+
+    def __init__(self, runwaySet, committedHeight=200, exitGrace=EXIT_GRACE, ttl=STATE_TTL):
+        self.runwaySet = runwaySet
+        self.committedHeight = committedHeight
+        self.exitGrace = exitGrace
+        self.ttl = ttl
+        self.visits = {}
+        self.now = 0
+        self.numReports = 0
+
+    def addBatch(self, batch):
+        """
+        Adds a ReportBatch of reports.
+
+        Returns:
+            list of AirportDailyEvents for the visits that are over
+        """
+        events = []
+        if not len(batch):
+            return events
+        batch = batch.sortByTime()
+        self.numReports += len(batch)
+        runways = self.runwaySet.locate(batch, self.committedHeight)
+        #
+        # Only reports on a runway, or of planes that were, need looking at
+        #
+        interesting = np.not_equal(runways, None)
+        if self.visits:
+            interesting |= np.fromiter((h in self.visits for h in batch.hex.tolist()), dtype=bool,
+                                       count=len(batch))
+        for i in np.nonzero(interesting)[0]:
+            report = VisitReport(float(batch.time[i]), float(batch.altitude[i]), float(batch.track[i]),
+                                 bool(batch.isGnd[i]), batch.flight[i], batch.hex[i])
+            visit = self.visits.get(report.hex)
+            runway = runways[i]
+            if visit and runway is not None and visit.runway is not runway:
+                #
+                # Where runways cross, a plane stays on the one it's been using
+                #
+                if self.runwaySet.onRunway(batch.lat[i], batch.lon[i], visit.runway):
+                    runway = visit.runway
+                else:
+                    events.extend(self.endVisit(report.hex))
+                    visit = None
+            if runway is not None:
+                if visit is None:
+                    visit = self.visits[report.hex] = Visit(runway)
+                visit.reports.append(report)
+                visit.outsideSince = None
+            elif visit is None:
+                #
+                # The visit ended earlier in this batch
+                #
+                continue
+            elif visit.outsideSince is None:
+                visit.outsideSince = report.time
+            elif report.time - visit.outsideSince >= self.exitGrace:
+                events.extend(self.endVisit(report.hex))
+                continue
+            visit.lastSeen = report.time
+        self.now = max(self.now, float(batch.time.max()))
+        events.extend(self.expire())
+        return events
+
+    def expire(self, now=None):
+        """Ends the visits of planes that haven't been heard from for ttl seconds"""
+        now = self.now if now is None else now
+        events = []
+        for hex in [hex for hex, visit in self.visits.items() if now - visit.lastSeen >= self.ttl]:
+            events.extend(self.endVisit(hex))
+        return events
+
+    def flush(self):
+        """Ends every visit, as at the end of a replay"""
+        events = []
+        for hex in list(self.visits):
+            events.extend(self.endVisit(hex))
+        return events
+
+    def endVisit(self, hex):
+        visit = self.visits.pop(hex)
+        event = classifyEvent(visit.reports, visit.runway)
+        if not event:
+            return []
+        lastplane = visit.reports[-1]
+        return [pr.AirportDailyEvents(airport=visit.runway.airport, event_time=int(lastplane.time),
+                                      type_of_event=event[0], flight=lastplane.flight,
+                                      hex=lastplane.hex, runway=visit.runway.name)]
+
+
+class EventWriter(object):
+    """
+    Inserts AirportDailyEvents into the DB a batch at a time.
+
+    Args:
+        dbconn: psycopg2 DB connection
+        batchSize: Number of events to hold before inserting them (optional)
+        maxDelay: Seconds an event may be held before being inserted (optional)
+        printQuery: Print the SQL (optional)
+    """
+
+    def __init__(self, dbconn, batchSize=100, maxDelay=5.0, printQuery=False):
+        self.dbconn = dbconn
+        self.batchSize = batchSize
+        self.maxDelay = maxDelay
+        self.printQuery = printQuery
+        self.pending = []
+        self.oldest = None
+        self.written = 0
+
+    def add(self, events):
+        """Queues events, inserting the queue if it's full or old enough"""
+        if events and not self.pending:
+            self.oldest = time.time()
+        self.pending.extend(events)
+        if len(self.pending) >= self.batchSize or \
+                (self.pending and time.time() - self.oldest >= self.maxDelay):
+            self.flush()
+
+    def flush(self):
+        """Inserts, and commits, any queued events"""
+        if not self.pending:
+            return
+        cur = self.dbconn.cursor()
+        sql = '''
+			INSERT into airport_daily_events (airport, hex, flight, type_of_event, event_epoch, runway)
+			VALUES %s'''
+        params = [(e.airport, e.hex, e.flight, e.type_of_event, e.event_time, e.runway) for e in self.pending]
+        if self.printQuery:
+            print(sql, len(params), "events")
+        try:
+            execute_values(cur, sql, params)
+            self.dbconn.commit()
+            self.written += len(params)
+        except psycopg2.Error as err:
+            self.dbconn.rollback()
+            print("Error logging airport events", err)
+        cur.close()
+        self.pending = []
+        self.oldest = None
+
+
+def airportCodes(codes=None, within=None, lon=None, lat=None, dbconn=None, aptFile=None, debug=False):
+    """
+    Works out which airports to watch - those named, or those within so many km
+    of a position, found with the airport index.
+
+    Returns:
+        list of ICAO codes
+    """
+    if codes:
+        return codes.split(',')
+    index = pa.loadAirportIndex(dbconn=dbconn, aptFile=aptFile, debug=debug)
+    return [airport.icao for airport, dist in index.within(lon, lat, within * 1000.0)]
+
+
+def loadRunwaySet(codes, dbconn=None, aptFile=None, printQuery=None):
+    """Returns a RunwaySet of airports, from an apt.dat file if one is given, otherwise the DB"""
+    if aptFile:
+        return RunwaySet.fromAptFile(aptFile, codes)
+    return RunwaySet.fromDB(dbconn, codes, printQuery=printQuery)
@@ -0,0 +1,213 @@
+"""
+Module containing a streaming KML (or KMZ) writer for plane tracks, and
+Douglas-Peucker simplification of the tracks, so that long, many aircraft
+exports can be written a bit at a time in bounded memory.
+"""
+import io
+import zipfile
+import numpy as np
+from xml.sax.saxutils import escape
+
+EARTH_RADIUS = 6371000.0
+
+#
+# Tracks are simplified & written in chunks of at most this many points
+#
+MAX_CHUNK_POINTS = 5000
+
+
+def localCoords(lons, lats, alts):
+    """
+    Converts positions to metres on a flat approximation of the earth about their
+    middle, which is good enough for measuring how far a point is off a track.
+
+    Returns:
+        numpy array of x, y, z rows
+    """
+    lat0 = np.radians(np.mean(lats))
+    xs = np.radians(lons) * np.cos(lat0) * EARTH_RADIUS
+    ys = np.radians(lats) * EARTH_RADIUS
+    return np.column_stack((xs, ys, alts))
+
+
+def douglasPeucker(points, tolerance):
+    """
+    Simplifies a 3D track with the Douglas-Peucker algorithm.
+
+    Args:
+        points: numpy array of x, y, z rows, in metres
+        tolerance: how far (in metres) the simplified track may stray from the original
+
+    Returns:
+        numpy boolean array, True for the points to keep. The first and last
+        points are always kept.
+    """
+    num = len(points)
+    keep = np.zeros(num, dtype=bool)
+    if num <= 2:
+        keep[:] = True
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, num - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        seg = points[last] - points[first]
+        rel = points[first + 1:last] - points[first]
+        seglen2 = np.dot(seg, seg)
+        if seglen2 > 0:
+            frac = np.clip(rel.dot(seg) / seglen2, 0.0, 1.0)
+            rel = rel - frac[:, None] * seg
+        dists = np.sqrt((rel * rel).sum(axis=1))
+        i = np.argmax(dists)
+        if dists[i] > tolerance:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return keep
+
+
+def headingChanges(headings, tolerance):
+    """
+    Returns a boolean array marking the points where the heading has turned by more
+    than tolerance degrees since the last point marked.
+    """
+    keep = np.zeros(len(headings), dtype=bool)
+    if not len(headings):
+        return keep
+    last = headings[0]
+    keep[0] = True
+    for i, heading in enumerate(headings):
+        if abs((heading - last + 180.0) % 360.0 - 180.0) > tolerance:
+            keep[i] = True
+            last = heading
+    return keep
+
+
+class TrackSimplifier(object):
+    """
+    Collects the points of a track, and hands them on simplified, in chunks of at
+    most maxPoints, so the memory used is bounded however long the track is.
+
+    Each chunk after the first starts with the point that ended the one before,
+    so that chunks drawn as lines join up.
+
+    Args:
+        emit: function called with (times, lons, lats, alts, headings, continued),
+              continued being True when the first point was the last of the previous chunk
+        tolerance: Douglas-Peucker tolerance in metres, 0 to keep every point
+        headingTolerance: also keep points where the heading turns by more than this many degrees (optional)
+        maxPoints: maximum number of points held at once (optional)
+    """
+
+    def __init__(self, emit, tolerance, headingTolerance=None, maxPoints=MAX_CHUNK_POINTS):
+        self.emit = emit
+        self.tolerance = tolerance
+        self.headingTolerance = headingTolerance
+        self.maxPoints = maxPoints
+        self.points = []
+        self.continued = False
+        self.lastTime = None
+
+    def add(self, time, lon, lat, alt, heading):
+        self.points.append((time, lon, lat, alt, heading))
+        self.lastTime = time
+        if len(self.points) >= self.maxPoints:
+            self.flush(final=False)
+
+    def flush(self, final=True):
+        """Simplifies & emits the points held, keeping the last one back unless final"""
+        if not self.points or (len(self.points) == 1 and self.continued):
+            self.points = []
+            return
+        cols = np.array(self.points, dtype=np.float64)
+        times, lons, lats, alts, headings = cols.T
+        if self.tolerance > 0:
+            keep = douglasPeucker(localCoords(lons, lats, alts), self.tolerance)
+            if self.headingTolerance is not None:
+                keep |= headingChanges(headings, self.headingTolerance)
+        else:
+            keep = np.ones(len(cols), dtype=bool)
+        self.emit(times[keep], lons[keep], lats[keep], alts[keep], headings[keep], self.continued)
+        if final:
+            self.points = []
+            self.continued = False
+        else:
+            self.points = self.points[-1:]
+            self.continued = True
+
+
+class KMLWriter(object):
+    """
+    Writes a KML document a piece at a time, rather than building it all in
+    memory. If the filename ends in .kmz, it's written compressed, as doc.kml
+    inside a zip archive.
+
+    Use as:
+        with KMLWriter("foo.kml") as kml:
+            kml.lineStyle("track", "ffffff00", 2)
+            kml.track("Some plane", lons, lats, alts, style="track")
+    """
+
+    def __init__(self, filename):
+        if filename.lower().endswith(".kmz"):
+            self.archive = zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED)
+            self.fp = io.TextIOWrapper(self.archive.open("doc.kml", "w"), encoding="utf-8")
+        else:
+            self.archive = None
+            self.fp = open(filename, "w", encoding="utf-8")
+        self.ids = 0
+        self.fp.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n'
+                      '<Document>\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def nextId(self):
+        self.ids += 1
+        return self.ids
+
+    def lineStyle(self, styleId, colour, width):
+        """Defines a line style, colour being KML's aabbggrr hex"""
+        self.fp.write('<Style id="%s"><LineStyle><color>%s</color><width>%s</width></LineStyle></Style>\n' %
+                      (escape(styleId), colour, width))
+
+    def track(self, name, lons, lats, alts, style=None, description=None):
+        """Writes a track as a Placemark holding a LineString"""
+        self.fp.write('<Placemark id="track_%d"><name>%s</name>' % (self.nextId(), escape(name)))
+        if description:
+            self.fp.write('<description>%s</description>' % escape(description))
+        if style:
+            self.fp.write('<styleUrl>#%s</styleUrl>' % escape(style))
+        self.fp.write('<LineString><extrude>1</extrude><altitudeMode>absolute</altitudeMode><coordinates>')
+        self.fp.write(" ".join("%.6f,%.6f,%d" % (lon, lat, alt) for lon, lat, alt in zip(lons, lats, alts)))
+        self.fp.write('</coordinates></LineString></Placemark>\n')
+
+    def startTour(self, name="Play me"):
+        self.fp.write('<gx:Tour><name>%s</name><gx:Playlist>\n' % escape(name))
+        self.fp.write('<gx:AnimatedUpdate><gx:duration>1.0</gx:duration></gx:AnimatedUpdate>\n')
+
+    def flyTo(self, duration, lon, lat, alt, heading, tilt):
+        """Writes one keyframe of a tour, with the camera at the position given"""
+        self.fp.write('<gx:FlyTo><gx:duration>%.2f</gx:duration><gx:flyToMode>smooth</gx:flyToMode>'
+                      '<Camera><longitude>%.6f</longitude><latitude>%.6f</latitude><altitude>%d</altitude>'
+                      '<heading>%d</heading><tilt>%s</tilt><altitudeMode>absolute</altitudeMode>'
+                      '<roll>0</roll></Camera></gx:FlyTo>\n' % (duration, lon, lat, alt, heading, tilt))
+
+    def endTour(self):
+        self.fp.write('</gx:Playlist></gx:Tour>\n')
+
+    def close(self):
+        if self.fp is None:
+            return
+        self.fp.write('</Document>\n</kml>\n')
+        self.fp.close()
+        if self.archive:
+            self.archive.close()
+        self.fp = None
@@ -0,0 +1,322 @@
+"""
+Module containing helpers for drawing the maps under the plots and movies,
+and the density images plotted on them in place of very many markers.
+
+Reading the high resolution coastlines and rasterising the shaded relief takes
+a long time, and gives the same result every time for the same map, so the
+results are cached on disk. Import this after the matplotlib backend has been chosen.
+"""
+import os
+import json
+import hashlib
+import zipfile
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from mpl_toolkits.basemap import Basemap
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+MAP_CACHE_DIR = os.environ.get("PLANEREPORT_MAP_CACHE",
+                               os.path.join(os.path.expanduser("~"), ".cache", "planereport", "maps"))
+MAP_CACHE_SIZE = 512 * 1024 * 1024
+MAP_CACHE_VERSION = 1
+
+#
+# As per Basemap's drawcoastlines & drawstates defaults
+#
+COASTLINE_WIDTH = 1.0
+STATE_WIDTH = 0.5
+
+
+class MapCache(object):
+    """
+    A directory of cached map data, one compressed numpy file per map, evicting
+    the least recently used once the directory grows beyond maxBytes.
+    """
+
+    def __init__(self, cacheDir=MAP_CACHE_DIR, maxBytes=MAP_CACHE_SIZE, debug=False):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.debug = debug
+        self.hits = 0
+        self.misses = 0
+
+    def pathname(self, kind, params):
+        key = json.dumps(dict(params, kind=kind, version=MAP_CACHE_VERSION), sort_keys=True)
+        return os.path.join(self.cacheDir, kind + "-" + hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def load(self, kind, params):
+        """Returns a dict of the arrays stored for a map, or None if it isn't cached"""
+        pathname = self.pathname(kind, params)
+        try:
+            with np.load(pathname) as npz:
+                entry = dict(npz)
+        except FileNotFoundError:
+            self.misses += 1
+            if self.debug:
+                print("Map cache miss", pathname)
+            return None
+        except (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile) as err:
+            #
+            # A truncated or corrupt entry (say from a full disk) is thrown away, to be made again
+            #
+            self.misses += 1
+            if self.debug:
+                print("Map cache discarding", pathname, err)
+            try:
+                os.remove(pathname)
+            except OSError:
+                pass
+            return None
+        #
+        # Bump the modification time, which is what eviction goes by. Another
+        # process may have just evicted it, which doesn't matter.
+        #
+        try:
+            os.utime(pathname, None)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        if self.debug:
+            print("Map cache hit", pathname)
+        return entry
+
+    def store(self, kind, params, **arrays):
+        """Saves the arrays for a map, then trims the cache back to size"""
+        os.makedirs(self.cacheDir, exist_ok=True)
+        pathname = self.pathname(kind, params)
+        tmpname = pathname + ".%d.tmp" % os.getpid()
+        with open(tmpname, "wb") as fp:
+            np.savez_compressed(fp, params=json.dumps(params, sort_keys=True), **arrays)
+        os.replace(tmpname, pathname)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for fn in os.listdir(self.cacheDir):
+            if not fn.endswith(".npz"):
+                continue
+            st = os.stat(os.path.join(self.cacheDir, fn))
+            entries.append((st.st_mtime, st.st_size, fn))
+        total = sum(size for mtime, size, fn in entries)
+        for mtime, size, fn in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            if self.debug:
+                print("Map cache evicting", fn)
+            os.remove(os.path.join(self.cacheDir, fn))
+            total -= size
+
+
+def mapParams(width, height, lat_0, lon_0, projection='tmerc', resolution='h', figsize=(10, 10), dpi=100):
+    """The parameters that determine what a map looks like, used as the cache key"""
+    return {"width": float(width), "height": float(height), "lat_0": float(lat_0),
+            "lon_0": float(lon_0), "projection": projection, "resolution": resolution,
+            "figsize": [float(x) for x in figsize], "dpi": float(dpi)}
+
+
+def projectionMap(params, ax=None):
+    """A Basemap for projecting positions, without the (slow to load) coastlines"""
+    return Basemap(width=params["width"], height=params["height"], resolution=None,
+                   projection=params["projection"], lat_0=params["lat_0"],
+                   lon_0=params["lon_0"], ax=ax)
+
+
+def renderBackground(params):
+    """
+    Rasterises the shaded relief, states and coastlines of a map, to an image
+    covering exactly the map's extent, at the resolution the map is plotted at.
+    """
+    width = params["figsize"][0]
+    fig = Figure(figsize=(width, width * params["height"] / params["width"]), dpi=params["dpi"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    mymap = Basemap(width=params["width"], height=params["height"], resolution=params["resolution"],
+                    projection=params["projection"], lat_0=params["lat_0"], lon_0=params["lon_0"],
+                    ax=ax, fix_aspect=False)
+    mymap.shadedrelief()
+    mymap.drawstates()
+    mymap.drawcoastlines()
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+
+def drawBackground(ax, width, height, lat_0, lon_0, projection='tmerc', resolution='h',
+                   figsize=(10, 10), dpi=100, cache=None):
+    """
+    Draws shaded relief, states and coastlines on a 2D plot.
+
+    Args:
+        ax: matplotlib axes to draw on
+        width, height: size of the map in metres
+        lat_0, lon_0: centre of the map
+        projection, resolution: as per Basemap (optional)
+        figsize, dpi: of the figure being plotted (optional)
+        cache: a MapCache to keep the rendered background in (optional)
+
+    Returns:
+        The Basemap, to project positions with
+
+    Without a cache, the map is drawn with Basemap as it always was. With one,
+    the background is drawn as a single image, rendered on the first run.
+    """
+    if not cache:
+        mymap = Basemap(width=width, height=height, resolution=resolution, projection=projection,
+                        lat_0=lat_0, lon_0=lon_0, ax=ax)
+        mymap.shadedrelief()
+        mymap.drawstates()
+        mymap.drawcoastlines()
+        return mymap
+
+    params = mapParams(width, height, lat_0, lon_0, projection=projection, resolution=resolution,
+                       figsize=figsize, dpi=dpi)
+    entry = cache.load("background", params)
+    if entry is None:
+        image = renderBackground(params)
+        cache.store("background", params, image=image)
+    else:
+        image = entry["image"]
+    mymap = projectionMap(params, ax=ax)
+    mymap.imshow(image, origin='upper', interpolation='bilinear')
+    return mymap
+
+
+def mapLines(params):
+    """
+    Returns the projected coastline and state boundary segments of a map, each as
+    an array of points and an array of where each segment starts.
+    """
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    mymap = Basemap(width=params["width"], height=params["height"], resolution=params["resolution"],
+                    projection=params["projection"], lat_0=params["lat_0"], lon_0=params["lon_0"],
+                    ax=ax)
+    arrays = {}
+    for name, lines in [("coastlines", mymap.drawcoastlines()), ("states", mymap.drawstates())]:
+        segments = lines.get_segments()
+        lengths = [len(seg) for seg in segments]
+        arrays[name] = np.concatenate(segments) if segments else np.zeros((0, 2))
+        arrays[name + "_offsets"] = np.cumsum([0] + lengths)
+    return arrays
+
+
+def drawLines3D(ax, width, height, lat_0, lon_0, projection='tmerc', resolution='h', cache=None):
+    """
+    Draws the coastlines and state boundaries on the floor of a 3D plot, as
+    planeplot3d & planeplot3dmovie do.
+
+    Args:
+        as per drawBackground
+
+    Returns:
+        The Basemap, to project positions with
+    """
+    if not cache:
+        mymap = Basemap(width=width, height=height, resolution=resolution, projection=projection,
+                        lat_0=lat_0, lon_0=lon_0)
+        ax.add_collection3d(mymap.drawcoastlines())
+        ax.add_collection3d(mymap.drawstates())
+        return mymap
+
+    params = mapParams(width, height, lat_0, lon_0, projection=projection, resolution=resolution,
+                       figsize=(0, 0), dpi=0)
+    entry = cache.load("lines", params)
+    if entry is None:
+        entry = mapLines(params)
+        cache.store("lines", params, **entry)
+    #
+    # The lines lie on the floor of the plot, at an altitude of zero
+    #
+    for name, linewidth in [("coastlines", COASTLINE_WIDTH), ("states", STATE_WIDTH)]:
+        points = np.column_stack((entry[name], np.zeros(len(entry[name]))))
+        offsets = entry[name + "_offsets"]
+        segments = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        ax.add_collection(Line3DCollection(segments, linewidths=linewidth, colors='k'))
+    ax.set_xlim(0, params["width"])
+    ax.set_ylim(0, params["height"])
+    return projectionMap(params)
+
+
+class DensityGrid(object):
+    """
+    Counts of positions on a grid of square cells centred on the middle of a
+    map, so that any number of positions can be drawn as one image, in memory
+    that depends only on the size of the grid.
+
+    Args:
+        width, height: size of the area covered, in metres
+        cellSize: size of each cell, in metres
+        grow: rather than dropping positions outside the area, double the area
+              (merging each 2x2 block of cells into one) until they fit (optional)
+    """
+
+    def __init__(self, width, height, cellSize, grow=False):
+        #
+        # A multiple of 4 cells each way keeps the cells lined up, and the grid
+        # centred, when they're merged.
+        #
+        self.nx = 4 * max(1, int(np.ceil(width / cellSize / 4.0)))
+        self.ny = 4 * max(1, int(np.ceil(height / cellSize / 4.0)))
+        self.cellSize = float(cellSize)
+        self.grow = grow
+        self.counts = np.zeros((self.ny, self.nx), dtype=np.int64)
+        self.total = 0
+
+    def halfSize(self):
+        """Returns half the width & height covered, in metres"""
+        return self.nx * self.cellSize / 2.0, self.ny * self.cellSize / 2.0
+
+    def _double(self):
+        ny, nx = self.ny, self.nx
+        merged = self.counts.reshape(ny // 2, 2, nx // 2, 2).sum(axis=(1, 3))
+        self.counts = np.zeros((ny, nx), dtype=np.int64)
+        self.counts[ny // 4:ny // 4 + ny // 2, nx // 4:nx // 4 + nx // 2] = merged
+        self.cellSize *= 2
+
+    def add(self, xs, ys):
+        """
+        Counts positions.
+
+        Args:
+            xs, ys: numpy arrays of the positions, in metres east & north of the centre
+        """
+        if not len(xs):
+            return
+        halfw, halfh = self.halfSize()
+        while self.grow and (np.abs(xs).max() >= halfw or np.abs(ys).max() >= halfh):
+            self._double()
+            halfw, halfh = self.halfSize()
+        ix = np.floor(xs / self.cellSize).astype(np.int64) + self.nx // 2
+        iy = np.floor(ys / self.cellSize).astype(np.int64) + self.ny // 2
+        inside = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        self.counts += np.bincount(iy[inside] * self.nx + ix[inside],
+                                   minlength=self.nx * self.ny).reshape(self.ny, self.nx)
+        self.total += len(xs)
+
+
+def drawDensity(ax, grid, width, height, cmap='YlOrRd'):
+    """
+    Draws a DensityGrid on a map as an image, each cell coloured by how many
+    positions fell in it, on a log scale, with the empty cells left clear.
+
+    Args:
+        ax: matplotlib axes the map is drawn on
+        grid: the DensityGrid, centred on the centre of the map
+        width, height: size of the map in metres
+        cmap: matplotlib colour map (optional)
+
+    Returns:
+        The image drawn
+    """
+    halfw, halfh = grid.halfSize()
+    counts = np.ma.masked_equal(grid.counts, 0)
+    image = ax.imshow(counts, origin='lower', interpolation='nearest', cmap=cmap,
+                      norm=LogNorm(vmin=1, vmax=max(1, grid.counts.max())),
+                      extent=(width / 2.0 - halfw, width / 2.0 + halfw,
+                              height / 2.0 - halfh, height / 2.0 + halfh))
+    ax.set_xlim(0, width)
+    ax.set_ylim(0, height)
+    return image
@@ -0,0 +1,247 @@
+"""
+Module for light-weight counters and stage timers for the long running scripts
+(planelogger.py), exported in the Prometheus text format - either as a file for
+node_exporter's textfile collector, or from a small HTTP server's /metrics.
+
+Counters and gauges are plain numbers. Timers keep the count and sum of the
+durations of a stage, and the last RESERVOIR of them, from which the 50th and
+99th percentiles are worked out when the metrics are rendered, so recording a
+duration is cheap whatever the percentiles are wanted for.
+
+Everything is guarded by a lock, as the HTTP server renders the metrics from
+its own thread.
+"""
+import os
+import time
+import tempfile
+import threading
+import http.server
+import numpy as np
+
+#
+# Number of durations each timer keeps for its percentiles, and the percentiles
+#
+RESERVOIR = 1024
+QUANTILES = (0.5, 0.99)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StageTimer(object):
+    """
+    Keeps the count and sum of the durations of a stage, and the last size of
+    them, in a ring, for its percentiles.
+
+    Args:
+        size: number of durations kept for the percentiles (optional)
+    """
+
+    def __init__(self, size=RESERVOIR):
+        self.samples = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Returns the quantiles of the durations kept (NaN before there are any)"""
+        kept = min(self.count, len(self.samples))
+        if not kept:
+            return [float("nan")] * len(quantiles)
+        return np.quantile(self.samples[:kept], quantiles).tolist()
+
+
+class Metrics(object):
+    """
+    A set of named counters, gauges and timers, which may be labelled.
+
+    Args:
+        prefix: prepended (with an underscore) to the name of every metric (optional)
+        reservoir: number of durations each timer keeps for its percentiles (optional)
+    """
+
+    def __init__(self, prefix="", reservoir=RESERVOIR):
+        self.prefix = prefix + "_" if prefix else ""
+        self.reservoir = reservoir
+        self.lock = threading.Lock()
+        #
+        # name -> (type, help), and name -> {labels: value (or StageTimer)}, in the
+        # order they were described
+        #
+        self.described = {}
+        self.values = {}
+
+    def describe(self, name, kind, helpText, labels=None):
+        """
+        Declares a metric, so that it's rendered (with its HELP and TYPE) before
+        anything is recorded against it.
+
+        Args:
+            name: name of the metric, without the prefix
+            kind: "counter", "gauge" or "summary" (a timer)
+            helpText: what the metric measures
+            labels: list of dicts of labels to start at zero (optional - an unlabelled
+                    counter starts at zero anyway)
+        """
+        with self.lock:
+            self.described[name] = (kind, helpText)
+            series = self.values.setdefault(name, {})
+            for label in labels or ([{}] if kind == "counter" else []):
+                key = self._key(label)
+                if key not in series:
+                    series[key] = StageTimer(self.reservoir) if kind == "summary" else 0
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def count(self, name, increment=1, **labels):
+        """Adds to a counter"""
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.setdefault(name, {})
+            series[key] = series.get(key, 0) + increment
+
+    def set(self, name, value, **labels):
+        """Sets a gauge"""
+        key = self._key(labels)
+        with self.lock:
+            self.values.setdefault(name, {})[key] = value
+
+    def observe(self, name, seconds, **labels):
+        """Adds a duration to a timer"""
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.setdefault(name, {})
+            timer = series.get(key)
+            if timer is None:
+                timer = series[key] = StageTimer(self.reservoir)
+            timer.add(seconds)
+
+    def timer(self, name, **labels):
+        """Returns a context manager timing its body into a timer"""
+        return _Timing(self, name, labels)
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, series in self.values.items():
+                kind, helpText = self.described.get(name, (None, None))
+                fullName = self.prefix + name
+                if helpText:
+                    lines.append("# HELP %s %s" % (fullName, helpText))
+                if kind is None:
+                    kind = "summary" if any(isinstance(v, StageTimer) for v in series.values()) else "untyped"
+                lines.append("# TYPE %s %s" % (fullName, kind))
+                for key, value in series.items():
+                    if isinstance(value, StageTimer):
+                        for quantile, seconds in zip(QUANTILES, value.quantiles()):
+                            lines.append(_sample(fullName, key + (("quantile", str(quantile)),), seconds))
+                        lines.append(_sample(fullName + "_sum", key, value.total))
+                        lines.append(_sample(fullName + "_count", key, value.count))
+                    else:
+                        lines.append(_sample(fullName, key, value))
+        return "\n".join(lines) + "\n"
+
+    def writeTextfile(self, pathname):
+        """
+        Writes the metrics to a file, for node_exporter's textfile collector,
+        atomically, so the collector never reads half a file.
+        """
+        directory = os.path.dirname(os.path.abspath(pathname))
+        fd, tmpName = tempfile.mkstemp(prefix=".metrics", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(self.render())
+            os.chmod(tmpName, 0o644)
+            os.replace(tmpName, pathname)
+        except OSError:
+            if os.path.exists(tmpName):
+                os.remove(tmpName)
+            raise
+
+
+class _Timing(object):
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def _sample(name, key, value):
+    if key:
+        labels = ",".join('%s="%s"' % (label, str(text).replace('\\', '\\\\').replace('"', '\\"'))
+                          for label, text in key)
+        name = "%s{%s}" % (name, labels)
+    if isinstance(value, float):
+        if value != value:
+            text = "NaN"
+        elif value in (float("inf"), float("-inf")):
+            text = "+Inf" if value > 0 else "-Inf"
+        else:
+            text = repr(value)
+    else:
+        text = str(value)
+    return "%s %s" % (name, text)
+
+
+class MetricsServer(object):
+    """
+    Serves the metrics at /metrics over HTTP, from a background thread.
+
+    Args:
+        metrics: the Metrics
+        host, port: where to listen - port 0 picks a free one (optional)
+    """
+
+    def __init__(self, metrics, host="127.0.0.1", port=0):
+        self.metrics = metrics
+        self.server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def url(self):
+        return "http://%s:%d/metrics" % (self.server.server_address[0], self.port)
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
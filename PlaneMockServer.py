@@ -0,0 +1,346 @@
+"""
+Module for a stand-in for dump1090 and VRS servers, for testing planelogger.py and
+vrsgetplanes.py, and measuring how they cope with load and timeouts, without a
+real receiver.
+
+Reports - recorded in a file, from a directory of aircraft.json or VRS snapshots,
+or made up as they're asked for by PlaneSynth - are replayed against the clock.
+Each request is answered with the latest report of every aircraft heard in the
+last minute (of replay time), with their times moved to the present, in any of
+the forms the scripts read:
+
+    /data/aircraft.json                dump1090 mutability (or piaware, see variant)
+    /dump1090/data/aircraft.json       dump1090 mutability
+    /dump1090-fa/data/aircraft.json    piaware 3.6 (alt_baro, gs and baro_rate keys)
+    /data.json                         the original dump1090 list of aircraft
+    /VirtualRadar/AircraftList.json    VRS, honouring the fDstL/fDstU (km from lat/lng)
+                                       and fAltL/fAltU (feet) filters
+    /stats                             counts of requests served, and faults injected
+
+Responses can be delayed, with jitter, left hanging (so clients time out) or
+failed, at random, but repeatably for a given seed.
+"""
+import os
+import json
+import glob
+import time
+import random
+import threading
+import collections
+import http.server
+import urllib.parse
+import numpy as np
+import PlaneReport as pr
+import PlaneSynth as ps
+
+#
+# How long (seconds) an aircraft stays in the list after its last report
+#
+WINDOW = 60
+AIRCRAFT_PATHS = {"/dump1090/data/aircraft.json": "mutability", "/dump1090-fa/data/aircraft.json": "piaware"}
+
+
+def fileBatches(filename, numRecs=10000):
+    """Yields ReportBatches of a file of PlaneReport JSON lines"""
+    inputfile = pr.openFile(filename)
+    try:
+        for batch in pr.ReportFileReader(inputfile, numRecs=numRecs).batches():
+            yield batch
+    finally:
+        inputfile.close()
+
+
+def snapshotBatches(directory):
+    """
+    Yields a ReportBatch for each aircraft.json, data.json or VRS AircraftList.json
+    file in a directory (as synthtraffic.py writes them), in the order of their names.
+    Reports are timed from the file's "now" (or when it was written) less how long
+    ago the aircraft's position was seen.
+    """
+    for filename in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(filename, "r") as fp:
+            data = json.load(fp)
+        if isinstance(data, dict) and "acList" in data:
+            inputfile = pr.openFile(filename)
+            batch = pr.readVRSBatchFromFile(inputfile)
+            inputfile.close()
+            yield batch
+            continue
+        now = data.get("now", os.path.getmtime(filename)) if isinstance(data, dict) else os.path.getmtime(filename)
+        planes = pr.planesFromJSON(data, now)
+        for plane in planes:
+            if not plane.time:
+                seen = getattr(plane, "seen_pos", -1)
+                plane.time = now - (seen if seen is not None and seen >= 0 else plane.seen)
+        if planes:
+            yield pr.ReportBatch.fromPlanes(planes)
+
+
+def syntheticBatches(numAircraft, lat, lon, seed=1, startTime=None, duration=7 * 24 * 3600,
+                     airports=None, runways=None):
+    """Yields ReportBatches of synthetic traffic heard by one receiver at lat, lon"""
+    receiver = ps.makeReceiver("Mock", lat, lon)
+    generator = ps.TrafficGenerator([receiver], airports=airports, runways=runways, numAircraft=numAircraft,
+                                    startTime=int(startTime if startTime is not None else time.time()),
+                                    duration=duration, seed=seed)
+    return generator.batches(60)
+
+
+class ReportReplay(object):
+    """
+    Keeps the latest report of each aircraft as a stream of reports is replayed.
+
+    Args:
+        source: function returning an iterator of ReportBatches, in time order
+        loop: start again at the end of the reports (optional)
+        window: seconds an aircraft is listed for after its last report (optional)
+    """
+
+    def __init__(self, source, loop=False, window=WINDOW):
+        self.source = source
+        self.loop = loop
+        self.window = window
+        self.lock = threading.Lock()
+        self._restart()
+        self.offset = 0.0
+        self.buffered = pr.ReportBatch.fromDicts([])
+        self.startTime = None
+        self._fill(None)
+        self.startTime = float(self.buffered.time.min()) if len(self.buffered) else 0.0
+
+    def _restart(self):
+        self.batches = iter(self.source())
+        self.first = None
+        self.last = None
+
+    def _fill(self, until):
+        """Reads batches until there's one with a report after until (the first batch if None)"""
+        while until is None or not len(self.buffered) or self.buffered.time.max() <= until:
+            batch = next(self.batches, None)
+            if batch is None:
+                if not self.loop or self.first is None:
+                    return
+                #
+                # Round again, later by the length of the reports
+                #
+                self.offset += self.last - self.first + 1
+                self._restart()
+                continue
+            if not len(batch):
+                continue
+            if self.first is None:
+                self.first = float(batch.time.min())
+            self.last = float(batch.time.max())
+            if self.offset:
+                batch = batch[np.arange(len(batch))]
+                batch.time = batch.time + self.offset
+            self.buffered = pr.ReportBatch.concatenate([self.buffered, batch])
+            if until is None:
+                return
+
+    def snapshot(self, when):
+        """
+        Returns a ReportBatch of the latest report of each aircraft heard in the
+        window before when (replay time), ordered by hex code.
+        """
+        with self.lock:
+            self._fill(when)
+            buffered = self.buffered
+            buffered = buffered[buffered.time > when - self.window]
+            self.buffered = buffered
+        current = buffered[buffered.time <= when]
+        if not len(current):
+            return current
+        order = np.lexsort((current.time, current.hex.astype(str)))
+        hexes = current.hex[order].astype(str)
+        last = np.append(hexes[1:] != hexes[:-1], True)
+        return current[order[last]]
+
+
+class MockReceiver(object):
+    """
+    A dump1090 and VRS stand-in serving a ReportReplay over HTTP, from a background
+    thread (or the caller's, with serve_forever).
+
+    Args:
+        replay: the ReportReplay
+        host, port: where to listen - port 0 picks a free one (optional)
+        speed: replay speed, 2 playing the reports twice as fast as they happened (optional)
+        variant: "mutability" or "piaware" keys for /data/aircraft.json (optional)
+        latency: seconds every response is delayed by (optional)
+        jitter: responses are delayed up to this many seconds more, or less (optional)
+        timeoutRate: chance of a request being left hanging for hang seconds (optional)
+        hang: seconds a hanging request is left for before being answered (optional)
+        errorRate: chance of a request failing with a 503 (optional)
+        seed: seed for the faults (optional)
+    """
+
+    def __init__(self, replay, host="127.0.0.1", port=0, speed=1.0, variant="mutability", latency=0.0,
+                 jitter=0.0, timeoutRate=0.0, hang=5.0, errorRate=0.0, seed=1):
+        self.replay = replay
+        self.speed = speed
+        self.variant = variant
+        self.latency = latency
+        self.jitter = jitter
+        self.timeoutRate = timeoutRate
+        self.hang = hang
+        self.errorRate = errorRate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        self.wallStart = time.time()
+        self.server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def url(self, path="/data/aircraft.json"):
+        """Returns the URL of one of the documents served"""
+        return "http://%s:%d%s" % (self.server.server_address[0], self.port, path)
+
+    def replayTime(self, now):
+        """Works out the replay time at a wall clock time"""
+        return self.replay.startTime + (now - self.wallStart) * self.speed
+
+    def fault(self):
+        """Picks the fault (None, "hang" or "error") and delay for a request"""
+        with self.lock:
+            chance = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if chance < self.timeoutRate:
+            return "hang", delay + self.hang
+        if chance < self.timeoutRate + self.errorRate:
+            return "error", delay
+        return None, delay
+
+    def document(self, path, query):
+        """
+        Builds the document for a path, or returns None for an unknown one.
+
+        Args:
+            path: path of the URL
+            query: dict of the URL's query parameters, as per urllib.parse.parse_qs
+        """
+        if path == "/stats":
+            with self.lock:
+                return dict(self.stats)
+        now = time.time()
+        when = self.replayTime(now)
+        if path not in AIRCRAFT_PATHS and path not in ["/data/aircraft.json", "/data.json",
+                                                       "/VirtualRadar/AircraftList.json"]:
+            return None
+        batch = self.replay.snapshot(when)
+        #
+        # Reports are moved to the present, and their ages scaled to the replay speed
+        #
+        batch = batch[np.arange(len(batch))]
+        batch.time = now - (when - batch.time) / self.speed
+        if path == "/data.json":
+            return ps.dataDocument(batch)
+        if path == "/VirtualRadar/AircraftList.json":
+            batch = self.vrsFilter(batch, query)
+            doc = ps.vrsDocument(batch, trails=False)
+            doc["stm"] = int(now * 1000)
+            return doc
+        return ps.aircraftDocument(batch, now, variant=AIRCRAFT_PATHS.get(path, self.variant))
+
+    @staticmethod
+    def vrsFilter(batch, query):
+        """Applies VRS's distance (km from lat/lng) and altitude (feet) filters"""
+        def param(name):
+            try:
+                return float(query[name][0])
+            except (KeyError, IndexError, ValueError):
+                return None
+
+        keep = np.ones(len(batch), dtype=bool)
+        lat, lon = param("lat"), param("lng")
+        if lat is not None and lon is not None:
+            dist = batch.distances(lon, lat) / 1000.0
+            if param("fDstL") is not None:
+                keep &= dist >= param("fDstL")
+            if param("fDstU") is not None:
+                keep &= dist <= param("fDstU")
+        feet = batch.altitude / pr.FEET_TO_METRES
+        if param("fAltL") is not None:
+            keep &= feet >= param("fAltL")
+        if param("fAltU") is not None:
+            keep &= feet <= param("fAltU")
+        return batch[keep]
+
+    def _handler(self):
+        mock = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                with mock.lock:
+                    mock.stats["requests"] += 1
+                if url.path == "/stats":
+                    fault, delay = None, 0.0
+                else:
+                    fault, delay = mock.fault()
+                if delay:
+                    time.sleep(delay)
+                if fault:
+                    with mock.lock:
+                        mock.stats[fault + "s"] += 1
+                if fault == "error":
+                    self.send_error(503)
+                    return
+                doc = mock.document(url.path, urllib.parse.parse_qs(url.query))
+                if doc is None:
+                    with mock.lock:
+                        mock.stats["not_found"] += 1
+                    self.send_error(404)
+                    return
+                body = json.dumps(doc, separators=(',', ':')).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    #
+                    # The client gave up waiting
+                    #
+                    with mock.lock:
+                        mock.stats["abandoned"] += 1
+                    return
+                with mock.lock:
+                    mock.stats["served"] += 1
+                    mock.stats["bytes"] += len(body)
+                    if isinstance(doc, list):
+                        mock.stats["aircraft"] += len(doc)
+                    elif url.path != "/stats":
+                        mock.stats["aircraft"] += len(doc.get("aircraft", doc.get("acList", [])))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serves requests from a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,276 @@
+"""
+Module containing helpers shared by the movie making programs,
+planeplotmovie.py and planeplot3dmovie.py.
+"""
+import io
+import collections
+import multiprocessing
+import numpy as np
+import matplotlib.animation as animation
+
+#
+# Set by saveMovie just before the worker processes are forked, so they
+# inherit the figure and its init/update functions.
+#
+movie_state = {}
+
+
+class RawFrameWriter(animation.FFMpegWriter):
+    """
+    An FFMpegWriter that can also be fed frames which have already been
+    rendered, in its frame_format, elsewhere.
+    """
+
+    def writeFrame(self, data):
+        self._proc.stdin.write(data)
+
+
+class LabelPool(object):
+    """
+    A reusable set of text labels for the planes in a movie. Rather than making
+    new text artists each frame, the ones from earlier frames are moved and
+    relabelled, with any left over hidden. The pool only grows to the most
+    planes labelled in any one frame.
+
+    Args:
+        newLabel: function returning a new, empty text artist
+    """
+
+    def __init__(self, newLabel):
+        self.newLabel = newLabel
+        self.labels = []
+        self.shown = 0
+
+    def update(self, texts, xs, ys, zs=None):
+        """
+        Shows the labels for a frame.
+
+        Args:
+            texts: list of the label strings
+            xs, ys: positions of the labels, in data coordinates
+            zs: altitudes of the labels, for 3D plots (optional)
+
+        Returns:
+            list of all the labels, for returning to FuncAnimation
+        """
+        while len(self.labels) < len(texts):
+            self.labels.append(self.newLabel())
+        for i, txt in enumerate(texts):
+            label = self.labels[i]
+            label.set_text(txt)
+            label.set_position((xs[i], ys[i]))
+            if zs is not None:
+                label.set_3d_properties(zs[i], None)
+            label.set_visible(True)
+        for label in self.labels[len(texts):self.shown]:
+            label.set_visible(False)
+        self.shown = len(texts)
+        return self.labels
+
+
+class TrailBuffer(object):
+    """
+    Keeps the most recent positions of each plane for drawing trails behind them,
+    in a fixed size numpy ring buffer per plane, so a frame only costs in proportion
+    to the number of planes on screen times the trail length.
+
+    Args:
+        trailLength: Number of frames a position stays in the trail for
+        dims: 2 for flat plots, 3 for ones with altitude (optional)
+    """
+
+    def __init__(self, trailLength, dims=2):
+        self.trailLength = trailLength
+        self.dims = dims
+        self.reset()
+
+    def reset(self):
+        """Forget all the trails"""
+        self.frame = None
+        self.slots = {}
+        self.free = []
+        self.points = np.zeros((0, self.trailLength, self.dims))
+        self.pointFrames = np.zeros((0, self.trailLength), dtype=np.int64)
+        self.heads = np.zeros(0, dtype=np.int64)
+        self.lastseen = np.zeros(0, dtype=np.int64)
+
+    def _grow(self):
+        num = max(16, len(self.heads))
+        self.free.extend(range(len(self.heads) + num - 1, len(self.heads) - 1, -1))
+        self.points = np.concatenate((self.points, np.zeros((num, self.trailLength, self.dims))))
+        self.pointFrames = np.concatenate((self.pointFrames, np.zeros((num, self.trailLength), dtype=np.int64)))
+        self.heads = np.concatenate((self.heads, np.zeros(num, dtype=np.int64)))
+        self.lastseen = np.concatenate((self.lastseen, np.zeros(num, dtype=np.int64)))
+
+    def add(self, frame, keys, points):
+        """
+        Adds a frame's positions to the trails.
+
+        Args:
+            frame: the frame number
+            keys: list of the planes' hex codes
+            points: numpy array of their positions, one row per plane
+        """
+        #
+        # Planes whose trails have completely faded give up their slots
+        #
+        for key, slot in list(self.slots.items()):
+            if frame - self.lastseen[slot] >= self.trailLength:
+                del self.slots[key]
+                self.free.append(slot)
+        slots = np.zeros(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                if not self.free:
+                    self._grow()
+                slot = self.free.pop()
+                self.slots[key] = slot
+                self.heads[slot] = 0
+                self.pointFrames[slot] = frame - self.trailLength
+            slots[i] = slot
+        self.points[slots, self.heads[slots]] = points
+        self.pointFrames[slots, self.heads[slots]] = frame
+        self.heads[slots] = (self.heads[slots] + 1) % self.trailLength
+        self.lastseen[slots] = frame
+        self.frame = frame
+
+    def advanceTo(self, frame, framePoints):
+        """
+        Brings the trails up to date for a frame, adding its positions. If the
+        previous frame wasn't the last one added (the first frame a parallel
+        worker draws, say), the trails are rebuilt from the frames leading up
+        to it, so they come out the same however the frames are split up.
+
+        Args:
+            frame: the frame number
+            framePoints: function returning (keys, points) for a frame number
+        """
+        if self.frame != frame - 1:
+            self.reset()
+            for prev in range(max(0, frame - self.trailLength + 1), frame):
+                self.add(prev, *framePoints(prev))
+        self.add(frame, *framePoints(frame))
+
+    def segments(self):
+        """
+        Returns the trails as line segments, oldest first for each plane, with an
+        alpha for each that fades with age.
+
+        Returns:
+            (numpy array of segments, shape (n, 2, dims), numpy array of n alphas)
+        """
+        #
+        # Ordered by hex code, rather than slot, so that the drawing order
+        # doesn't depend on the order the planes turned up in.
+        #
+        slots = np.array([self.slots[key] for key in sorted(self.slots)], dtype=np.int64)
+        if not len(slots):
+            return np.zeros((0, 2, self.dims)), np.zeros(0)
+        #
+        # Unroll each ring buffer so that its newest point is last, then pair up
+        # neighbouring points, dropping pairs with a point that's aged out.
+        #
+        order = (self.heads[slots, None] + np.arange(self.trailLength)) % self.trailLength
+        trails = self.points[slots[:, None], order]
+        age = self.frame - self.pointFrames[slots[:, None], order]
+        segs = np.stack((trails[:, :-1], trails[:, 1:]), axis=2)
+        valid = age[:, :-1] < self.trailLength
+        alphas = 1.0 - age[:, 1:] / float(self.trailLength)
+        return segs[valid], alphas[valid]
+
+
+def renderFrames(frames):
+    """
+    Worker function - renders a run of frames, in order.
+
+    Args:
+        frames: range of frame numbers
+
+    Returns:
+        list of the raw image data of each frame
+    """
+    fig = movie_state["fig"]
+    update = movie_state["update"]
+    width, height = movie_state["size"]
+    if movie_state["init"] and not movie_state.get("initialised"):
+        movie_state["init"]()
+        movie_state["initialised"] = True
+    retlist = []
+    for frame in frames:
+        update(frame)
+        fig.set_size_inches(width, height)
+        buf = io.BytesIO()
+        fig.savefig(buf, format=movie_state["format"], dpi=movie_state["dpi"])
+        retlist.append(buf.getvalue())
+    return retlist
+
+
+def frameChunks(numFrames, jobs, chunkSize=None):
+    """
+    Split the frames into contiguous runs to hand to the workers. Runs are kept
+    short enough that each worker gets several, so they all finish at about the
+    same time.
+    """
+    if not chunkSize:
+        chunkSize = max(1, min(25, numFrames // (jobs * 4)))
+    return [range(start, min(start + chunkSize, numFrames))
+            for start in range(0, numFrames, chunkSize)]
+
+
+def saveMovie(fig, update, numFrames, outfile, init=None, fps=25, codec='h264',
+              jobs=None, chunkSize=None, debug=False):
+    """
+    Renders a movie across a pool of worker processes, each drawing runs of
+    frames with the Agg backend, and pipes the frames, in order, to a single
+    ffmpeg process. The frames are drawn and encoded exactly as
+    FuncAnimation.save() would.
+
+    Args:
+        fig: The matplotlib figure
+        update: function drawing a frame, given its number, as for FuncAnimation
+        numFrames: The number of frames
+        outfile: Name of the movie file to write
+        init: function to set up the figure before the first frame (optional)
+        fps: Frames per second of the movie (optional)
+        codec: ffmpeg codec (optional)
+        jobs: Number of worker processes, defaults to the number of CPUs (optional)
+        chunkSize: Number of frames handed to a worker at a time (optional)
+        debug: Print progress (optional)
+
+    Each worker only sees its own runs of frames, so update() has to depend only
+    on the frame number, not on what earlier frames drew. Uses fork to get the
+    figure into the workers, so isn't available on Windows.
+    """
+    if not jobs:
+        jobs = multiprocessing.cpu_count()
+    writer = RawFrameWriter(fps=fps, codec=codec)
+    chunks = frameChunks(numFrames, jobs, chunkSize)
+    with writer.saving(fig, outfile, fig.dpi):
+        movie_state.update(fig=fig, update=update, init=init, dpi=writer.dpi,
+                           format=writer.frame_format, size=fig.get_size_inches())
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+        try:
+            #
+            # Keep a couple of runs per worker in flight, so the rendered frames
+            # don't pile up in memory when ffmpeg is the bottleneck.
+            #
+            pending = collections.deque()
+            next_chunk = 0
+            done = 0
+            while pending or next_chunk < len(chunks):
+                while next_chunk < len(chunks) and len(pending) < jobs * 2:
+                    pending.append(pool.apply_async(renderFrames, (chunks[next_chunk],)))
+                    next_chunk += 1
+                for data in pending.popleft().get():
+                    writer.writeFrame(data)
+                    done += 1
+                if debug:
+                    print("Written", done, "of", numFrames, "frames")
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
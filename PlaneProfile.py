@@ -0,0 +1,243 @@
+"""
+Module for profiling the command line scripts, without editing or wrapping them.
+
+Every script adds the profiling options to its parser (addProfileArgs), and runs
+its main() through runMain, which looks for them on the command line - or in the
+PLANEREPORT_PROFILE environment variable, as they would be given on the command
+line ("--profile sample --tracemalloc 10"), or just the name of a profiler - and
+runs main() under:
+
+    --profile cprofile     cProfile, writing <script>.pstats (for pstats, snakeviz
+                           or gprof2dot)
+    --profile sample       a sampling profiler, which looks at the main thread's
+                           stack every --profile-interval milliseconds, writing
+                           <script>.collapsed - the folded stacks flamegraph.pl,
+                           inferno and speedscope read
+    --tracemalloc N        tracemalloc, keeping N frames of each allocation,
+                           writing a snapshot to <script>.tracemalloc when the
+                           script ends (and <script>.<n>.tracemalloc every
+                           --tracemalloc-interval seconds, if given), and printing
+                           the lines that allocated most
+
+Output goes to --profile-output (the extension is added for each kind of output)
+or the script's name in the current directory. The profiles are written however
+the script ends, including exit() and Ctrl-C, so a logger left running can be
+profiled, and the summary goes to stderr, out of the way of reports printed to
+stdout.
+
+Scripts can also be run in-process, without profiling, by importing them and
+calling main() with a list of arguments.
+"""
+import os
+import sys
+import time
+import shlex
+import pstats
+import cProfile
+import argparse
+import threading
+import tracemalloc
+import collections
+
+ENV_VAR = "PLANEREPORT_PROFILE"
+PROFILERS = ["cprofile", "sample"]
+#
+# Milliseconds between samples of the sampling profiler, and the number of
+# functions or lines printed in the summaries
+#
+SAMPLE_INTERVAL = 5.0
+TOP = 20
+
+
+def addProfileArgs(parser):
+    """Adds the profiling options to a script's parser"""
+    group = parser.add_argument_group("profiling", "Options may also be given in the %s environment variable" %
+                                      ENV_VAR)
+    group.add_argument('--profile', dest='profile', choices=PROFILERS,
+                       help="Run under cProfile (writing .pstats) or a sampling profiler (writing folded "
+                       "stacks, .collapsed, for flame graphs)")
+    group.add_argument('--profile-output', dest='profileOutput', metavar='PATH',
+                       help="Pathname of the profiles, without the extension (default the script's name)")
+    group.add_argument('--profile-interval', dest='profileInterval', type=float, default=SAMPLE_INTERVAL,
+                       metavar='MS',
+                       help="Milliseconds between samples of the sampling profiler (default %g)" % SAMPLE_INTERVAL)
+    group.add_argument('--tracemalloc', dest='tracemalloc', type=int, default=0, metavar='FRAMES',
+                       help="Trace memory allocations, keeping this many frames of each, and write a snapshot at the end")
+    group.add_argument('--tracemalloc-interval', dest='tracemallocInterval', type=float, metavar='SECONDS',
+                       help="Also write a tracemalloc snapshot every this many seconds")
+    return parser
+
+
+def profileOptions(argv=None):
+    """
+    Picks the profiling options out of the environment and a command line, the
+    command line taking precedence.
+
+    Args:
+        argv: the command line arguments (optional, default sys.argv[1:])
+
+    Returns:
+        an argparse Namespace of the profiling options
+    """
+    parser = addProfileArgs(argparse.ArgumentParser(add_help=False, allow_abbrev=False))
+    env = os.environ.get(ENV_VAR, "").strip()
+    envArgs = shlex.split(env)
+    if len(envArgs) == 1 and not envArgs[0].startswith("-"):
+        envArgs = ["--profile", envArgs[0]]
+    options, unknown = parser.parse_known_args(envArgs)
+    if unknown:
+        print("Ignoring", " ".join(unknown), "in", ENV_VAR, file=sys.stderr)
+    options, unknown = parser.parse_known_args(sys.argv[1:] if argv is None else argv, namespace=options)
+    return options
+
+
+class SamplingProfiler(object):
+    """
+    Counts the stacks of a thread, looked at from a background thread every
+    interval seconds. Stacks start below the function which started the profiler.
+
+    Args:
+        interval: seconds between samples (optional)
+        threadId: the thread to sample (optional, default the calling thread)
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL / 1000.0, threadId=None):
+        self.interval = interval
+        self.threadId = threadId if threadId is not None else threading.get_ident()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = None
+        self.root = None
+
+    def _sample(self):
+        names = {}
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None and frame is not self.root:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename),
+                                                         code.co_firstlineno)
+                stack.append(name)
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self.root = sys._getframe(1)
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def write(self, pathname):
+        """Writes the stacks in the folded format, "outer;...;inner count" a line"""
+        with open(pathname, "w") as fp:
+            for stack, count in self.stacks.most_common():
+                fp.write("%s %d\n" % (stack, count))
+
+    def printSummary(self, top=TOP, out=sys.stderr):
+        """Prints the functions seen most, at the top of the stack and anywhere in it"""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        print("%d samples" % self.samples, file=out)
+        print("%8s %8s  function" % ("own%", "total%"), file=out)
+        for name, count in own.most_common(top):
+            print("%8.1f %8.1f  %s" % (100.0 * count / max(self.samples, 1), 100.0 * total[name] / max(self.samples, 1),
+                                         name), file=out)
+
+
+class _SnapshotTimer(object):
+    """Writes a tracemalloc snapshot every interval seconds, from a background thread"""
+
+    def __init__(self, base, interval):
+        self.base = base
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        taken = 0
+        while not self.stopping.wait(self.interval):
+            taken += 1
+            tracemalloc.take_snapshot().dump("%s.%d.tracemalloc" % (self.base, taken))
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+
+def printAllocations(snapshot, top=TOP, out=sys.stderr):
+    """Prints the lines which allocated the most memory still in use in a tracemalloc snapshot"""
+    stats = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+    print("%d KiB allocated, still in use, by:" % (sum(stat.size for stat in stats) // 1024), file=out)
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        print("%10d KiB %8d blocks  %s:%d" % (stat.size // 1024, stat.count, frame.filename, frame.lineno), file=out)
+
+
+def runMain(main, argv=None):
+    """
+    Runs a script's main() under the profilers asked for on its command line or
+    in the environment, or just runs it.
+
+    Args:
+        main: the script's main function, taking the list of arguments
+        argv: the command line arguments (optional, default sys.argv[1:])
+
+    Returns:
+        whatever main returns
+    """
+    options = profileOptions(argv)
+    if not options.profile and not options.tracemalloc:
+        return main(argv)
+    base = options.profileOutput or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "profile"
+    profiler = None
+    sampler = None
+    snapshots = None
+    if options.tracemalloc:
+        tracemalloc.start(options.tracemalloc)
+        if options.tracemallocInterval:
+            snapshots = _SnapshotTimer(base, options.tracemallocInterval)
+    if options.profile == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif options.profile == "sample":
+        sampler = SamplingProfiler(options.profileInterval / 1000.0).start()
+    t1 = time.perf_counter()
+    try:
+        return main(argv)
+    finally:
+        elapsed = time.perf_counter() - t1
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(base + ".pstats")
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(TOP)
+            print("Profile written to", base + ".pstats", file=sys.stderr)
+        if sampler:
+            sampler.stop()
+            sampler.write(base + ".collapsed")
+            sampler.printSummary()
+            print("Stacks written to", base + ".collapsed", file=sys.stderr)
+        if snapshots:
+            snapshots.stop()
+        if options.tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            snapshot.dump(base + ".tracemalloc")
+            printAllocations(snapshot)
+            print("Allocations written to", base + ".tracemalloc", file=sys.stderr)
+        print("%.3f seconds" % elapsed, file=sys.stderr)
@@ -7,13 +7,32 @@ import requests
 # from collections import namedtuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
+import psycopg2.pool
 import time
 import yaml
+import argparse
 from yaml import Loader
 import sys
 import io
+import os
+import re
+import itertools
+import mmap
+import zlib
+import bz2
+import lzma
+import queue
+import threading
+import collections
+import contextlib
+import concurrent.futures
+import numpy as np
 from math import radians, cos, sin, asin, sqrt
 from geographiclib.geodesic import Geodesic
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 def haversine(lon1, lat1, lon2, lat2):
@@ -258,7 +277,39 @@ class PlaneReport(object):
 #
 # Connect to the Database
 #
-def connDB(yamlfile, dbuser=None, dbhost=None, dbpasswd=None, dbport=5432):
+DB_POOL_SIZE = 4
+
+
+def dbConnParams(yamlfile, dbuser=None, dbhost=None, dbpasswd=None, dbport=None, poolSize=False):
+    """
+    Works out the connection parameters for the DB, from a yaml file with optional
+    overrides. Returned as a dict of keyword arguments for psycopg2.connect, so that
+    the password never ends up in a DSN string that might get printed.
+
+    The yaml file may also have dbname, dbport and pool_size entries. pool_size
+    (defaulting to DB_POOL_SIZE) is only included when poolSize is True, and has
+    to be taken out before the dict is passed to psycopg2.connect.
+    """
+    db_conf = {}
+    if not (dbuser and dbhost and dbpasswd):
+        with open(yamlfile, 'r') as db_cfg_file:
+            db_conf = yaml.load(db_cfg_file, Loader=Loader)["adsb_logger"]
+        if not dbhost:
+            dbhost = db_conf["dbhost"]
+        if not dbuser:
+            dbuser = db_conf["dbuser"]
+        if not dbpasswd:
+            dbpasswd = db_conf["dbpassword"]
+    if not dbport:
+        dbport = db_conf.get("dbport", 5432)
+    params = {"dbname": db_conf.get("dbname", "PlaneReports"), "user": dbuser,
+              "host": dbhost, "password": dbpasswd, "port": dbport}
+    if poolSize:
+        params["pool_size"] = db_conf.get("pool_size", DB_POOL_SIZE)
+    return params
+
+
+def connDB(yamlfile, dbuser=None, dbhost=None, dbpasswd=None, dbport=None, printTiming=False):
     """
     Makes a connection to a Postgres DB, dictated by a yaml file, with optional
     overides.
@@ -268,7 +319,8 @@ def connDB(yamlfile, dbuser=None, dbhost=None, dbpasswd=None, dbport=5432):
         dbuser: Contains name of database user to login (optional)
         dbhost: Name of host that DB is running on (optional)
         dbpasswd: Password for the DB account (optional)
-        dbport: Portnumber to connect to on DB host (optional)
+        dbport: Portnumber to connect to on DB host (optional, defaults to 5432)
+        printTiming: Print how long the connection took to make (optional)
 
     Returns:
         psycopg2 DB connection
@@ -279,35 +331,199 @@ def connDB(yamlfile, dbuser=None, dbhost=None, dbpasswd=None, dbport=5432):
             dbuser: some_username
             dbpassword: S3kr1t_P4ssw0rd
     """
-    dbconn = None
-    #
-    # Also allow yaml file to be completely or partially overridden
-    #
-    if not (dbuser and dbhost and dbpasswd):
-        with open(yamlfile, 'r') as db_cfg_file:
-            db_conf = yaml.load(db_cfg_file, Loader=Loader)
-        if not dbhost:
-            dbhost = db_conf["adsb_logger"]["dbhost"]
-        if not dbuser:
-            dbuser = db_conf["adsb_logger"]["dbuser"]
-        if not dbpasswd:
-            dbpasswd = db_conf["adsb_logger"]["dbpassword"]
-    connect_str = "dbname=PlaneReports user=" + dbuser + " host=" + \
-        dbhost + " password=" + dbpasswd + " port=" + str(dbport)
+    params = dbConnParams(yamlfile, dbuser=dbuser, dbhost=dbhost, dbpasswd=dbpasswd, dbport=dbport)
+    t1 = time.time()
     try:
-        dbconn = psycopg2.connect(connect_str)
-    except:
-        print("Can't connect to plane report database with " + connect_str)
+        dbconn = psycopg2.connect(**params)
+    except psycopg2.Error as err:
+        print("Can't connect to plane report database %s as %s on %s:%s - %s" %
+              (params["dbname"], params["user"], params["host"], params["port"], err))
         exit(-1)
+    if printTiming:
+        print("Connected to %s in %.3f secs" % (params["host"], time.time() - t1))
     return dbconn
 
 
+class DBPool(object):
+    """
+    A thread-safe pool of DB connections, so that threads (and the tools run back to
+    back within one process) can share connections rather than each making their own.
+
+    Connections that have sat idle for longer than healthCheckInterval seconds are
+    checked with a trivial query before being handed out, and are replaced if they've
+    gone bad. Counts and timings of connects and failures are kept in stats.
+
+    Use as:
+        pool = DBPool("dbconfig.yaml")
+        with pool.connection() as dbconn:
+            ...
+    """
+
+    def __init__(self, yamlfile, minconn=1, maxconn=None, dbuser=None, dbhost=None,
+                 dbpasswd=None, dbport=None, healthCheckInterval=30.0, retries=3,
+                 retryDelay=1.0):
+        self.params = dbConnParams(yamlfile, dbuser=dbuser, dbhost=dbhost, dbpasswd=dbpasswd,
+                                   dbport=dbport, poolSize=True)
+        poolSize = self.params.pop("pool_size")
+        if not maxconn:
+            maxconn = poolSize
+        self.maxconn = maxconn
+        self.pid = os.getpid()
+        self.healthCheckInterval = healthCheckInterval
+        self.retries = retries
+        self.retryDelay = retryDelay
+        self.stats = {"connects": 0, "connect_failures": 0, "connect_time": 0.0,
+                      "max_connect_time": 0.0, "health_failures": 0, "checkouts": 0}
+        self._lastused = {}
+        self._lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(maxconn)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(0, maxconn, **self.params)
+        #
+        # psycopg2 closes connections put back once it has minconn idle ones, so
+        # it's told to keep up to maxconn, having been made without connecting.
+        # The pool is seeded without touching _available, which only counts the
+        # connections handed out.
+        #
+        self._pool.minconn = maxconn
+        for i in range(minconn):
+            self._pool.putconn(self._connect())
+
+    def _connect(self):
+        """
+        Takes a connection from the underlying pool - an idle one, or a new one,
+        retrying a few times before giving up. Only new connections are counted,
+        and timed, as connects; they're recognised by not having been used yet.
+        """
+        for attempt in range(self.retries + 1):
+            t1 = time.time()
+            try:
+                dbconn = self._pool.getconn()
+            except psycopg2.OperationalError:
+                with self._lock:
+                    self.stats["connect_failures"] += 1
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retryDelay * (attempt + 1))
+                continue
+            elapsed = time.time() - t1
+            with self._lock:
+                if id(dbconn) not in self._lastused:
+                    #
+                    # Just made, so there's no need to check it before it's used
+                    #
+                    self._lastused[id(dbconn)] = time.time()
+                    self.stats["connects"] += 1
+                    self.stats["connect_time"] += elapsed
+                    self.stats["max_connect_time"] = max(self.stats["max_connect_time"], elapsed)
+            return dbconn
+
+    def _discard(self, dbconn):
+        """Closes a connection, forgetting when it was last used"""
+        with self._lock:
+            self._lastused.pop(id(dbconn), None)
+        self._pool.putconn(dbconn, close=True)
+
+    def _healthy(self, dbconn):
+        if dbconn.closed:
+            return False
+        if time.time() - self._lastused.get(id(dbconn), 0) < self.healthCheckInterval:
+            return True
+        try:
+            cur = dbconn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            dbconn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Takes a connection from the pool, waiting if they're all in use"""
+        self._available.acquire()
+        try:
+            dbconn = self._connect()
+            while not self._healthy(dbconn):
+                with self._lock:
+                    self.stats["health_failures"] += 1
+                self._discard(dbconn)
+                dbconn = self._connect()
+        except Exception:
+            self._available.release()
+            raise
+        with self._lock:
+            self.stats["checkouts"] += 1
+        return dbconn
+
+    def putconn(self, dbconn, close=False):
+        """Returns a connection to the pool, closing it if asked (or if it's broken)"""
+        if close or dbconn.closed:
+            self._discard(dbconn)
+        else:
+            with self._lock:
+                self._lastused[id(dbconn)] = time.time()
+            self._pool.putconn(dbconn)
+            if dbconn.closed:
+                #
+                # psycopg2 closes a connection whose server has gone away
+                #
+                with self._lock:
+                    self._lastused.pop(id(dbconn), None)
+        self._available.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager handing out a pooled connection. Commits when the block
+        finishes cleanly, otherwise rolls back, then returns the connection to the pool.
+        """
+        dbconn = self.getconn()
+        broken = False
+        try:
+            yield dbconn
+            dbconn.commit()
+        except Exception:
+            try:
+                dbconn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.putconn(dbconn, close=broken)
+
+    def closeall(self):
+        self._pool.closeall()
+
+    def printStats(self):
+        stats = dict(self.stats)
+        if stats["connects"]:
+            stats["mean_connect_time"] = stats["connect_time"] / stats["connects"]
+        print("DB pool", self.params["host"], json.dumps(stats, sort_keys=True))
+
+
+db_pools = {}
+db_pool_lock = threading.Lock()
+
+
+def getDBPool(yamlfile, **kwargs):
+    """
+    Returns the process wide DBPool for a yaml file, creating it on first use,
+    so that everything in a process shares one set of connections. A worker
+    process forked after the pool was made gets a pool of its own, rather than
+    sharing its parent's connections.
+    """
+    with db_pool_lock:
+        pool = db_pools.get(yamlfile)
+        if pool is None or pool.pid != os.getpid():
+            pool = db_pools[yamlfile] = DBPool(yamlfile, **kwargs)
+        return pool
+
+
 def queryReportsDB(dbconn, myhex=None, myStartTime=None, myEndTime=None, myflight=None,
                    preSql=None, postSql=None, maxAltitude=None, minAltitude=None,
                    reporterLocation=None, minDistance=None, maxDistance=None,
                    myReporter=None, maxSpeed=None, minSpeed=None, minVert_rate=None,
                    maxVert_rate=None, minRssi=None, maxRssi=None, minNucp=None, maxNucp=None,
-                   runways=None, printQuery=None):
+                   runways=None, printQuery=None, cursorName=None):
     """
     Function to set up and execute a query on the DB.
 
@@ -341,6 +557,8 @@ def queryReportsDB(dbconn, myhex=None, myStartTime=None, myEndTime=None, myfligh
         maxNucp: Look for Navigation Uncertainty Category - Position >= this
         runways: Look for reports located within this polygon WKB format (optional)
         printQuery: Display the constructed query to stdout for debugging (optional)
+        cursorName: Use a server side cursor of this name, so that large results are
+            fetched a bit at a time rather than all at once (optional)
 
     Returns:
         A psycopg2 cursor pointing to the results of the query
@@ -361,7 +579,8 @@ def queryReportsDB(dbconn, myhex=None, myStartTime=None, myEndTime=None, myfligh
     conditions = 0
     if myStartTime or myEndTime or myflight or myhex or (maxDistance and reporterLocation) \
            or (minDistance and reporterLocation) or maxAltitude or minAltitude or myReporter \
-           or minSpeed or maxSpeed or minVert_rate or maxVert_rate or runways:
+           or minSpeed or maxSpeed or minVert_rate or maxVert_rate or runways \
+           or minRssi or maxRssi or minNucp or maxNucp:
         sql = sql + " where "
 
     #
@@ -511,7 +730,7 @@ def queryReportsDB(dbconn, myhex=None, myStartTime=None, myEndTime=None, myfligh
     # Now execute the query
     #
     # Gets us a list of JSON objects
-    cur = dbconn.cursor(cursor_factory=RealDictCursor)
+    cur = dbconn.cursor(name=cursorName, cursor_factory=RealDictCursor)
     if printQuery:
         print(cur.mogrify(sql))
     cur.execute(sql)
@@ -537,21 +756,884 @@ def readReportsDB(cur, numRecs=100):
     return retlist
 
 
-def openFile(filename, encoding='latin-1'):
+def readBatchesDB(cur, numRecs=10000):
+    """
+    Read the position reports returned by queryReportsDB as ReportBatches,
+    rather than a PlaneReport at a time.
+
+    Args:
+        cur: psycopg2 cursor returned by queryReportsDB.
+        numRecs: Maximum number of reports in each batch (optional)
+
+    Yields:
+        ReportBatches, until the results run out, when the cursor is closed
+    """
+    while True:
+        data = cur.fetchmany(numRecs)
+        if not data:
+            break
+        yield ReportBatch.fromDicts(data)
+    cur.close()
+
+
+#
+# The options planedbreader.py takes for choosing reports from the DB, for the
+# programs that can read reports from either the DB or a file. Short forms are
+# left out where a program already uses them for something else.
+#
+DB_QUERY_ARGS = [
+    (('-y', '--db-conf-file'), dict(dest='db_conf',
+                                    help="A yaml file containing the DB connection parameters - if given, reports are read from the DB rather than a file")),
+    (('-t', '--start-time'), dict(dest='start_time',
+                                  help="The start of the time window from which records shall be retrieved, default 00:00 today")),
+    (('-T', '--end-time'), dict(dest='end_time',
+                                help="The end of the time window from which records shall be retrieved - default now")),
+    (('-x', '--hex'), dict(dest='hexcodes',
+                           help="The ICAO24 code(s) of the aircraft to be singled out, separated by commas")),
+    (('-f', '--flights'), dict(dest='flights',
+                               help="The flight numbers(s) of the aircraft to be singled out, separated by commas")),
+    (('-d', '--min-distance'), dict(dest='minDistance', type=float,
+                                    help="Minimum distance that the aircraft has to be from the reporter, in metres")),
+    (('-D', '--max-distance'), dict(dest='maxDistance', type=float,
+                                    help="Maximum distance that the aircraft has to be from the reporter, in metres")),
+    (('-A', '--max-altitude'), dict(dest='maxAltitude', type=float,
+                                    help="The aircraft has to be at an altitude lower than this (Units are in metres)")),
+    (('-a', '--min-altitude'), dict(dest='minAltitude', type=float,
+                                    help="The aircraft has to be at an altitude higher than this (Units are in metres)")),
+    (('-r', '--reporter'), dict(dest='reporter', default=None,
+                                help="Name of the reporting data collector")),
+    (('--min-rssi',), dict(dest='minRssi', type=float,
+                           help="The Received Signal Strength Indicator has to be higher than this (Units are in dB)")),
+    (('--max-rssi',), dict(dest='maxRssi', type=float,
+                           help="The Received Signal Strength Indicator has to be less than this (Units are in dB)")),
+    (('--min-nucp',), dict(dest='minNucp', type=float,
+                           help="The Navigational Uncertainity Category: Position to be higher than this")),
+    (('--max-nucp',), dict(dest='maxNucp', type=float,
+                           help="The Navigational Uncertainity Category: Position has to be less than this")),
+    (('--min-speed',), dict(dest='minSpeed', type=float,
+                            help="The aircraft has to be at a speed greater than or equal than this (Units are in km/h)")),
+    (('--max-speed',), dict(dest='maxSpeed', type=float,
+                            help="The aircraft has to be at a speed less than or equal than this (Units are in km/h)")),
+]
+
+
+def addDBQueryArgs(parser):
+    """
+    Adds planedbreader.py's options for choosing reports from the DB to a
+    program's argparse parser, leaving out the short forms it already uses.
+    """
+    for flags, kwargs in DB_QUERY_ARGS:
+        try:
+            parser.add_argument(*flags, **kwargs)
+        except argparse.ArgumentError:
+            parser.add_argument(*[flag for flag in flags if flag.startswith('--')], **kwargs)
+
+
+def readReportSource(args, numRecs=10000):
+    """
+    Works out where a program, with options added by addDBQueryArgs, reads its
+    reports from - the DB if a yaml file was given, otherwise the file named by
+    args.datafile.
+
+    Args:
+        args: The parsed arguments
+        numRecs: Maximum number of reports in each batch (optional)
+
+    Returns:
+        (generator of ReportBatches, the Reporter asked for, or None).
+        Reports from the DB come in time order, over a connection from the
+        process's DBPool, which goes back to the pool once they've all been read.
+    """
+    if not args.db_conf:
+        return ReportFileReader(openFile(args.datafile), numRecs=numRecs).batches(), None
+
+    pool = getDBPool(args.db_conf)
+    dbconn = pool.getconn()
+    try:
+        reporter = None
+        if args.reporter:
+            reporter = readReporter(dbconn, args.reporter, printQuery=args.debug)
+        if not args.start_time:
+            args.start_time = time.strftime("%F") + " 00:00:00"
+        cur = queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time,
+                             myEndTime=args.end_time, myflight=args.flights,
+                             minDistance=args.minDistance, maxDistance=args.maxDistance,
+                             minAltitude=args.minAltitude, maxAltitude=args.maxAltitude,
+                             minSpeed=args.minSpeed, maxSpeed=args.maxSpeed,
+                             minRssi=args.minRssi, maxRssi=args.maxRssi,
+                             minNucp=args.minNucp, maxNucp=args.maxNucp,
+                             myReporter=args.reporter,
+                             reporterLocation=reporter.location if reporter else None,
+                             printQuery=args.debug, postSql=" order by report_epoch",
+                             cursorName="reportsource")
+    except Exception:
+        pool.putconn(dbconn)
+        raise
+    return pooledBatches(pool, dbconn, cur, numRecs), reporter
+
+
+def pooledBatches(pool, dbconn, cur, numRecs=10000):
+    """
+    Yields the ReportBatches read by a cursor, as per readBatchesDB, then hands
+    the cursor's connection back to the pool it came from (also when the reader
+    stops early).
+    """
+    broken = False
+    try:
+        yield from readBatchesDB(cur, numRecs)
+    finally:
+        try:
+            cur.close()
+            dbconn.rollback()
+        except psycopg2.Error:
+            broken = True
+        pool.putconn(dbconn, close=broken)
+
+
+#
+# Compressed files are recognised by their leading magic bytes. For those formats
+# that can be made up of multiple independent members (concatenated gzip files,
+# pbzip2 output, zstd frames), MEMBER_PATTERNS finds where each member may start,
+# so that they can be decompressed in parallel.
+#
+COMPRESSION_MAGIC = [(b"\x1f\x8b", "gzip"), (b"BZh", "bzip2"),
+                     (b"\xfd7zXZ\x00", "xz"), (b"\x28\xb5\x2f\xfd", "zstd")]
+MEMBER_PATTERNS = {"gzip": re.compile(b"\x1f\x8b\x08[\x00-\x1f]"),
+                   "bzip2": re.compile(b"BZh[1-9]1AY&SY"),
+                   "zstd": re.compile(re.escape(b"\x28\xb5\x2f\xfd"))}
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+
+def compressionType(header):
+    """Returns the name of the compression format, given the first few bytes of a file, or None"""
+    for magic, kind in COMPRESSION_MAGIC:
+        if header.startswith(magic):
+            return kind
+    return None
+
+
+def newDecompressor(kind):
+    """
+    Returns a decompressor object for a compression format. All of them have
+    decompress(), eof and unused_data, and stop at the end of a member.
+    """
+    if kind == "gzip":
+        return zlib.decompressobj(wbits=31)
+    elif kind == "bzip2":
+        return bz2.BZ2Decompressor()
+    elif kind == "xz":
+        return lzma.LZMADecompressor()
+    elif kind == "zstd":
+        if zstandard is None:
+            print("The zstandard module is needed to read zstd compressed files")
+            exit(-1)
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError("Unknown compression type %s" % kind)
+
+
+def inputSize(kind, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Returns how much compressed data to feed a decompressor at a time. zstd can't
+    limit how much it outputs for its input, so it is fed less at a time.
+    """
+    return chunkSize // 64 if kind == "zstd" else chunkSize // 4
+
+
+def drainDecompress(decomp, data, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Feeds data to a decompressor, yielding its output no more than about chunkSize
+    bytes at a time, until the data is used up or the end of the member is reached
+    (after which unused_data holds whatever was left of data).
+    """
+    if hasattr(decomp, "unconsumed_tail"):
+        #
+        # zlib keeps the input it didn't get to in unconsumed_tail, and may have more
+        # output to give while any output chunk comes back full
+        #
+        out = decomp.decompress(data, chunkSize)
+        while True:
+            if out:
+                yield out
+            data = decomp.unconsumed_tail
+            if decomp.eof or (not data and len(out) < chunkSize):
+                return
+            out = decomp.decompress(data, chunkSize)
+    elif hasattr(decomp, "needs_input"):
+        #
+        # bz2 and lzma buffer the input they didn't get to themselves
+        #
+        out = decomp.decompress(data, chunkSize)
+        while True:
+            if out:
+                yield out
+            if decomp.eof or decomp.needs_input:
+                return
+            out = decomp.decompress(b"", chunkSize)
+    else:
+        out = decomp.decompress(data)
+        if out:
+            yield out
+
+
+def checkDecompressor(kind):
+    """
+    Exits if a compression format can't be read because the module it needs isn't
+    installed. Called before any decompressing thread is started.
+    """
+    if kind == "zstd" and zstandard is None:
+        print("The zstandard module is needed to read zstd compressed files")
+        exit(-1)
+
+
+def streamDecompress(fp, kind, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Yields decompressed chunks from a file handle, one member after another.
+    Used for files that can't be mapped (e.g. stdin) or only have one member.
+    """
+    decomp = newDecompressor(kind)
+    started = False
+    while True:
+        data = fp.read(inputSize(kind, chunkSize))
+        if not data:
+            break
+        #
+        # No member starts with a zero byte, so zeros between members are padding
+        #
+        if not started:
+            data = data.lstrip(b"\0")
+        while data:
+            started = True
+            for out in drainDecompress(decomp, data, chunkSize):
+                yield out
+            if not decomp.eof:
+                break
+            data = decomp.unused_data.lstrip(b"\0")
+            decomp = newDecompressor(kind)
+            started = False
+    if started and not decomp.eof:
+        raise EOFError("Compressed file ended before the end of the last member")
+
+
+NON_ZERO = re.compile(b"[^\x00]")
+
+
+def decompressRange(view, lo, hi, kind, decomp=None, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Yields the decompressed contents of view[lo:hi], one member after another, no
+    more than about chunkSize bytes at a time. Zero padding between members is skipped.
+
+    Args:
+        view: memoryview of the compressed data
+        lo: Offset of the start of the range
+        hi: Offset of the end of the range
+        kind: Compression format
+        decomp: Decompressor of a member begun before lo, to carry on with (optional)
+        chunkSize: Most output yielded at a time (optional)
+
+    Returns:
+        (as the value of the generator) the decompressor of a member left
+        unfinished at hi, or None
+    """
+    step = inputSize(kind, chunkSize)
+    pos = lo
+    while pos < hi:
+        if decomp is None:
+            start = NON_ZERO.search(view, pos, hi)
+            if start is None:
+                break
+            pos = start.start()
+            decomp = newDecompressor(kind)
+        end = min(pos + step, hi)
+        yield from drainDecompress(decomp, view[pos:end], chunkSize)
+        if decomp.eof:
+            pos = end - len(decomp.unused_data)
+            decomp = None
+        else:
+            pos = end
+    return decomp
+
+
+#
+# How much of a file is scanned for the starts of members at a time
+#
+SCAN_WINDOW = 1 << 24
+
+
+def releasePages(buf, lo, hi):
+    """
+    Lets the kernel drop the pages of an mmap'ed file between lo and hi from the
+    process, once they have been read (they are read back in if needed again).
+    Does nothing for other buffers, or where madvise isn't available.
+    """
+    if isinstance(buf, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+        lo = -(-lo // mmap.PAGESIZE) * mmap.PAGESIZE
+        hi = hi // mmap.PAGESIZE * mmap.PAGESIZE
+        if hi > lo:
+            buf.madvise(mmap.MADV_DONTNEED, lo, hi - lo)
+
+
+def findMemberStarts(buf, kind, pos=0):
+    """
+    Yields the offsets in a buffer where a member might start, a window at a time,
+    so that an mmap'ed file isn't all paged in at once.
+    """
+    pattern = MEMBER_PATTERNS[kind]
+    while pos < len(buf):
+        end = min(pos + SCAN_WINDOW, len(buf))
+        for m in pattern.finditer(buf, pos, min(end + 16, len(buf))):
+            if m.start() >= end:
+                break
+            yield m.start()
+        releasePages(buf, pos, end)
+        pos = end
+
+
+def decompressSegment(view, lo, hi, kind, results, stop, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Decompresses one segment of a file, view[lo:hi], starting at what looks like the
+    start of a member, for parallelDecompress. The output chunks are put on the
+    results queue, followed by a tuple holding the decompressor of any member left
+    unfinished at the end of the segment (or None), or by the exception if the
+    segment couldn't be decompressed. Gives up as soon as stop is set.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    chunks = decompressRange(view, lo, hi, kind, chunkSize=chunkSize)
+    try:
+        while True:
+            try:
+                out = next(chunks)
+            except StopIteration as end:
+                put((end.value,))
+                return
+            if not put(out):
+                return
+    except Exception as err:
+        put(err)
+
+
+SEGMENT_QUEUE_SIZE = 4
+
+
+def parallelDecompress(buf, kind, workers, chunkSize=DECOMPRESS_CHUNK_SIZE):
+    """
+    Yields decompressed chunks from a buffer (usually an mmap'ed file) holding
+    one or more members, decompressing up to workers segments at once.
+
+    The buffer is split at every place a member might start. Each segment is
+    decompressed speculatively in a thread pool (zlib, bz2 and zstd all release
+    the GIL), each thread getting no more than SEGMENT_QUEUE_SIZE chunks ahead,
+    so memory use depends on the number of workers rather than the size of the
+    members. Segments are then taken in order: if the previous segment ended
+    exactly at the end of its member, this segment's output is used, otherwise
+    the candidate was a false match within a member, and the previous
+    decompressor carries on through this segment instead.
+    """
+    view = memoryview(buf)
+    starts = list(findMemberStarts(buf, kind))
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = list(zip(starts, starts[1:] + [len(buf)]))
+    stops = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        nextseg = 0
+        decomp = None
+        try:
+            for seg in range(len(bounds)):
+                while nextseg < len(bounds) and nextseg < seg + workers:
+                    results = queue.Queue(SEGMENT_QUEUE_SIZE)
+                    stops.append(threading.Event())
+                    pending.append(results)
+                    pool.submit(decompressSegment, view, bounds[nextseg][0], bounds[nextseg][1], kind,
+                                results, stops[-1], chunkSize)
+                    nextseg += 1
+                results = pending.popleft()
+                lo, hi = bounds[seg]
+                if decomp is not None:
+                    #
+                    # False start - the previous member runs on through this segment
+                    #
+                    stops[seg].set()
+                    decomp = yield from decompressRange(view, lo, hi, kind, decomp, chunkSize)
+                else:
+                    while True:
+                        item = results.get()
+                        if isinstance(item, tuple):
+                            decomp = item[0]
+                            break
+                        if isinstance(item, Exception):
+                            raise IOError("Corrupt %s data in the member starting at offset %d: %s" % (kind, lo, item))
+                        yield item
+                releasePages(buf, lo, hi)
+        finally:
+            #
+            # Let any threads still working (or blocked on a full queue) go
+            #
+            for stop in stops:
+                stop.set()
+    if decomp is not None:
+        raise EOFError("Compressed file ended before the end of the last member")
+
+
+#
+# How much of each possible member start is decompressed to decide whether it is real
+#
+PROBE_SIZE = 1 << 16
+
+
+def isMultiMember(buf, kind):
+    """
+    Returns True if a buffer holds more than one member, that is if something
+    after its start both looks like the start of a member and decompresses as one.
+    """
+    view = memoryview(buf)
+    try:
+        for start in findMemberStarts(buf, kind, 1):
+            try:
+                for out in drainDecompress(newDecompressor(kind), view[start:start + PROBE_SIZE], PROBE_SIZE):
+                    pass
+            except Exception:
+                continue
+            return True
+        return False
+    finally:
+        view.release()
+
+
+class DecompressedStream(io.RawIOBase):
+    """
+    A raw, read only stream over the output of a decompressing generator. The
+    generator is run in a background thread, so that decompression overlaps
+    with whatever is consuming the stream (usually the JSON decoding).
+    """
+
+    def __init__(self, chunks, queueSize=8):
+        super().__init__()
+        self._queue = queue.Queue(queueSize)
+        self._buffer = b""
+        self._pos = 0
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _produce(self, chunks):
+        try:
+            for chunk in chunks:
+                if self._stop.is_set():
+                    return
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except BaseException as err:
+            #
+            # Anything at all, even SystemExit, is handed on, so the reader isn't left waiting
+            #
+            self._queue.put(err)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._buffer):
+            if self._finished:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._finished = True
+                return 0
+            if isinstance(item, BaseException):
+                self._finished = True
+                raise item
+            self._buffer = item
+            self._pos = 0
+        count = min(len(b), len(self._buffer) - self._pos)
+        b[:count] = self._buffer[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def close(self):
+        self._stop.set()
+        #
+        # Drain the queue so the producer isn't left blocked on a put
+        #
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        super().close()
+
+
+def openFile(filename, encoding='latin-1', workers=None):
     """
     Opens a plane ordinary file, usually containing the textual representations
     of PlaneReports produced by the to_JSON method.
 
+    gzip, bzip2, xz and zstd compressed files (or stdin) are recognised by their
+    magic bytes and decompressed on the fly. Files made up of several members
+    (e.g. a month of daily backups cat'ed together) are decompressed in parallel,
+    files with just one are streamed. Either way only a few chunks of output per
+    worker are held in memory at once.
+
     Args:
         filename: Pathname of file
+        encoding: Character encoding of the file (optional)
+        workers: Number of threads used to decompress members (optional, defaults to the number of CPUs)
 
     Returns:
         A valid file handle
     """
+    if not workers:
+        workers = os.cpu_count() or 1
     if filename == "-":
-        return io.TextIOWrapper(sys.stdin.buffer, encoding=encoding)
+        raw = sys.stdin.buffer
+        kind = compressionType(raw.peek(8)[:8])
+        if not kind:
+            return io.TextIOWrapper(raw, encoding=encoding)
+        checkDecompressor(kind)
+        stream = DecompressedStream(streamDecompress(raw, kind))
     else:
-        return open(filename, 'r', encoding=encoding)
+        raw = open(filename, 'rb')
+        kind = compressionType(raw.read(8))
+        if not kind:
+            raw.close()
+            return open(filename, 'r', encoding=encoding)
+        raw.seek(0)
+        checkDecompressor(kind)
+        buf = None
+        if kind in MEMBER_PATTERNS and workers > 1 and os.fstat(raw.fileno()).st_size > 0:
+            buf = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+            if not isMultiMember(buf, kind):
+                buf.close()
+                buf = None
+        if buf is not None:
+            raw.close()
+            stream = DecompressedStream(parallelDecompress(buf, kind, workers))
+        else:
+            stream = DecompressedStream(streamDecompress(raw, kind))
+    return io.TextIOWrapper(io.BufferedReader(stream, DECOMPRESS_CHUNK_SIZE), encoding=encoding)
+
+
+#
+# Columns held by a ReportBatch, split up by the type of numpy array they live in
+#
+BATCH_FLOAT_COLS = ["time", "lat", "lon", "vert_rate", "track", "rssi"]
+BATCH_INT_COLS = ["altitude", "speed", "messages", "nucp"]
+BATCH_BOOL_COLS = ["isGnd", "mlat"]
+BATCH_STR_COLS = ["hex", "squawk", "flight", "reporter", "report_location"]
+BATCH_COLS = BATCH_FLOAT_COLS + BATCH_INT_COLS + BATCH_BOOL_COLS + BATCH_STR_COLS
+BATCH_DEFAULTS = {"time": 0, "lat": 0.0, "lon": 0.0, "altitude": 0, "speed": 0,
+                  "vert_rate": 0.0, "track": 0, "rssi": -49.5, "nucp": -1, "messages": 0,
+                  "mlat": False, "hex": None, "squawk": None, "flight": None,
+                  "reporter": None, "report_location": None}
+
+
+class ReportBatch(object):
+    """
+    A columnar batch of plane reports - one numpy array per attribute, all in
+    metric units. Used where building a PlaneReport per record would be the
+    dominant cost (bulk loads, plotting, vectorised filtering).
+    PlaneReports are only built on demand, via planes().
+    """
+
+    def __init__(self, **columns):
+        for col in BATCH_COLS:
+            setattr(self, col, columns[col])
+
+    @classmethod
+    def fromDicts(cls, records):
+        """
+        Build a batch from a list of dicts, as decoded from to_JSON lines or a DB row.
+
+        Applies the same defaults and feet/knots to metric conversion as PlaneReport,
+        but one column at a time.
+        """
+        columns = {}
+        for col in BATCH_FLOAT_COLS:
+            dflt = BATCH_DEFAULTS[col]
+            columns[col] = np.array([rec.get(col, dflt) for rec in records], dtype=np.float64)
+        #
+        # Integer columns get converted to floats first, so missing values can be
+        # filled in and the unit conversion done before truncating them.
+        #
+        for col in BATCH_INT_COLS:
+            dflt = BATCH_DEFAULTS[col]
+            columns[col] = np.array([rec.get(col, dflt) for rec in records], dtype=np.float64)
+        for col in BATCH_STR_COLS:
+            dflt = BATCH_DEFAULTS[col]
+            columns[col] = np.array([rec.get(col, dflt) for rec in records], dtype=object)
+        columns["mlat"] = np.array([bool(rec.get("mlat", False)) for rec in records], dtype=bool)
+        #
+        # Records that aren't already metric get converted (with the same truncation
+        # to whole metres & km/h that PlaneReport.convertToMetric does)
+        #
+        imperial = ~np.array([bool(rec.get("isMetric", False)) for rec in records], dtype=bool)
+        if imperial.any():
+            columns["vert_rate"][imperial] *= FEET_TO_METRES
+            columns["altitude"][imperial] = np.trunc(columns["altitude"][imperial] * FEET_TO_METRES)
+            columns["speed"][imperial] = np.trunc(columns["speed"][imperial] * KNOTS_TO_KMH)
+        for col in BATCH_INT_COLS:
+            columns[col] = np.nan_to_num(columns[col]).astype(np.int64)
+        #
+        # isGnd defaults to being on the ground at zero altitude
+        #
+        gnd = [rec.get("isGnd", rec.get("isgnd")) for rec in records]
+        columns["isGnd"] = np.array([g if g is not None else False for g in gnd], dtype=bool)
+        unknown = np.array([g is None for g in gnd], dtype=bool)
+        columns["isGnd"][unknown] = columns["altitude"][unknown] == 0
+        return cls(**columns)
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Join a list of batches into one"""
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return cls.fromDicts([])
+        columns = {}
+        for col in BATCH_COLS:
+            columns[col] = np.concatenate([getattr(b, col) for b in batches])
+        return cls(**columns)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        """Select records with a slice, index array or boolean mask, returning a new batch"""
+        columns = {}
+        for col in BATCH_COLS:
+            columns[col] = getattr(self, col)[index]
+        return ReportBatch(**columns)
+
+    @classmethod
+    def fromPlanes(cls, planes):
+        """Build a batch from a list of PlaneReports"""
+        return cls.fromDicts([plane.__dict__ for plane in planes])
+
+    def columnValues(self, col):
+        """
+        Returns a column as a list of python values, in the types a to_JSON line is
+        read back as - whole time, track and vert_rate values as ints - so that
+        reports written from a batch look the same as before.
+        """
+        values = getattr(self, col)
+        if col in ("time", "track", "vert_rate"):
+            whole = np.isfinite(values) & (values == np.trunc(values))
+            if whole.any():
+                mixed = values.astype(object)
+                mixed[whole] = values[whole].astype(np.int64).tolist()
+                return mixed.tolist()
+        return values.tolist()
+
+    def planes(self):
+        """Yields a PlaneReport for each record in the batch"""
+        for values in zip(*[self.columnValues(col) for col in BATCH_COLS]):
+            kwargs = dict(zip(BATCH_COLS, values))
+            kwargs["isMetric"] = True
+            yield PlaneReport(**kwargs)
+
+    def sortByTime(self):
+        """Returns a copy of the batch ordered by report time (stable, so ties keep their order)"""
+        return self[np.argsort(self.time, kind="stable")]
+
+    def distances(self, lon, lat):
+        """
+        Returns an array of the distance in metres of each report from a point,
+        using the haversine formula, as per haversine().
+        """
+        lon1, lat1, lon2, lat2 = map(np.radians, [self.lon, self.lat, lon, lat])
+        a = np.sin((lat2 - lat1) / 2.0) ** 2 + \
+            np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+        return 2 * np.arcsin(np.sqrt(a)) * 6371000
+
+    def bearings(self, lon, lat):
+        """
+        Returns an array of the initial bearing, in degrees clockwise from north,
+        of each report as seen from a point.
+        """
+        lon1, lat1, lon2, lat2 = map(np.radians, [lon, lat, self.lon, self.lat])
+        dlon = lon2 - lon1
+        x = np.sin(dlon) * np.cos(lat2)
+        y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+        return np.degrees(np.arctan2(x, y)) % 360.0
+
+    def toJSONLines(self):
+        """
+        Returns a list of one line JSON representations of the records, in the same
+        form as PlaneReport.to_JSON, without building the PlaneReports.
+        """
+        cols = sorted(BATCH_COLS + ["isMetric"])
+        values = [self.columnValues(col) if col != "isMetric" else itertools.repeat(True)
+                  for col in cols]
+        return [json.dumps(dict(zip(cols, row)), sort_keys=True, separators=(',', ':'))
+                for row in zip(*values)]
+
+    def copyToDB(self, dbconn, printQuery=False):
+        """
+        Bulk loads the batch into the planereports table with COPY, which is much
+        quicker than an INSERT per report. The caller commits.
+
+        Args:
+            dbconn: An existing connection to the PostGIS DB
+            printQuery: A boolean which controls printing of the COPY statement
+
+        Raises:
+            psycopg2 exceptions
+        """
+        def textCol(col):
+            return [copyEscape(val) for val in getattr(self, col).tolist()]
+
+        def boolCol(col):
+            return ["t" if val else "f" for val in getattr(self, col).tolist()]
+
+        #
+        # integer columns in the DB get rounded, as the INSERT casts would have done
+        #
+        def intCol(col):
+            return [str(val) for val in np.floor(getattr(self, col) + 0.5).astype(np.int64).tolist()]
+
+        def floatCol(col):
+            return [repr(val) for val in getattr(self, col).tolist()]
+
+        locations = ["SRID=4326;POINT(%r %r)" % (lon, lat)
+                     for lon, lat in zip(self.lon.tolist(), self.lat.tolist())]
+        columns = [textCol("hex"), textCol("squawk"), textCol("flight"),
+                   ["t"] * len(self), boolCol("mlat"), floatCol("altitude"),
+                   floatCol("speed"), floatCol("vert_rate"), intCol("track"), locations,
+                   intCol("messages"), intCol("time"), textCol("reporter"),
+                   floatCol("rssi"), intCol("nucp"), boolCol("isGnd")]
+        data = io.StringIO("".join("\t".join(row) + "\n" for row in zip(*columns)))
+        sql = '''COPY planereports (hex, squawk, flight, "isMetric", "isMLAT", altitude, speed, vert_rate, bearing, report_location, messages_sent, report_epoch, reporter, rssi, nucp, isgnd) FROM STDIN'''
+        if printQuery:
+            print(sql)
+        cur = dbconn.cursor()
+        cur.copy_expert(sql, data)
+        cur.close()
+
+
+def copyEscape(val):
+    """Escape a value for a COPY text format row, None becoming NULL"""
+    if val is None:
+        return "\\N"
+    return str(val).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+READ_CHUNK_SIZE = 1 << 20
+
+
+def decodeLines(lines, stats=None, quiet=False):
+    """
+    Decode a list of to_JSON lines into a list of dicts.
+
+    The whole list is handed to the JSON decoder as a single array, which is much
+    quicker than a json.loads per line. Should that fail, we fall back to decoding
+    line by line so that the faulty ones can be counted and skipped.
+
+    Args:
+        lines: list of strings, each holding one JSON object
+        stats: a ReportFileReader (or anything with a faulty_lines attr) to count faults against (optional)
+        quiet: Don't print faulty lines (optional)
+
+    Returns:
+        A list of dicts, one per valid line
+    """
+    lines = [line for line in lines if line and not line.isspace()]
+    if not lines:
+        return []
+    try:
+        records = json.loads("[" + ",".join(lines) + "]")
+        if len(records) == len(lines) and all(type(rec) is dict for rec in records):
+            return records
+    except ValueError:
+        pass
+    records = []
+    for line in lines:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            rec = None
+        if type(rec) is dict:
+            records.append(rec)
+        else:
+            if stats is not None:
+                stats.faulty_lines += 1
+            if not quiet:
+                print("Faulty line ", line.rstrip())
+    return records
+
+
+class ReportFileReader(object):
+    """
+    Streaming decoder for files of PlaneReport to_JSON lines.
+
+    Reads the file in large chunks, splits them into lines, and decodes each
+    numRecs lines in bulk. Iterating over the reader yields lists of PlaneReports,
+    batches() yields ReportBatches instead. Counts of lines read and faulty
+    lines skipped are kept as it goes.
+    """
+
+    def __init__(self, inputfile, numRecs=100, chunkSize=READ_CHUNK_SIZE, quiet=False):
+        self.inputfile = inputfile
+        self.numRecs = numRecs
+        self.chunkSize = chunkSize
+        self.quiet = quiet
+        self.lines_read = 0
+        self.faulty_lines = 0
+        self.records_read = 0
+
+    def lineGroups(self):
+        """Yields lists of up to numRecs raw lines from the file"""
+        carry = ""
+        pending = []
+        while True:
+            chunk = self.inputfile.read(self.chunkSize)
+            if not chunk:
+                break
+            end = chunk.rfind("\n")
+            if end == -1:
+                carry = carry + chunk
+                continue
+            lines = chunk[:end].split("\n")
+            if carry:
+                lines[0] = carry + lines[0]
+            carry = chunk[end + 1:]
+            pending.extend(lines)
+            while len(pending) >= self.numRecs:
+                group = pending[:self.numRecs]
+                del pending[:self.numRecs]
+                self.lines_read += len(group)
+                yield group
+        if carry:
+            pending.append(carry)
+        while pending:
+            group = pending[:self.numRecs]
+            del pending[:self.numRecs]
+            self.lines_read += len(group)
+            yield group
+
+    def records(self):
+        """Yields lists of decoded dicts, of up to numRecs each"""
+        for group in self.lineGroups():
+            records = decodeLines(group, stats=self, quiet=self.quiet)
+            if records:
+                self.records_read += len(records)
+                yield records
+
+    def __iter__(self):
+        for records in self.records():
+            yield [PlaneReport(**rec) for rec in records]
+
+    def batches(self):
+        """Yields ReportBatches of up to numRecs records each"""
+        for records in self.records():
+            yield ReportBatch.fromDicts(records)
 
 
 def readFromFile(inputfile, numRecs=100):
@@ -563,21 +1645,206 @@ def readFromFile(inputfile, numRecs=100):
         numRecs: Return up to this number of records per call (optional)
 
     Returns:
-        A list of PlaneReports
+        A list of PlaneReports, empty at the end of the file. Faulty lines are
+        skipped, so fewer than numRecs may be returned before then.
+
+    For large files, iterating over a ReportFileReader is much quicker.
     """
     retlist = []
+    while not retlist:
+        lines = list(itertools.islice(inputfile, numRecs))
+        if not lines:
+            break
+        retlist = [PlaneReport(**rec) for rec in decodeLines(lines)]
+    return retlist
 
 
-    for i, line_terminated in enumerate(inputfile):
-        try:
-            data = json.loads(line_terminated.rstrip('\n'))
-        except:
-            print("Faulty line ", line_terminated.rstrip('\n'))
-        plane = PlaneReport(**data)
-        retlist.append(plane)
-        if i > numRecs:
+def readBatchFromFile(inputfile, numRecs=10000):
+    """
+    Reads a whole file of PlaneReport records into a single ReportBatch
+
+    Args:
+        inputfile: A filehandle returned by openFile
+        numRecs: Number of records decoded at a time (optional)
+
+    Returns:
+        A ReportBatch, in file order
+    """
+    return ReportBatch.concatenate(list(ReportFileReader(inputfile, numRecs=numRecs).batches()))
+
+
+def frameOffsets(times, startTime, secPerFrame):
+    """
+    Splits a sorted array of report times into frames of a movie.
+
+    Args:
+        times: numpy array of times, in ascending order
+        startTime: time of the start of the first frame
+        secPerFrame: number of seconds each frame covers
+
+    Returns:
+        numpy array of numFrames + 1 offsets into times, so frame i covers
+        times[offsets[i]:offsets[i + 1]]. Frames with no reports are empty.
+    """
+    if not len(times):
+        return np.zeros(1, dtype=np.int64)
+    numFrames = int((times[-1] - startTime) // secPerFrame) + 1
+    edges = startTime + secPerFrame * np.arange(1, numFrames)
+    return np.concatenate(([0], np.searchsorted(times, edges, side='left'), [len(times)]))
+
+def iterVRSAircraft(inputfile, chunkSize=READ_CHUNK_SIZE):
+    """
+    Incrementally parses the acList array of a VRS AircraftList.json style
+    document, yielding one aircraft dict at a time, so that the whole file
+    never has to be held in memory.
+
+    Args:
+        inputfile: A filehandle returned by openFile
+        chunkSize: Number of characters to read at a time (optional)
+
+    Yields:
+        dicts, one per aircraft in acList. Stops early at the first
+        malformed aircraft or the end of a truncated file.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = -1
+    eof = False
+    #
+    # Find the start of the acList array
+    #
+    while pos == -1:
+        chunk = inputfile.read(chunkSize)
+        if not chunk:
+            return
+        buf = buf + chunk
+        pos = buf.find('"acList"')
+    while True:
+        pos = buf.find("[", pos)
+        if pos != -1:
+            pos += 1
             break
-    return retlist
+        chunk = inputfile.read(chunkSize)
+        if not chunk:
+            return
+        buf = buf + chunk
+        pos = 0
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+            pos += 1
+        if pos < len(buf):
+            if buf[pos] == "]":
+                return
+            try:
+                aircraft, pos = decoder.raw_decode(buf, pos)
+                yield aircraft
+                continue
+            except ValueError:
+                if eof:
+                    return
+        elif eof:
+            return
+        #
+        # Ran out of buffered data part way through an aircraft - read some more
+        #
+        buf = buf[pos:]
+        pos = 0
+        chunk = inputfile.read(chunkSize)
+        if not chunk:
+            eof = True
+        buf = buf + chunk
+
+
+def readVRSBatchFromFile(inputfile):
+    """
+    Reads a file of VRS records (from the daily archive) into a ReportBatch.
+
+    Only aircraft with an altitude ('a') or speed ('s') short trail are used, with one
+    report per trail point. The trails of every aircraft are gathered into one
+    (n x 4) array of lat, lon, time, value; checked with vectorised masks, and the
+    fields that don't change along a trail are broadcast across it.
+
+    Args:
+        inputfile: A filehandle returned by openFile
+
+    Returns:
+        A ReportBatch, in metric units
+    """
+    cos = []
+    counts = []
+    statics = {"hex": [], "squawk": [], "flight": [], "altitude": [], "speed": [],
+               "track": [], "isGnd": [], "messages": [], "mlat": [], "vert_rate": [],
+               "TT": []}
+    for pl in iterVRSAircraft(inputfile):
+        valid = True
+        for keywrd in VRSFILE_KEYWRDS:
+            if keywrd not in pl:
+                valid = False
+                break
+        if not valid or (pl['TT'] != 'a' and pl['TT'] != 's'):
+            continue
+        numpos = len(pl['Cos']) // 4
+        if not numpos:
+            continue
+        cos.extend(pl['Cos'][:numpos * 4])
+        counts.append(numpos)
+        statics["hex"].append(pl['Icao'].lower())
+        statics["squawk"].append(pl['Sqk'])
+        if 'Call' in pl:
+            statics["flight"].append(FLT_FMT.format(pl['Call']))
+        else:
+            statics["flight"].append(' ')
+        statics["altitude"].append(pl['Alt'])
+        statics["speed"].append(pl['Spd'])
+        statics["track"].append(pl['Trak'])
+        statics["isGnd"].append(bool(pl['Gnd']))
+        statics["messages"].append(pl['CMsgs'])
+        statics["mlat"].append(bool(pl['Mlat']))
+        statics["vert_rate"].append(pl.get('Vsi', 0.0))
+        statics["TT"].append(pl['TT'])
+
+    trail = np.array(cos, dtype=np.float64).reshape(-1, 4)
+    counts = np.array(counts, dtype=np.int64)
+    columns = {}
+    for key in ["hex", "squawk", "flight"]:
+        columns[key] = np.repeat(np.array(statics[key], dtype=object), counts)
+    for key in ["altitude", "speed", "track", "messages", "vert_rate"]:
+        columns[key] = np.repeat(np.array(statics[key], dtype=np.float64), counts)
+    for key in ["isGnd", "mlat"]:
+        columns[key] = np.repeat(np.array(statics[key], dtype=bool), counts)
+    trail_type = np.repeat(np.array(statics["TT"], dtype=object), counts)
+
+    #
+    # Trail points with no value, or an impossible position, are dropped
+    #
+    lat = trail[:, 0]
+    lon = trail[:, 1]
+    value = trail[:, 3]
+    keep = (value != 0) & ~np.isnan(value) & (lat >= -90.0) & (lat <= 90.0) & \
+        (lon >= -180.0) & (lon <= 180.0)
+    value = np.nan_to_num(value)
+    is_alt = trail_type == 'a'
+    columns["altitude"] = np.where(is_alt, value, columns["altitude"])
+    columns["speed"] = np.where(is_alt, columns["speed"], value)
+    columns["lat"] = lat
+    columns["lon"] = lon
+    columns["time"] = trail[:, 2] / 1000
+
+    #
+    # VRS reports are in feet and knots
+    #
+    columns["vert_rate"] = columns["vert_rate"] * FEET_TO_METRES
+    columns["altitude"] = np.trunc(columns["altitude"] * FEET_TO_METRES).astype(np.int64)
+    columns["speed"] = np.trunc(columns["speed"] * KNOTS_TO_KMH).astype(np.int64)
+    columns["messages"] = columns["messages"].astype(np.int64)
+
+    num = len(lat)
+    columns["rssi"] = np.full(num, -49.5)
+    columns["nucp"] = np.full(num, -1, dtype=np.int64)
+    columns["reporter"] = np.full(num, "", dtype=object)
+    columns["report_location"] = np.full(num, None, dtype=object)
+    return ReportBatch(**columns)[keep]
+
 
 def readVRSFromFile(inputfile):
     """
@@ -587,82 +1854,52 @@ def readVRSFromFile(inputfile):
         inputfile: A filehandle returned by openFile
 
     Returns:
-        A list of PlaneReports
+        A list of PlaneReports. Use readVRSBatchFromFile to avoid building them.
     """
-    retlist = []
-    try:
-        data = json.load(inputfile)
-    except:
-        return []
-    for pl in data['acList']:
-            valid = True
-            for keywrd in VRSFILE_KEYWRDS:
-                if keywrd not in pl:
-                    valid = False
-                    break
-            if valid:
-                mytime = pl['PosTime'] / 1000
-                hex = pl['Icao'].lower()
-                altitude = pl['Alt']
-                speed = pl['Spd']
-                squawk = pl['Sqk']
-                if 'Call' in pl:
-                    flight = FLT_FMT.format(pl['Call'])
-                else:
-                    flight = ' '
-                track = pl['Trak']
-                lon = pl['Long']
-                lat = pl['Lat']
-                isGnd = pl['Gnd']
-                messages = pl['CMsgs']
-                mlat = pl['Mlat']
-                TT = pl['TT']
+    return list(readVRSBatchFromFile(inputfile).planes())
 
-                if 'Vsi' in pl:
-                    vert_rate = pl['Vsi']
-                else:
-                    vert_rate = 0.0
-                isMetric = False
-                Cos = pl['Cos']
-                if TT == 'a' or TT == 's':
-                    numpos = len(Cos) / 4
-                    for i in range(int(numpos)):
-                        if Cos[(i * 4) + 3]:
-                            if TT == 'a':
-                                altitude = Cos[(i * 4) + 3]
-                            elif TT == 's':
-                                speed = Cos[(i * 4) + 3]
-                            lat = Cos[(i * 4) + 0]
-                            lon = Cos[(i * 4) + 1]
-                            if lat < -90.0 or lat > 90.0 or lon < -180.0 or lon > 180.0:
-                                continue
-                            mytime = Cos[(i * 4) + 2] / 1000
-                            seen = seen_pos = 0
-                            plane = PlaneReport(hex=hex, time=mytime, speed=speed, squawk=squawk, flight=flight,
-                                                altitude=altitude, isMetric=False,
-                                                track=track, lon=lon, lat=lat, vert_rate=vert_rate, seen=seen,
-                                                validposition=1, validtrack=1, reporter="", mlat=mlat, isGnd=isGnd,
-                                                report_location=None, messages=messages, seen_pos=seen_pos, category=None)
-                            retlist.append(plane)
-    return retlist            
-
-def getPlanesFromURL(urlstr, myparams=None, mytimeout=0.9):
+def getPlanesFromURL(urlstr, myparams=None, mytimeout=0.9, timings=None):
     """
     Reads JSON objects from a server at a URL (usually a dump1090 instance)
 
     Args:
         urlstr: A string containing a URL (e.g. http://mydump1090:8080/data.json)
         myparams: parameters used for filtering requests to adsbexchange.com
+        timings: a dict to put the seconds spent fetching ("fetch") and parsing
+                 ("parse") the reports in (optional)
 
     Returns:
         A list of PlaneReports
     """
     cur_time = time.time()
+    t1 = time.perf_counter()
     if myparams:
         response = requests.get(urlstr, params=myparams, timeout=mytimeout)
     else:
         response = requests.get(urlstr, timeout=mytimeout)
-    data = json.loads(response.text)
+    if timings is None:
+        return planesFromJSON(json.loads(response.text), cur_time)
+    t2 = time.perf_counter()
+    planes = planesFromJSON(json.loads(response.text), cur_time)
+    timings["fetch"] = t2 - t1
+    timings["parse"] = time.perf_counter() - t2
+    return planes
+
+
+def planesFromJSON(data, cur_time=None):
+    """
+    Makes PlaneReports from a decoded dump1090 aircraft.json or data.json, or VRS
+    AircraftList.json document, as served up to getPlanesFromURL.
+
+    Args:
+        data: The decoded document
+        cur_time: When the document was fetched, for the age of VRS reports (optional)
+
+    Returns:
+        A list of PlaneReports
+    """
+    if cur_time is None:
+        cur_time = time.time()
     # Check for dump1090_mutability style of interface
     if 'aircraft' in data: 
         planereps = []
@@ -1137,18 +2374,15 @@ class Runway(object):
     runway_points = []
 
     def __init__(self, **kwargs):
-        try:
-            for keyword in ["airport", "name", "lon", "lat", "heading", "runway_area", "runway_area_poly",
-                            "runway_points"]:
-                setattr(self, keyword, kwargs[keyword])
-        except:
-             for keyword in ["airport", "name", "lon", "lat", "heading", "runway_points"]:
+        for keyword in ["airport", "name", "lon", "lat", "heading", "runway_points"]:
+            setattr(self, keyword, kwargs[keyword])
+        for keyword in ["runway_area", "runway_area_poly"]:
+            if keyword in kwargs:
                 setattr(self, keyword, kwargs[keyword])
-           
 
     def to_JSON(self):
         """Creates a JSON representation string of the airport"""
-        return json.dumps(self, default=lambda o: o.__dict__, \
+        return json.dumps(self, default=lambda o: o.tolist() if isinstance(o, np.ndarray) else o.__dict__, \
                           sort_keys=True, separators=(',', ':'))
 
     def logToDB(self, dbconn, printQuery=None, update=None):
@@ -1235,52 +2469,107 @@ class Runway(object):
         return geodistance(self.lon, self.lat, plane.lon, plane.lat)
 
 
-def readRunways(dbconn, airport, printQuery=None, numRecs=100):
+def decodePolygonWKB(wkb):
+    """
+    Decodes the outer ring of a WKB polygon straight into a numpy array.
+
+    Args:
+        wkb: The WKB, as bytes or a buffer (as psycopg2 returns bytea)
+
+    Returns:
+        numpy array of (lat, lon) rows - WKB has them as x/y, i.e. lon/lat
+    """
+    order = "<" if bytes(wkb[:1]) == b"\x01" else ">"
+    geomtype, rings = np.frombuffer(wkb, dtype=order + "u4", count=2, offset=1)
+    if not rings:
+        return np.zeros((0, 2))
+    points = int(np.frombuffer(wkb, dtype=order + "u4", count=1, offset=9)[0])
+    coords = np.frombuffer(wkb, dtype=order + "f8", count=2 * points, offset=13)
+    return coords.reshape(points, 2)[:, ::-1].astype(np.float64)
+
+
+#
+# Runways read from the DB, kept for the life of the process, by DB and airport,
+# so programs looking at many airports (or the same one many times) read each once
+#
+RUNWAY_CACHE = {}
+
+RUNWAY_SQL = '''
+		SELECT airport, name, heading, ST_X(location::geometry) as lon, ST_Y(location::geometry) as lat, location, runway_area, ST_AsBinary(runway_area::geometry) as runway_wkb
+			FROM runways WHERE '''
+
+
+def fetchRunways(cur, numRecs=100):
+    """Reads every row from a cursor executing RUNWAY_SQL, as Runway objects"""
+    runways = []
+    data = cur.fetchmany(numRecs)
+    while data:
+        for rec in data:
+            runways.append(Runway(airport=rec['airport'].rstrip(), name=rec['name'], heading=rec['heading'],
+                                  lat=rec['lat'], lon=rec['lon'], runway_area=rec['runway_area'],
+                                  runway_points=decodePolygonWKB(rec['runway_wkb'])))
+        data = cur.fetchmany(numRecs)
+    cur.close()
+    return runways
+
+
+def readRunwaysRegion(dbconn, airports, printQuery=None, numRecs=1000):
     """
-    Reads an airport's runways from the DB.
+    Reads the runways of a list of airports from the DB with one query, and
+    keeps them for the rest of the process's life, for readRunways.
 
     Args:
         dbconn: A psycopg2 DB connection
-        airport: The conICAO 4 character name for the airport
+        airports: list of ICAO codes
         printQuery: Boolean that triggers printing of the SQL (optional)
 
     Returns:
-        An list of Runway objects
+        dict of lists of Runway objects, by ICAO code
 
     Raises:
         psycopg2 exceptions
     """
-    runways = []
-    cur = dbconn.cursor(cursor_factory=RealDictCursor)
-    sql = '''
-		SELECT airport, name, heading, ST_X(location::geometry) as lon, ST_Y(location::geometry) as lat, location, runway_area, ST_AsText(runway_area::geometry) as runway_area_poly
-			FROM runways WHERE airport like \'%s\' ''' % airport
+    cache = RUNWAY_CACHE.setdefault(dbconn.dsn, {})
+    wanted = sorted(set(icao.rstrip() for icao in airports) - set(cache))
+    if wanted:
+        cur = dbconn.cursor(cursor_factory=RealDictCursor)
+        sql = RUNWAY_SQL + "airport = ANY(%s::bpchar[])"
+        if printQuery:
+            print(cur.mogrify(sql, [wanted]))
+        cur.execute(sql, [wanted])
+        for icao in wanted:
+            cache[icao] = []
+        for runway in fetchRunways(cur, numRecs):
+            cache.setdefault(runway.airport, []).append(runway)
+    return dict((icao.rstrip(), cache[icao.rstrip()]) for icao in airports)
 
-    if printQuery:
-        print(cur.mogrify(sql))
-    cur.execute(sql)
-    data = cur.fetchmany(numRecs)
-    if data:
-        for rec in data:
-            pointstr = rec['runway_area_poly'].strip("POLYGON()")
-            pointlist = pointstr.split(',')
-            runway_points = []
-            for i in pointlist:
-                j = i.split(' ')
-                tmp = [float(j[1]), float(j[0])]
-                runway_points.append(tmp)
 
-                runway = Runway(airport=rec['airport'], name=rec['name'], heading=rec['heading'],
-                            lat=rec['lat'], lon=rec['lon'], runway_area=rec['runway_area'],
-                                runway_area_poly=rec['runway_area_poly'], runway_points=runway_points)
+def readRunways(dbconn, airport, printQuery=None, numRecs=100):
+    """
+    Reads an airport's runways from the DB, or the runways already read.
 
-            runways.append(runway)
+    Args:
+        dbconn: A psycopg2 DB connection
+        airport: The conICAO 4 character name for the airport, or an SQL like
+                 pattern (whose results aren't kept)
+        printQuery: Boolean that triggers printing of the SQL (optional)
 
+    Returns:
+        An list of Runway objects, None if there are none
+
+    Raises:
+        psycopg2 exceptions
+    """
+    if "%" not in airport and "_" not in airport:
+        return readRunwaysRegion(dbconn, [airport], printQuery=printQuery, numRecs=numRecs)[airport.rstrip()] \
+            or None
+    cur = dbconn.cursor(cursor_factory=RealDictCursor)
+    sql = RUNWAY_SQL + "airport like %s"
+    if printQuery:
+        print(cur.mogrify(sql, [airport]))
+    cur.execute(sql, [airport])
+    return fetchRunways(cur, numRecs) or None
 
-        return runways
-    else:
-        return None
-    
 
 class AirportDailyEvents(object):
     """
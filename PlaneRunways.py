@@ -0,0 +1,171 @@
+"""
+Module for testing which runways (if any) reports are on, in bulk, rather than
+asking PostGIS (ST_Contains) a runway at a time.
+
+The outline of each runway is turned into numpy arrays of its edges once, and
+runways are filed in a grid of cells by their bounding boxes, so that each
+report is only tested against the runways whose bounding box covers the cell
+it's in - usually none at all. The point in polygon test is then a ray cast
+over every (report, candidate runway) pair at once.
+"""
+import numpy as np
+
+#
+# Size, in degrees, of the cells of the grid runways are filed in (about 1km)
+#
+GRID_CELL = 0.01
+KEY_STRIDE = 1 << 32
+
+
+class RunwayHitTester(object):
+    """
+    A point in polygon engine for runways.
+
+    Args:
+        runways: list of Runway objects, with runway_points of (lat, lon) pairs
+                 (closed or not)
+        cellSize: Size of the grid cells, in degrees (optional)
+
+    Runways are referred to by their position in the list.
+    """
+
+    def __init__(self, runways, cellSize=GRID_CELL):
+        self.runways = list(runways)
+        self.cellSize = cellSize
+        polys = [np.asarray(runway.runway_points, dtype=np.float64).reshape(-1, 2) for runway in self.runways]
+        num = len(polys)
+        lengths = np.array([len(poly) for poly in polys], dtype=np.int64)
+        vertices = np.concatenate(polys) if num else np.zeros((0, 2))
+        starts = np.cumsum(lengths) - lengths
+        #
+        # Edge j of a runway runs from vertex j-1 to vertex j. Polygons with fewer
+        # vertices are padded with edges from (0, 0) to (0, 0), which never cross
+        # a ray, as does the zero length edge closing an already closed polygon.
+        #
+        edges = int(lengths.max()) if num else 1
+        rows = np.repeat(np.arange(num), lengths)
+        cols = np.arange(len(vertices)) - np.repeat(starts, lengths)
+        previous = np.arange(len(vertices)) - 1
+        used = lengths > 0
+        previous[starts[used]] = starts[used] + lengths[used] - 1
+        self.lat1, self.lon1, self.lat2, self.lon2 = [np.zeros((num, edges)) for i in range(4)]
+        self.lat1[rows, cols] = vertices[previous, 0]
+        self.lon1[rows, cols] = vertices[previous, 1]
+        self.lat2[rows, cols] = vertices[:, 0]
+        self.lon2[rows, cols] = vertices[:, 1]
+        dlat = self.lat2 - self.lat1
+        self.slope = np.divide(self.lon2 - self.lon1, dlat, out=np.zeros_like(dlat), where=dlat != 0)
+        #
+        # Bounding boxes, as min lat, max lat, min lon, max lon. A runway without
+        # any points gets an empty one.
+        #
+        self.bbox = np.tile([np.inf, -np.inf, np.inf, -np.inf], (num, 1))
+        if used.any():
+            for col, reduce in enumerate([np.minimum, np.maximum, np.minimum, np.maximum]):
+                self.bbox[used, col] = reduce.reduceat(vertices[:, col // 2], starts[used])
+        #
+        # The grid is kept as a sorted array of the keys of the cells runways'
+        # bounding boxes cover, with where each cell's runways start in cellRunways
+        #
+        y0, y1 = self._cell(self.bbox[used, 0], 90.0), self._cell(self.bbox[used, 1], 90.0)
+        x0, x1 = self._cell(self.bbox[used, 2], 180.0), self._cell(self.bbox[used, 3], 180.0)
+        width = x1 - x0 + 1
+        cells = (y1 - y0 + 1) * width
+        owners = np.repeat(np.arange(len(y0)), cells)
+        offsets = np.arange(len(owners)) - np.repeat(np.cumsum(cells) - cells, cells)
+        keys = (y0[owners] + offsets // width[owners]) * KEY_STRIDE + x0[owners] + offsets % width[owners]
+        owners = np.nonzero(used)[0][owners]
+        order = np.argsort(keys, kind="stable")
+        self.cellKeys, self.cellStarts = np.unique(keys[order], return_index=True)
+        self.cellStarts = np.append(self.cellStarts, len(keys))
+        self.cellRunways = owners[order]
+
+    def __len__(self):
+        return len(self.runways)
+
+    def boundingBox(self):
+        """
+        Returns the bounding box of all the runways, as an EWKT polygon, to ask
+        the DB for the reports that might be on any of them
+        """
+        used = np.isfinite(self.bbox[:, 0])
+        minlat, maxlat = float(self.bbox[used, 0].min()), float(self.bbox[used, 1].max())
+        minlon, maxlon = float(self.bbox[used, 2].min()), float(self.bbox[used, 3].max())
+        return "SRID=4326;POLYGON((%r %r, %r %r, %r %r, %r %r, %r %r))" % (
+            minlon, minlat, maxlon, minlat, maxlon, maxlat, minlon, maxlat, minlon, minlat)
+
+    def _cell(self, values, offset):
+        return np.floor((np.asarray(values, dtype=np.float64) + offset) / self.cellSize).astype(np.int64)
+
+    def candidates(self, lats, lons):
+        """
+        Returns the (report, runway) pairs, as arrays of positions, of reports in a
+        grid cell the runway's bounding box covers.
+        """
+        if not len(self.cellKeys):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        keys = self._cell(lats, 90.0) * KEY_STRIDE + self._cell(lons, 180.0)
+        cells = np.minimum(np.searchsorted(self.cellKeys, keys), len(self.cellKeys) - 1)
+        known = self.cellKeys[cells] == keys
+        start = self.cellStarts[cells]
+        counts = np.where(known, self.cellStarts[cells + 1] - start, 0)
+        points = np.repeat(np.arange(len(keys)), counts)
+        if not len(points):
+            return points, points
+        offsets = np.arange(len(points)) - np.repeat(np.cumsum(counts) - counts, counts) + \
+            np.repeat(start, counts)
+        return points, self.cellRunways[offsets]
+
+    def contains(self, lats, lons, runways):
+        """
+        Tests whether each position is inside the corresponding runway.
+
+        Args:
+            lats, lons: arrays of positions
+            runways: array of the runways (positions in the list), one per position
+
+        Returns:
+            numpy boolean array
+        """
+        lats = np.asarray(lats, dtype=np.float64)[:, None]
+        lons = np.asarray(lons, dtype=np.float64)[:, None]
+        lat1 = self.lat1[runways]
+        crossings = ((lat1 > lats) != (self.lat2[runways] > lats)) & \
+            (lons < self.slope[runways] * (lats - lat1) + self.lon1[runways])
+        return np.logical_xor.reduce(crossings, axis=1) if crossings.shape[1] else \
+            np.zeros(len(lats), dtype=bool)
+
+    def pairs(self, lats, lons):
+        """
+        Finds every (report, runway) pair where the report is on the runway.
+
+        Returns:
+            (array of report positions, array of runway positions), ordered by
+            report, then runway
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        points, runways = self.candidates(lats, lons)
+        if not len(points):
+            return points, runways
+        box = self.bbox[runways]
+        plats, plons = lats[points], lons[points]
+        near = (plats >= box[:, 0]) & (plats <= box[:, 1]) & (plons >= box[:, 2]) & (plons <= box[:, 3])
+        points, runways = points[near], runways[near]
+        inside = self.contains(lats[points], lons[points], runways)
+        return points[inside], runways[inside]
+
+    def first(self, lats, lons):
+        """
+        Returns an array of the first runway (position in the list) each report is
+        on, -1 where it's on none
+        """
+        points, runways = self.pairs(lats, lons)
+        found = np.full(len(lats), -1, dtype=np.int64)
+        #
+        # Pairs come ordered by report, then runway, so the first of each report's is wanted
+        #
+        leading = np.ones(len(points), dtype=bool)
+        leading[1:] = points[1:] != points[:-1]
+        found[points[leading]] = runways[leading]
+        return found
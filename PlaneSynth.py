@@ -0,0 +1,575 @@
+"""
+Module for generating synthetic plane reports, for load testing the DB, the
+cleaning and deduplication scripts and the plotting tools at a larger scale than
+the sample data allows.
+
+Aircraft fly between the runways of a set of airports, and in and out of a circle
+around them - taking off along the runway heading, climbing to a cruise altitude,
+and descending onto the extended centreline of the runway they land on. Each
+receiver hears the aircraft in its range, with drop-outs (more of them at long
+range, and outages of the whole receiver), duplicates (a stale position repeated,
+as dump1090 does between position messages) and corrupted positions.
+
+Everything is worked out with numpy, a chunk of time at a time, and the random
+choices made per report are hashes of the seed, the receiver, the flight and the
+time, so the same arguments always give the same reports however they're chunked.
+"""
+import collections
+import numpy as np
+import PlaneReport as pr
+
+EARTH_RADIUS = 6371000.0
+#
+# Flight profile - distances in metres, speeds in m/s
+#
+TAKEOFF_ROLL = 1200.0       # From the threshold to lift off
+CLIMB_GRADIENT = 0.08       # Metres climbed per metre flown
+DEPARTURE_LEG = 12000.0     # Flown along the runway heading after taking off
+GLIDE_SLOPE = 0.0524        # 3 degrees
+FINAL_APPROACH = 15000.0    # Length of the final approach, along the runway heading
+TOUCHDOWN = 300.0           # Past the threshold
+LANDING_ROLL = 1500.0       # Past the threshold, to where the aircraft has slowed down
+MIN_RUNWAY_LENGTH = 800.0   # Shorter runways (and helipads) aren't used
+SPEED_HEIGHT = 3000.0       # Height above the ground at which cruise speed is reached
+PROFILE_POINTS = 400        # Points along each flight its timing is worked out at
+#
+# How often the runway in use at an airport (and its direction) can change, in seconds
+#
+RUNWAY_PERIOD = 3 * 3600
+#
+# Receivers are down for blocks of this many seconds at a time
+#
+OUTAGE_PERIOD = 600
+RADIO_HORIZON = 4120.0      # Metres of range per square root metre of height
+RECEIVER_HEIGHT = 10.0
+CORRUPT_OFFSET = 6.0        # Degrees a corrupted position is out by, as a CPR zone error would be
+AIRLINES = ["QFA", "VOZ", "JST", "RXA", "QLK", "TEY", "FDA", "UTY"]
+#
+# Separate streams of random numbers for each choice made per report
+#
+STREAM_LOSS, STREAM_OUTAGE, STREAM_DUPLICATE, STREAM_CORRUPT, STREAM_CORRUPT_AXIS, \
+    STREAM_RUNWAY, STREAM_DIRECTION = range(1, 8)
+
+Receiver = collections.namedtuple("Receiver", ["name", "lat", "lon", "range", "loss", "outage",
+                                               "duplicate", "corrupt"])
+Receiver.__doc__ = """
+A receiver the synthetic traffic is heard by.
+
+    name: name of the reporter (no more than 10 characters)
+    lat, lon: location
+    range: how far away (metres) it can hear aircraft, at best
+    loss: chance of missing a report, even close by - rises to 1 at the edge of its range
+    outage: chance of the receiver being down for each OUTAGE_PERIOD seconds
+    duplicate: chance of a report repeating the position of the previous one
+    corrupt: chance of a report's position being out by CORRUPT_OFFSET degrees
+"""
+
+
+def makeReceiver(name, lat, lon, range=250000.0, loss=0.02, outage=0.01, duplicate=0.05, corrupt=0.001):
+    """Returns a Receiver, with defaults for its faults"""
+    return Receiver(name, lat, lon, range, loss, outage, duplicate, corrupt)
+
+
+def hashUniform(seed, stream, *keys):
+    """
+    Returns uniform random numbers in [0, 1), one per element of the keys (which
+    are broadcast together), by hashing them with splitmix64. The same keys always
+    give the same numbers.
+
+    Args:
+        seed: integer seed
+        stream: integer picking a stream of numbers, so different choices about
+                the same report are independent
+        keys: integers or integer arrays
+
+    Returns:
+        numpy array of float64
+    """
+    mask = np.uint64(0xffffffffffffffff)
+    h = np.full(np.broadcast(*keys).shape if keys else (), np.uint64((seed * 1000003 + stream) & 0xffffffffffffffff))
+    with np.errstate(over="ignore"):
+        for key in keys:
+            h = h ^ (np.asarray(key).astype(np.int64).astype(np.uint64) & mask)
+            h = h + np.uint64(0x9e3779b97f4a7c15)
+            h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+            h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+            h = h ^ (h >> np.uint64(31))
+    return (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+class Flights(object):
+    """
+    A table of flights, one numpy array per attribute, as built by TrafficGenerator.
+
+    Positions are in metres east (x) and north (y) of the centre of the area.
+    Each flight follows four waypoints: where it starts (the threshold of its runway,
+    or the edge of the area), the end of its departure leg, the start of its final
+    approach and where it stops (the end of its landing roll, or the edge of the area).
+    """
+
+    COLUMNS = ["aircraft", "start", "duration", "points", "lengths", "fromRunway", "toRunway",
+               "fromElev", "toElev", "cruiseAlt", "cruiseSpeed", "approachSpeed", "callsign", "squawk"]
+
+    def __init__(self, **columns):
+        for col in self.COLUMNS:
+            setattr(self, col, columns[col])
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, index):
+        return Flights(**dict((col, getattr(self, col)[index]) for col in self.COLUMNS))
+
+    @classmethod
+    def concatenate(cls, tables):
+        return cls(**dict((col, np.concatenate([getattr(t, col) for t in tables])) for col in cls.COLUMNS))
+
+    def altitude(self, s, rows):
+        """Returns altitudes (metres) at distances s along flights rows"""
+        total = self.lengths[rows, 3]
+        climb = np.where(self.fromRunway[rows],
+                         self.fromElev[rows] + np.maximum(0.0, s - TAKEOFF_ROLL) * CLIMB_GRADIENT, np.inf)
+        descent = np.where(self.toRunway[rows],
+                           self.toElev[rows] + np.maximum(0.0, total - s - (LANDING_ROLL - TOUCHDOWN)) * GLIDE_SLOPE,
+                           np.inf)
+        return np.minimum(self.cruiseAlt[rows], np.minimum(climb, descent))
+
+    def speed(self, s, rows):
+        """Returns ground speeds (m/s) at distances s along flights rows"""
+        total = self.lengths[rows, 3]
+        ground = np.where(s < total / 2.0, np.where(self.fromRunway[rows], self.fromElev[rows], 0.0),
+                          np.where(self.toRunway[rows], self.toElev[rows], 0.0))
+        height = np.clip((self.altitude(s, rows) - ground) / SPEED_HEIGHT, 0.0, 1.0)
+        air = self.approachSpeed[rows] + (self.cruiseSpeed[rows] - self.approachSpeed[rows]) * height
+        #
+        # Speeding up along the runway when taking off, and slowing down after landing
+        #
+        rolling = np.minimum(np.where(self.fromRunway[rows], np.sqrt(np.maximum(s, 0.0) / TAKEOFF_ROLL), 1.0),
+                             np.where(self.toRunway[rows],
+                                      np.sqrt(np.maximum(total - s, 0.0) / (LANDING_ROLL - TOUCHDOWN)), 1.0))
+        return air * np.clip(rolling, 0.15, 1.0)
+
+    def onGround(self, s, rows):
+        """Returns whether flights rows are on the runway at distances s along them"""
+        total = self.lengths[rows, 3]
+        return (self.fromRunway[rows] & (s < TAKEOFF_ROLL)) | \
+            (self.toRunway[rows] & (s > total - (LANDING_ROLL - TOUCHDOWN)))
+
+    def profile(self, rows=None):
+        """
+        Works out when each flight gets how far along its path.
+
+        Returns:
+            (distances, times) - arrays of shape (flights, PROFILE_POINTS), times
+            in seconds from the start of the flight. Points are closer together
+            at the ends of a flight, where the speed changes most.
+        """
+        if rows is None:
+            rows = np.arange(len(self))
+        frac = (1.0 - np.cos(np.pi * np.arange(PROFILE_POINTS) / (PROFILE_POINTS - 1))) / 2.0
+        dist = self.lengths[rows, 3][:, None] * frac
+        rows2d = np.broadcast_to(rows[:, None], dist.shape)
+        pace = 1.0 / self.speed(dist, rows2d)
+        steps = np.diff(dist, axis=1) * (pace[:, 1:] + pace[:, :-1]) / 2.0
+        times = np.concatenate((np.zeros((len(rows), 1)), np.cumsum(steps, axis=1)), axis=1)
+        return dist, times
+
+    def position(self, s, rows):
+        """Returns (x, y, track) arrays at distances s along flights rows"""
+        lengths = self.lengths[rows]
+        leg = (s > lengths[:, 1]).astype(np.int64) + (s > lengths[:, 2])
+        start = self.points[rows, leg]
+        delta = self.points[rows, leg + 1] - start
+        legLength = lengths[np.arange(len(rows)), leg + 1] - lengths[np.arange(len(rows)), leg]
+        frac = np.divide(s - lengths[np.arange(len(rows)), leg], legLength,
+                         out=np.zeros_like(legLength), where=legLength > 0)
+        frac = np.clip(frac, 0.0, 1.0)
+        track = np.degrees(np.arctan2(delta[:, 0], delta[:, 1])) % 360.0
+        return start[:, 0] + delta[:, 0] * frac, start[:, 1] + delta[:, 1] * frac, track
+
+
+class TrafficGenerator(object):
+    """
+    Generates synthetic traffic over an area, as ReportBatches.
+
+    Args:
+        receivers: list of Receivers
+        airports: list of Airport objects, with altitudes in metres (optional)
+        runways: list of their Runway objects, with runway_points (optional)
+        numAircraft: number of aircraft flying around
+        startTime: epoch time of the first report
+        duration: seconds of traffic to generate
+        centre: (lat, lon) of the centre of the area (defaults to the middle of
+                the airports, or the receivers)
+        radius: radius (metres) of the area, aircraft enter and leave at its edge
+        interval: seconds between each receiver's reports of an aircraft
+        seed: seed for all the random choices
+        toAirport: chance of an aircraft coming in from outside flying to one of the
+                   airports, rather than straight across
+        groundFlag: flag reports on a runway as on the ground (isGnd), as receivers
+                    decoding surface position messages do - the receivers the sample
+                    data came from give an altitude on the ground instead
+
+    Without any airports, every flight crosses the area at its cruise altitude.
+    """
+
+    def __init__(self, receivers, airports=None, runways=None, numAircraft=100, startTime=0, duration=3600,
+                 centre=None, radius=250000.0, interval=1, seed=1, toAirport=0.8, groundFlag=False):
+        self.receivers = list(receivers)
+        self.numAircraft = numAircraft
+        self.startTime = int(startTime)
+        self.endTime = int(startTime + duration)
+        self.radius = radius
+        self.interval = interval
+        self.seed = seed
+        self.toAirport = toAirport
+        self.groundFlag = groundFlag
+        airports = list(airports or [])
+        if centre is None:
+            places = airports or self.receivers
+            centre = (float(np.mean([p.lat for p in places])), float(np.mean([p.lon for p in places])))
+        self.centre = centre
+        self.lonScale = np.cos(np.radians(centre[0]))
+        self._runways(airports, runways or [])
+        self.rx = np.array([self.toXY(r.lat, r.lon) for r in self.receivers]).reshape(-1, 2)
+        self.flights = self._schedule()
+        #
+        # Flights ordered by start, with the latest end of any flight so far, for
+        # finding the ones in a stretch of time with a binary search
+        #
+        order = np.argsort(self.flights.start, kind="stable")
+        self.flights = self.flights[order]
+        self.latestEnd = np.maximum.accumulate(self.flights.start + self.flights.duration) \
+            if len(self.flights) else np.zeros(0)
+
+    def toXY(self, lat, lon):
+        """Projects lat/lon onto metres east & north of the centre"""
+        x = np.radians(np.asarray(lon) - self.centre[1]) * self.lonScale * EARTH_RADIUS
+        y = np.radians(np.asarray(lat) - self.centre[0]) * EARTH_RADIUS
+        return x, y
+
+    def toLatLon(self, x, y):
+        """The reverse of toXY"""
+        lat = self.centre[0] + np.degrees(y / EARTH_RADIUS)
+        lon = self.centre[1] + np.degrees(x / (EARTH_RADIUS * self.lonScale))
+        return lat, lon
+
+    def _runways(self, airports, runways):
+        """Works out the ends of the usable runways of each airport"""
+        self.airports = []
+        self.runwayEnds = []
+        self.airportElev = []
+        byAirport = {}
+        for runway in runways:
+            byAirport.setdefault(runway.airport, []).append(runway)
+        for airport in airports:
+            ends = []
+            for runway in byAirport.get(airport.icao, []):
+                corners = np.asarray(runway.runway_points, dtype=np.float64).reshape(-1, 2)
+                if len(corners) < 4:
+                    continue
+                x, y = self.toXY(corners[:4, 0], corners[:4, 1])
+                end1 = np.array([(x[0] + x[1]) / 2.0, (y[0] + y[1]) / 2.0])
+                end2 = np.array([(x[2] + x[3]) / 2.0, (y[2] + y[3]) / 2.0])
+                if np.hypot(*(end2 - end1)) >= MIN_RUNWAY_LENGTH:
+                    ends.append((end1, end2))
+            if ends:
+                self.airports.append(airport)
+                self.runwayEnds.append(np.array(ends))
+                self.airportElev.append(float(airport.altitude or 0.0))
+
+    def runwayInUse(self, airport, when):
+        """
+        Returns (threshold, unit vector along the runway) of the runway in use at an
+        airport at times when - the same for every flight, for a few hours at a time.
+        """
+        ends = self.runwayEnds[airport]
+        period = np.asarray(when, dtype=np.float64) // RUNWAY_PERIOD
+        choice = np.minimum((hashUniform(self.seed, STREAM_RUNWAY, airport, period) * len(ends)).astype(np.int64),
+                            len(ends) - 1)
+        reverse = hashUniform(self.seed, STREAM_DIRECTION, airport, period) < 0.5
+        first, second = ends[choice, 0], ends[choice, 1]
+        threshold = np.where(reverse[..., None], second, first)
+        along = np.where(reverse[..., None], first - second, second - first)
+        return threshold, along / np.hypot(along[..., 0], along[..., 1])[..., None]
+
+    def _edgePoints(self, rng, num):
+        bearing = rng.uniform(0.0, 2 * np.pi, num)
+        return np.stack((np.sin(bearing), np.cos(bearing)), axis=1) * self.radius
+
+    def _schedule(self):
+        """
+        Plans every aircraft's flights, a round at a time - each aircraft that's
+        ready flies from where it is to somewhere else, then waits to go again.
+        """
+        rng = np.random.default_rng(self.seed)
+        num = self.numAircraft
+        numAirports = len(self.airports)
+        #
+        # Where each aircraft is - an airport, or -1 for outside the area
+        #
+        where = np.where(rng.random(num) < 0.5, rng.integers(0, max(numAirports, 1), num), -1) \
+            if numAirports else np.full(num, -1)
+        ready = self.startTime - rng.uniform(0, 3600, num)
+        cruiseSpeed = np.where(rng.random(num) < 0.3, rng.uniform(120, 150, num), rng.uniform(200, 250, num))
+        callsigns = np.array(["%s%d" % (AIRLINES[i % len(AIRLINES)], 100 + (i * 37) % 900) for i in range(num)],
+                             dtype=object)
+        tables = []
+        active = ready < self.endTime
+        while active.any():
+            planes = np.nonzero(active)[0]
+            count = len(planes)
+            origin = where[planes]
+            if numAirports:
+                destination = np.where(rng.random(count) < self.toAirport,
+                                       rng.integers(0, numAirports, count), -1)
+                #
+                # Aircraft at an airport go somewhere else
+                #
+                same = (destination == origin) & (origin >= 0)
+                destination[same] = np.where(numAirports > 1, (origin[same] + 1) % numAirports, -1)
+            else:
+                destination = np.full(count, -1)
+            start = ready[planes]
+            points = np.zeros((count, 4, 2))
+            points[:, 0] = self._edgePoints(rng, count)
+            points[:, 3] = self._edgePoints(rng, count)
+            fromRunway, toRunway = origin >= 0, destination >= 0
+            fromElev, toElev = np.zeros(count), np.zeros(count)
+            for airport in range(numAirports):
+                leaving = np.nonzero(origin == airport)[0]
+                if len(leaving):
+                    threshold, along = self.runwayInUse(airport, start[leaving])
+                    points[leaving, 0] = threshold
+                    points[leaving, 1] = threshold + along * DEPARTURE_LEG
+                    fromElev[leaving] = self.airportElev[airport]
+                arriving = np.nonzero(destination == airport)[0]
+                if len(arriving):
+                    #
+                    # The runway is the one in use about when it'll arrive - near enough
+                    #
+                    threshold, along = self.runwayInUse(airport, start[arriving] + 1800)
+                    points[arriving, 2] = threshold - along * FINAL_APPROACH
+                    points[arriving, 3] = threshold + along * LANDING_ROLL
+                    toElev[arriving] = self.airportElev[airport]
+            points[~fromRunway, 1] = points[~fromRunway, 0]
+            points[~toRunway, 2] = points[~toRunway, 3]
+            legs = np.hypot(*np.moveaxis(np.diff(points, axis=1), 2, 0))
+            lengths = np.concatenate((np.zeros((count, 1)), np.cumsum(legs, axis=1)), axis=1)
+            flightNums = rng.integers(100, 1000, count)
+            table = Flights(aircraft=planes, start=start, duration=np.zeros(count), points=points,
+                            lengths=lengths, fromRunway=fromRunway, toRunway=toRunway,
+                            fromElev=fromElev, toElev=toElev,
+                            cruiseAlt=np.where(cruiseSpeed[planes] < 160, rng.uniform(3000, 7500, count),
+                                               rng.uniform(7500, 12000, count)),
+                            cruiseSpeed=cruiseSpeed[planes], approachSpeed=rng.uniform(60, 75, count),
+                            callsign=np.array([pr.FLT_FMT.format(c[:3] + str(n))
+                                               for c, n in zip(callsigns[planes], flightNums)], dtype=object),
+                            squawk=np.array(["%04o" % n for n in rng.integers(0, 4096, count)], dtype=object))
+            table.duration = table.profile()[1][:, -1]
+            tables.append(table)
+            #
+            # Turnarounds take longer away from the area
+            #
+            where[planes] = destination
+            ready[planes] = start + table.duration + np.where(toRunway, rng.uniform(1800, 5400, count),
+                                                              rng.uniform(3600, 4 * 3600, count))
+            active = ready < self.endTime
+        if not tables:
+            return Flights(**dict((col, np.zeros((0, 4, 2) if col == "points" else
+                                                 (0, 4) if col == "lengths" else 0))
+                                  for col in Flights.COLUMNS))
+        return Flights.concatenate(tables)
+
+    def hexCodes(self):
+        """Returns the ICAO24 codes of the aircraft"""
+        return np.array(["%06x" % (0x7c4000 + i) for i in range(self.numAircraft)], dtype=object)
+
+    def truth(self, chunkStart, chunkEnd):
+        """
+        Works out where every flight is at each report time in a stretch of time.
+
+        Returns:
+            dict of numpy arrays - flight (row of self.flights), time, x, y,
+            altitude, speed, track, vert_rate, isGnd - and the same at the previous
+            report time, under "previous", for duplicates
+        """
+        flights = self.flights
+        last = np.searchsorted(flights.start, chunkEnd)
+        first = np.searchsorted(self.latestEnd[:last], chunkStart, side="right")
+        rows = np.arange(first, last)
+        rows = rows[flights.start[rows] + flights.duration[rows] > chunkStart]
+        #
+        # Report times are on a grid of interval seconds from the start time
+        #
+        lo = np.maximum(flights.start[rows], chunkStart)
+        hi = np.minimum(flights.start[rows] + flights.duration[rows], chunkEnd)
+        firstTick = np.ceil((lo - self.startTime) / self.interval).astype(np.int64)
+        lastTick = np.ceil((hi - self.startTime) / self.interval).astype(np.int64)
+        counts = np.maximum(lastTick - firstTick, 0)
+        which = np.repeat(np.arange(len(rows)), counts)
+        ticks = np.arange(len(which)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(firstTick, counts)
+        times = self.startTime + ticks * self.interval
+        dist, profileTimes = flights.profile(rows)
+        current = self._evaluate(rows, which, times, dist, profileTimes)
+        previous = self._evaluate(rows, which, times - self.interval, dist, profileTimes)
+        current["previous"] = previous
+        return current
+
+    def _evaluate(self, rows, which, times, dist, profileTimes):
+        flights = self.flights
+        flightRows = rows[which]
+        elapsed = np.clip(times - flights.start[flightRows], 0.0, flights.duration[flightRows])
+        #
+        # One binary search over every flight's profile at once, each flight's
+        # times offset well clear of the others
+        #
+        spacing = float(profileTimes[:, -1].max()) + 1.0 if len(rows) else 1.0
+        keys = (profileTimes + spacing * np.arange(len(rows))[:, None]).ravel()
+        pos = np.searchsorted(keys, elapsed + spacing * which, side="right") - 1
+        pos = np.clip(pos, which * PROFILE_POINTS, (which + 1) * PROFILE_POINTS - 2)
+        t0, t1 = profileTimes.ravel()[pos], profileTimes.ravel()[pos + 1]
+        d0, d1 = dist.ravel()[pos], dist.ravel()[pos + 1]
+        frac = np.divide(elapsed - t0, t1 - t0, out=np.zeros_like(elapsed), where=t1 > t0)
+        s = d0 + (d1 - d0) * np.clip(frac, 0.0, 1.0)
+        x, y, track = flights.position(s, flightRows)
+        speed = flights.speed(s, flightRows)
+        altitude = flights.altitude(s, flightRows)
+        climb = (flights.altitude(s + 1.0, flightRows) - altitude) * speed * 60.0
+        return {"flight": flightRows, "time": times, "x": x, "y": y, "altitude": altitude, "speed": speed,
+                "track": track, "vert_rate": climb, "isGnd": flights.onGround(s, flightRows)}
+
+    def batch(self, chunkStart, chunkEnd):
+        """
+        Returns the reports every receiver makes between chunkStart and chunkEnd,
+        as a ReportBatch, ordered by time then receiver.
+        """
+        truth = self.truth(chunkStart, chunkEnd)
+        previous = truth["previous"]
+        hexCodes = self.hexCodes()
+        flights = self.flights
+        batches = []
+        for num, receiver in enumerate(self.receivers):
+            dx, dy = truth["x"] - self.rx[num, 0], truth["y"] - self.rx[num, 1]
+            dist = np.hypot(dx, dy)
+            reach = np.minimum(receiver.range, RADIO_HORIZON * (np.sqrt(np.maximum(truth["altitude"], 0.0)) +
+                                                                np.sqrt(RECEIVER_HEIGHT)))
+            keys = (num, truth["flight"], truth["time"])
+            lost = hashUniform(self.seed, STREAM_LOSS, *keys) < \
+                receiver.loss + (1.0 - receiver.loss) * (dist / receiver.range) ** 4
+            down = hashUniform(self.seed, STREAM_OUTAGE, num, truth["time"] // OUTAGE_PERIOD) < receiver.outage
+            heard = np.nonzero((dist <= reach) & ~lost & ~down)[0]
+            stale = hashUniform(self.seed, STREAM_DUPLICATE, num, truth["flight"][heard],
+                                truth["time"][heard]) < receiver.duplicate
+            columns = {}
+            for col in ["x", "y", "altitude", "speed", "track", "vert_rate", "isGnd"]:
+                columns[col] = np.where(stale, previous[col][heard], truth[col][heard])
+            lat, lon = self.toLatLon(columns["x"], columns["y"])
+            corrupt = hashUniform(self.seed, STREAM_CORRUPT, num, truth["flight"][heard],
+                                  truth["time"][heard]) < receiver.corrupt
+            axis = hashUniform(self.seed, STREAM_CORRUPT_AXIS, num, truth["flight"][heard], truth["time"][heard])
+            offset = np.where(axis < 0.25, -CORRUPT_OFFSET, CORRUPT_OFFSET) * corrupt
+            lat = np.round(np.clip(lat + np.where(axis < 0.5, offset, 0.0), -90.0, 90.0), 6)
+            lon = np.round(lon + np.where(axis >= 0.5, offset, 0.0), 6)
+            flightRows = truth["flight"][heard]
+            num_heard = len(heard)
+            #
+            # Units as dump1090 gives them (whole feet, in 25s, and knots), then made metric
+            #
+            feet = np.round(columns["altitude"] / pr.FEET_TO_METRES / 25.0) * 25.0
+            knots = np.round(columns["speed"] * 3600.0 / 1000.0 / pr.KNOTS_TO_KMH)
+            elapsed = truth["time"][heard] - flights.start[flightRows]
+            batches.append(pr.ReportBatch(
+                time=truth["time"][heard].astype(np.float64), lat=lat, lon=lon,
+                vert_rate=np.round(columns["vert_rate"] / pr.FEET_TO_METRES / 64.0) * 64.0 * pr.FEET_TO_METRES,
+                track=np.round(columns["track"]),
+                rssi=np.round(np.clip(-5.0 - 20.0 * np.log10(np.maximum(dist[heard], 1000.0) / 1000.0), -49.5, -1.0), 1),
+                altitude=np.trunc(feet * pr.FEET_TO_METRES).astype(np.int64),
+                speed=np.trunc(knots * pr.KNOTS_TO_KMH).astype(np.int64),
+                messages=(np.maximum(elapsed, 0.0) * 4.0).astype(np.int64),
+                nucp=np.full(num_heard, 7, dtype=np.int64),
+                isGnd=columns["isGnd"] & self.groundFlag, mlat=np.zeros(num_heard, dtype=bool),
+                hex=hexCodes[flights.aircraft[flightRows]], squawk=flights.squawk[flightRows],
+                flight=flights.callsign[flightRows], reporter=np.full(num_heard, receiver.name, dtype=object),
+                report_location=np.full(num_heard, None, dtype=object)))
+        result = pr.ReportBatch.concatenate(batches)
+        return result[np.argsort(result.time, kind="stable")]
+
+    def batches(self, chunkSeconds=600):
+        """Yields the reports a chunk of chunkSeconds at a time, as ReportBatches"""
+        for chunkStart in range(self.startTime, self.endTime, chunkSeconds):
+            yield self.batch(chunkStart, min(chunkStart + chunkSeconds, self.endTime))
+
+
+def aircraftDocument(batch, now, variant="mutability"):
+    """
+    Builds a dump1090 aircraft.json document from one receiver's reports at a time.
+
+    Args:
+        batch: ReportBatch of the reports (metric)
+        now: the time of the snapshot
+        variant: "mutability", or "piaware" for piaware 3.6's alt_baro, gs and
+                 baro_rate keys
+
+    Returns:
+        the document, as a dict
+    """
+    altitude = np.round(batch.altitude / pr.FEET_TO_METRES).astype(np.int64).tolist()
+    speed = np.round(batch.speed / pr.KNOTS_TO_KMH).astype(np.int64).tolist()
+    vert_rate = np.round(batch.vert_rate / pr.FEET_TO_METRES).astype(np.int64).tolist()
+    keys = ("alt_baro", "gs", "baro_rate") if variant == "piaware" else ("altitude", "speed", "vert_rate")
+    aircraft = []
+    for i, (hexcode, flight, squawk, lat, lon, track, messages, rssi, seen) in enumerate(zip(
+            batch.hex.tolist(), batch.flight.tolist(), batch.squawk.tolist(), batch.lat.tolist(),
+            batch.lon.tolist(), batch.track.tolist(), batch.messages.tolist(), batch.rssi.tolist(),
+            (now - batch.time).tolist())):
+        aircraft.append({"hex": hexcode, "squawk": squawk, "flight": flight, "lat": lat, "lon": lon,
+                         "nucp": 7, "seen_pos": seen, keys[0]: altitude[i], keys[2]: vert_rate[i],
+                         "track": int(track), keys[1]: speed[i], "category": "A3", "mlat": [],
+                         "tisb": [], "messages": messages, "seen": seen, "rssi": rssi})
+    return {"now": now, "messages": int(batch.messages.sum()), "aircraft": aircraft}
+
+
+def dataDocument(batch):
+    """Builds the legacy dump1090 data.json list, in feet and knots, from one receiver's reports"""
+    return [{"hex": hexcode, "squawk": squawk, "flight": flight, "lat": lat, "lon": lon,
+             "validposition": 1, "altitude": int(round(altitude / pr.FEET_TO_METRES)),
+             "vert_rate": int(round(vert_rate / pr.FEET_TO_METRES)), "track": int(track),
+             "validtrack": 1, "speed": int(round(speed / pr.KNOTS_TO_KMH)), "messages": messages, "seen": 0}
+            for hexcode, squawk, flight, lat, lon, altitude, vert_rate, track, speed, messages in zip(
+                batch.hex.tolist(), batch.squawk.tolist(), batch.flight.tolist(), batch.lat.tolist(),
+                batch.lon.tolist(), batch.altitude.tolist(), batch.vert_rate.tolist(), batch.track.tolist(),
+                batch.speed.tolist(), batch.messages.tolist())]
+
+
+def vrsDocument(batch, trails=True):
+    """
+    Builds a VRS AircraftList.json document from one receiver's reports, in feet
+    and knots. With trails, each aircraft's reports become its Cos short trail (as
+    in the daily archives), and its latest report gives the rest of its fields.
+    """
+    if not len(batch):
+        return {"acList": [], "totalAc": 0, "src": 1, "stm": 0}
+    order = np.lexsort((batch.time, batch.hex.astype(str))) if trails else np.arange(len(batch))
+    batch = batch[order]
+    if trails:
+        hexes = batch.hex.astype(str)
+        last = np.append(np.nonzero(hexes[1:] != hexes[:-1])[0], len(batch) - 1)
+    else:
+        last = np.arange(len(batch))
+    starts = np.concatenate(([0], last[:-1] + 1))
+    feet = np.round(batch.altitude / pr.FEET_TO_METRES)
+    cos = np.stack((batch.lat, batch.lon, batch.time * 1000.0, feet), axis=1)
+    aircraft = []
+    for first, i in zip(starts.tolist(), last.tolist()):
+        entry = {"PosTime": int(batch.time[i] * 1000), "Icao": batch.hex[i].upper(), "Alt": int(feet[i]),
+                 "Spd": round(batch.speed[i] / pr.KNOTS_TO_KMH, 1), "Sqk": batch.squawk[i],
+                 "Call": batch.flight[i].strip(), "Trak": float(batch.track[i]), "Long": float(batch.lon[i]),
+                 "Lat": float(batch.lat[i]), "Gnd": bool(batch.isGnd[i]), "CMsgs": int(batch.messages[i]),
+                 "Mlat": bool(batch.mlat[i]), "Vsi": int(round(batch.vert_rate[i] / pr.FEET_TO_METRES))}
+        if trails:
+            entry["Cos"] = cos[first:i + 1].ravel().tolist()
+            entry["TT"] = "a"
+        aircraft.append(entry)
+    return {"acList": aircraft, "totalAc": len(aircraft), "src": 1,
+            "stm": int(batch.time.max() * 1000)}
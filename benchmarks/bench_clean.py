@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for the DB cleaning scripts' inner loops.
+#
+"""
+Times planedbclean.py's procPlaneDist, over the shipped reports with some of their
+positions corrupted, and planededuplicate.py's comparePlanes, run over the reports
+in the order the script reads them, with a duplicate of every other report.
+"""
+import copy
+import random
+import argparse
+import itertools
+
+import benchcommon as bc
+import PlaneProfile as pp
+import planedbclean
+import planededuplicate
+
+GROUP = "clean"
+
+#
+# Proportion of reports whose position gets corrupted for procPlaneDist to find
+#
+CORRUPT_FRACTION = 0.01
+
+
+def corruptedTracks(planes, seed=1):
+    """
+    Returns a list of each plane's reports, in time order, with a few positions
+    moved hundreds of km away. The first two of each plane are left alone, as
+    procPlaneDist can't remove a bad first report.
+    """
+    rand = random.Random(seed)
+    tracks = []
+    planes = sorted(planes, key=lambda plane: (plane.hex, plane.time))
+    for hexcode, track in itertools.groupby(planes, key=lambda plane: plane.hex):
+        track = [copy.copy(plane) for plane in track]
+        for plane in track[2:]:
+            if rand.random() < CORRUPT_FRACTION:
+                plane.lat += rand.choice([-5.0, 5.0])
+        tracks.append(track)
+    return tracks
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the cleaning benchmarks, adding their timings to results"""
+    planes = bc.readReports()
+    procPlaneDist = planedbclean.procPlaneDist
+    comparePlanes = planededuplicate.comparePlanes
+    #
+    # Copies of the shipped planes, as different planes, for bigger scales
+    #
+    scaled = []
+    for copyNum in range(scale):
+        for plane in planes:
+            plane = copy.copy(plane)
+            plane.hex = "%s-%d" % (plane.hex, copyNum)
+            scaled.append(plane)
+    tracks = corruptedTracks(scaled)
+    results.run(GROUP, "procPlaneDist", lambda: sum(len(procPlaneDist(list(track))) for track in tracks),
+                items=len(scaled), repeat=repeat)
+
+    #
+    # planededuplicate.py reads reports ordered by hex, time and location
+    #
+    doubled = []
+    for i, plane in enumerate(sorted(scaled, key=lambda plane: (plane.hex, plane.time))):
+        doubled.append(plane)
+        if i % 2:
+            doubled.append(copy.copy(plane))
+
+    def dedup():
+        oldplane = None
+        duplicates = 0
+        for plane in doubled:
+            if not comparePlanes(oldplane, plane):
+                duplicates += 1
+            else:
+                oldplane = plane
+        return duplicates
+
+    results.run(GROUP, "comparePlanes dedup", dedup, items=len(doubled), repeat=repeat)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the DB cleaning scripts")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
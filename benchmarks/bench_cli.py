@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for whole command line tools, run in-process through their main().
+#
+"""
+Times some of the scripts end to end - synthtraffic.py writing JSON lines,
+planekml.py and planecoverage.py reading the shipped reports, and planelogger.py
+polling the mock server - by calling their main() with a command line, with
+what they print thrown away, so the cost of everything between the library
+calls the other benchmarks time shows up too.
+"""
+import io
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneMockServer as pms
+import synthtraffic
+import planekml
+import planecoverage
+import planelogger
+
+GROUP = "cli"
+LAT, LON = -35.343135, 149.141059
+
+
+def runQuietly(main, argv):
+    """Runs a script's main() with a command line, throwing away what it prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main(argv)
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the command line tool benchmarks, adding their timings to results"""
+    reportFile = bc.dataFile(bc.REPORT_FILES[0])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        numAircraft = 20 * scale
+        results.run(GROUP, "synthtraffic.py %d aircraft, 10 min" % numAircraft,
+                    lambda: runQuietly(synthtraffic.main, ["-n", str(numAircraft), "-d", "600",
+                                                           "--lat", str(LAT), "--lon", str(LON),
+                                                           "-t", "2020-01-01 00:00:00",
+                                                           "-o", os.path.join(tmpdir, "synth.json")]),
+                    items=numAircraft, unit="aircraft", repeat=repeat)
+        results.run(GROUP, "planekml.py %s" % bc.REPORT_FILES[0],
+                    lambda: runQuietly(planekml.main, ["-f", reportFile,
+                                                       "--output-file", os.path.join(tmpdir, "tracks.kml")]),
+                    repeat=repeat)
+        results.run(GROUP, "planecoverage.py %s" % bc.REPORT_FILES[0],
+                    lambda: runQuietly(planecoverage.main, ["-f", reportFile, "--lat", str(LAT), "--lon", str(LON),
+                                                            "-j", "1", "--save", os.path.join(tmpdir, "cover.npz")]),
+                    repeat=repeat)
+    #
+    # The logger polls as fast as it can (a zero sample interval), printing the reports
+    #
+    numAircraft = 200 * scale
+    numSamples = 10
+    start = time.time()
+    replay = pms.ReportReplay(lambda: pms.syntheticBatches(numAircraft, LAT, LON, startTime=start - 600))
+    with pms.MockReceiver(replay) as mock:
+        results.run(GROUP, "planelogger.py %d samples, %d aircraft" % (numSamples, numAircraft),
+                    lambda: runQuietly(planelogger.main, ["-u", mock.url(), "-c", str(numSamples), "-i", "0",
+                                                          "--lat", str(LAT), "--lon", str(LON)]),
+                    items=numSamples, unit="samples", repeat=repeat)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark whole command line tools, run in-process")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,222 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for writing reports to, and reading them from, PostGIS.
+#
+"""
+Times logging reports a row at a time with PlaneReport.logToDB and in bulk with
+ReportBatch.copyToDB, and reading them back with readReportsDB, readBatchesDB and
+a runway (ST_Contains) query.
+
+The DB is either one given with -y, or a disposable PostgreSQL cluster made in a
+temporary directory with initdb, loaded with db_create_v3.psql (which needs the
+PostGIS extension installed), and removed afterwards. Everything is done in a
+transaction that is rolled back, so nothing is left behind in a -y DB. If there's
+no DB to be had, the benchmarks are recorded as skipped.
+"""
+import os
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneReport as pr
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+GROUP = "db"
+REPORTER = "Bench"
+NAMES = ["PlaneReport.logToDB", "ReportBatch.copyToDB", "readReportsDB", "readBatchesDB",
+         "runway query"]
+#
+# A box around Canberra airport, for the runway query
+#
+RUNWAY_AREA = "SRID=4326;POLYGON((149.17 -35.32, 149.21 -35.32, 149.21 -35.29, 149.17 -35.29, 149.17 -35.32))"
+
+
+def pgBinDir():
+    """Returns the directory of the PostgreSQL server programs, or None"""
+    bindir = os.environ.get("PG_BIN")
+    if bindir:
+        return bindir
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        try:
+            return subprocess.run([pg_config, "--bindir"], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return None
+
+
+class DisposableCluster(object):
+    """
+    A PostgreSQL cluster in a temporary directory, only listening on a unix socket
+    in that directory, with the PlaneReports schema loaded.
+
+    Args:
+        bindir: directory of initdb, pg_ctl and psql
+    """
+
+    def __init__(self, bindir):
+        self.bindir = bindir
+        self.tmpdir = tempfile.mkdtemp(prefix="planereports-pg-")
+        self.datadir = os.path.join(self.tmpdir, "data")
+        self.started = False
+        #
+        # Any free port will do, it's only used to name the socket
+        #
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.yamlfile = os.path.join(self.tmpdir, "db.yaml")
+
+    def _run(self, program, *args):
+        return subprocess.run([os.path.join(self.bindir, program)] + list(args),
+                              capture_output=True, text=True, check=True)
+
+    def __enter__(self):
+        try:
+            self._run("initdb", "-D", self.datadir, "-U", "postgres", "-A", "trust")
+            self._run("pg_ctl", "-D", self.datadir, "-w", "-l", os.path.join(self.tmpdir, "log"),
+                      "-o", "-k %s -p %d -c listen_addresses=''" % (self.tmpdir, self.port), "start")
+            self.started = True
+            self._run("psql", "-q", "-h", self.tmpdir, "-p", str(self.port), "-U", "postgres",
+                      "-f", bc.dataFile("db_create_v3.psql"), "postgres")
+        except (OSError, subprocess.CalledProcessError):
+            self.__exit__()
+            raise
+        with open(self.yamlfile, "w") as out:
+            out.write("adsb_logger:\n  dbhost: %s\n  dbport: %d\n  dbuser: postgres\n"
+                      "  dbpassword: bench\n  dbname: PlaneReports\n" % (self.tmpdir, self.port))
+        return self
+
+    def __exit__(self, *exc):
+        if self.started:
+            subprocess.run([os.path.join(self.bindir, "pg_ctl"), "-D", self.datadir, "-m", "immediate",
+                            "-w", "stop"], capture_output=True)
+            self.started = False
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def timeDB(results, dbconn, scale=1, repeat=5):
+    """Runs the DB benchmarks against a connection, rolling back what they do"""
+    planes = []
+    for plane in bc.readReports():
+        plane.reporter = REPORTER
+        planes.append(plane)
+    batch = pr.ReportBatch.fromPlanes(planes * scale)
+    few = planes[:1000]
+
+    def logRows():
+        for plane in few:
+            plane.logToDB(dbconn)
+        dbconn.rollback()
+
+    def copyBatch():
+        batch.copyToDB(dbconn)
+        dbconn.rollback()
+
+    results.run(GROUP, "PlaneReport.logToDB", logRows, items=len(few), repeat=repeat)
+    results.run(GROUP, "ReportBatch.copyToDB", copyBatch, items=len(batch), repeat=repeat)
+
+    #
+    # The reads see the reports loaded earlier in the same transaction
+    #
+    batch.copyToDB(dbconn)
+    try:
+        def readPlanes():
+            cur = pr.queryReportsDB(dbconn, myReporter=REPORTER)
+            count = 0
+            data = pr.readReportsDB(cur, 10000)
+            while data:
+                count += len(data)
+                data = pr.readReportsDB(cur, 10000)
+            cur.close()
+            return count
+
+        def readBatches():
+            cur = pr.queryReportsDB(dbconn, myReporter=REPORTER)
+            count = sum(len(data) for data in pr.readBatchesDB(cur, 10000))
+            cur.close()
+            return count
+
+        def readRunway():
+            cur = pr.queryReportsDB(dbconn, myReporter=REPORTER, runways=RUNWAY_AREA)
+            count = sum(len(data) for data in pr.readBatchesDB(cur, 10000))
+            cur.close()
+            return count
+
+        results.run(GROUP, "readReportsDB", readPlanes, items=len(batch), repeat=repeat)
+        results.run(GROUP, "readBatchesDB", readBatches, items=len(batch), repeat=repeat)
+        results.run(GROUP, "runway query", readRunway, items=len(batch), repeat=repeat,
+                    found=readRunway())
+    finally:
+        dbconn.rollback()
+
+
+def runBenchmarks(results, scale=1, repeat=5, dbConf=None):
+    """
+    Runs the DB benchmarks, adding their timings to results.
+
+    Args:
+        results: a Results object
+        scale: size of the fixtures
+        repeat: number of times to time each benchmark
+        dbConf: yaml file of a DB to use, rather than a disposable one (optional)
+    """
+    def skipAll(reason):
+        for name in NAMES:
+            results.skip(GROUP, name, reason)
+
+    if psycopg2 is None:
+        skipAll("psycopg2 isn't installed")
+        return
+    if dbConf:
+        dbconn = pr.connDB(dbConf)
+        try:
+            timeDB(results, dbconn, scale=scale, repeat=repeat)
+        finally:
+            dbconn.close()
+        return
+    bindir = pgBinDir()
+    if not bindir or not os.path.exists(os.path.join(bindir, "initdb")):
+        skipAll("no PostgreSQL server programs found (set PG_BIN, or use -y)")
+        return
+    try:
+        with DisposableCluster(bindir) as cluster:
+            dbconn = pr.connDB(cluster.yamlfile)
+            try:
+                timeDB(results, dbconn, scale=scale, repeat=repeat)
+            finally:
+                dbconn.close()
+    except (OSError, subprocess.CalledProcessError) as err:
+        skipAll("couldn't set up a disposable PostGIS DB: %s" %
+                (getattr(err, "stderr", None) or err))
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark logging and reading reports in the DB")
+bc.addCommonArgs(parser)
+parser.add_argument('-y', '--db-conf-file', dest='db_conf',
+                    help="A yaml file containing the DB connection parameters, rather than a disposable DB")
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat, dbConf=args.db_conf)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for the distance calculations.
+#
+"""
+Times geodistance and haversine, a call per pair of points as the scripts use them,
+against ReportBatch.distances doing the lot at once, over the points of the
+shipped range rings and reports.
+"""
+import argparse
+
+import numpy as np
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneReport as pr
+
+GROUP = "geo"
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the distance benchmarks, adding their timings to results"""
+    rings = np.tile(bc.ringPoints(), (scale, 1))
+    lat0, lon0 = float(rings[:, 0].mean()), float(rings[:, 1].mean())
+    pairs = list(zip(rings[:, 1].tolist(), rings[:, 0].tolist()))
+    results.run(GROUP, "geodistance", lambda: [pr.geodistance(lon, lat, lon0, lat0) for lon, lat in pairs],
+                items=len(pairs), unit="dists", repeat=repeat)
+    results.run(GROUP, "haversine", lambda: [pr.haversine(lon, lat, lon0, lat0) for lon, lat in pairs],
+                items=len(pairs), unit="dists", repeat=repeat)
+
+    planes = bc.readReports() * scale
+    reporter = pr.Reporter(name="Bench", mytype="Fixed", lon=lon0, lat=lat0, url="", location="")
+    results.run(GROUP, "PlaneReport.distance", lambda: [plane.distance(reporter) for plane in planes],
+                items=len(planes), unit="dists", repeat=repeat)
+    batch = pr.ReportBatch.fromPlanes(planes)
+    results.run(GROUP, "ReportBatch.distances", lambda: batch.distances(lon0, lat0),
+                items=len(batch), unit="dists", repeat=repeat)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the distance calculations")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for getting reports in: from dump1090, VRS and files.
+#
+"""
+Times getPlanesFromURL against a local stub server (dump1090 mutability, piaware
+3.6, VRS and plain list documents), PlaneReport construction and to_JSON, and
+readFromFile and readVRSFromFile over fixtures built from the shipped data.
+"""
+import os
+import json
+import argparse
+import tempfile
+
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneReport as pr
+
+GROUP = "ingest"
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the ingest benchmarks, adding their timings to results"""
+    planes = bc.readReports()
+    records = bc.reportRecords()
+    #
+    # Parsing the documents dump1090 and VRS serve
+    #
+    pages = {"/data/aircraft.json": bc.aircraftDocument(scale * 20),
+             "/piaware/aircraft.json": bc.aircraftDocument(scale * 20, variant="piaware"),
+             "/VirtualRadar/AircraftList.json": bc.vrsDocument(planes[:1000 * scale], trailLength=1),
+             "/data.json": [dict(rec, isMetric=False) for rec in records[:200 * scale]]}
+    with bc.StubServer(pages) as server:
+        for name, path in [("getPlanesFromURL mutability", "/data/aircraft.json"),
+                           ("getPlanesFromURL piaware", "/piaware/aircraft.json"),
+                           ("getPlanesFromURL VRS", "/VirtualRadar/AircraftList.json"),
+                           ("getPlanesFromURL data.json", "/data.json")]:
+            url = server.url(path)
+            num = len(pr.getPlanesFromURL(url, mytimeout=10))
+            results.run(GROUP, name, lambda: pr.getPlanesFromURL(url, mytimeout=10),
+                        items=num, repeat=repeat * 4)
+
+    #
+    # Building reports, and turning them back into lines
+    #
+    results.run(GROUP, "PlaneReport(**record)", lambda: [pr.PlaneReport(**rec) for rec in records],
+                items=len(records), repeat=repeat)
+    results.run(GROUP, "PlaneReport.to_JSON", lambda: [plane.to_JSON() for plane in planes],
+                items=len(planes), repeat=repeat)
+
+    #
+    # Reading files - the shipped reports repeated scale times, and a VRS archive of them
+    #
+    lines = [plane.to_JSON() + "\n" for plane in planes]
+    fd, reportfile = tempfile.mkstemp(prefix="planereports-", suffix=".dat")
+    with os.fdopen(fd, "w", encoding="latin-1") as out:
+        out.write("".join(lines) * scale)
+    fd, vrsfile = tempfile.mkstemp(prefix="planereports-", suffix=".json")
+    vrs = bc.vrsDocument(planes * scale)
+    with os.fdopen(fd, "w") as out:
+        json.dump(vrs, out)
+    try:
+        def readReportFile():
+            inputfile = pr.openFile(reportfile)
+            count = 0
+            data = pr.readFromFile(inputfile, 10000)
+            while data:
+                count += len(data)
+                data = pr.readFromFile(inputfile, 10000)
+            inputfile.close()
+            return count
+
+        def readVRSFile():
+            inputfile = pr.openFile(vrsfile)
+            data = pr.readVRSFromFile(inputfile)
+            inputfile.close()
+            return len(data)
+
+        results.run(GROUP, "readFromFile", readReportFile, items=len(lines) * scale, repeat=repeat)
+        results.run(GROUP, "readVRSFromFile", readVRSFile, items=readVRSFile(), repeat=repeat)
+    finally:
+        os.remove(reportfile)
+        os.remove(vrsfile)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark getting plane reports from dump1090, VRS and files")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
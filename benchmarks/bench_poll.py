@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for polling a receiver, against the mock dump1090/VRS server.
+#
+"""
+Times getPlanesFromURL polling PlaneMockServer serving synthetic traffic, as
+planelogger.py does, with a quick server, a slow and jittery one, and one that
+leaves some requests hanging, counting the polls that time out.
+"""
+import time
+import argparse
+
+import requests
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneReport as pr
+import PlaneMockServer as pms
+
+GROUP = "poll"
+CLIENT_TIMEOUT = 0.5
+#
+# (name, latency, jitter, timeout rate) of the servers polled
+#
+SERVERS = [("quick", 0.0, 0.0, 0.0),
+           ("slow 100ms +-50ms", 0.1, 0.05, 0.0),
+           ("10% hanging", 0.0, 0.0, 0.1)]
+PATHS = [("aircraft.json", "/data/aircraft.json", None),
+         ("VRS", "/VirtualRadar/AircraftList.json", {"fDstL": 0, "fDstU": 450, "lat": -35.343135, "lng": 149.141059})]
+
+
+def poll(url, params, numPolls):
+    """Polls a URL, returning (seconds taken, reports read, polls timed out)"""
+    reports = 0
+    timeouts = 0
+    t1 = time.perf_counter()
+    for i in range(numPolls):
+        try:
+            reports += len(pr.getPlanesFromURL(url, myparams=params, mytimeout=CLIENT_TIMEOUT))
+        except requests.exceptions.Timeout:
+            timeouts += 1
+    return time.perf_counter() - t1, reports, timeouts
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the polling benchmarks, adding their timings to results"""
+    numAircraft = 200 * scale
+    start = time.time()
+    replay = pms.ReportReplay(lambda: pms.syntheticBatches(numAircraft, -35.343135, 149.141059,
+                                                           startTime=start - 600))
+    numPolls = 10 * repeat
+    for server, latency, jitter, timeoutRate in SERVERS:
+        with pms.MockReceiver(replay, latency=latency, jitter=jitter, timeoutRate=timeoutRate,
+                              hang=CLIENT_TIMEOUT * 2) as mock:
+            for name, path, params in PATHS:
+                elapsed, reports, timeouts = poll(mock.url(path), params, numPolls)
+                results.add(GROUP, "%s %s" % (name, server), elapsed / numPolls, elapsed / numPolls,
+                            items=reports / numPolls, unit="recs", polls=numPolls, timeouts=timeouts,
+                            aircraft=numAircraft)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark polling a receiver, against the mock server")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+#
+# Throughput benchmark for reading files of PlaneReport to_JSON lines.
+#
+"""
+Times readFromFile, and ReportFileReader yielding both PlaneReports and
+ReportBatches, over the shipped sample files and a large synthetic file
+built by repeating one of them.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneReport as pr
+import PlaneProfile as pp
+
+DATADIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SAMPLE_FILES = ["TEY-1.dat", "N999LR-2017-02-16.dat"]
+
+
+def buildSyntheticFile(template, numLines):
+    """
+    Write a file of numLines lines by repeating the lines of template,
+    returning its pathname. Caller is responsible for removing it.
+    """
+    with open(template, "r", encoding="latin-1") as fp:
+        lines = [line for line in fp if line.strip()]
+    fd, pathname = tempfile.mkstemp(prefix="planereports-", suffix=".dat")
+    with os.fdopen(fd, "w", encoding="latin-1") as out:
+        block = "".join(lines)
+        written = 0
+        while written + len(lines) <= numLines:
+            out.write(block)
+            written += len(lines)
+        out.write("".join(lines[:numLines - written]))
+    return pathname
+
+
+def timeReadFromFile(pathname, numRecs):
+    inputfile = pr.openFile(pathname)
+    count = 0
+    data = pr.readFromFile(inputfile, numRecs)
+    while data:
+        count += len(data)
+        data = pr.readFromFile(inputfile, numRecs)
+    inputfile.close()
+    return count
+
+
+def timeReaderPlanes(pathname, numRecs):
+    inputfile = pr.openFile(pathname)
+    count = 0
+    for data in pr.ReportFileReader(inputfile, numRecs=numRecs):
+        count += len(data)
+    inputfile.close()
+    return count
+
+
+def timeReaderBatches(pathname, numRecs):
+    inputfile = pr.openFile(pathname)
+    count = 0
+    for batch in pr.ReportFileReader(inputfile, numRecs=numRecs).batches():
+        count += len(batch)
+    inputfile.close()
+    return count
+
+
+METHODS = [("readFromFile", timeReadFromFile),
+           ("ReportFileReader", timeReaderPlanes),
+           ("ReportFileReader.batches", timeReaderBatches)]
+
+
+def runBenchmark(pathname, numRecs, methods=METHODS):
+    """Print records/second for each method over a file"""
+    size = os.path.getsize(pathname)
+    for name, func in methods:
+        t1 = time.time()
+        count = func(pathname, numRecs)
+        t2 = time.time()
+        elapsed = max(t2 - t1, 1e-9)
+        print("%-40s %-26s %10d recs %8.2f s %12.0f recs/s %8.1f MB/s" %
+              (os.path.basename(pathname), name, count, elapsed, count / elapsed,
+               size / elapsed / 1e6))
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark reading files of plane reports")
+parser.add_argument('-n', '--num-recs', dest='numRecs', type=int, default=10000,
+                    help="Number of records to read at a time (default 10000)")
+parser.add_argument('-N', '--synthetic-lines', dest='syntheticLines', type=int, default=10000000,
+                    help="Number of lines in the synthetic file, 0 to skip it (default 10000000)")
+parser.add_argument('--skip-slow', dest='skipSlow', action="store_true", default=False,
+                    help="Only time batch decoding on the synthetic file")
+parser.add_argument('-f', '--file', dest='datafiles', action='append',
+                    help="Additional files to benchmark")
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    files = [os.path.join(DATADIR, fn) for fn in SAMPLE_FILES]
+    if args.datafiles:
+        files = files + args.datafiles
+    for fn in files:
+        runBenchmark(fn, args.numRecs)
+
+    if args.syntheticLines > 0:
+        synthetic = buildSyntheticFile(os.path.join(DATADIR, SAMPLE_FILES[0]), args.syntheticLines)
+        try:
+            if args.skipSlow:
+                runBenchmark(synthetic, args.numRecs, methods=METHODS[2:])
+            else:
+                runBenchmark(synthetic, args.numRecs)
+        finally:
+            os.remove(synthetic)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+#
+# Benchmarks for the movie tools' frame handling.
+#
+"""
+Times splitting reports into movie frames with frameOffsets, and keeping the plane
+trails up to date with a TrailBuffer frame by frame, as planeplotmovie.py does,
+without drawing anything.
+"""
+import argparse
+
+import numpy as np
+import benchcommon as bc
+import PlaneProfile as pp
+import PlaneReport as pr
+import PlaneMovie as pm
+
+GROUP = "render"
+SEC_PER_FRAME = 10
+TRAIL_LENGTH = 10
+
+
+def runBenchmarks(results, scale=1, repeat=5):
+    """Runs the frame benchmarks, adding their timings to results"""
+    #
+    # The sample files are from different days, so each is moved to start at the
+    # same time, and bigger scales lay copies of the lot end to end
+    #
+    batches = []
+    for name in bc.REPORT_FILES:
+        batch = pr.ReportBatch.fromPlanes(bc.readReports([name]))
+        batch.time = batch.time - batch.time.min()
+        batches.append(batch)
+    batch = pr.ReportBatch.concatenate(batches)
+    span = int(batch.time.max()) + 1
+    copies = []
+    for copyNum in range(scale):
+        copied = batch[np.arange(len(batch))]
+        copied.time = copied.time + copyNum * span
+        copies.append(copied)
+    reports = pr.ReportBatch.concatenate(copies).sortByTime()
+    first_time = float(reports.time[0])
+
+    offsets = results.run(GROUP, "frameOffsets",
+                          lambda: pr.frameOffsets(reports.time, first_time, SEC_PER_FRAME),
+                          items=len(reports), repeat=repeat)
+    num_frames = len(offsets) - 1
+    points = np.column_stack((reports.lon, reports.lat))
+    hexes = reports.hex.tolist()
+
+    def framePoints(frame):
+        start, end = offsets[frame], offsets[frame + 1]
+        return hexes[start:end], points[start:end]
+
+    def trails():
+        buffer = pm.TrailBuffer(TRAIL_LENGTH)
+        count = 0
+        for frame in range(num_frames):
+            buffer.advanceTo(frame, framePoints)
+            count += len(buffer.segments()[0])
+        return count
+
+    results.run(GROUP, "TrailBuffer per frame", trails, items=num_frames, unit="frames",
+                repeat=repeat)
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the movie tools' frame handling")
+bc.addCommonArgs(parser)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    results = bc.Results(quiet=args.quiet)
+    runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,284 @@
+#
+# Shared pieces of the benchmark scripts: timing, JSON results, fixtures built
+# from the shipped sample data, and a stub HTTP server standing in for dump1090.
+#
+"""
+Helpers shared by the bench_*.py scripts and run_benchmarks.py.
+
+Each benchmark is timed a few times over, keeping the best and median times, and
+recorded in a Results object, which can be written out as JSON so that runs on
+different commits can be compared.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import platform
+import threading
+import subprocess
+import http.server
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(BENCHDIR, "..")
+sys.path.insert(0, DATADIR)
+import numpy as np
+import PlaneReport as pr
+import PlaneProfile as pp
+
+REPORT_FILES = ["TEY.dat", "TEY-1.dat", "TEY-2.dat", "TEY-11.dat", "N999LR-2017-02-16.dat"]
+RING_FILES = ["upintheair.json.Home1", "upintheair.json.paterson", "upintheair.json.pollock"]
+AIRCRAFT_FILE = "aircraft.json"
+
+
+def dataFile(name):
+    """Returns the pathname of one of the shipped sample files"""
+    return os.path.join(DATADIR, name)
+
+
+def timeCall(func, repeat=5, number=1):
+    """
+    Times a function, taking the best and median of several runs.
+
+    Args:
+        func: function to time, called with no arguments
+        repeat: number of times to time it
+        number: number of calls per timing
+
+    Returns:
+        (best seconds per call, median seconds per call, result of the last call)
+    """
+    times = []
+    result = None
+    for i in range(repeat):
+        t1 = time.perf_counter()
+        for j in range(number):
+            result = func()
+        times.append((time.perf_counter() - t1) / number)
+    return min(times), float(np.median(times)), result
+
+
+class Results(object):
+    """
+    Collects benchmark timings, printing each as it comes in.
+
+    Args:
+        quiet: don't print the timings (optional)
+    """
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.benchmarks = []
+
+    def add(self, group, name, best, median, items=None, unit="recs", **extra):
+        """
+        Records a benchmark's timing.
+
+        Args:
+            group: the area being benchmarked (ingest, geo, clean, render, db)
+            name: name of the benchmark
+            best, median: seconds per call
+            items: number of things processed per call, for a rate (optional)
+            unit: what the items are (optional)
+            extra: anything else worth keeping with the result
+        """
+        entry = {"group": group, "name": name, "best": best, "median": median}
+        if items is not None:
+            entry.update({"items": items, "unit": unit, "rate": items / max(best, 1e-12)})
+        entry.update(extra)
+        self.benchmarks.append(entry)
+        if not self.quiet:
+            if items is not None:
+                print("%-8s %-44s %10.4f s %10.4f s %14.0f %s/s" %
+                      (group, name, best, median, entry["rate"], unit))
+            else:
+                print("%-8s %-44s %10.4f s %10.4f s" % (group, name, best, median))
+
+    def run(self, group, name, func, items=None, unit="recs", repeat=5, number=1, **extra):
+        """Times func and records the result, returning what func returned"""
+        best, median, result = timeCall(func, repeat=repeat, number=number)
+        self.add(group, name, best, median, items=items, unit=unit, **extra)
+        return result
+
+    def skip(self, group, name, reason):
+        """Records a benchmark that couldn't be run"""
+        self.benchmarks.append({"group": group, "name": name, "skipped": reason})
+        if not self.quiet:
+            print("%-8s %-44s skipped: %s" % (group, name, reason))
+
+    def save(self, pathname):
+        """Writes the results, and what they were run on, to a JSON file"""
+        doc = {"metadata": runMetadata(), "benchmarks": self.benchmarks}
+        with open(pathname, "w") as out:
+            json.dump(doc, out, indent=1, sort_keys=True)
+
+
+def runMetadata():
+    """Returns a dict describing the code and machine the benchmarks ran on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=DATADIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def addCommonArgs(parser):
+    """Adds the arguments every benchmark script takes"""
+    parser.add_argument('-o', '--output', dest='output',
+                        help="Write the results to this JSON file")
+    parser.add_argument('-s', '--scale', dest='scale', type=int, default=1,
+                        help="Multiply the size of the synthetic fixtures by this (default 1)")
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=5,
+                        help="Number of times each benchmark is timed (default 5)")
+    parser.add_argument('-q', '--quiet', action="store_true", dest='quiet', default=False,
+                        help="Don't print the timings as they're taken")
+    pp.addProfileArgs(parser)
+
+
+#
+# Fixtures
+#
+def readReports(names=REPORT_FILES):
+    """Returns a list of the PlaneReports in the shipped report files"""
+    planes = []
+    for name in names:
+        inputfile = pr.openFile(dataFile(name))
+        planes.extend(pr.readFromFile(inputfile, 1000000))
+        inputfile.close()
+    return planes
+
+
+def reportRecords(names=REPORT_FILES):
+    """Returns the shipped reports as the dicts their lines decode to"""
+    records = []
+    for name in names:
+        with open(dataFile(name), encoding="latin-1") as fp:
+            records.extend(json.loads(line) for line in fp if line.strip())
+    return records
+
+
+def ringPoints():
+    """Returns an (n x 2) array of the lat, lon points of the shipped range rings"""
+    points = []
+    for name in RING_FILES:
+        with open(dataFile(name)) as fp:
+            for ring in json.load(fp)["rings"]:
+                points.extend(ring["points"])
+    return np.array(points, dtype=np.float64)
+
+
+def aircraftDocument(scale=1, variant="mutability", seed=1):
+    """
+    Builds an aircraft.json document by copying the shipped one scale times over,
+    each copy with fresh hex codes and nudged positions.
+
+    Args:
+        scale: number of copies of the shipped aircraft
+        variant: "mutability" for the shipped format, "piaware" for piaware 3.6's
+                 renamed fields
+        seed: seed for the nudges, so the fixture is the same every run
+
+    Returns:
+        the document, as a dict
+    """
+    with open(dataFile(AIRCRAFT_FILE)) as fp:
+        doc = json.load(fp)
+    rand = random.Random(seed)
+    aircraft = []
+    for copyNum in range(scale):
+        for pl in doc["aircraft"]:
+            pl = copy.deepcopy(pl)
+            pl["hex"] = "%06x" % ((int(pl["hex"], 16) + copyNum * 0x1000) & 0xffffff)
+            if "lat" in pl:
+                pl["lat"] += rand.uniform(-0.1, 0.1)
+                pl["lon"] += rand.uniform(-0.1, 0.1)
+            if variant == "piaware":
+                if "altitude" in pl:
+                    pl["alt_baro"] = pl.pop("altitude")
+                if "speed" in pl:
+                    pl["gs"] = pl.pop("speed")
+                if "vert_rate" in pl:
+                    pl["baro_rate"] = pl.pop("vert_rate")
+            aircraft.append(pl)
+    doc["aircraft"] = aircraft
+    return doc
+
+
+def vrsDocument(planes, trailLength=10):
+    """
+    Builds a VRS AircraftList.json style document from PlaneReports, one aircraft per
+    trailLength reports, each with those reports as its Cos short trail.
+
+    Args:
+        planes: list of PlaneReports (metric)
+        trailLength: number of trail points per aircraft
+
+    Returns:
+        the document, as a dict
+    """
+    aircraft = []
+    for start in range(0, len(planes) - trailLength + 1, trailLength):
+        trail = planes[start:start + trailLength]
+        last = trail[-1]
+        cos = []
+        for plane in trail:
+            cos.extend([plane.lat, plane.lon, plane.time * 1000,
+                        plane.altitude / pr.FEET_TO_METRES])
+        aircraft.append({"PosTime": last.time * 1000, "Icao": last.hex.upper(),
+                         "Alt": int(last.altitude / pr.FEET_TO_METRES),
+                         "Spd": last.speed / pr.KNOTS_TO_KMH, "Sqk": last.squawk,
+                         "Call": (last.flight or "").strip(), "Trak": last.track,
+                         "Long": last.lon, "Lat": last.lat, "Gnd": bool(last.isGnd),
+                         "CMsgs": last.messages, "Mlat": bool(last.mlat),
+                         "Vsi": last.vert_rate / pr.FEET_TO_METRES, "Cos": cos, "TT": "a"})
+    return {"acList": aircraft, "totalAc": len(aircraft), "src": 1, "stm": int(time.time() * 1000)}
+
+
+class StubServer(object):
+    """
+    A local HTTP server standing in for dump1090, serving fixed documents from a
+    background thread, so getPlanesFromURL can be timed without the network.
+
+    Args:
+        pages: dict of path to document (dict or list), served as JSON
+    """
+
+    def __init__(self, pages):
+        bodies = {path: json.dumps(doc).encode() for path, doc in pages.items()}
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = bodies.get(self.path.split("?")[0])
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        """Returns the URL of a page"""
+        return "http://127.0.0.1:%d%s" % (self.server.server_address[1], path)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+#
+# Run all the benchmarks, writing the results to a JSON file.
+#
+"""
+Runs the ingest, geo, clean, render, db, poll and cli benchmarks (or a choice of them) and
+saves the timings, with the commit and machine they were taken on, as JSON, so
+that runs before and after a change can be compared.
+"""
+import argparse
+
+import benchcommon as bc
+import PlaneProfile as pp
+import bench_ingest
+import bench_geo
+import bench_clean
+import bench_render
+import bench_db
+import bench_poll
+import bench_cli
+
+SUITES = {"ingest": bench_ingest, "geo": bench_geo, "clean": bench_clean,
+          "render": bench_render, "db": bench_db, "poll": bench_poll,
+          "cli": bench_cli}
+
+parser = argparse.ArgumentParser(
+    description="Run the benchmarks and save the results as JSON")
+bc.addCommonArgs(parser)
+parser.add_argument('-b', '--bench', dest='suites',
+                    help="Benchmarks to run, separated by commas (default %s)" % ",".join(SUITES))
+parser.add_argument('-y', '--db-conf-file', dest='db_conf',
+                    help="A yaml file containing the DB connection parameters, rather than a disposable DB")
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    suites = args.suites.split(",") if args.suites else list(SUITES)
+    for suite in suites:
+        if suite not in SUITES:
+            print("Unknown benchmark", suite, "- choose from", ",".join(SUITES))
+            exit(1)
+    results = bc.Results(quiet=args.quiet)
+    for suite in suites:
+        if suite == "db":
+            bench_db.runBenchmarks(results, scale=args.scale, repeat=args.repeat, dbConf=args.db_conf)
+        else:
+            SUITES[suite].runBenchmarks(results, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        results.save(args.output)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
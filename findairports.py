@@ -4,7 +4,9 @@
 import time
 import argparse
 import PlaneReport as pr
+import PlaneAirports as pa
 from shapely.geometry import Point
+import PlaneProfile as pp
 
 parser = argparse.ArgumentParser(
     description="Find airports withion a given distance from a location (either lat/lon pair or reporter)")
@@ -32,50 +34,59 @@ parser.add_argument('-d', '--distance', dest='distance',
 parser.add_argument('-y', '--db-conf-file', dest='db_conf',
                     help="A yaml file containing the DB connection parameters")
 
-args = parser.parse_args()
+parser.add_argument('--apt-file', dest='aptFile',
+                    help="Read the airports from this apt.dat file, rather than the DB")
 
-if (not args.latitude and not args.reporter) or (not args.longitude and not args.reporter):
-    print("Need a location of some sort - either reporter or lat/lon pair")
-    exit(1)
+parser.add_argument('--no-cache', action="store_false", dest='cache', default=True,
+                    help="Read the airports afresh, rather than using (and refreshing) the airport index cache")
 
-if not args.db_conf:
-    print("Need a dbconfig file to read database!")
-    exit(1)
+pp.addProfileArgs(parser)
 
-dbconn = pr.connDB(args.db_conf)
 
-if args.latitude and args.longitude:
-    point = Point(args.longitude, args.latitude)
-    reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude,
-                           location=point.wkb_hex, url="", mytype="")
-else:
-    reporter = pr.readReporter(dbconn, key=args.reporter, printQuery=args.debug)
+def main(argv=None):
+    """Prints the airports within a distance of a reporter, or a lat/lon"""
+    args = parser.parse_args(argv)
 
-if args.debug:
-    print(reporter.to_JSON())
+    if (not args.latitude and not args.reporter) or (not args.longitude and not args.reporter):
+        print("Need a location of some sort - either reporter or lat/lon pair")
+        exit(1)
 
-postSql = None
+    if not args.db_conf and (args.reporter or not args.aptFile):
+        print("Need a dbconfig file to read database!")
+        exit(1)
 
-if args.sortOrder:
-    if args.sortOrder == "name":
-        postSql = "order by name"
-    elif args.sortOrder == "icao":
-        postSql = "order by icao"
-    elif args.sortOrder == "dist":
-        postSql = "order by ST_Distance(location, '%s')" % reporter.location
-    else:
+    if args.sortOrder and args.sortOrder not in ["dist", "name", "icao"]:
         print("sort order requires one of dist, icao or name")
         exit(1)
 
+    dbconn = None
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
 
-airports = pr.readAirport(dbconn, key='%', maxDistance=(args.distance * 1000.0),
-                          reporterLocation=reporter.location, printQuery=args.debug,
-                          postSql=postSql)
+    if args.latitude and args.longitude:
+        point = Point(args.longitude, args.latitude)
+        reporter = pr.Reporter(name="", lon=args.longitude, lat=args.latitude,
+                               location=point.wkb_hex, url="", mytype="")
+    else:
+        reporter = pr.readReporter(dbconn, key=args.reporter, printQuery=args.debug)
 
-print(len(airports))
-for airport in airports:
-    print(airport.icao, airport.lat, airport.lon, airport.altitude, reporter.distance(airport) / 1000.0, airport.name)
+    if args.debug:
+        print(reporter.to_JSON())
+
+    index = pa.loadAirportIndex(dbconn=dbconn, aptFile=args.aptFile, debug=args.debug,
+                                cacheFile=pa.AIRPORT_CACHE_FILE if args.cache else None)
+
+    airports = index.within(reporter.lon, reporter.lat, args.distance * 1000.0)
+
+    if args.sortOrder == "name":
+        airports.sort(key=lambda found: found[0].name)
+    elif args.sortOrder == "icao":
+        airports.sort(key=lambda found: found[0].icao)
 
-#airport_list = pr.readAirport(dbconn, args.airport, printQuery=args.debug, maxDistance=args.distance, reporterLocation=reporter.)
+    print(len(airports))
+    for airport, dist in airports:
+        print(airport.icao, airport.lat, airport.lon, airport.altitude, dist / 1000.0, airport.name)
 
 
+if __name__ == "__main__":
+    pp.runMain(main)
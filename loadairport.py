@@ -3,9 +3,7 @@
 #
 import argparse
 import PlaneReport as pr
-
-print("Deprecated! - Do not use!")
-exit(1)
+import PlaneProfile as pp
 
 parser = argparse.ArgumentParser(
     description="Load an airport into the DB from a simple text file")
@@ -18,23 +16,35 @@ parser.add_argument('--debug', action="store_true",
 parser.add_argument('-f', '--file', dest='datafile',
                     help="A file to load data from to populate a database (only makes sense when a DB Conf file is specified)")
 
-args = parser.parse_args()
+pp.addProfileArgs(parser)
 
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(1)
 
-if not args.datafile:
-    print("A valid airport file is needed!")
+def main(argv=None):
+    """Loads an airport from a simple text file into the DB - deprecated"""
+    print("Deprecated! - Do not use!")
     exit(1)
 
-dbconn = pr.connDB(args.db_conf)
-inputfile = pr.openFile(args.datafile)
+    args = parser.parse_args(argv)
+
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
+
+    if not args.datafile:
+        print("A valid airport file is needed!")
+        exit(1)
+
+    dbconn = pr.connDB(args.db_conf)
+    inputfile = pr.openFile(args.datafile)
+
+    airport = pr.readAirportFromFile(inputfile)
+
+    airport.logToDB(dbconn, update=args.update, printQuery=args.debug)
+    dbconn.commit()
 
-airport = pr.readAirportFromFile(inputfile)
+    if args.debug:
+        print(airport.to_JSON())
 
-airport.logToDB(dbconn, update=args.update, printQuery=args.debug)
-dbconn.commit()
 
-if args.debug:
-    print(airport.to_JSON())
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -4,142 +4,34 @@
 #
 """
 Attempts to locate a given airport in the apt.dat file and optionally insert it into the database.
+Without an airport, every airport in the file is read, in parallel, and bulk loaded into the database.
 """
+import os
+import json
+import time
 import argparse
+import multiprocessing
+import psycopg2
 import PlaneReport as pr
-import datetime
-import time
-from datetime import date, timedelta
-from geographiclib.geodesic import Geodesic
-import math
-
-def runwaypolygon(width, lat1, lon1, lat2, lon2):
-    geod = Geodesic.WGS84
-    g = geod.Inverse(lat1, lon1, lat2, lon2)
-    bearing = g['azi1']
-    b1 =  bearing + 90.0
-    if b1 >= 360.0:
-        b1 = b1 - 360.0
-    b2 = bearing - 90.0
-    if b2 < 0.0:
-        b2 = b2 + 360.0
-    d1 = geod.Direct(lat1, lon1, b1, width / 2.0)
-    cnr1lat = d1['lat2']
-    cnr1lon = d1['lon2']
-    d2 = geod.Direct(lat1, lon1, b2, width / 2.0)
-    cnr2lat = d2['lat2']
-    cnr2lon = d2['lon2']
-    d3 = geod.Direct(lat2, lon2, b2, width / 2.0)
-    cnr3lat = d3['lat2']
-    cnr3lon = d3['lon2']
-    d4 = geod.Direct(lat2, lon2, b1, width / 2.0)
-    cnr4lat = d4['lat2']
-    cnr4lon = d4['lon2']
-     
-    runwaypoly = [(cnr1lat, cnr1lon), (cnr2lat, cnr2lon),
-              (cnr3lat, cnr3lon), (cnr4lat, cnr4lon)]
-    return runwaypoly
-
-def helipadpolygon(lat, lon, bearing, length, width):
-    geod = Geodesic.WGS84
-    b1 = bearing
-    b2 = bearing - 180.0
-    if b2 < 0.0:
-        b2 = b2 + 360.0
-    d =  geod.Direct(lat, lon, b1, length / 2.0)
-    ta1 = d['lat2']
-    to1 = d['lon2']
-    d =  geod.Direct(lat, lon, b2, length / 2.0)
-    ta2 = d['lat2']
-    to2 = d['lon2']
-    return runwaypolygon(width, ta1, to1, ta2, to2)
-
-def returnmidpoint(lat1, lon1, lat2, lon2):
-    g = Geodesic.WGS84.Inverse(lat1, lon1, lat2, lon2);
-    # Compute midpoint starting at 1
-    h1 = Geodesic.WGS84.Direct(lat1, lon1, g['azi1'], g['s12']/2);
-    return h1['lat2'], h1['lon2']
- 
-#
-# Build a description of an airport with a list of runways. Take the location of
-# the airport as the midpoint of the 1st runway
-#
-def buildAirportRunways (fp, record):
-    airport = {}
-    airport['icao'] = str(record[4])
-    airport['name'] = " ".join(map(str, record[5:]))
-    airport['altitude'] = float(record[1]) * pr.FEET_TO_METRES
-    airport['city'] = ""
-    airport['country'] = ""
-    airport['iata'] = ""
-    runways = []
-    geod = Geodesic.WGS84
-
-    for line in fp:
-        rec = line.split()
-        if len(rec) > 0:
-            #
-            # Another airport, so finish up
-            #
-            if rec[0] == "1" or rec[0] == "16" or rec[0] == "17":
-                break
-            #
-            # Land based runways
-            #
-            if rec[0] == "100" or rec[0] == "101" or rec[0] == "102":
-                runway = {}
-                end1 = ""
-                end2 = ""
-                if rec[0] == "100":
-                    width = float(rec[1])
-                    end1 = rec[8]
-                    lat1 = float(rec[9])
-                    lon1 = float(rec[10])
-                    end2 = rec[17]
-                    lat2 = float(rec[18])
-                    lon2 = float(rec[19])
-                    runway['poly'] = runwaypolygon(width, lat1, lon1, lat2, lon2)
-                    runway['lat'], runway['lon'] = returnmidpoint(lat1, lon1, lat2, lon2)
-                    g = geod.Inverse(lat1, lon1, lat2, lon2)
-                    runway['heading'] = g['azi1']
-                 #
-                # Water based runways
-                #
-                if rec[0] == "101":
-                    width = float(rec[1])
-                    end1 = str(rec[3])
-                    lat1 = float(rec[4])
-                    lon1 = float(rec[5])
-                    end2 = str(rec[6])
-                    lat2 = float(rec[7])
-                    lon2 = float(rec[8])
-                    runway['poly'] = runwaypolygon(width, lat1, lon1, lat2, lon2)
-                    runway['lat'], runway['lon'] = returnmidpoint(lat1, lon1, lat2, lon2)
-                    g = geod.Inverse(lat1, lon1, lat2, lon2)
-                    runway['heading'] = g['azi1']
-                #
-                # Helipad
-                #
-                if rec[0] == "102":
-                    end1 = rec[1]
-                    heading = float(rec[4])
-                    lat = float(rec[2])
-                    lon = float(rec[3])
-                    width = float(rec[6])
-                    length = float(rec[5])
-                    runway['poly'] = helipadpolygon(lat, lon, heading, length, width)
-                    runway['lat'] = lat
-                    runway['lon'] = lon
-                    runway['heading'] = heading
-
-                runway['name'] = " ".join(map(str, [end1, end2])).rstrip()
-                runway['airport'] = airport['icao']
-                runways.append(runway)
-                
-        #
-    airport['lat'] = runways[0]['lat']
-    airport['lon'] = runways[0]['lon']
-    return airport, runways, rec
+import PlaneAptDat as pad
+import PlaneProfile as pp
+
+
+def printAirport(airport, runways, printJSON):
+    if printJSON:
+        print(json.dumps(airport, sort_keys=True))
+        for runway in runways:
+            print(json.dumps(runway, sort_keys=True))
+    else:
+        print(airport)
+        print(runways)
+
+
+def printCacheStats(hits, misses):
+    total = hits + misses
+    print("Runway cache: %d hits, %d misses (%.1f%% hit rate)" %
+          (hits, misses, 100.0 * hits / total if total else 0.0))
+
 
 parser = argparse.ArgumentParser(
     description="Read an apt.dat formatted file and load airport & runway definitions into the database.")
@@ -148,7 +40,7 @@ parser.add_argument('-y', '--db-conf-file', dest='db_conf',
 parser.add_argument('--debug', action="store_true",
                     dest='debug', default=False, help="Turn on debug mode")
 parser.add_argument('-A', '--airport', dest='airport',
-                    help="The ICAO code for the airport we are interested in")
+                    help="The ICAO code(s) of the airport(s) we are interested in, separated by commas")
 parser.add_argument('-l', '--log-to-db', action="store_true", dest='logToDB', default=False,
                     help="Only list events, don't log them to the DBLog events to DB \
                     (default is to only print them out)")
@@ -160,72 +52,142 @@ parser.add_argument('-q', '--quiet', action="store_true", dest='quiet', default=
                     help="If chosen, don't print any output (default is false)")
 parser.add_argument('-u', '--update', action="store_true", dest='update',
                     default=False, help="Update the reporter data, rather than create it")
+parser.add_argument('--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                    help="Number of worker processes reading the file when loading every airport (defaults to the number of CPUs)")
+parser.add_argument('--no-index-cache', action="store_false", dest='indexCache', default=True,
+                    help="Index the file afresh, rather than using (and filling) the cache of apt.dat indexes")
+parser.add_argument('--no-runway-cache', action="store_false", dest='runwayCache', default=True,
+                    help="Work out every runway's outline afresh, rather than using (and filling) the runway cache")
 
 parser.add_argument('-f', '--file', dest='datafile', help='Input datafile')
 
+pp.addProfileArgs(parser)
+
 
-args = parser.parse_args()
-
-dbconn = None
-
-if not args.db_conf and (args.logToDB or args.update):
-    print("A valid URL db configuration file is needed!")
-    exit(1)
-
-if not args.datafile:
-    print("A datafile is required!")
-    exit(1)
-
-if args.db_conf:
-    dbconn = pr.connDB(args.db_conf)
-
-#if not args.airport:
-#    print("An Airport is needed!")
-#    exit(1)
-
-inputfile = pr.openFile(args.datafile)
-
-for line in inputfile:
-    record = line.split()
-    if len(record) > 0:
-        if record[0] == "1" or record[0] == "16" or record[0] == "17":
-            while len(record) > 5:
-                if record[4] == args.airport:
-                    airport, runways, record = buildAirportRunways(inputfile, record)
-                    airportrec = pr.Airport(icao=airport['icao'], iata=airport['iata'], name=airport['name'],
-                                         city=airport['city'], country=airport['country'], altitude=airport['altitude'],
-                                         lon=airport['lon'], lat=airport['lat'])
-                    if dbconn:
-                        airportrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
-                        dbconn.commit()
-                        for runway in runways:
-                            runwayrec = pr.Runway(airport=runway['airport'], name=runway['name'],
-                                                  heading=runway['heading'], runway_points=runway['poly'],
-                                                  lat=runway['lat'], lon=runway['lon'])
-                            runwayrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
-                    if dbconn:
-                        dbconn.commit()
-                    exit(0)
-                elif not args.airport:
-                    airport, runways, record = buildAirportRunways(inputfile, record)
-                    if dbconn:
-                        airportrec = pr.Airport(icao=airport['icao'], iata=airport['iata'], name=airport['name'],
-                                         city=airport['city'], country=airport['country'], altitude=airport['altitude'],
-                                         lon=airport['lon'], lat=airport['lat'])
-                        airportrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
-                        dbconn.commit()
-                        for runway in runways:
-                            runwayrec = pr.Runway(airport=runway['airport'], name=runway['name'],
-                                                  heading=runway['heading'], runway_points=runway['poly'],
-                                                  lat=runway['lat'], lon=runway['lon'])
-                            runwayrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
-                    if dbconn:
-                        dbconn.commit()
-                    print(airport)
-                    print(runways)
-                else:
-                    break
-                    
-
-
-        
+def main(argv=None):
+    """Reads airports and runways from an apt.dat file, printing them or loading them into the DB"""
+    args = parser.parse_args(argv)
+
+    dbconn = None
+
+    if not args.db_conf and (args.logToDB or args.update):
+        print("A valid URL db configuration file is needed!")
+        exit(1)
+
+    if not args.datafile:
+        print("A datafile is required!")
+        exit(1)
+
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
+
+    t1 = time.time()
+    index = pad.AptIndex(args.datafile, cacheDir=pad.APT_CACHE_DIR if args.indexCache else None,
+                         debug=args.debug)
+    if args.debug:
+        print("Index ready in", time.time() - t1, "seconds")
+
+    cache_file = pad.RUNWAY_CACHE_FILE if args.runwayCache else None
+    cache = pad.getRunwayCache(cache_file) if cache_file else None
+
+
+    if args.airport:
+        #
+        # Each airport is found with a seek to where the index says it starts
+        #
+        for icao in args.airport.split(','):
+            lines = index.airportLines(icao)
+            if lines is None:
+                print("Airport", icao, "not found in", args.datafile)
+                exit(1)
+            airports, runways, skipped = pad.buildAirports([lines], cache=cache)
+            if skipped:
+                print("Airport", icao, "has no runways")
+                exit(1)
+            airport = airports[0]
+            if not args.quiet:
+                printAirport(airport, runways, args.printJSON)
+            if dbconn:
+                airportrec = pr.Airport(icao=airport['icao'], iata=airport['iata'], name=airport['name'],
+                                        city=airport['city'], country=airport['country'], altitude=airport['altitude'],
+                                        lon=airport['lon'], lat=airport['lat'])
+                airportrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
+                for runway in runways:
+                    runwayrec = pr.Runway(airport=runway['airport'], name=runway['name'],
+                                          heading=runway['heading'], runway_points=runway['poly'],
+                                          lat=runway['lat'], lon=runway['lon'])
+                    runwayrec.logToDB(dbconn, printQuery=args.debug, update=args.update)
+                dbconn.commit()
+        if cache:
+            cache.save()
+            if args.debug:
+                printCacheStats(cache.hits, cache.misses)
+        return
+
+    #
+    # Every airport - the file is split on airport boundaries, and the pieces read in
+    # parallel. A compressed file has been decompressed into memory, so is read here.
+    #
+    chunks = [(args.datafile, start, end, cache_file) for start, end in index.chunks(args.jobs * 4)]
+    if isinstance(index.data, bytes):
+        results = [pad.buildAirports(pad.recordsIn(index.data.decode("latin-1")), cache=cache) +
+                   ({"hits": cache.hits, "misses": cache.misses, "added": {}} if cache else {},)]
+        pool = None
+    elif args.jobs > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap(pad.parseChunk, chunks)
+    else:
+        pool = None
+        results = map(pad.parseChunk, chunks)
+
+    airports, runways, no_runways = [], [], []
+    cache_hits, cache_misses = 0, 0
+    for chunk_airports, chunk_runways, chunk_skipped, chunk_cache in results:
+        airports.extend(chunk_airports)
+        runways.extend(chunk_runways)
+        no_runways.extend(chunk_skipped)
+        if cache:
+            #
+            # Workers only read the runway cache - what they've added is saved here
+            #
+            cache.update(chunk_cache["added"])
+            cache_hits += chunk_cache["hits"]
+            cache_misses += chunk_cache["misses"]
+    if pool:
+        pool.close()
+        pool.join()
+    if cache:
+        cache.save()
+
+    if args.debug:
+        print("Read", len(airports), "airports and", len(runways), "runways in", time.time() - t1, "seconds,",
+              len(no_runways), "airports without runways skipped")
+    if cache and (args.debug or (dbconn and not args.quiet)):
+        printCacheStats(cache_hits, cache_misses)
+
+    if dbconn:
+        #
+        # One transaction for the lot, so a failed load leaves the tables as they were
+        #
+        t2 = time.time()
+        try:
+            too_long = pad.copyAirports(dbconn, airports, runways, update=args.update, printQuery=args.debug)
+            dbconn.commit()
+        except psycopg2.Error as err:
+            dbconn.rollback()
+            print("Error loading airports", err)
+            exit(-1)
+        if too_long and not args.quiet:
+            print("Skipped", len(too_long), "airports with codes longer than", pad.ICAO_LEN, "characters")
+        if args.debug:
+            print("Loaded into the DB in", time.time() - t2, "seconds")
+    elif not args.quiet:
+        runways_by_airport = {}
+        for runway in runways:
+            runways_by_airport.setdefault(runway['airport'], []).append(runway)
+        for airport in airports:
+            printAirport(airport, runways_by_airport.get(airport['icao'], []), args.printJSON)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
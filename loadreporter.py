@@ -5,6 +5,7 @@
 # from a 4 line text file.
 import argparse
 import PlaneReport as pr
+import PlaneProfile as pp
 
 def readReporterFromFile(inputfile):
     """
@@ -48,29 +49,37 @@ parser.add_argument('-f', '--file', dest='datafile',
 parser.add_argument('-l', '--log-to-db', dest='logToDB', action="store_true",
                     default=False, help="Log the data to the DB")
 
+pp.addProfileArgs(parser)
 
-args = parser.parse_args()
 
-dbconn = False
+def main(argv=None):
+    """Reads a reporter from a text file, printing it or loading it into the DB"""
+    args = parser.parse_args(argv)
 
-if not args.db_conf and (args.logToDB or args.update):
-    print("A valid URL db configuration file is needed to log data to the database!")
-    exit(1)
+    dbconn = False
 
-if not args.datafile:
-    print("A valid reporter file is needed!")
-    exit(1)
+    if not args.db_conf and (args.logToDB or args.update):
+        print("A valid URL db configuration file is needed to log data to the database!")
+        exit(1)
 
-if args.db_conf:
-    dbconn = pr.connDB(args.db_conf)
+    if not args.datafile:
+        print("A valid reporter file is needed!")
+        exit(1)
 
-inputfile = pr.openFile(args.datafile)
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
 
-reporter = readReporterFromFile(inputfile)
+    inputfile = pr.openFile(args.datafile)
 
-if args.logToDB or args.update:
-    reporter.logToDB(dbconn, update=args.update, printQuery=args.debug)
-    dbconn.commit()
+    reporter = readReporterFromFile(inputfile)
 
-if args.debug:
-    print(reporter.to_JSON())
+    if args.logToDB or args.update:
+        reporter.logToDB(dbconn, update=args.update, printQuery=args.debug)
+        dbconn.commit()
+
+    if args.debug:
+        print(reporter.to_JSON())
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
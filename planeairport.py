@@ -12,37 +12,15 @@ from an airport.
 """
 import argparse
 import PlaneReport as pr 
+import PlaneAirports as pa
+import PlaneEvents as pe
+import PlaneRunways as prw
+import itertools
 import datetime
 import time
 from datetime import date, timedelta
+import PlaneProfile as pp
 
-#
-# check to see if a given bearing is within a couple of degrees of another
-#
-def checkbearing(heading1, heading2, slop):
-    if heading1  == heading2:
-        return True
-    lowercheck = False
-    uppercheck = False
-    
-    lowerbound = heading1 - slop
-    if lowerbound < 0:
-        if heading2 >= 0 or heading2 >= (lowerbound + 360):
-            lowercheck = True
-    else:
-        if heading2 >= lowerbound:
-            lowercheck = True
-    
-    upperbound = heading1 + slop
-    if upperbound >= 360:
-        if heading2 <= (upperbound - 360):
-            uppercheck = True
-    else:
-        if heading2 <= upperbound:
-            uppercheck = True
-        
-    return uppercheck and lowercheck
-    
 #
 # Look at list and determining if aircraft is ascending (taking off)
 # or descending (landing)
@@ -63,48 +41,23 @@ def analyseList(eventlist, dbconn, airport, runway, logToDB=False, debug=False,
     Returns:
         Nothing
     """
-    firstplane = eventlist[0]
     lastplane = eventlist[-1]
-    middleplane = eventlist[int(len(eventlist) / 2)]
     #
-    # Are we actually using this runway, or are we crossing it?
-    # Use runway heading and middleplane heading to find out.
+    # The same rules as the streaming event detector in planelogger.py
     #
-    
-    otherheading = runway.heading - 180
-    if otherheading < 0:
-        otherheading += 360
-    if not checkbearing(middleplane.track, runway.heading, 4) and not checkbearing(middleplane.track, otherheading, 4):
+    event = pe.classifyEvent(eventlist, runway)
+    if not event:
         return
-    touchedgnd = False
-    for plane in eventlist:
-        if plane.isGnd:
-            touchedgnd = True
-    if firstplane.altitude >= lastplane.altitude: 
-        event = "landed at"
-    elif firstplane.altitude < lastplane.altitude:
-        if touchedgnd:
-            event = "bump & go at"
-        else:
-            event = "took off at"
-    else:
-        event = "dunno what to call this"
 
     airport_event = pr.AirportDailyEvents(airport=airport,
-                                          event_time=lastplane.time,
+                                          event_time=int(lastplane.time),
                                           type_of_event=event[0],
                                           flight=lastplane.flight, hex=lastplane.hex,
                                           runway=runway.name)
 
     
     if not quiet:
-        if printJSON:
-            print(airport_event.to_JSON())
-        else:
-            print("Plane", lastplane.hex, "as flight", lastplane.flight, event,
-                  time.strftime("%F %H:%M:%S", time.localtime(lastplane.time)),
-                  "on runway", runway.name)
-
+        pe.printEvent(airport_event, printJSON)
 
     if logToDB:
         airport_event.logToDB(dbconn, printQuery=debug)
@@ -183,7 +136,9 @@ parser.add_argument('-f', '--flights', dest='flights',
                     help="The flight numbers(s) of the aircraft to be singled out, \
                     separated by commas when there are multiple instances")
 parser.add_argument('-A', '--airport', dest='airport',
-                    help="The ICAO code for the airport we are interested in")
+                    help="The ICAO code(s) of the airport(s) we are interested in, separated by commas")
+parser.add_argument('--within', dest='within', type=float,
+                    help="Look at every airport within this many km of the reporter, rather than the -A airport(s)")
 parser.add_argument('-a', '--committed-height', dest='committed_height',
                     help="The height above the airport below which the aircraft is \
                     considered to be interested in the airport(metres, default 200)", default=200)
@@ -204,63 +159,81 @@ parser.add_argument('--runway', dest='runways',
                     help="The names of the runways to be singled out, \
                     separated by commas when there are multiple instances", default=None)
 
-args = parser.parse_args()
+pp.addProfileArgs(parser)
 
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(1)
 
-if not args.airport:
-    print("An Airport is needed!")
-    exit(1)
-else:
-    if not args.start_time:
-        args.start_time = datetime.date.today().strftime("%F") + " 00:00:00"
-    dbconn = pr.connDB(args.db_conf)
-    reporter = pr.readReporter(dbconn, args.reporter, printQuery=args.debug)
-    airport_list = pr.readAirport(dbconn, args.airport, printQuery=args.debug)
-    for airport in airport_list:
-        runways = pr.readRunways(dbconn, args.airport, printQuery=args.debug)
-    
-        for runway in runways:
+def main(argv=None):
+    """Finds and prints (or logs) the takeoffs and landings at airports"""
+    args = parser.parse_args(argv)
+
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
+
+    if not args.airport and not args.within:
+        print("An Airport is needed!")
+        exit(1)
+    else:
+        if not args.start_time:
+            args.start_time = datetime.date.today().strftime("%F") + " 00:00:00"
+        dbconn = pr.connDB(args.db_conf)
+        reporter = pr.readReporter(dbconn, args.reporter, printQuery=args.debug)
+        if args.airport:
+            airport_codes = args.airport.split(',')
+        else:
+            #
+            # Find the airports nearby from the airport index, rather than asking the DB
+            # for the distance to every airport
+            #
+            index = pa.loadAirportIndex(dbconn=dbconn, debug=args.debug)
+            airport_codes = [airport.icao for airport, dist in
+                             index.within(reporter.lon, reporter.lat, args.within * 1000.0)]
             if args.debug:
-                print(runway.to_JSON())
-            if not args.runways or args.runways == runway.name:
+                print("Airports within", args.within, "km:", " ".join(airport_codes))
+        #
+        # All the airports' runways are read at once, and kept, rather than an airport at a time
+        #
+        pr.readRunwaysRegion(dbconn, airport_codes, printQuery=args.debug)
+        for airport_code in airport_codes:
+            airport_list = pr.readAirport(dbconn, airport_code, printQuery=args.debug) or []
+            for airport in airport_list:
+                runways = [runway for runway in pr.readRunways(dbconn, airport_code, printQuery=args.debug) or []
+                           if not args.runways or args.runways == runway.name]
+                if not runways:
+                    continue
+                if args.debug:
+                    for runway in runways:
+                        print(runway.to_JSON())
+                #
+                # One query for the reports that might be on any of the airport's runways,
+                # which are sorted out by runway here, rather than by PostGIS a runway at a time
+                #
+                tester = prw.RunwayHitTester(runways)
                 cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, \
                                         myEndTime=args.end_time, myflight=args.flights,
                                         maxAltitude=(int(args.committed_height) + airport.altitude),
                                         minAltitude=(airport.altitude - 150), myReporter=args.reporter,
                                         reporterLocation=reporter.location, printQuery=args.debug, \
-                                        runways=runway.runway_area,
+                                        runways=tester.boundingBox(),
                                         postSql=" order by hex, report_epoch")
-                data = pr.readReportsDB(cur, numRecs=10000)
-                oldplane = None
-                eventlist = []
-                #
-                # Split up into a separate list for each plane
-                #
-                while data:
-                    for plane in data:
+                reports = pr.ReportBatch.concatenate(list(pr.readBatchesDB(cur, numRecs=int(args.numRecs))))
+                points, on_runways = tester.pairs(reports.lat, reports.lon)
+                for i, runway in enumerate(tester.runways):
+                    #
+                    # Still ordered by hex and time - split up into a separate list for each plane
+                    #
+                    for hex, planes in itertools.groupby(reports[points[on_runways == i]].planes(),
+                                                         key=lambda plane: plane.hex):
+                        eventlist = list(planes)
                         if args.debug:
-                            print(plane.to_JSON())
-                        if not oldplane:
-                            eventlist.append(plane)
-                        elif oldplane.hex == plane.hex:
-                            eventlist.append(plane)
-                        else:
-                            splitList(
-                                eventlist, dbconn, logToDB=args.logToDB, debug=args.debug,
-                                airport=args.airport, runway=runway, printJSON=args.printJSON, quiet=args.quiet)
-                            eventlist = []
-                            eventlist.append(plane)
-                        
-                        oldplane = plane
+                            for plane in eventlist:
+                                print(plane.to_JSON())
+                        splitList(eventlist, dbconn, logToDB=args.logToDB, debug=args.debug,
+                                  airport=airport_code, runway=runway, printJSON=args.printJSON, quiet=args.quiet)
 
-                    data = pr.readReportsDB(cur, args.numRecs)
+        if args.logToDB:
+            dbconn.commit()
 
-                    if eventlist:
-                        splitList(eventlist, dbconn, logToDB=args.logToDB, debug=args.debug,
-                                  airport=args.airport, runway=runway, printJSON=args.printJSON, quiet=args.quiet)
 
-    if args.logToDB:
-        dbconn.commit()
+if __name__ == "__main__":
+    pp.runMain(main)
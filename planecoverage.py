@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+#
+# Work out the reception coverage of a reporter - the furthest planes have been seen
+# in each direction, for bands of altitude, and where the reports have come from.
+#
+"""
+Builds the coverage of a reporter from its reports in the DB (split into chunks of
+time, read by a pool of worker processes) or a file, and plots it as a polar plot of
+range by bearing, and a heatmap. Coverage can be saved, and merged with coverage
+saved by earlier runs, so months of data can be built up a piece at a time.
+"""
+import os
+import time
+import argparse
+import multiprocessing
+import PlaneReport as pr
+import matplotlib as mpl
+import PlaneCoverage as pc
+import PlaneProfile as pp
+
+parser = argparse.ArgumentParser(
+    description="Plot the reception coverage of a reporter, from the DB or a file")
+
+parser.add_argument('--debug', action="store_true",
+                    dest='debug', default=False, help="Turn on debug mode")
+parser.add_argument('-f', '--file', dest='datafile',
+                    help="A file to load reports from, rather than the DB")
+parser.add_argument('--lat', dest='latitude', type=float,
+                    help="Latitude of the reporter - if not set, the reporter's location is read from the DB")
+parser.add_argument('--lon', dest='longitude', type=float,
+                    help="Longitude of the reporter - if not set, the reporter's location is read from the DB")
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                    help="Number of worker processes reading from the DB (defaults to the number of CPUs)")
+parser.add_argument('--chunk-hours', dest='chunkHours', type=float, default=24.0,
+                    help="Hours of reports each worker reads from the DB at a time (default 24)")
+parser.add_argument('--bearing-bins', dest='bearingBins', type=int, default=360,
+                    help="Number of bins the compass is divided into (default 360)")
+parser.add_argument('--altitude-bands', dest='altitudeBands', default="0,3000,6000,9000,12000",
+                    help="Comma separated altitudes, in metres, at which each altitude band starts (default 0,3000,6000,9000,12000)")
+parser.add_argument('--max-range', dest='maxRange', type=float, default=600000.0,
+                    help="Positions further than this from the reporter, in metres, are taken to be bad and ignored (default 600000)")
+parser.add_argument('--cell-size', dest='cellSize', type=float, default=5000.0,
+                    help="Size of the heatmap cells, in metres (default 5000)")
+parser.add_argument('--save', dest='savefile',
+                    help="Save the coverage to this .npz file, to be merged with later")
+parser.add_argument('--merge', dest='mergefiles', nargs='+', default=[],
+                    help="Coverage files, saved with --save, to merge in")
+parser.add_argument('--title', dest='title',
+                    help="Title of plots (otherwise auto-generated)")
+parser.add_argument('--polar-file', dest='polarfile',
+                    help="Output filename of the polar range plot")
+parser.add_argument('--heatmap-file', dest='heatmapfile',
+                    help="Output filename of the heatmap")
+
+pr.addDBQueryArgs(parser)
+pp.addProfileArgs(parser)
+
+
+def newCoverage(args, lon, lat):
+    return pc.Coverage(lon, lat, bearingBins=args.bearingBins,
+                       altitudeBands=[float(alt) for alt in args.altitudeBands.split(',')],
+                       maxRange=args.maxRange, cellSize=args.cellSize)
+
+
+def timeChunks(startTime, endTime, hours):
+    """
+    Splits a time window, as YYYY-MM-DD hh:mm:ss strings, into chunks of so many hours.
+    The DB query includes both ends of a window, so each chunk stops a second short of
+    the next one.
+    """
+    start = time.mktime(time.strptime(startTime, "%Y-%m-%d %H:%M:%S"))
+    end = time.mktime(time.strptime(endTime, "%Y-%m-%d %H:%M:%S"))
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + hours * 3600.0 - 1, end)
+        chunks.append((time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)),
+                       time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(chunk_end))))
+        start = chunk_end + 1
+    return chunks
+
+
+def coverageChunk(job):
+    """
+    Worker function - reads the reports for a chunk of time from the DB.
+
+    Args:
+        job: (the script's arguments, (start, end) of the chunk)
+
+    Returns:
+        (Coverage of the chunk, number of reports read)
+    """
+    args, chunk = job
+    chunk_args = argparse.Namespace(**vars(args))
+    chunk_args.start_time, chunk_args.end_time = chunk
+    batches, reporter = pr.readReportSource(chunk_args)
+    coverage = newCoverage(args, args.longitude, args.latitude)
+    num_reports = 0
+    for batch in batches:
+        num_reports += len(batch)
+        coverage.add(batch)
+    return coverage, num_reports
+
+
+def main(argv=None):
+    """Builds, saves and plots the reception coverage of a reporter"""
+    args = parser.parse_args(argv)
+
+    if args.polarfile or args.heatmapfile or args.savefile:
+        mpl.use('Agg')
+    #
+    # Importing here, as they set the matplotlib backend to X if Agg call hasn't been made.
+    #
+    import matplotlib.pyplot as plt
+
+    if not args.datafile and not args.db_conf and not args.mergefiles:
+        print("Need a data filename, a DB to query, or coverage files to merge")
+        exit(1)
+
+    if args.db_conf and not args.reporter:
+        print("Need the name of the reporter")
+        exit(1)
+
+    if args.db_conf and (not args.latitude or not args.longitude):
+        with pr.getDBPool(args.db_conf).connection() as dbconn:
+            reporter = pr.readReporter(dbconn, args.reporter, printQuery=args.debug)
+        args.latitude, args.longitude = reporter.lat, reporter.lon
+
+    saved = [(fn, pc.Coverage.load(fn)) for fn in args.mergefiles]
+
+    if saved and (not args.latitude or not args.longitude):
+        args.latitude, args.longitude = saved[0][1].lat, saved[0][1].lon
+
+    if not args.latitude or not args.longitude:
+        print("Require lat/lon cordinates")
+        exit(1)
+
+    #
+    # Coverage merely being merged keeps the parameters it was saved with, otherwise
+    # the saved coverage has to have been built with the same ones as asked for now.
+    #
+    if args.datafile or args.db_conf or not saved:
+        coverage = newCoverage(args, args.longitude, args.latitude)
+    else:
+        coverage = saved.pop(0)[1]
+    for fn, other in saved:
+        try:
+            coverage.merge(other)
+        except ValueError as err:
+            print(fn, err)
+            exit(1)
+
+    t1 = time.time()
+    num_reports = 0
+    if args.db_conf:
+        if not args.start_time:
+            args.start_time = time.strftime("%F") + " 00:00:00"
+        if not args.end_time:
+            args.end_time = time.strftime("%F %T")
+        chunks = [(args, chunk) for chunk in timeChunks(args.start_time, args.end_time, args.chunkHours)]
+        if args.jobs > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(args.jobs)
+            results = pool.imap_unordered(coverageChunk, chunks)
+        else:
+            pool = None
+            results = map(coverageChunk, chunks)
+        for chunk_coverage, chunk_reports in results:
+            coverage.merge(chunk_coverage)
+            num_reports += chunk_reports
+        if pool:
+            pool.close()
+            pool.join()
+    elif args.datafile:
+        batches, db_reporter = pr.readReportSource(args)
+        for batch in batches:
+            num_reports += len(batch)
+            coverage.add(batch)
+
+    if args.debug:
+        print("Read", num_reports, "reports in", time.time() - t1, "seconds")
+
+    if args.savefile:
+        coverage.save(args.savefile)
+
+    if not args.title:
+        args.title = args.reporter if args.reporter else "Coverage"
+        if coverage.firstTime is not None:
+            args.title += " " + time.strftime("%Y-%m-%d", time.localtime(coverage.firstTime)) + \
+                " to " + time.strftime("%Y-%m-%d", time.localtime(coverage.lastTime))
+
+    if args.polarfile or not (args.heatmapfile or args.savefile):
+        fig = plt.figure(figsize=(10, 10))
+        ax = fig.add_subplot(1, 1, 1, projection='polar')
+        coverage.plotPolar(ax)
+        ax.set_title(args.title + " - maximum range (km)", fontsize=14)
+        if args.polarfile:
+            fig.savefig(args.polarfile)
+
+    if args.heatmapfile or not (args.polarfile or args.savefile):
+        fig = plt.figure(figsize=(10, 10))
+        ax = fig.add_subplot(1, 1, 1)
+        image = coverage.plotHeatmap(ax)
+        fig.colorbar(image, ax=ax, shrink=0.8, label="Reports")
+        ax.set_title(args.title + " - reports received", fontsize=14)
+        if args.heatmapfile:
+            fig.savefig(args.heatmapfile)
+
+    if not (args.polarfile or args.heatmapfile or args.savefile):
+        plt.show()
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -11,6 +11,7 @@ import PlaneReport as pr
 import datetime
 import time
 from datetime import date, timedelta
+import PlaneProfile as pp
 #
 # Print and/or log a list of flights/planes to DB
 #
@@ -116,33 +117,42 @@ parser.add_argument('-d', '--date', dest='date', default=False,
 parser.add_argument('-q', '--quiet', action="store_true", dest='quiet', default=False,
                     help="Keep the noise to a minimum")
 
-args = parser.parse_args()
+pp.addProfileArgs(parser)
 
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(1)
 
-if not args.date:
-    print("A date is required!")
-    exit(1)
+def main(argv=None):
+    """Lists (or logs) the planes and flights seen on a day"""
+    args = parser.parse_args(argv)
 
-if not (args.getFlights or args.getPlanes):
-    print("At least one of --planes or --flights is required!")
-    exit(1)
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
 
-    
-start_time = args.date + " 00:00:00"
-end_time = args.date + " 23:59:59"
+    if not args.date:
+        print("A date is required!")
+        exit(1)
 
-dbconn = pr.connDB(args.db_conf)
+    if not (args.getFlights or args.getPlanes):
+        print("At least one of --planes or --flights is required!")
+        exit(1)
 
-if args.getFlights:
-    splitList(dbconn, start_time, end_time, 'flight', args.date, args.debug, args.reporter,
-              args.logToDB, args.printJSON, args.quiet, args.numRecs)
-if args.getPlanes:    
-    splitList(dbconn, start_time, end_time, 'hex', args.date, args.debug, args.reporter,
-              args.logToDB, args.printJSON, args.quiet, args.numRecs)
 
-if args.logToDB:
-    dbconn.commit()
-    
+    start_time = args.date + " 00:00:00"
+    end_time = args.date + " 23:59:59"
+
+    dbconn = pr.connDB(args.db_conf)
+
+    if args.getFlights:
+        splitList(dbconn, start_time, end_time, 'flight', args.date, args.debug, args.reporter,
+                  args.logToDB, args.printJSON, args.quiet, args.numRecs)
+    if args.getPlanes:    
+        splitList(dbconn, start_time, end_time, 'hex', args.date, args.debug, args.reporter,
+                  args.logToDB, args.printJSON, args.quiet, args.numRecs)
+
+    if args.logToDB:
+        dbconn.commit()
+
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -5,6 +5,7 @@ import argparse
 import datetime
 from datetime import date, timedelta
 import PlaneReport as pr
+import PlaneProfile as pp
 
 del_count = 0
 
@@ -202,77 +203,84 @@ parser.add_argument('--track-plane', dest='track_plane', action="store_true",
                     help="Go through each of a plane's position reports, and toss out the ones that are \
                     not at a sensible distance from the reports on either side", default=False)
 
+pp.addProfileArgs(parser)
 
 
-args = parser.parse_args()
-
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(-1)
-else:
-    yesterday = datetime.date.today() - timedelta(1)
-    dbconn = pr.connDB(args.db_conf)
-    reporter = pr.readReporter(dbconn, args.reporter)
-    if not args.start_time:
-        args.start_time = yesterday.strftime("%F") + " 00:00:00"
-    if not args.end_time:
-        args.end_time = yesterday.strftime("%F") + " 23:59:59"
-
-    postSql = " or altitude < 0 or speed > %s " %  args.maxSpeed
-    cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, myEndTime=args.end_time,
-                            myflight=args.flights, minDistance=args.minDistance, maxDistance=args.maxDistance,
-                            myReporter=args.reporter, reporterLocation=reporter.location, printQuery=args.debug, postSql=postSql)
-    data = pr.readReportsDB(cur, args.numRecs)
-    while data:
-        for plane in data:
-            if args.debug or args.list:
-                print("Deleting distance problem " + plane.to_JSON())
-            if not args.list:
-                plane.delFromDB(dbconn, printQuery=args.debug)
-            del_count += 1
-        data = pr.readReportsDB(cur, args.numRecs)
-    dbconn.commit()
-    cur.close()
+def main(argv=None):
+    """Removes the reports from the DB which look corrupt"""
+    args = parser.parse_args(argv)
 
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(-1)
+    else:
+        yesterday = datetime.date.today() - timedelta(1)
+        dbconn = pr.connDB(args.db_conf)
+        reporter = pr.readReporter(dbconn, args.reporter)
+        if not args.start_time:
+            args.start_time = yesterday.strftime("%F") + " 00:00:00"
+        if not args.end_time:
+            args.end_time = yesterday.strftime("%F") + " 23:59:59"
 
-    #
-    # Trying to assume position & reported speed can bear some relationship has proven to be unwise...
-    #
-    if args.track_plane:
-
-        postSql = " order by hex, report_epoch"
-        oldplane = None
-        planelist = []
-        dodgy_planes = []
-
+        postSql = " or altitude < 0 or speed > %s " %  args.maxSpeed
         cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, myEndTime=args.end_time,
-                                myflight=args.flights, printQuery=args.debug, postSql=postSql)
-
+                                myflight=args.flights, minDistance=args.minDistance, maxDistance=args.maxDistance,
+                                myReporter=args.reporter, reporterLocation=reporter.location, printQuery=args.debug, postSql=postSql)
         data = pr.readReportsDB(cur, args.numRecs)
-
         while data:
             for plane in data:
-                if args.debug:
-                    print(plane.to_JSON())
-                if not oldplane or oldplane.hex != plane.hex:
-                    if oldplane:
-                        dodgy_planes = procPlaneDist(planelist, debug=args.debug)
-                        del_count += len(dodgy_planes)
-                        planelist = []
-                        planelist.append(plane)
-                        oldplane = plane
-                    else:
-                        oldplane = plane
-                else:
-                    planelist.append(plane)
-            
+                if args.debug or args.list:
+                    print("Deleting distance problem " + plane.to_JSON())
+                if not args.list:
+                    plane.delFromDB(dbconn, printQuery=args.debug)
+                del_count += 1
             data = pr.readReportsDB(cur, args.numRecs)
-
-        if planelist:
-            dodgy_planes = procPlaneDist(planelist, dbconn, debug=args.debug, listOnly=args.list)
-            del_count += len(dodgy_planes)
-    
         dbconn.commit()
         cur.close()
 
-    print("Deleted records", del_count)
+
+        #
+        # Trying to assume position & reported speed can bear some relationship has proven to be unwise...
+        #
+        if args.track_plane:
+
+            postSql = " order by hex, report_epoch"
+            oldplane = None
+            planelist = []
+            dodgy_planes = []
+
+            cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, myEndTime=args.end_time,
+                                    myflight=args.flights, printQuery=args.debug, postSql=postSql)
+
+            data = pr.readReportsDB(cur, args.numRecs)
+
+            while data:
+                for plane in data:
+                    if args.debug:
+                        print(plane.to_JSON())
+                    if not oldplane or oldplane.hex != plane.hex:
+                        if oldplane:
+                            dodgy_planes = procPlaneDist(planelist, debug=args.debug)
+                            del_count += len(dodgy_planes)
+                            planelist = []
+                            planelist.append(plane)
+                            oldplane = plane
+                        else:
+                            oldplane = plane
+                    else:
+                        planelist.append(plane)
+
+                data = pr.readReportsDB(cur, args.numRecs)
+
+            if planelist:
+                dodgy_planes = procPlaneDist(planelist, dbconn, debug=args.debug, listOnly=args.list)
+                del_count += len(dodgy_planes)
+
+            dbconn.commit()
+            cur.close()
+
+        print("Deleted records", del_count)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
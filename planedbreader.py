@@ -5,6 +5,7 @@ import argparse
 import PlaneReport as pr
 import datetime
 from datetime import date, timedelta
+import PlaneProfile as pp
 
 parser = argparse.ArgumentParser(
     description="Extract previously recorded plane position reports from DB, to stdout ")
@@ -45,32 +46,41 @@ parser.add_argument('--max-speed', dest='maxSpeed',
 parser.add_argument('--min-speed', dest='minSpeed',
                     help="The aircraft has to be at a speed greater than or equal than this (Units are in km/h)", type=float)
 
-args = parser.parse_args()
+pp.addProfileArgs(parser)
 
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(1)
-else:
-    if not args.start_time:
-        args.start_time = datetime.date.today().strftime("%F") + " 00:00:00"
-    dbconn = pr.connDB(args.db_conf)
 
-    if args.reporter:
-        reporter = pr.readReporter(dbconn, args.reporter)
+def main(argv=None):
+    """Prints reports from the DB"""
+    args = parser.parse_args(argv)
+
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
     else:
-        reporter = pr.Reporter(name=None, mytype=None, lon=None, lat=None, url=None, location=None)
+        if not args.start_time:
+            args.start_time = datetime.date.today().strftime("%F") + " 00:00:00"
+        dbconn = pr.connDB(args.db_conf)
+
+        if args.reporter:
+            reporter = pr.readReporter(dbconn, args.reporter)
+        else:
+            reporter = pr.Reporter(name=None, mytype=None, lon=None, lat=None, url=None, location=None)
+
+        cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time,
+                                myEndTime=args.end_time, myflight=args.flights,
+                                minDistance=args.minDistance, maxDistance=args.maxDistance,
+                                minAltitude=args.minAltitude, maxAltitude=args.maxAltitude,
+                                minSpeed=args.minSpeed, maxSpeed=args.maxSpeed,
+                                minRssi=args.minRssi, maxRssi=args.maxRssi,
+                                minNucp=args.minNucp, maxNucp=args.maxNucp,
+                                myReporter=args.reporter, reporterLocation=reporter.location,
+                                printQuery=args.debug, postSql=" order by report_epoch")
+        data = pr.readReportsDB(cur)
+        while data:
+            for plane in data:
+                print(plane.to_JSON())
+            data = pr.readReportsDB(cur, args.numRecs)
+
 
-    cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time,
-                            myEndTime=args.end_time, myflight=args.flights,
-                            minDistance=args.minDistance, maxDistance=args.maxDistance,
-                            minAltitude=args.minAltitude, maxAltitude=args.maxAltitude,
-                            minSpeed=args.minSpeed, maxSpeed=args.maxSpeed,
-                            minRssi=args.minRssi, maxRssi=args.maxRssi,
-                            minNucp=args.minNucp, maxNucp=args.maxNucp,
-                            myReporter=args.reporter, reporterLocation=reporter.location,
-                            printQuery=args.debug, postSql=" order by report_epoch")
-    data = pr.readReportsDB(cur)
-    while data:
-        for plane in data:
-            print(plane.to_JSON())
-        data = pr.readReportsDB(cur, args.numRecs)
+if __name__ == "__main__":
+    pp.runMain(main)
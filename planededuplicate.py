@@ -13,6 +13,7 @@ import argparse
 import PlaneReport as pr
 import datetime
 from datetime import date, timedelta
+import PlaneProfile as pp
 
 
 def comparePlanes(oldplane, plane):
@@ -86,60 +87,68 @@ parser.add_argument('-n', '--num-recs', dest='numRecs',
 parser.add_argument('-r', '--reporter', dest='reporter',
                     help="Name of the reporting data collector (defaults to Home1)", default="Home1")
 
+pp.addProfileArgs(parser)
 
-args = parser.parse_args()
-
-if not args.db_conf:
-    print("A valid URL db configuration file is needed!")
-    exit(-1)
-else:
-    yesterday = datetime.date.today() - timedelta(1)
-    if not args.start_time:
-        args.start_time = yesterday.strftime("%F") + " 00:00:00"
-    if not args.end_time:
-        args.end_time = yesterday.strftime("%F") + " 23:59:59"
-    dbconn = pr.connDB(args.db_conf)
-    oldplane = None
-    reporter = pr.readReporter(dbconn, args.reporter)
-    delete_count = 0
-    this_plane_delete = 0
-    delete_list = []
-    cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, myEndTime=args.end_time, myflight=args.flights, minDistance=args.minDistance, maxDistance=args.maxDistance,
-                            minAltitude=args.minAltitude, maxAltitude=args.maxAltitude, myReporter=args.reporter, reporterLocation=reporter.location, printQuery=args.debug, postSql=" order by hex, report_epoch, report_location")
-    data = pr.readReportsDB(cur, args.numRecs)
-    while data:
-        for plane in data:
-
-            notequal = comparePlanes(oldplane, plane)
-
-            if not notequal:
-                if args.debug or args.list:
-                    print("Deleting " + plane.to_JSON())
-                    print(oldplane.to_JSON())
-                if not args.list:
-                    delete_list.append(plane)
-                delete_count += 1
-                this_plane_delete += 1
-            else:
-                if this_plane_delete:
-                    this_plane_delete = 0
-                    if args.list or args.debug:
-                        print("Plane ", oldplane.to_JSON(), " had ",
-                              str(this_plane_delete), " duplicates")
-                        print(
-                            "Different plane ", reasons[notequal], " ", plane.to_JSON())
-                recorded_reasons[notequal] += 1
-
-                oldplane = plane
-                if args.debug:
-                    print("New record " + plane.to_JSON())
-        for plane in delete_list:
-            plane.delFromDB(dbconn, args.debug)
-        dbconn.commit()
-        delete_list = []
 
+def main(argv=None):
+    """Removes duplicate reports from the DB"""
+    args = parser.parse_args(argv)
+
+    if not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(-1)
+    else:
+        yesterday = datetime.date.today() - timedelta(1)
+        if not args.start_time:
+            args.start_time = yesterday.strftime("%F") + " 00:00:00"
+        if not args.end_time:
+            args.end_time = yesterday.strftime("%F") + " 23:59:59"
+        dbconn = pr.connDB(args.db_conf)
+        oldplane = None
+        reporter = pr.readReporter(dbconn, args.reporter)
+        delete_count = 0
+        this_plane_delete = 0
+        delete_list = []
+        cur = pr.queryReportsDB(dbconn, myhex=args.hexcodes, myStartTime=args.start_time, myEndTime=args.end_time, myflight=args.flights, minDistance=args.minDistance, maxDistance=args.maxDistance,
+                                minAltitude=args.minAltitude, maxAltitude=args.maxAltitude, myReporter=args.reporter, reporterLocation=reporter.location, printQuery=args.debug, postSql=" order by hex, report_epoch, report_location")
         data = pr.readReportsDB(cur, args.numRecs)
-    print("Deleted records", delete_count)
-    if args.debug:
-        for i in range(0, len(reasons)):
-            print(reasons[i], " ", recorded_reasons[i])
+        while data:
+            for plane in data:
+
+                notequal = comparePlanes(oldplane, plane)
+
+                if not notequal:
+                    if args.debug or args.list:
+                        print("Deleting " + plane.to_JSON())
+                        print(oldplane.to_JSON())
+                    if not args.list:
+                        delete_list.append(plane)
+                    delete_count += 1
+                    this_plane_delete += 1
+                else:
+                    if this_plane_delete:
+                        this_plane_delete = 0
+                        if args.list or args.debug:
+                            print("Plane ", oldplane.to_JSON(), " had ",
+                                  str(this_plane_delete), " duplicates")
+                            print(
+                                "Different plane ", reasons[notequal], " ", plane.to_JSON())
+                    recorded_reasons[notequal] += 1
+
+                    oldplane = plane
+                    if args.debug:
+                        print("New record " + plane.to_JSON())
+            for plane in delete_list:
+                plane.delFromDB(dbconn, args.debug)
+            dbconn.commit()
+            delete_list = []
+
+            data = pr.readReportsDB(cur, args.numRecs)
+        print("Deleted records", delete_count)
+        if args.debug:
+            for i in range(0, len(reasons)):
+                print(reasons[i], " ", recorded_reasons[i])
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
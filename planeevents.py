@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+#
+# Replay archived reports through the streaming airport event detector
+#
+"""
+Runs reports from a file (or the DB) through the same event detector that
+planelogger.py's --detect-events runs over live reports, printing (or logging)
+the takeoffs and landings it finds. Handy for trying out the detector, and
+for comparing it with planeairport.py.
+"""
+import time
+import argparse
+import PlaneReport as pr
+import PlaneEvents as pe
+import PlaneProfile as pp
+
+parser = argparse.ArgumentParser(
+    description="Replay reports from a file or the DB through the airport event detector")
+parser.add_argument('--debug', action="store_true",
+                    dest='debug', default=False, help="Turn on debug mode")
+parser.add_argument('-f', '--file', dest='datafile',
+                    help="A file of archived reports to replay")
+parser.add_argument('-A', '--airport', dest='airport',
+                    help="The ICAO code(s) of the airport(s) we are interested in, separated by commas")
+parser.add_argument('--within', dest='within', type=float,
+                    help="Watch every airport within this many km of the reporter, rather than the -A airport(s)")
+parser.add_argument('--lat', dest='lat', type=float,
+                    help="Latitude used with --within, if the reporter's location isn't read from the DB")
+parser.add_argument('--lon', dest='lon', type=float,
+                    help="Longitude used with --within, if the reporter's location isn't read from the DB")
+parser.add_argument('--apt-file', dest='aptfile',
+                    help="Read airports and runways from an apt.dat file, rather than the DB")
+parser.add_argument('--committed-height', dest='committed_height', type=float, default=200,
+                    help="The height above the airport below which the aircraft is \
+                    considered to be interested in the airport(metres, default 200)")
+parser.add_argument('--exit-grace', dest='exitGrace', type=float, default=pe.EXIT_GRACE,
+                    help="Seconds a plane has to be off the runway for its visit to be over (default %d)" % pe.EXIT_GRACE)
+parser.add_argument('--ttl', dest='ttl', type=float, default=pe.STATE_TTL,
+                    help="Seconds without a report after which a plane is forgotten (default %d)" % pe.STATE_TTL)
+parser.add_argument('-l', '--log-to-db', action="store_true", dest='logToDB', default=False,
+                    help="Log events to the DB (default is to only print them out)")
+parser.add_argument('-j', '--json', action="store_true", dest='printJSON', default=False,
+                    help="print events in JSON format (default is to print as text)")
+parser.add_argument('-q', '--quiet', action="store_true", dest='quiet', default=False,
+                    help="If chosen, don't print any output (default is false)")
+
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Replays reports from a file or the DB through the airport event detector"""
+    args = parser.parse_args(argv)
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    if not args.airport and not args.within:
+        print("An Airport is needed!")
+        exit(1)
+
+    if args.logToDB and not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
+
+    if not args.aptfile and not args.db_conf:
+        print("Need an apt.dat file, or a DB, to read runways from")
+        exit(1)
+
+    dbconn = pr.connDB(args.db_conf) if args.db_conf else None
+
+    if args.within and (args.lat is None or args.lon is None):
+        if not dbconn or not args.reporter:
+            print("Need the reporter, or --lat/--lon, to find airports with --within")
+            exit(1)
+        reporter = pr.readReporter(dbconn, args.reporter, printQuery=args.debug)
+        args.lat, args.lon = reporter.lat, reporter.lon
+
+    codes = pe.airportCodes(args.airport, within=args.within, lon=args.lon, lat=args.lat,
+                            dbconn=dbconn, aptFile=args.aptfile, debug=args.debug)
+    runway_set = pe.loadRunwaySet(codes, dbconn=dbconn, aptFile=args.aptfile, printQuery=args.debug)
+    if args.debug:
+        print("Watching", len(runway_set), "runways at", " ".join(codes))
+
+    detector = pe.EventDetector(runway_set, committedHeight=args.committed_height,
+                                exitGrace=args.exitGrace, ttl=args.ttl)
+    writer = pe.EventWriter(dbconn, printQuery=args.debug) if args.logToDB else None
+
+    if args.datafile:
+        batches = pr.ReportFileReader(pr.openFile(args.datafile), numRecs=10000).batches()
+    else:
+        batches, db_reporter = pr.readReportSource(args)
+
+
+    def handleEvents(events):
+        for event in events:
+            if not args.quiet:
+                pe.printEvent(event, args.printJSON)
+        if writer:
+            writer.add(events)
+
+
+    t1 = time.time()
+    num_events = 0
+    for batch in batches:
+        events = detector.addBatch(batch)
+        num_events += len(events)
+        handleEvents(events)
+    events = detector.flush()
+    num_events += len(events)
+    handleEvents(events)
+    if writer:
+        writer.flush()
+
+    if args.debug:
+        print("Replayed", detector.numReports, "reports in", time.time() - t1, "seconds,",
+              num_events, "events found")
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -4,11 +4,12 @@
 import time
 import argparse
 import PlaneReport as pr
-from googleearthplot import googleearthplot
+import PlaneKML as pk
+import PlaneProfile as pp
 
 
 parser = argparse.ArgumentParser(
-    description="Plot plane positiions from a file to kml")
+    description="Plot plane positiions from a file, or the DB, to kml")
 
 parser.add_argument('--debug', action="store_true",
                     dest='debug', default=False, help="Turn on debug mode")
@@ -29,55 +30,112 @@ parser.add_argument('-t', '--title', dest='title',
                     help="Title of plot (otherwise auto-generated)", default="")
 
 parser.add_argument('--output-file', dest='outfile',
-                    help="Output filename - if not specified, the plot is displayed directly.", default=False)
-
-
-args = parser.parse_args()
-
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
-
-if not args.outfile:
-    print("Need an output filename")
-    exit(1)
-
-xx, yy, zz, bearings, timedeltas = [], [], [], [], []
-lastpos = ""
-lasttime = -1
-
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-
-while data:
-    for plane in data:
-        if plane.report_location != lastpos:
-            lastpos = plane.report_location
-            if lasttime == -1:
-                lasttime = plane.time - 1
-            if (plane.time - lasttime) > 0:
-                xx.append(plane.lon)
-                yy.append(plane.lat)
-                zz.append(plane.altitude)
-                bearings.append(plane.track)
-                timedeltas.append(plane.time - lasttime)
-                lasttime = plane.time
-            
-
-    data = pr.readFromFile(inputfile)
-
-if args.debug:
-    print("Lons", xx)
-    print("Lats", yy)
-    print("Alts", zz)
-    print("Bearings", bearings)
-    print("Timedeltas", timedeltas)
-
-mykmlplot = googleearthplot.googleearthplot()
-
-if args.movie:
-    mykmlplot.PlotPlaneMovie(yy, xx, zz, bearings, timedeltas, name=args.title, timestretch=args.timestretch, tilt=args.cameraAngle)
-else:
-    mykmlplot.PlotLineChart(yy, xx, heightList=zz, color="aqua", altMode='absolute', name=args.title, width=2)
-
-mykmlplot.GenerateKMLFile(filepath=args.outfile)
+                    help="Output filename, ending in .kml or .kmz", default=False)
+
+parser.add_argument('--tolerance', dest='tolerance', type=float, default=5.0,
+                    help="Simplify the tracks, so they stray no more than this many metres from the reported positions, 0 to keep every point (default 5)")
+
+parser.add_argument('--heading-tolerance', dest='headingTolerance', type=float, default=10.0,
+                    help="In a movie, also keep the keyframes where the heading turns by more than this many degrees (default 10)")
+
+parser.add_argument('--max-gap', dest='maxGap', type=float, default=600.0,
+                    help="Start a new track for a plane when there's a gap of more than this many seconds between its reports (default 600)")
+
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Writes reports from a file, or the DB, as KML"""
+    args = parser.parse_args(argv)
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    if not args.outfile:
+        print("Need an output filename")
+        exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
+    kml = pk.KMLWriter(args.outfile)
+    num_reports = 0
+    num_points = 0
+
+    if args.movie:
+        #
+        # The camera follows the reports in the order they're read in, with the
+        # keyframes that add nothing to the path or heading dropped.
+        #
+        last_keyframe = [None]
+
+        def writeKeyframes(times, lons, lats, alts, headings, continued):
+            nonlocal num_points
+            for i in range(1 if continued else 0, len(times)):
+                if last_keyframe[0] is None:
+                    delta = 1.0
+                else:
+                    delta = times[i] - last_keyframe[0]
+                last_keyframe[0] = times[i]
+                kml.flyTo(delta * args.timestretch, lons[i], lats[i], alts[i], headings[i], args.cameraAngle)
+                num_points += 1
+
+        kml.startTour()
+        camera = pk.TrackSimplifier(writeKeyframes, args.tolerance, headingTolerance=args.headingTolerance)
+        lastpos = None
+        for batch in batches:
+            for plane in batch.planes():
+                num_reports += 1
+                if (plane.lon, plane.lat) != lastpos:
+                    lastpos = (plane.lon, plane.lat)
+                    if camera.lastTime is None or plane.time > camera.lastTime:
+                        camera.add(plane.time, plane.lon, plane.lat, plane.altitude, plane.track)
+        camera.flush()
+        kml.endTour()
+    else:
+        #
+        # Each plane gets its own track, which is written out (simplified) once the
+        # plane has gone quiet for long enough, or grows too long to hold.
+        #
+        kml.lineStyle("track", "ffffff00", 2)
+        tracks = {}
+
+        def trackWriter(name):
+            def writeTrack(times, lons, lats, alts, headings, continued):
+                nonlocal num_points
+                kml.track(name, lons, lats, alts, style="track", description=name)
+                num_points += len(times) - (1 if continued else 0)
+            return writeTrack
+
+        def closeTracks(before):
+            for hexcode in [h for h, (track, lastpos) in tracks.items() if track.lastTime < before]:
+                tracks.pop(hexcode)[0].flush()
+
+        for batch in batches:
+            for plane in batch.planes():
+                num_reports += 1
+                if plane.hex in tracks:
+                    track, lastpos = tracks[plane.hex]
+                    if plane.time - track.lastTime > args.maxGap:
+                        track.flush()
+                        del tracks[plane.hex]
+                if plane.hex not in tracks:
+                    name = args.title if args.title else ((plane.flight or "").strip() or plane.hex)
+                    track, lastpos = pk.TrackSimplifier(trackWriter(name), args.tolerance), None
+                if (plane.lon, plane.lat) != lastpos and (track.lastTime is None or plane.time > track.lastTime):
+                    track.add(plane.time, plane.lon, plane.lat, plane.altitude, plane.track)
+                    lastpos = (plane.lon, plane.lat)
+                if track.lastTime is not None:
+                    tracks[plane.hex] = (track, lastpos)
+            closeTracks(batch.time[-1] - args.maxGap)
+        closeTracks(float("inf"))
+
+    kml.close()
+
+    if args.debug:
+        print("Read", num_reports, "reports, wrote", num_points, "points")
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
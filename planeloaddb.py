@@ -5,6 +5,7 @@ import time
 import requests
 import argparse
 import PlaneReport as pr
+import PlaneProfile as pp
 
 #
 # Set timestamp to initial nonsense value (is secs since epoch)
@@ -24,28 +25,37 @@ parser.add_argument('-n',  dest='numrecs',  default=100, type=int,
 parser.add_argument('-f', '--file', dest='datafile',
                     help="A file to load data from to populate a database (only makes sense when a DB Conf file is specified)")
 
+pp.addProfileArgs(parser)
 
-args = parser.parse_args()
 
-reporter = None
-dbconn = None
+def main(argv=None):
+    """Loads a file of reports into the DB"""
+    args = parser.parse_args(argv)
 
-if not args.db_conf or not args.datafile:
-    print("A valid filename and db connection is needed!")
-    exit(-1)
+    reporter = None
+    dbconn = None
 
-if args.db_conf:
-    dbconn = pr.connDB(args.db_conf)
-    inputfile = pr.openFile(args.datafile)
-    data = pr.readFromFile(inputfile, numRecs=args.numrecs)
-    while data:
-        for plane in data:
-    #        if not plane.reporter:
-    #            plane.reporter = args.reporter
+    if not args.db_conf or not args.datafile:
+        print("A valid filename and db connection is needed!")
+        exit(-1)
+
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
+        inputfile = pr.openFile(args.datafile)
+        reader = pr.ReportFileReader(inputfile, numRecs=args.numrecs)
+        for data in reader:
+            for plane in data:
+        #        if not plane.reporter:
+        #            plane.reporter = args.reporter
+                if dbconn:
+                    plane.logToDB(dbconn, printQuery=args.debug)
+                else:
+                    print(plane.to_JSON())
             if dbconn:
-                plane.logToDB(dbconn, printQuery=args.debug)
-            else:
-                print(plane.to_JSON())
-        if dbconn:
-            dbconn.commit()
-        data = pr.readFromFile(inputfile, numRecs=args.numrecs)
+                dbconn.commit()
+        if reader.faulty_lines:
+            print("Skipped", reader.faulty_lines, "faulty lines of", reader.lines_read)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -5,12 +5,20 @@ import time
 import requests
 import argparse
 import PlaneReport as pr
+import PlaneEvents as pe
+import PlaneMetrics as pm
+import PlaneProfile as pp
 
 #
 # Set timestamp to initial nonsense value (is secs since epoch)
 # Code may break in 2038 (Hey! I is a poet!)
 #
 sample_timestamp = 0
+#
+# Stages of a sample timed, and the sanity checks reports are dropped by, for the metrics
+#
+STAGES = ["fetch", "parse", "filter", "log", "commit", "events", "sample"]
+DROP_REASONS = ["invalid", "stale", "altitude", "speed", "distance"]
 
 
 parser = argparse.ArgumentParser(
@@ -61,91 +69,237 @@ parser.add_argument('-t', '--timeout', dest='mytimeout', type=float,
 parser.add_argument('-n', '--numrecs', dest='numrecs', type=int,
                     help="Number of records to read at a time", default=100)
 
+parser.add_argument('--detect-events', action='store_true', dest='detectEvents', default=False,
+                    help="Look for takeoffs and landings at airports as reports arrive, logging them to the DB (or printing them)")
+parser.add_argument('--event-airports', dest='eventAirports',
+                    help="The ICAO code(s) of the airport(s) to watch for events, separated by commas")
+parser.add_argument('--event-within', dest='eventWithin', type=float,
+                    help="Watch every airport within this many km of the reporter for events")
+parser.add_argument('--committed-height', dest='committed_height', type=float, default=200,
+                    help="The height above the airport below which the aircraft is \
+                    considered to be interested in the airport(metres, default 200)")
+parser.add_argument('--apt-file', dest='aptfile',
+                    help="Read the airports and runways watched for events from an apt.dat file, rather than the DB")
+parser.add_argument('--metrics-file', dest='metricsFile',
+                    help="Write timings and counts of the acquisition loop to this file, in the Prometheus \
+                    text format (e.g. for node_exporter's textfile collector)")
+parser.add_argument('--metrics-interval', dest='metricsInterval', type=float, default=15,
+                    help="Seconds between writes of the metrics file (default 15)")
+parser.add_argument('--metrics-port', dest='metricsPort', type=int,
+                    help="Serve the timings and counts of the acquisition loop at /metrics on this port")
+parser.add_argument('--metrics-host', dest='metricsHost', default="127.0.0.1",
+                    help="Address the /metrics server listens on (default 127.0.0.1)")
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Polls a receiver (or reads a file) for reports, and logs them to the DB or prints them"""
+    args = parser.parse_args(argv)
+
+    reporter = None
+    dbconn = None
+
+    if not args.dump1090url and not args.db_conf and not args.datafile:
+        print("A valid URL or a valid filename or db connection is needed!")
+        exit(-1)
 
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
+        reporter = pr.readReporter(dbconn, key=args.reporter, printQuery=args.debug)
 
+    if not args.db_conf and (args.lat and args.lon):
+        reporter = pr.Reporter(name='bodge', lat=args.lat, lon=args.lon, url='',
+                               location="", mytype='')
+    detector = None
+    event_writer = None
+    if args.detectEvents:
+        if not args.eventAirports and not (args.eventWithin and reporter):
+            print("Need the airports to watch for events, or a reporter location and --event-within")
+            exit(-1)
+        if not args.aptfile and not dbconn:
+            print("Need an apt.dat file, or a DB, to read runways from")
+            exit(-1)
+        event_codes = pe.airportCodes(args.eventAirports, within=args.eventWithin,
+                                      lon=reporter.lon if reporter else None, lat=reporter.lat if reporter else None,
+                                      dbconn=dbconn, aptFile=args.aptfile, debug=args.debug)
+        detector = pe.EventDetector(pe.loadRunwaySet(event_codes, dbconn=dbconn, aptFile=args.aptfile,
+                                                     printQuery=args.debug),
+                                    committedHeight=args.committed_height)
+        if dbconn:
+            event_writer = pe.EventWriter(dbconn, printQuery=args.debug)
 
-args = parser.parse_args()
 
-reporter = None
-dbconn = None
+    def detectEvents(planes, now=None, final=False):
+        """
+        Runs newly logged reports through the event detector. Planes that have gone
+        quiet are only noticed as time passes, so live reports give the time now.
+        """
+        if not detector:
+            return
+        events = detector.addBatch(pr.ReportBatch.fromPlanes(planes)) if planes else []
+        if now:
+            events.extend(detector.expire(now))
+        if final:
+            events.extend(detector.flush())
+        if event_writer:
+            event_writer.add(events)
+        else:
+            for event in events:
+                pe.printEvent(event)
 
-if not args.dump1090url and not args.db_conf and not args.datafile:
-    print("A valid URL or a valid filename or db connection is needed!")
-    exit(-1)
 
-if args.db_conf:
-    dbconn = pr.connDB(args.db_conf)
-    reporter = pr.readReporter(dbconn, key=args.reporter, printQuery=args.debug)
+    def dropReason(plane):
+        """
+        Returns why a report fails the sanity checks (valid position and track, how
+        long ago it was seen, altitude, speed, distance), or None if it passes them.
+        """
+        if not (plane.validposition and plane.validtrack):
+            return "invalid"
+        if not plane.seen < args.boredom_threshold:
+            return "stale"
+        if not args.minAltitude <= plane.altitude <= args.maxAltitude:
+            return "altitude"
+        if not int(args.minSpeed) <= plane.speed <= int(args.maxSpeed):
+            return "speed"
+        if reporter and not args.minDistance <= plane.distance(reporter) <= args.maxDistance:
+            return "distance"
+        return None
 
-if not args.db_conf and (args.lat and args.lon):
-    reporter = pr.Reporter(name='bodge', lat=args.lat, lon=args.lon, url='',
-                           location="", mytype='')
-#if args.datafile and not args.db_conf:
-#    print("When specifying an input file, a database connection is needed")
-#    exit(-1)
 
-if not args.datafile:
     #
-    # Set up the acquisition loop
+    # Timings and counts of the acquisition loop, if they're wanted. With neither a
+    # metrics file nor port, metrics is None and the loop only takes a few clock
+    # readings a sample.
     #
-    samps_taken = 0
-    while samps_taken < args.num_samps or args.num_samps < 0:
-        t1 = time.time()
-        planereps = []
-        if args.vrs_fmt:
-            myparams = {'fDstL': args.minDistance,  'fDstU': args.maxDistance/1000, 'lat': reporter.lat, 'lng': reporter.lon,
-                        'fAltL': args.minAltitude/pr.FEET_TO_METRES, 'fAltU': args.maxAltitude/pr.FEET_TO_METRES}
+    metrics = None
+    metrics_server = None
+    if args.metricsFile or args.metricsPort:
+        metrics = pm.Metrics(prefix="planelogger")
+        metrics.describe("samples_total", "counter", "Samples taken")
+        metrics.describe("reports_seen_total", "counter", "Reports read from the receiver")
+        metrics.describe("reports_accepted_total", "counter", "Reports passing the sanity checks, and logged")
+        metrics.describe("reports_dropped_total", "counter", "Reports failing the sanity checks, by the first check failed",
+                         labels=[{"reason": reason} for reason in DROP_REASONS])
+        metrics.describe("fetch_timeouts_total", "counter", "Requests to the receiver that timed out")
+        metrics.describe("stage_seconds", "summary", "Seconds spent in each stage of a sample",
+                         labels=[{"stage": stage} for stage in STAGES])
+        metrics.describe("sleep_slack_seconds", "summary",
+                         "Seconds left of the sample interval after a sample (negative when it overran)")
+        metrics.describe("sample_overruns_total", "counter", "Samples taking longer than the sample interval")
+        metrics.describe("last_sample_timestamp_seconds", "gauge", "When the last sample was taken")
+        if args.metricsPort:
+            metrics_server = pm.MetricsServer(metrics, host=args.metricsHost, port=args.metricsPort).start()
             if args.debug:
-                print("myparams: ", myparams)
-            try:
-                planereps = pr.getPlanesFromURL(args.dump1090url, myparams=myparams, mytimeout=args.mytimeout)
-            except requests.exceptions.Timeout:
+                print("Serving metrics on", metrics_server.url())
+
+
+    #if args.datafile and not args.db_conf:
+    #    print("When specifying an input file, a database connection is needed")
+    #    exit(-1)
+
+    if not args.datafile:
+        #
+        # Set up the acquisition loop
+        #
+        samps_taken = 0
+        metrics_written = time.time()
+        while samps_taken < args.num_samps or args.num_samps < 0:
+            t1 = time.time()
+            p1 = time.perf_counter()
+            planereps = []
+            timings = {} if metrics else None
+            myparams = None
+            if args.vrs_fmt:
+                myparams = {'fDstL': args.minDistance,  'fDstU': args.maxDistance/1000, 'lat': reporter.lat, 'lng': reporter.lon,
+                            'fAltL': args.minAltitude/pr.FEET_TO_METRES, 'fAltU': args.maxAltitude/pr.FEET_TO_METRES}
                 if args.debug:
-                    print("Timeout!")
-        else:
+                    print("myparams: ", myparams)
             try:
-                planereps = pr.getPlanesFromURL(args.dump1090url, mytimeout=args.mytimeout)
+                planereps = pr.getPlanesFromURL(args.dump1090url, myparams=myparams, mytimeout=args.mytimeout,
+                                                timings=timings)
             except requests.exceptions.Timeout:
                 if args.debug:
                     print("Timeout!")
-                
-        sample_timestamp = int(time.time())
-        for plane in planereps:
-            #
-            # Do some sanity checks (valid bearing and pos, altitude, distance)
-            #
-            if plane.validposition and plane.validtrack and plane.seen < args.boredom_threshold and \
-                    plane.altitude <= args.maxAltitude and plane.altitude >= args.minAltitude and \
-                    plane.speed <= int(args.maxSpeed) and plane.speed >= int(args.minSpeed) and \
-                    (not reporter or (plane.distance(reporter) >= args.minDistance and plane.distance(reporter) <= args.maxDistance)):
-                if plane.time == 0:
-                    plane.time = sample_timestamp - plane.seen
-                plane.reporter = args.reporter
+                if metrics:
+                    metrics.count("fetch_timeouts_total")
+                    timings["fetch"] = time.perf_counter() - p1
+
+            sample_timestamp = int(time.time())
+            p2 = time.perf_counter()
+            logged = []
+            dropped = {}
+            for plane in planereps:
+                #
+                # Do some sanity checks (valid bearing and pos, altitude, distance)
+                #
+                reason = dropReason(plane)
+                if reason is None:
+                    if plane.time == 0:
+                        plane.time = sample_timestamp - plane.seen
+                    plane.reporter = args.reporter
+                    logged.append(plane)
+                else:
+                    dropped[reason] = dropped.get(reason, 0) + 1
+                    if args.debug:
+                        print("Dropped report " + plane.to_JSON())
+            p3 = time.perf_counter()
+            for plane in logged:
                 if args.db_conf and dbconn:
                     plane.logToDB(dbconn, printQuery=args.debug)
                 else:
                     print(plane.to_JSON())
-            else:
-                if args.debug:
-                    print("Dropped report " + plane.to_JSON())
-        samps_taken += 1
-        if args.db_conf and dbconn:
-            dbconn.commit()
-        t2 = time.time()
-        if samps_taken < args.num_samps or args.num_samps < 0:
-            if (t2 - t1) < args.boredom_threshold:
-                time.sleep(args.boredom_threshold - (t2 - t1))
-else:
-    inputfile = pr.openFile(args.datafile)
-    data = pr.readFromFile(inputfile, numRecs=args.numrecs)
-    while data:
-        for plane in data:
-            if not plane.reporter:
-                plane.reporter = args.reporter
+            samps_taken += 1
+            p4 = time.perf_counter()
+            if args.db_conf and dbconn:
+                dbconn.commit()
+            p5 = time.perf_counter()
+            detectEvents(logged, now=sample_timestamp)
+            p6 = time.perf_counter()
+            t2 = time.time()
+            if metrics:
+                for stage, seconds in [("filter", p3 - p2), ("log", p4 - p3), ("commit", p5 - p4),
+                                       ("events", p6 - p5), ("sample", p6 - p1)] + list(timings.items()):
+                    metrics.observe("stage_seconds", seconds, stage=stage)
+                metrics.count("samples_total")
+                metrics.count("reports_seen_total", len(planereps))
+                metrics.count("reports_accepted_total", len(logged))
+                for reason, dropCount in dropped.items():
+                    metrics.count("reports_dropped_total", dropCount, reason=reason)
+                metrics.observe("sleep_slack_seconds", args.boredom_threshold - (t2 - t1))
+                if (t2 - t1) > args.boredom_threshold:
+                    metrics.count("sample_overruns_total")
+                metrics.set("last_sample_timestamp_seconds", sample_timestamp)
+                if args.metricsFile and t2 - metrics_written >= args.metricsInterval:
+                    metrics.writeTextfile(args.metricsFile)
+                    metrics_written = t2
+            if samps_taken < args.num_samps or args.num_samps < 0:
+                if (t2 - t1) < args.boredom_threshold:
+                    time.sleep(args.boredom_threshold - (t2 - t1))
+        detectEvents([], final=True)
+    else:
+        inputfile = pr.openFile(args.datafile)
+        for data in pr.ReportFileReader(inputfile, numRecs=args.numrecs):
+            for plane in data:
+                if not plane.reporter:
+                    plane.reporter = args.reporter
+                if dbconn:
+                    plane.logToDB(dbconn, printQuery=args.debug)
+                else:
+                    print(plane.to_JSON())
             if dbconn:
-                plane.logToDB(dbconn, printQuery=args.debug)
-            else:
-                print(plane.to_JSON())
-        if dbconn:
-            dbconn.commit()
-        data = pr.readFromFile(inputfile, numRecs=args.numrecs)
+                dbconn.commit()
+            detectEvents(data)
+        detectEvents([], final=True)
+
+    if event_writer:
+        event_writer.flush()
+
+    if metrics and args.metricsFile:
+        metrics.writeTextfile(args.metricsFile)
+    if metrics_server:
+        metrics_server.stop()
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
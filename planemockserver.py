@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+#
+# A stand-in for dump1090 and VRS servers
+#
+"""
+Serves recorded or synthetic reports as dump1090 (mutability and piaware 3.6)
+aircraft.json, the original data.json and VRS AircraftList.json do, for running
+planelogger.py and vrsgetplanes.py against, and measuring their throughput and
+how they handle slow or failing servers.
+"""
+import time
+import json
+import argparse
+import PlaneMockServer as pms
+import PlaneEvents as pe
+import PlaneProfile as pp
+
+parser = argparse.ArgumentParser(
+    description="Serve recorded or synthetic plane reports as dump1090 or VRS would")
+parser.add_argument('--debug', action="store_true",
+                    dest='debug', default=False, help="Turn on debug mode")
+parser.add_argument('--host', dest='host', default="127.0.0.1",
+                    help="Address to listen on (default 127.0.0.1)")
+parser.add_argument('-p', '--port', dest='port', type=int, default=8080,
+                    help="Port to listen on (default 8080)")
+parser.add_argument('-f', '--file', dest='datafile',
+                    help="A file of recorded reports to replay")
+parser.add_argument('--snapshots', dest='snapshots',
+                    help="A directory of aircraft.json, data.json or VRS files (as synthtraffic.py writes) to replay")
+parser.add_argument('-n', '--synthetic', dest='synthetic', type=int,
+                    help="Make up the reports of this many aircraft, with PlaneSynth")
+parser.add_argument('--lat', dest='lat', type=float, default=-35.343135,
+                    help="Latitude of the synthetic receiver (default Home1's)")
+parser.add_argument('--lon', dest='lon', type=float, default=149.141059,
+                    help="Longitude of the synthetic receiver (default Home1's)")
+parser.add_argument('-A', '--airport', dest='airport',
+                    help="The ICAO code(s) of airport(s) for synthetic aircraft to fly to and from, separated by commas")
+parser.add_argument('--apt-file', dest='aptfile',
+                    help="Read the airports for -A from an apt.dat file")
+parser.add_argument('-s', '--seed', dest='seed', type=int, default=1,
+                    help="Seed for the synthetic reports, and the faults (default 1)")
+parser.add_argument('--speed', dest='speed', type=float, default=1.0,
+                    help="Replay speed - 2 plays the reports twice as fast as they happened (default 1)")
+parser.add_argument('--loop', action="store_true", dest='loop', default=False,
+                    help="Start again at the end of the recorded reports")
+parser.add_argument('--variant', dest='variant', default="mutability", choices=["mutability", "piaware"],
+                    help="Keys used in /data/aircraft.json (default mutability)")
+parser.add_argument('--latency', dest='latency', type=float, default=0.0,
+                    help="Milliseconds every response is delayed by (default 0)")
+parser.add_argument('--jitter', dest='jitter', type=float, default=0.0,
+                    help="Responses are delayed up to this many milliseconds more, or less (default 0)")
+parser.add_argument('--timeout-rate', dest='timeoutRate', type=float, default=0.0,
+                    help="Chance of a request being left hanging, so the client times out (default 0)")
+parser.add_argument('--hang', dest='hang', type=float, default=5.0,
+                    help="Seconds a hanging request is left for (default 5)")
+parser.add_argument('--error-rate', dest='errorRate', type=float, default=0.0,
+                    help="Chance of a request failing with a 503 (default 0)")
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Serves recorded or synthetic reports as dump1090 or VRS would, until interrupted"""
+    args = parser.parse_args(argv)
+
+    if len([source for source in [args.datafile, args.snapshots, args.synthetic] if source]) != 1:
+        print("Need one of a data file, a directory of snapshots or a number of synthetic aircraft")
+        exit(1)
+
+    if args.airport and not args.aptfile:
+        print("Need an apt.dat file to read the airports from")
+        exit(1)
+
+    if args.datafile:
+        source = lambda: pms.fileBatches(args.datafile)
+    elif args.snapshots:
+        source = lambda: pms.snapshotBatches(args.snapshots)
+    else:
+        airports, runways = None, None
+        if args.airport:
+            runway_set = pe.loadRunwaySet(args.airport.split(','), aptFile=args.aptfile)
+            airports, runways = list(runway_set.airports.values()), runway_set.tester.runways
+        start = time.time()
+        source = lambda: pms.syntheticBatches(args.synthetic, args.lat, args.lon, seed=args.seed, startTime=start,
+                                              airports=airports, runways=runways)
+
+    replay = pms.ReportReplay(source, loop=args.loop)
+    mock = pms.MockReceiver(replay, host=args.host, port=args.port, speed=args.speed, variant=args.variant,
+                            latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                            timeoutRate=args.timeoutRate, hang=args.hang, errorRate=args.errorRate, seed=args.seed)
+    if args.debug:
+        print("Serving on", mock.url())
+    try:
+        mock.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    mock.stop()
+    if args.debug:
+        print(json.dumps(dict(mock.stats), sort_keys=True))
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
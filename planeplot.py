@@ -3,11 +3,13 @@
 #
 import time
 import argparse
+import numpy as np
 import PlaneReport as pr
 import matplotlib as mpl
+import PlaneProfile as pp
 
 parser = argparse.ArgumentParser(
-    description="Plot plane positiions from a file")
+    description="Plot plane positiions from a file, or from the DB")
 
 parser.add_argument('--debug', action="store_true",
                     dest='debug', default=False, help="Turn on debug mode")
@@ -35,80 +37,142 @@ parser.add_argument('--output-file', dest='outfile',
 parser.add_argument('--autoscale', action="store_true",
                     dest='autoscale', default=False, help="Set area of plot to be 50kms larger than max distance of plane(s)")
 
-
-args = parser.parse_args()
-
-if args.outfile:
-    mpl.use('Agg')
-#
-# Importing here, as they set the matplotlib backend to X if Agg call hasn't been made.
-#
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
-
-
-if not args.latitude or not args.longitude:
-    print("Require lat/lon cordinates")
-    exit(1)
-
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
-
-xx, yy, lats, lons = [], [], [], []
-
-reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude,
-                       location="", url="", mytype="")
-
-max_dist = 0.0
-
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-
-while data:
-    for plane in data:
-        xx.append(plane.lon)
-        yy.append(plane.lat)
-        zz = plane.distance(reporter)
-        if zz > max_dist:
-            max_dist = zz
-
-    data = pr.readFromFile(inputfile)
-
-if args.autoscale:
-    args.xdim = args.ydim = max_dist * 2 + 50000
-
-if args.debug:
-    print("Height", args.height, "Width", args.width)
-
-mymap = Basemap(width=args.xdim, height=args.ydim, resolution='h', projection='tmerc', \
-              lat_0=args.latitude, lon_0=args.longitude)
-
-lons,lats = mymap(xx, yy)
-
-
-if args.debug:
-    print("maximum distance", max_dist)
-    
-            
-#mymap.drawmapboundary(fill_color='aqua')
-#mymap.fillcontinents(color='#ddaa66',lake_color='aqua')
-#mmyap.drawrivers()
-#mymap.etopo()
-
-fig = plt.figure(figsize=(10,10))
-ax = plt.subplot(1,1,1)
-mymap.shadedrelief()
-mymap.drawstates()
-mymap.drawcoastlines()
-
-ax.scatter(lons, lats, marker='.', s=1, color='red')
-
-
-if args.title:
-    ax.set_title(args.title, fontsize=20)
-
-if args.outfile:
-    plt.savefig(args.outfile)
-else:
-    plt.show()
+parser.add_argument('--no-map-cache', action="store_false", dest='map_cache', default=True,
+                    help="Draw the map from scratch, rather than using (and filling) the map cache")
+
+parser.add_argument('--render', dest='render', choices=['auto', 'exact', 'density'], default='auto',
+                    help="Plot a marker for every report (exact), or shade each pixel by the number of reports in it (density). auto, the default, plots markers unless there are more than --exact-limit reports")
+
+parser.add_argument('--exact-limit', dest='exactLimit', type=int, default=100000,
+                    help="Most reports to plot as markers with --render auto (default 100000)")
+
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Plots reports from a file, or the DB, on a map"""
+    args = parser.parse_args(argv)
+
+    if args.outfile:
+        mpl.use('Agg')
+    #
+    # Importing here, as they set the matplotlib backend to X if Agg call hasn't been made.
+    #
+    import matplotlib.pyplot as plt
+    import PlaneMap as pmap
+
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
+
+    if db_reporter and not args.latitude and not args.longitude:
+        args.latitude, args.longitude = db_reporter.lat, db_reporter.lon
+
+    if not args.latitude or not args.longitude:
+        print("Require lat/lon cordinates")
+        exit(1)
+
+    fig = plt.figure(figsize=(10,10))
+    ax = plt.subplot(1,1,1)
+    axpos = ax.get_position()
+    pixels = min(axpos.width * fig.get_figwidth(), axpos.height * fig.get_figheight()) * fig.dpi
+
+    #
+    # Positions are projected relative to the centre of the plot as they're read,
+    # which doesn't depend on how big the plot turns out to be.
+    #
+    proj_dims = (args.xdim, args.ydim)
+    proj = pmap.projectionMap(pmap.mapParams(args.xdim, args.ydim, args.latitude, args.longitude))
+
+
+    def relativePositions(lons, lats):
+        xs, ys = proj(lons, lats)
+        return np.asarray(xs) - proj_dims[0] / 2.0, np.asarray(ys) - proj_dims[1] / 2.0
+
+
+    def newDensityGrid():
+        #
+        # One cell per pixel of the map. When autoscaling, the size isn't known until
+        # all the reports have been read, so the grid starts at twice the resolution
+        # and doubles in size as further planes turn up.
+        #
+        if args.autoscale:
+            size = max_dist * 2 + 50000
+            return pmap.DensityGrid(size, size, size / (2 * pixels), grow=True)
+        return pmap.DensityGrid(args.xdim, args.ydim, max(args.xdim, args.ydim) / pixels)
+
+
+    #
+    # Reports are kept to be plotted exactly until there are too many of them, after
+    # which they're counted in a grid, so memory doesn't grow with the number read.
+    #
+    exact = args.render != 'density'
+    xx, yy = [], []
+    grid = None
+    num_reports = 0
+    max_dist = 0.0
+    t1 = time.time()
+    for batch in batches:
+        if not len(batch):
+            continue
+        num_reports += len(batch)
+        max_dist = max(max_dist, batch.distances(args.longitude, args.latitude).max())
+        if exact and args.render == 'auto' and num_reports > args.exactLimit:
+            exact = False
+            grid = newDensityGrid()
+            for lons, lats in zip(xx, yy):
+                grid.add(*relativePositions(lons, lats))
+            xx, yy = [], []
+        if exact:
+            xx.append(batch.lon)
+            yy.append(batch.lat)
+        else:
+            if grid is None:
+                grid = newDensityGrid()
+            grid.add(*relativePositions(batch.lon, batch.lat))
+    #
+    # Nothing was read, so there's an empty grid to draw
+    #
+    if not exact and grid is None:
+        grid = newDensityGrid()
+
+    if args.debug:
+        print("Read", num_reports, "reports in", time.time() - t1, "seconds, plotting them",
+              "exactly" if exact else "as a %d x %d density grid" % (grid.nx, grid.ny))
+
+    if args.autoscale:
+        args.xdim = args.ydim = max_dist * 2 + 50000
+
+    if args.debug:
+        print("Height", args.ydim, "Width", args.xdim)
+
+    if args.debug:
+        print("maximum distance", max_dist)
+
+    map_cache = pmap.MapCache(debug=args.debug) if args.map_cache else None
+    mymap = pmap.drawBackground(ax, args.xdim, args.ydim, args.latitude, args.longitude,
+                                figsize=fig.get_size_inches(), dpi=fig.dpi, cache=map_cache)
+
+    if exact:
+        lons,lats = mymap(np.concatenate(xx) if xx else [], np.concatenate(yy) if yy else [])
+        ax.scatter(lons, lats, marker='.', s=1, color='red')
+    else:
+        pmap.drawDensity(ax, grid, args.xdim, args.ydim)
+
+
+    if args.title:
+        ax.set_title(args.title, fontsize=20)
+
+    if args.outfile:
+        plt.savefig(args.outfile)
+    else:
+        plt.show()
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -4,7 +4,7 @@
 import time
 import argparse
 import PlaneReport as pr
-from mpl_toolkits.basemap import Basemap
+import PlaneMap as pmap
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from mpl_toolkits.mplot3d import Axes3D
@@ -12,6 +12,7 @@ from  matplotlib.animation import FuncAnimation
 from datetime import datetime
 import time
 import numpy as np
+import PlaneProfile as pp
 
 
 parser = argparse.ArgumentParser(
@@ -35,6 +36,9 @@ parser.add_argument('-X', '--x-dim', dest='xdim',
 parser.add_argument('--autoscale', action="store_true",
                     dest='autoscale', default=False, help="Set area of plot to be 50kms larger than max distance of plane(s)")
 
+parser.add_argument('--no-map-cache', action="store_false", dest='map_cache', default=True,
+                    help="Draw the map from scratch, rather than using (and filling) the map cache")
+
 parser.add_argument('-t', '--title', dest='title',
                     help="Title of plot", default=False)
 
@@ -46,60 +50,59 @@ parser.add_argument('--fps', dest='fps',
 parser.add_argument('--codec', dest='codec',
                     help="FFMpeg codec used to create movie (default h264)", default='h264')
 
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Plots reports from a file in 3D"""
+    args = parser.parse_args(argv)
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
+
+    if db_reporter and not args.latitude and not args.longitude:
+        args.latitude, args.longitude = db_reporter.lat, db_reporter.lon
+
+    if not args.latitude or not args.longitude:
+        print("Require lat/lon cordinates")
+        exit(1)
+
+    reports = pr.ReportBatch.concatenate(list(batches))
+    xx, yy = reports.lon, reports.lat
+    alts = reports.altitude.astype(int)
+    max_dist = reports.distances(args.longitude, args.latitude).max() if len(reports) else 0.0
+
+    if args.debug:
+        print("Arrays built")
+
+    if args.autoscale:
+        args.xdim = args.ydim = (2 * max_dist) + 50
+
+    fig = plt.figure(figsize=(10,10))
+    #ax = Axes3D(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    map_cache = pmap.MapCache(debug=args.debug) if args.map_cache else None
+    mymap = pmap.drawLines3D(ax, args.xdim, args.ydim, args.latitude, args.longitude, cache=map_cache)
+
+    lons,lats = mymap(xx, yy)
+
+    ax.plot(lons, lats, alts, ',', color='red')
+    #ax.view_init(azim=40, elev=20000)
+    #ax.scatter(lons, lats, alts, marker='.', color='red', s=1)
+    if args.title:
+        ax.set_title(args.title)
+    ax.set_zlabel('Altitude (m)')
+    ax.grid(True)
+    plt.draw()
+    if args.debug:
+        print("showing plot")
+    plt.show()
+
 
-args = parser.parse_args()
-
-if not args.latitude or not args.longitude:
-    print("Require lat/lon cordinates")
-    exit(1)
-
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
-
-xx, yy, lats, lons, alts = [], [], [], [], []
-max_dist = 0.0
-
-reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude,
-                       location="", url="", mytype="")
-
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-while data:
-    for plane in data:
-        xx.append(plane.lon)
-        yy.append(plane.lat)
-        alts.append(int(plane.altitude))
-        zz = plane.distance(reporter)
-        if zz > max_dist:
-            max_dist = zz
-        
-    data = pr.readFromFile(inputfile)
-
-if args.debug:
-    print("Arrays built")
-
-if args.autoscale:
-    args.xdim = args.ydim = (2 * max_dist) + 50
-
-mymap = Basemap(width=args.xdim, height=args.ydim, resolution='h', projection='tmerc', \
-                lat_0=args.latitude, lon_0=args.longitude)
-
-lons,lats = mymap(xx, yy)
-
-fig = plt.figure(figsize=(10,10))
-#ax = Axes3D(fig)
-ax = fig.add_subplot(111, projection='3d')
-ax.plot(lons, lats, alts, ',', color='red')
-#ax.view_init(azim=40, elev=20000)
-#ax.scatter(lons, lats, alts, marker='.', color='red', s=1)
-ax.add_collection3d(mymap.drawcoastlines())
-ax.add_collection3d(mymap.drawstates())
-if args.title:
-    ax.set_title(args.title)
-ax.set_zlabel('Altitude (m)')
-ax.grid(True)
-plt.draw()
-if args.debug:
-    print("showing plot")
-plt.show()
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 #
 #
+import os
 import time
 import argparse
 import PlaneReport as pr
@@ -8,6 +9,7 @@ import matplotlib as mpl
 from datetime import datetime
 import time
 import numpy as np
+import PlaneProfile as pp
 
 
 parser = argparse.ArgumentParser(
@@ -38,12 +40,18 @@ parser.add_argument('--output-file', dest='outfile', help="Name of output animat
 parser.add_argument('--fps', dest='fps',
                     help="Frames per second of output movie (default=25)", default=25, type=int)
 
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                    help="Number of processes rendering frames of the output file (defaults to the number of CPUs)")
+
 parser.add_argument('--display-hex', action="store_true",
                     dest='display_hex', default=False, help="Display the ICAO24 hex code for the planes")
 
 parser.add_argument('--display-flight', action="store_true",
                     dest='display_flt', default=False, help="Display the Flight Number for the planes")
 
+parser.add_argument('--trails', dest='trails', type=int, default=0,
+                    help="Draw a fading trail behind each plane, of where it was over the last N frames")
+
 parser.add_argument('-r', '--rotate', action="store_true",
                     dest='rotate', default=False, help="Rotate the animation")
 
@@ -57,200 +65,206 @@ parser.add_argument('-Z', '--z-dim', dest='zdim',
 parser.add_argument('--autoscale', action="store_true",
                     dest='autoscale', default=False, help="Set area of plot to be 50kms larger than max distance of plane(s)")
 
+parser.add_argument('--no-map-cache', action="store_false", dest='map_cache', default=True,
+                    help="Draw the map from scratch, rather than using (and filling) the map cache")
 
-args = parser.parse_args()
-
-if not args.latitude or not args.longitude:
-    print("Require lat/lon cordinates")
-    exit(1)
-else:
-    lat = float(args.latitude)
-    lon = float(args.longitude)
-
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
-
-if args.outfile:
-    mpl.use('Agg')
-
-from mpl_toolkits.basemap import Basemap
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import mpl_toolkits.mplot3d.axes3d as p3
-import matplotlib.animation as animation
-from  matplotlib.animation import FuncAnimation
-from mpl_toolkits.mplot3d.art3d import juggle_axes
-
-
-MAPX = 850000
-MAPY = 850000
-
-lats, lons, alts = [], [], []
-drawableslst = []
-annolist = []
-
-time_slices = []
-time_slices.append([])
-time_slc_idx = 0
-max_dist = 0.0
-max_alt = 0.0
-
-reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude, location="", url="", mytype="")
-
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-
-if data:
-    first_time = data[0].time
-    next_time = first_time + args.sec_per_frame
-
-while data:
-    for plane in data:
-        if plane.time >= next_time:
-            # Catch case where there's a long time without action
-            if plane.time > (next_time +  args.sec_per_frame):
-                while next_time < plane.time:
-                    time_slc_idx += 1
-                    time_slices.append([])
-                    next_time += args.sec_per_frame
-            else:    
-                time_slc_idx += 1
-                time_slices.append([])
-                next_time += args.sec_per_frame
-        time_slices[time_slc_idx].append(plane)
-        zz = plane.distance(reporter)
-        if zz > max_dist:
-            max_dist = zz
-        if plane.altitude > max_alt:
-            max_alt = plane.altitude
-        
-    data = pr.readFromFile(inputfile)
-
-if args.debug:
-    print("Number of slices is ", time_slc_idx)
-
-diff_time = time_slices[-1][-1].time - time_slices[0][0].time
-
-if args.debug:
-    print("Begin time", time_slices[0][0].time, "end time", time_slices[-1][-1].time, "diff",
-          diff_time, "calc slices", diff_time / args.sec_per_frame)
-
-if args.autoscale:
-    args.xdim = args.ydim = max_dist * 2 + 50000
-    args.zdim = max_alt + 500
-
-if args.debug:
-    print("Max dist", max_dist, "Width", args.xdim, "Height", args.ydim)
-
-mymap = Basemap(width=args.xdim, height=args.ydim, resolution='h', projection='tmerc', \
-              lat_0=lat, lon_0=lon)
-
-fig = plt.figure(figsize=(10,10))
-
-#ax = p3.Axes3D(fig)
-ax = fig.add_subplot(111, projection='3d')
-ax.set_zlim3d([0, args.zdim])
-if not args.title:
-    plot_title = "Flights between " + time.strftime("%F %H:%M:%S", time.localtime(time_slices[0][0].time)) + \
-                 " and " + time.strftime("%F %H:%M:%S", time.localtime(time_slices[-1][-1].time))
-else:
-    plot_title = args.title
-ax.set_title(plot_title)
-
-ax.set_zlabel('Altitude (m)')
-ax.add_collection3d(mymap.drawcoastlines())
-ax.add_collection3d(mymap.drawstates())
-
-for plane in time_slices[0]:
-    lon,lat = mymap(plane.lon, plane.lat)
-    lons.append(int(lon))
-    lats.append(int(lat))
-    alts.append(int(plane.altitude))
-
-centrex,centrey = mymap(reporter.lon, reporter.lat)
-
-#myplot, = ax.plot(lons, lats, alts, ',')
-#scat = ax.scatter(lons, lats, alts, c='r',color='red', s=1, marker='.', animated=True)
-scat = ax.scatter(lons, lats, alts, color='red', s=1, marker='.', animated=True)
-
-time_text = ax.text(-args.xdim / 5, (args.ydim * 16) / 17, (args.zdim / 10) * 9, '', fontsize=20)
-
-annolist.append(ax.text(0, 0, 0, '', fontsize=8))
-
-def init():
-    time_text.set_text("")
-    scat._offsets3d = juggle_axes(lons, lats, alts, 'z')
-    drawableslst = []
-    drawableslst.append(scat)
-    drawableslst.append(time_text)
-    for i in annolist:
-        drawableslst.append(i)
-    return tuple(drawableslst)
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Makes a 3D movie of reports from a file, or the DB"""
+    args = parser.parse_args(argv)
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
+
+    if db_reporter and not args.latitude and not args.longitude:
+        args.latitude, args.longitude = db_reporter.lat, db_reporter.lon
+
+    if not args.latitude or not args.longitude:
+        print("Require lat/lon cordinates")
+        exit(1)
+    else:
+        lat = float(args.latitude)
+        lon = float(args.longitude)
+
+    if args.outfile:
+        mpl.use('Agg')
+
+    import PlaneMap as pmap
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.mplot3d import Axes3D
+    import mpl_toolkits.mplot3d.axes3d as p3
+    import matplotlib.animation as animation
+    from  matplotlib.animation import FuncAnimation
+    import PlaneMovie as pm
+    from mpl_toolkits.mplot3d.art3d import juggle_axes, Line3DCollection
+
+
+    MAPX = 850000
+    MAPY = 850000
+
+    reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude, location="", url="", mytype="")
 
-#
-# the 3D version of plots doesn't support scatter plot annotations, so we have to use text objects
-# The tex objects don't seem to support having their position updated, so we have to create them
-# anew each time, then destroy them the next frame.
-def update(frame):
-    indicesdict = {}
-    alts = []
-    lons = []
-    lats = []
-    global annolist
-    i = 0
-
-    for i, plane in enumerate(time_slices[frame]):
-        lon,lat = mymap(plane.lon, plane.lat)
-        lons.append(int(lon))
-        lats.append(int(lat))
-        alts.append(int(plane.altitude))
-        indicesdict[plane.hex] = i
-
-
-    time_text.set_text(time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))))
     #
-    # Remove old texts from matplotlib's internal state
+    # Read all the reports into columns, and work out which reports fall in each
+    # frame in one go, rather than a list of PlaneReports per frame.
     #
-    for anno in annolist:
-        if anno:
-            ax.texts.remove(anno)
-            anno = None
-            
-    annolist = []
-
-    if args.display_hex or args.display_flt:
-        for lastpoint in indicesdict:
-            plane = time_slices[frame][indicesdict[lastpoint]]
-            if args.display_hex and args.display_flt:
-                txt = plane.hex + "/" + plane.flight
-            elif args.display_hex:
-                txt = plane.hex
-            else:
-                txt = plane.flight
-            x,y =  mymap(plane.lon, plane.lat)
-            z = plane.altitude
-            annolist.append(ax.text(x, y, z, txt, fontsize=8))
-
-    scat._offsets3d = juggle_axes(lons, lats, alts, 'z')
-
-    if args.rotate:
-        ax.view_init(30, (frame + 270) % 360)
-    drawableslst = []
-    drawableslst.append(scat)
-    drawableslst.append(time_text)
-    for anno in annolist:
-        if anno:
-            drawableslst.append(anno)
+    reports = pr.ReportBatch.concatenate(list(batches)).sortByTime()
+
+    if not len(reports):
+        print("No plane reports found")
+        exit(1)
+
+    first_time = reports.time[0]
+    frame_offsets = pr.frameOffsets(reports.time, first_time, args.sec_per_frame)
+    num_frames = len(frame_offsets) - 1
+    max_dist = reports.distances(reporter.lon, reporter.lat).max()
+    max_alt = max(reports.altitude.max(), 0.0)
+
+    if args.debug:
+        print("Number of slices is ", num_frames)
+
+    diff_time = reports.time[-1] - reports.time[0]
+
     if args.debug:
-        print (frame, time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))), len(time_slices[frame]), len(indicesdict), len(annolist), len(ax.texts))
+        print("Begin time", reports.time[0], "end time", reports.time[-1], "diff",
+              diff_time, "calc slices", diff_time / args.sec_per_frame)
+
+    if args.autoscale:
+        args.xdim = args.ydim = max_dist * 2 + 50000
+        args.zdim = max_alt + 500
+
+    if args.debug:
+        print("Max dist", max_dist, "Width", args.xdim, "Height", args.ydim)
+
+    fig = plt.figure(figsize=(10,10))
+
+    #ax = p3.Axes3D(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    ax.set_zlim3d([0, args.zdim])
+    if not args.title:
+        plot_title = "Flights between " + time.strftime("%F %H:%M:%S", time.localtime(reports.time[0])) + \
+                     " and " + time.strftime("%F %H:%M:%S", time.localtime(reports.time[-1]))
+    else:
+        plot_title = args.title
+    ax.set_title(plot_title)
+
+    ax.set_zlabel('Altitude (m)')
+    map_cache = pmap.MapCache(debug=args.debug) if args.map_cache else None
+    mymap = pmap.drawLines3D(ax, args.xdim, args.ydim, lat, lon, cache=map_cache)
+
+    #
+    # Project all the positions onto the map up front, each frame then being a slice
+    #
+    xs, ys = mymap(reports.lon, reports.lat)
+    alts = reports.altitude
+    positions = np.column_stack((xs, ys, alts))
+
+    if args.display_hex and args.display_flt:
+        labels = [h + "/" + f for h, f in zip(reports.hex, reports.flight)]
+    elif args.display_hex:
+        labels = reports.hex
+    else:
+        labels = reports.flight
+
+    centrex,centrey = mymap(reporter.lon, reporter.lat)
+
+    #myplot, = ax.plot(lons, lats, alts, ',')
+    #scat = ax.scatter(lons, lats, alts, c='r',color='red', s=1, marker='.', animated=True)
+    scat = ax.scatter(xs[:frame_offsets[1]], ys[:frame_offsets[1]], alts[:frame_offsets[1]], color='red', s=1, marker='.', animated=True)
+
+    time_text = ax.text(-args.xdim / 5, (args.ydim * 16) / 17, (args.zdim / 10) * 9, '', fontsize=20)
+
+    label_pool = pm.LabelPool(lambda: ax.text(0, 0, 0, '', fontsize=8))
+
+    trails = pm.TrailBuffer(max(args.trails, 1), dims=3)
+    trail_lines = Line3DCollection([], linewidths=0.5)
+    ax.add_collection(trail_lines)
+
+    def init():
+        time_text.set_text("")
+        scat._offsets3d = juggle_axes(xs[:frame_offsets[1]], ys[:frame_offsets[1]], alts[:frame_offsets[1]], 'z')
+        drawableslst = []
+        drawableslst.append(scat)
+        drawableslst.append(time_text)
+        drawableslst.append(trail_lines)
+        drawableslst.extend(label_pool.update([], [], [], []))
+        return tuple(drawableslst)
+
+    def lastReports(start, end):
+        """Returns the indices of the last report of each plane between start and end"""
+        _, idx = np.unique(reports.hex[start:end][::-1], return_index=True)
+        return np.sort(end - 1 - idx)
+
+
+    def framePoints(frame):
+        """The hex codes and positions of the last report of each plane in a frame"""
+        lastpoints = lastReports(frame_offsets[frame], frame_offsets[frame + 1])
+        return reports.hex[lastpoints], positions[lastpoints]
+
+
+    def drawTrails(frame):
+        """Updates the trail lines in place for a frame"""
+        if not args.trails:
+            return
+        trails.advanceTo(frame, framePoints)
+        segs, alphas = trails.segments()
+        colours = np.zeros((len(alphas), 4))
+        colours[:, 0] = 1.0
+        colours[:, 3] = alphas
+        trail_lines.set_segments(segs)
+        trail_lines.set_color(colours)
+
+
+    #
+    # the 3D version of plots doesn't support scatter plot annotations, so we have to use
+    # text objects. They're kept in a pool and moved about, rather than made anew each frame.
+    #
+    def update(frame):
+        start, end = frame_offsets[frame], frame_offsets[frame + 1]
+
+        time_text.set_text(time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))))
+
+        if args.display_hex or args.display_flt:
+            lastpoints = lastReports(start, end)
+        else:
+            lastpoints = np.zeros(0, dtype=np.int64)
+        shown = label_pool.update([labels[idx] for idx in lastpoints],
+                                  xs[lastpoints], ys[lastpoints], alts[lastpoints])
+
+        scat._offsets3d = juggle_axes(xs[start:end], ys[start:end], alts[start:end], 'z')
+
+        if args.rotate:
+            ax.view_init(30, (frame + 270) % 360)
+        drawTrails(frame)
+
+        drawableslst = []
+        drawableslst.append(scat)
+        drawableslst.append(time_text)
+        drawableslst.append(trail_lines)
+        drawableslst.extend(shown)
+        if args.debug:
+            print (frame, time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))), end - start, len(lastpoints), len(shown), len(ax.texts))
+
+        return tuple(drawableslst)
+
 
-    return tuple(drawableslst)
+    animation = FuncAnimation(fig, update, init_func=init, frames=num_frames, interval=40, repeat=False, blit=True)
 
+    if args.outfile and args.jobs > 1:
+        pm.saveMovie(fig, update, num_frames, args.outfile, init=init, fps=args.fps,
+                     codec=args.codec, jobs=args.jobs, debug=args.debug)
+    elif args.outfile:
+        animation.save(args.outfile, fps=args.fps, codec=args.codec)
+    else:
+        plt.show()
 
-animation = FuncAnimation(fig, update, init_func=init, frames=time_slc_idx, interval=40, repeat=False, blit=True)
 
-if args.outfile:
-    animation.save(args.outfile, fps=args.fps, codec=args.codec)
-else:
-    plt.show()
+if __name__ == "__main__":
+    pp.runMain(main)
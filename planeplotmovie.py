@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 #
 #
+import os
 import time
 import argparse
 import PlaneReport as pr
@@ -8,6 +9,7 @@ import matplotlib as mpl
 from datetime import datetime
 import time
 import numpy as np
+import PlaneProfile as pp
 
 
 parser = argparse.ArgumentParser(
@@ -38,12 +40,18 @@ parser.add_argument('--output-file', dest='outfile', help="Name of output animat
 parser.add_argument('--fps', dest='fps',
                     help="Frames per second of output movie (default=25)", default=25, type=int)
 
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                    help="Number of processes rendering frames of the output file (defaults to the number of CPUs)")
+
 parser.add_argument('--display-hex', action="store_true",
                     dest='display_hex', default=False, help="Display the ICAO24 hex code for the planes")
 
 parser.add_argument('--display-flight', action="store_true",
                     dest='display_flt', default=False, help="Display the Flight Number for the planes")
 
+parser.add_argument('--trails', dest='trails', type=int, default=0,
+                    help="Draw a fading trail behind each plane, of where it was over the last N frames")
+
 parser.add_argument('-Y', '--y-dim', dest='ydim',
                     help="Height of plot in metres", default=850000, type=int)
 parser.add_argument('-X', '--x-dim', dest='xdim',
@@ -52,168 +60,184 @@ parser.add_argument('-X', '--x-dim', dest='xdim',
 parser.add_argument('--autoscale', action="store_true",
                     dest='autoscale', default=False, help="Set area of plot to be 50kms larger than max distance of plane(s)")
 
-args = parser.parse_args()
-
-if not args.latitude or not args.longitude:
-    print("Require lat/lon cordinates")
-    exit(1)
-else:
-    lat = float(args.latitude)
-    lon = float(args.longitude)
-
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
-
-if args.outfile:
-    mpl.use('Agg')
-
-from mpl_toolkits.basemap import Basemap
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from  matplotlib.animation import FuncAnimation
-
-
-lats, lons, times = [], [], []
-
-time_slices = []
-time_slices.append([])
-time_slc_idx = 0
-max_dist = 0.0
-
-reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude, location="", url="", mytype="")
-
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-if data:
-    first_time = data[0].time
-    next_time = first_time + args.sec_per_frame
-while data:
-    for plane in data:
-        if plane.time >= next_time:
-            # Catch case where there's a long time without action
-            if plane.time > (next_time +  args.sec_per_frame):
-                while next_time < plane.time:
-                    time_slc_idx += 1
-                    time_slices.append([])
-                    next_time += args.sec_per_frame
-            else:    
-                time_slc_idx += 1
-                time_slices.append([])
-                next_time += args.sec_per_frame
-        time_slices[time_slc_idx].append(plane)
-        zz = plane.distance(reporter)
-        if zz > max_dist:
-            max_dist = zz
-        
-    data = pr.readFromFile(inputfile)
-
-if args.debug:
-    print("Number of slices is ", time_slc_idx)
-    print("Max dist is", max_dist)
-
-diff_time = time_slices[-1][-1].time - time_slices[0][0].time
-
-if args.debug:
-    print("Begin time", time_slices[0][0].time, "end time", time_slices[-1][-1].time, "diff",
-          diff_time, "calc slices", diff_time / args.sec_per_frame)
-
-fig = plt.figure(figsize=(10,10))
-ax = plt.subplot(1,1,1)
-
-if not args.title:
-    plot_title = "Flights between " + time.strftime("%F %H:%M:%S", time.localtime(time_slices[0][0].time)) + \
-                 " and " + time.strftime("%F %H:%M:%S", time.localtime(time_slices[-1][-1].time))
-else:
-    plot_title = args.title
-
-ax.set_title(plot_title)
-
-if args.autoscale:
-    args.xdim = args.ydim = max_dist * 2 + 50000
-
-mymap = Basemap(width=args.xdim, height=args.ydim, resolution='h', projection='tmerc', \
-              lat_0=lat, lon_0=lon)
-
-#mymap.drawmapboundary(fill_color='aqua')
-#mymap.fillcontinents(color='#ddaa66',lake_color='aqua')
-#mmyap.drawrivers()
-#mymap.etopo()
-
-mymap.shadedrelief()
-mymap.drawstates()
-mymap.drawcoastlines()
-
-i = 0
-positions = []
-drawableslst = []
-annolist = []
-
-scat = ax.scatter(lons, lats, marker='.', color='red',  s=1)
-
-time_text = ax.text(args.xdim / 3.4, -(args.ydim / 17), '', fontsize=20)
-
-annolist.append(ax.annotate('', xy=(0, 0), xycoords='data', fontsize=8))
-
-def init():
-    scat.set_offsets([])
-    time_text.set_text("")
-    drawableslst = []
-    drawableslst.append(scat)
-    drawableslst.append(time_text)
-    for i in annolist:
-        drawableslst.append(i)
-    return tuple(drawableslst)
-
-def update(frame):
-    positions = []
-    indicesdict = {}
-    i = 0
-
-    for i, plane in enumerate(time_slices[frame]):
-        lon,lat = mymap(plane.lon, plane.lat)
-        positions.append((lon, lat))
-        indicesdict[plane.hex] = i
-
-    scat.set_offsets(positions)
-    time_text.set_text(time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))))
-    for anno in annolist:
-        anno.set_text('')
-        anno.set_position((0, 0))
-
-    if args.display_hex or args.display_flt:
-        if len(annolist) < len(indicesdict):
-            z = len(indicesdict) - len(annolist)
-            while z > 0:
-                z -= 1
-                annolist.append(ax.annotate('', xy=(0, 0), xycoords='data', fontsize=8))
-
-
-        for i, lastpoint in enumerate(indicesdict):
-            plane = time_slices[frame][indicesdict[lastpoint]]
-            if args.display_hex and args.display_flt:
-                txt = plane.hex + "/" + plane.flight
-            elif args.display_hex:
-                txt = plane.hex
-            else:
-                txt = plane.flight
-            x,y =  mymap(plane.lon, plane.lat)
-            annolist[i].set_text(txt)
-            annolist[i].set_position((x, y))
-
-    drawableslst = []
-    drawableslst.append(scat)
-    drawableslst.append(time_text)
-    for i in annolist:
-        drawableslst.append(i)
+parser.add_argument('--no-map-cache', action="store_false", dest='map_cache', default=True,
+                    help="Draw the map from scratch, rather than using (and filling) the map cache")
+
+pr.addDBQueryArgs(parser)
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Makes a movie of reports from a file, or the DB, on a map"""
+    args = parser.parse_args(argv)
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
+
+    if db_reporter and not args.latitude and not args.longitude:
+        args.latitude, args.longitude = db_reporter.lat, db_reporter.lon
+
+    if not args.latitude or not args.longitude:
+        print("Require lat/lon cordinates")
+        exit(1)
+    else:
+        lat = float(args.latitude)
+        lon = float(args.longitude)
+
+    if args.outfile:
+        mpl.use('Agg')
+
+    import PlaneMap as pmap
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    from  matplotlib.animation import FuncAnimation
+    from matplotlib.collections import LineCollection
+    import PlaneMovie as pm
+
+
+    reporter = pr.Reporter(name="", type="", lon=args.longitude, lat=args.latitude, location="", url="", mytype="")
+
+    #
+    # Read all the reports into columns, and work out which reports fall in each
+    # frame in one go, rather than a list of PlaneReports per frame.
+    #
+    reports = pr.ReportBatch.concatenate(list(batches)).sortByTime()
+
+    if not len(reports):
+        print("No plane reports found")
+        exit(1)
+
+    first_time = reports.time[0]
+    frame_offsets = pr.frameOffsets(reports.time, first_time, args.sec_per_frame)
+    num_frames = len(frame_offsets) - 1
+    max_dist = reports.distances(reporter.lon, reporter.lat).max()
+
+    if args.debug:
+        print("Number of slices is ", num_frames)
+        print("Max dist is", max_dist)
+
+    diff_time = reports.time[-1] - reports.time[0]
+
     if args.debug:
-        print (frame, time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))), len(indicesdict))
-    return tuple(drawableslst)
+        print("Begin time", reports.time[0], "end time", reports.time[-1], "diff",
+              diff_time, "calc slices", diff_time / args.sec_per_frame)
+
+    fig = plt.figure(figsize=(10,10))
+    ax = plt.subplot(1,1,1)
+
+    if not args.title:
+        plot_title = "Flights between " + time.strftime("%F %H:%M:%S", time.localtime(reports.time[0])) + \
+                     " and " + time.strftime("%F %H:%M:%S", time.localtime(reports.time[-1]))
+    else:
+        plot_title = args.title
+
+    ax.set_title(plot_title)
+
+    if args.autoscale:
+        args.xdim = args.ydim = max_dist * 2 + 50000
+
+    map_cache = pmap.MapCache(debug=args.debug) if args.map_cache else None
+    mymap = pmap.drawBackground(ax, args.xdim, args.ydim, lat, lon,
+                                figsize=fig.get_size_inches(), dpi=fig.dpi, cache=map_cache)
+
+    #
+    # Project all the positions onto the map up front, each frame then being a slice
+    #
+    xs, ys = mymap(reports.lon, reports.lat)
+    positions = np.column_stack((xs, ys))
+
+    if args.display_hex and args.display_flt:
+        labels = [h + "/" + f for h, f in zip(reports.hex, reports.flight)]
+    elif args.display_hex:
+        labels = reports.hex
+    else:
+        labels = reports.flight
+
+    lats, lons = [], []
+
+    scat = ax.scatter(lons, lats, marker='.', color='red',  s=1)
+
+    time_text = ax.text(args.xdim / 3.4, -(args.ydim / 17), '', fontsize=20)
+
+    label_pool = pm.LabelPool(lambda: ax.annotate('', xy=(0, 0), xycoords='data', fontsize=8))
+
+    trails = pm.TrailBuffer(max(args.trails, 1))
+    trail_lines = LineCollection([], linewidths=0.5)
+    ax.add_collection(trail_lines, autolim=False)
+
+    def init():
+        scat.set_offsets(np.zeros((0, 2)))
+        time_text.set_text("")
+        drawableslst = []
+        drawableslst.append(scat)
+        drawableslst.append(time_text)
+        drawableslst.append(trail_lines)
+        drawableslst.extend(label_pool.update([], [], []))
+        return tuple(drawableslst)
+
+    def lastReports(start, end):
+        """Returns the indices of the last report of each plane between start and end"""
+        _, idx = np.unique(reports.hex[start:end][::-1], return_index=True)
+        return np.sort(end - 1 - idx)
+
+
+    def framePoints(frame):
+        """The hex codes and positions of the last report of each plane in a frame"""
+        lastpoints = lastReports(frame_offsets[frame], frame_offsets[frame + 1])
+        return reports.hex[lastpoints], positions[lastpoints]
+
+
+    def drawTrails(frame):
+        """Updates the trail lines in place for a frame"""
+        if not args.trails:
+            return
+        trails.advanceTo(frame, framePoints)
+        segs, alphas = trails.segments()
+        colours = np.zeros((len(alphas), 4))
+        colours[:, 0] = 1.0
+        colours[:, 3] = alphas
+        trail_lines.set_segments(segs)
+        trail_lines.set_color(colours)
+
+
+    def update(frame):
+        start, end = frame_offsets[frame], frame_offsets[frame + 1]
+
+        scat.set_offsets(positions[start:end])
+        time_text.set_text(time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))))
+
+        if args.display_hex or args.display_flt:
+            lastpoints = lastReports(start, end)
+        else:
+            lastpoints = np.zeros(0, dtype=np.int64)
+
+        drawTrails(frame)
+
+        drawableslst = []
+        drawableslst.append(scat)
+        drawableslst.append(time_text)
+        drawableslst.append(trail_lines)
+        drawableslst.extend(label_pool.update([labels[idx] for idx in lastpoints],
+                                              positions[lastpoints, 0], positions[lastpoints, 1]))
+        if args.debug:
+            print (frame, time.strftime("%F %H:%M:%S", time.localtime(first_time + (frame * args.sec_per_frame))), len(lastpoints))
+        return tuple(drawableslst)
 
 
-animation = FuncAnimation(fig, update, init_func=init, frames=time_slc_idx, interval=40, repeat=False, blit=True)
+    animation = FuncAnimation(fig, update, init_func=init, frames=num_frames, interval=40, repeat=False, blit=True)
+
+    if args.outfile and args.jobs > 1:
+        pm.saveMovie(fig, update, num_frames, args.outfile, init=init, fps=args.fps,
+                     codec=args.codec, jobs=args.jobs, debug=args.debug)
+    elif args.outfile:
+        animation.save(args.outfile, fps=args.fps, codec=args.codec)
+    else:
+        plt.show()
+
 
-if args.outfile:
-    animation.save(args.outfile, fps=args.fps, codec=args.codec)
-else:
-    plt.show()
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -5,9 +5,10 @@ import time
 import argparse
 import PlaneReport as pr
 import matplotlib as mpl
+import PlaneProfile as pp
 
 parser = argparse.ArgumentParser(
-    description="Plot various attributes of plane reports")
+    description="Plot various attributes of plane reports, from a file or the DB")
 
 parser.add_argument('--debug', action="store_true",
                     dest='debug', default=False, help="Turn on debug mode")
@@ -30,66 +31,80 @@ parser.add_argument('--lon', dest='longitude',
                     help="Longitude of point to calculate distance from.",
                     type=float)
 
-args = parser.parse_args()
+pr.addDBQueryArgs(parser)
 
+pp.addProfileArgs(parser)
 
-if args.outfile:
-    mpl.use('Agg')
-#
-# Importing here, as they set the matplotlib backend to X if Agg call hasn't been made.
-#
-import matplotlib.pyplot as plt
 
+def main(argv=None):
+    """Plots attributes of reports, from a file or the DB"""
+    args = parser.parse_args(argv)
+
+    if args.outfile:
+        mpl.use('Agg')
+    #
+    # Importing here, as they set the matplotlib backend to X if Agg call hasn't been made.
+    #
+    import matplotlib.pyplot as plt
+
+
+    if not args.datafile and not args.db_conf:
+        print("Need a data filename, or a DB to query")
+        exit(1)
+
+    attrs = args.attrs.split(',')
+    for i in attrs:
+        if i != 'distance' and i not in pr.BATCH_COLS:
+            print("Unknown attribute", i)
+            exit(1)
+
+    batches, db_reporter = pr.readReportSource(args)
 
-if not args.datafile:
-    print("Need a data filename")
-    exit(1)
+    if db_reporter and not args.latitude and not args.longitude:
+        args.latitude, args.longitude = db_reporter.lat, db_reporter.lon
 
-xx, yy  = [], []
+    if 'distance' in attrs and (not args.latitude or not args.longitude):
+        print("Need location(lat, lon) to calculate distance")
+        exit(1)
 
-attrs = args.attrs.split(',')
-zz={}
-for i in attrs:
-    zz[i] = []
+    reports = pr.ReportBatch.concatenate(list(batches))
+    if not len(reports):
+        print("No plane reports found")
+        exit(1)
 
-if 'distance' in attrs and (not args.latitude or not args.longitude):
-    print("Need location(lat, lon) to calculate distance")
-    exit(1)
+    time_start = reports.time[0]
+    xx = reports.time - time_start
+    zz = {}
+    for i in attrs:
+        if i == 'distance':
+            zz[i] = reports.distances(args.longitude, args.latitude) / 1000.0
+        else:
+            zz[i] = getattr(reports, i)
+    time_end = xx[-1] + time_start
 
-inputfile = pr.openFile(args.datafile)
-data = pr.readFromFile(inputfile)
-time_start = data[0].time
-while data:
-    for plane in data:
-        xx.append(plane.time - time_start)
-        for i in attrs:
-            if i == 'distance':
-                zz[i].append(pr.haversine(plane.lon, plane.lat, args.longitude, args.latitude) / 1000.0)
-            else:
-                zz[i].append(getattr(plane, i))
+    start_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_start))
+    end_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_end))
+    print(start_time_str, " ", time_start, " ", end_time_str, " ", time_end)
 
-    data = pr.readFromFile(inputfile)
-time_end = xx[-1] + time_start
+    pltndx = 1
+    fig = plt.figure(figsize=(10,10))
+    if not args.title:
+        args.title = start_time_str + " to " + end_time_str
 
-start_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_start))
-end_time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_end))
-print(start_time_str, " ", time_start, " ", end_time_str, " ", time_end)
+    fig.suptitle(args.title, fontsize=14, fontweight='bold')
 
-pltndx = 1
-fig = plt.figure(figsize=(10,10))
-if not args.title:
-    args.title = start_time_str + " to " + end_time_str
+    for i in attrs:
+        ax = fig.add_subplot(len(attrs), 1, pltndx)
+        ax.plot(xx,zz[i], ',')
+        ax.set_title(i)
+        pltndx += 1
 
-fig.suptitle(args.title, fontsize=14, fontweight='bold')
 
-for i in attrs:
-    ax = fig.add_subplot(len(attrs), 1, pltndx)
-    ax.plot(xx,zz[i], ',')
-    ax.set_title(i)
-    pltndx += 1
+    if args.outfile:
+        plt.savefig(args.outfile)
+    else:
+        plt.show()
 
 
-if args.outfile:
-    plt.savefig(args.outfile)
-else:
-    plt.show()
+if __name__ == "__main__":
+    pp.runMain(main)
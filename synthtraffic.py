@@ -0,0 +1,229 @@
+#! /usr/bin/env python3
+#
+# Generate synthetic plane reports for load testing
+#
+"""
+Generates synthetic traffic - aircraft taking off from, landing at and flying
+between the runways of a set of airports, and across the area around them - as
+heard by a number of receivers, with drop-outs, duplicates and corrupted
+positions. The same arguments always give the same reports.
+
+Output is PlaneReport JSON lines, dump1090 aircraft.json (or data.json) snapshots,
+VRS AircraftList.json files with short trails, or a bulk load into the DB.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import PlaneReport as pr
+import PlaneEvents as pe
+import PlaneSynth as ps
+import PlaneProfile as pp
+
+
+def readReporterFile(filename):
+    """Reads a receiver's name and location from a .reporter file, as loadreporter.py loads"""
+    with open(filename, 'r') as inputfile:
+        name = inputfile.readline().strip('\n')
+        inputfile.readline()
+        lat, lon = [float(coord) for coord in inputfile.readline().split(",")]
+    return name, lat, lon
+
+
+def writeJSON(pathname, doc):
+    """Writes a document, via a temporary file, so a reader never sees half of one"""
+    with open(pathname + ".tmp", "w") as out:
+        json.dump(doc, out, separators=(',', ':'))
+    os.replace(pathname + ".tmp", pathname)
+
+
+parser = argparse.ArgumentParser(
+    description="Generate synthetic plane reports, for load testing")
+parser.add_argument('-y', '--db-conf-file', dest='db_conf',
+                    help="A yaml file containing the DB connection parameters")
+parser.add_argument('--debug', action="store_true",
+                    dest='debug', default=False, help="Turn on debug mode")
+parser.add_argument('-A', '--airport', dest='airport',
+                    help="The ICAO code(s) of the airport(s) aircraft fly to and from, separated by commas")
+parser.add_argument('--within', dest='within', type=float,
+                    help="Use every airport within this many km of --lat/--lon, rather than the -A airport(s)")
+parser.add_argument('--apt-file', dest='aptfile',
+                    help="Read airports and runways from an apt.dat file, rather than the DB")
+parser.add_argument('--lat', dest='lat', type=float,
+                    help="Latitude of the centre of the area (defaults to the middle of the airports)")
+parser.add_argument('--lon', dest='lon', type=float,
+                    help="Longitude of the centre of the area (defaults to the middle of the airports)")
+parser.add_argument('--radius', dest='radius', type=float, default=250,
+                    help="Radius of the area, in km, aircraft come in and go out at its edge (default 250)")
+parser.add_argument('-R', '--reporter-file', dest='reporterFiles', action='append',
+                    help="A .reporter file of a receiver hearing the traffic (may be given more than once)")
+parser.add_argument('--receivers', dest='receivers', type=int, default=0,
+                    help="Number of receivers to scatter around the area, named SYN01 onwards \
+                    (default 1 if no reporter files are given)")
+parser.add_argument('--range', dest='range', type=float, default=250,
+                    help="Best range of each receiver, in km (default 250)")
+parser.add_argument('--loss', dest='loss', type=float, default=0.02,
+                    help="Chance of a receiver missing a report close by, rising to 1 at the edge of its range (default 0.02)")
+parser.add_argument('--outage', dest='outage', type=float, default=0.01,
+                    help="Chance of a receiver being down for each %d seconds (default 0.01)" % ps.OUTAGE_PERIOD)
+parser.add_argument('--duplicates', dest='duplicates', type=float, default=0.05,
+                    help="Chance of a report repeating the position of the one before (default 0.05)")
+parser.add_argument('--corrupt', dest='corrupt', type=float, default=0.001,
+                    help="Chance of a report's position being corrupted (default 0.001)")
+parser.add_argument('-n', '--aircraft', dest='aircraft', type=int, default=100,
+                    help="Number of aircraft (default 100)")
+parser.add_argument('-t', '--start-time', dest='start_time',
+                    help="Time of the first report, YYYY-MM-DD hh:mm:ss (default 00:00:00 today)")
+parser.add_argument('-d', '--duration', dest='duration', type=int, default=3600,
+                    help="Seconds of traffic to generate (default 3600)")
+parser.add_argument('-i', '--interval', dest='interval', type=int, default=1,
+                    help="Seconds between each receiver's reports of an aircraft (default 1)")
+parser.add_argument('-s', '--seed', dest='seed', type=int, default=1,
+                    help="Seed for the random choices (default 1)")
+parser.add_argument('--ground-flag', action="store_true", dest='groundFlag', default=False,
+                    help="Flag reports on a runway as on the ground")
+parser.add_argument('-F', '--format', dest='format', default="lines",
+                    choices=["lines", "aircraft", "piaware", "data", "vrs"],
+                    help="Output PlaneReport JSON lines, dump1090 aircraft.json (mutability or piaware 3.6 keys) \
+                    or data.json snapshots, or VRS AircraftList.json files with short trails (default lines)")
+parser.add_argument('-o', '--output', dest='output',
+                    help="File for JSON lines (default stdout), or the directory snapshots and VRS files \
+                    go in, a sub-directory per receiver")
+parser.add_argument('--snapshot-interval', dest='snapshotInterval', type=int, default=1,
+                    help="Seconds between aircraft.json snapshots (default 1)")
+parser.add_argument('--chunk', dest='chunk', type=int, default=600,
+                    help="Seconds of traffic worked out at a time (default 600)")
+parser.add_argument('-l', '--log-to-db', action="store_true", dest='logToDB', default=False,
+                    help="Bulk load the reports into the DB, rather than writing them out")
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Generates synthetic reports, writing them out or loading them into the DB"""
+    args = parser.parse_args(argv)
+
+    if args.logToDB and not args.db_conf:
+        print("A valid URL db configuration file is needed!")
+        exit(1)
+
+    if (args.airport or args.within) and not (args.aptfile or args.db_conf):
+        print("Need an apt.dat file, or a DB, to read runways from")
+        exit(1)
+
+    if args.within and (args.lat is None or args.lon is None):
+        print("Need --lat/--lon to find airports with --within")
+        exit(1)
+
+    if args.format != "lines" and not args.output and not args.logToDB:
+        print("Need an output directory for", args.format, "files")
+        exit(1)
+
+    dbconn = pr.connDB(args.db_conf) if args.db_conf else None
+
+    airports, runways = [], []
+    if args.airport or args.within:
+        codes = pe.airportCodes(args.airport, within=args.within, lon=args.lon, lat=args.lat,
+                                dbconn=dbconn, aptFile=args.aptfile, debug=args.debug)
+        runway_set = pe.loadRunwaySet(codes, dbconn=dbconn, aptFile=args.aptfile, printQuery=args.debug)
+        airports = list(runway_set.airports.values())
+        runways = runway_set.tester.runways
+        if not airports:
+            print("No airports with runways found")
+            exit(1)
+
+    centre = (args.lat, args.lon) if args.lat is not None and args.lon is not None else None
+    places = [readReporterFile(filename) for filename in args.reporterFiles or []]
+    if args.receivers or not places:
+        if centre is None and not airports:
+            centre = (places[0][1], places[0][2]) if places else None
+        if centre is None and not airports:
+            print("Need --lat/--lon, airports or reporter files to place receivers around")
+            exit(1)
+        if centre is None:
+            centre = (float(np.mean([a.lat for a in airports])), float(np.mean([a.lon for a in airports])))
+        #
+        # Scattered within half the area, the same way every time
+        #
+        rng = np.random.default_rng(args.seed)
+        num = args.receivers or 1
+        bearing = rng.uniform(0, 2 * np.pi, num)
+        dist = args.radius * 1000.0 * 0.5 * np.sqrt(rng.random(num))
+        lats = centre[0] + np.degrees(dist * np.cos(bearing) / ps.EARTH_RADIUS)
+        lons = centre[1] + np.degrees(dist * np.sin(bearing) / (ps.EARTH_RADIUS * np.cos(np.radians(centre[0]))))
+        places.extend(("SYN%02d" % (i + 1), float(lats[i]), float(lons[i])) for i in range(num))
+    receivers = [ps.makeReceiver(name, lat, lon, range=args.range * 1000.0, loss=args.loss, outage=args.outage,
+                                 duplicate=args.duplicates, corrupt=args.corrupt) for name, lat, lon in places]
+
+    if not args.start_time:
+        args.start_time = time.strftime("%F") + " 00:00:00"
+    start_time = int(time.mktime(time.strptime(args.start_time, "%Y-%m-%d %H:%M:%S")))
+
+    t1 = time.time()
+    generator = ps.TrafficGenerator(receivers, airports=airports, runways=runways, numAircraft=args.aircraft,
+                                    startTime=start_time, duration=args.duration, centre=centre,
+                                    radius=args.radius * 1000.0, interval=args.interval, seed=args.seed,
+                                    groundFlag=args.groundFlag)
+    if args.debug:
+        print("Planned", len(generator.flights), "flights of", args.aircraft, "aircraft heard by",
+              len(receivers), "receivers in", time.time() - t1, "seconds", file=sys.stderr)
+
+    if args.output and args.format != "lines":
+        for receiver in receivers:
+            os.makedirs(os.path.join(args.output, receiver.name), exist_ok=True)
+    out = None
+    if args.format == "lines" and not args.logToDB:
+        out = open(args.output, "w") if args.output else sys.stdout
+
+    num_reports = 0
+    for batch in generator.batches(args.chunk):
+        num_reports += len(batch)
+        if args.logToDB:
+            batch.copyToDB(dbconn, printQuery=args.debug)
+            dbconn.commit()
+        elif out:
+            out.writelines(line + "\n" for line in batch.toJSONLines())
+        else:
+            for receiver in receivers:
+                heard = batch[batch.reporter == receiver.name]
+                directory = os.path.join(args.output, receiver.name)
+                if args.format == "vrs":
+                    #
+                    # A file a minute, named as in the daily archives
+                    #
+                    minutes = (heard.time // 60).astype(np.int64)
+                    for minute in np.unique(minutes):
+                        writeJSON(os.path.join(directory, time.strftime("%Y-%m-%d-%H%MZ.json", time.gmtime(minute * 60))),
+                                  ps.vrsDocument(heard[minutes == minute]))
+                    continue
+                #
+                # A snapshot holds each aircraft's latest report up to its time
+                #
+                ticks = (heard.time // args.snapshotInterval).astype(np.int64)
+                bounds = np.searchsorted(ticks, np.unique(ticks), side="right")
+                for end in bounds:
+                    now = float(ticks[end - 1] * args.snapshotInterval)
+                    begin = np.searchsorted(heard.time, now - 60, side="right")
+                    recent = np.arange(end - 1, begin - 1, -1)
+                    hexes, latest = np.unique(heard.hex[recent].astype(str), return_index=True)
+                    snapshot = heard[recent[latest]]
+                    if args.format == "data":
+                        doc = ps.dataDocument(snapshot)
+                        name = "data-%d.json" % now
+                    else:
+                        doc = ps.aircraftDocument(snapshot, now, variant=args.format)
+                        name = "aircraft-%d.json" % now
+                    writeJSON(os.path.join(directory, name), doc)
+    if out and out is not sys.stdout:
+        out.close()
+
+    if args.debug:
+        elapsed = time.time() - t1
+        print("Generated", num_reports, "reports in", elapsed, "seconds,", num_reports / max(elapsed, 1e-9),
+              "reports/second", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -0,0 +1,72 @@
+#
+# Tests for the caching of airport indexes, which each source of airports gets its own of.
+#
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneAirports as pa
+
+APT_DAT = """I
+1000 Version
+
+1  1886 0 0 YSCB Canberra
+100 45.00 1 0 0.25 1 3 0 17 -35.29606 149.17798 0 0 3 0 0 0 35 -35.31815 149.20236 0 0 3 0 0 0
+"""
+
+
+class FakeDB(object):
+
+    def __init__(self, host, dbname):
+        self.params = {"host": host, "port": "5432", "dbname": dbname, "user": "planes"}
+
+    def get_dsn_parameters(self):
+        return self.params
+
+
+class AirportCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+        self.cacheFile = os.path.join(self.tmpdir, "airports.npz")
+
+    def writeAptFile(self, directory, icao):
+        os.makedirs(os.path.join(self.tmpdir, directory))
+        pathname = os.path.join(self.tmpdir, directory, "apt.dat")
+        with open(pathname, "w") as fp:
+            fp.write(APT_DAT.replace("YSCB", icao))
+        os.utime(pathname, (1500000000, 1500000000))
+        return pathname
+
+    def test_apt_files_cached_by_path(self):
+        first = self.writeAptFile("one", "YSCB")
+        second = self.writeAptFile("two", "YSSY")
+        self.assertNotEqual(pa.airportCacheFile(self.cacheFile, aptFile=first),
+                            pa.airportCacheFile(self.cacheFile, aptFile=second))
+        self.assertIsNotNone(pa.loadAirportIndex(aptFile=first, cacheFile=self.cacheFile).lookup("YSCB"))
+        self.assertIsNotNone(pa.loadAirportIndex(aptFile=second, cacheFile=self.cacheFile).lookup("YSSY"))
+
+    def test_dbs_cached_apart(self):
+        names = [pa.airportCacheFile(self.cacheFile, dbconn=FakeDB(host, dbname))
+                 for host, dbname in (("db1", "planes"), ("db2", "planes"), ("db1", "test"))]
+        self.assertEqual(len(set(names)), 3)
+        self.assertEqual(names[0], pa.airportCacheFile(self.cacheFile, dbconn=FakeDB("db1", "planes")))
+
+    def test_db_index_read_from_its_own_cache(self):
+        apt = self.writeAptFile("one", "YSCB")
+        index = pa.loadAirportIndex(aptFile=apt, cacheFile=None)
+        with mock.patch.object(pa.AirportIndex, "fromDB", return_value=index) as fromDB:
+            pa.loadAirportIndex(dbconn=FakeDB("db1", "planes"), cacheFile=self.cacheFile)
+            pa.loadAirportIndex(dbconn=FakeDB("db1", "planes"), cacheFile=self.cacheFile)
+            self.assertEqual(fromDB.call_count, 1)
+            pa.loadAirportIndex(dbconn=FakeDB("db2", "planes"), cacheFile=self.cacheFile)
+            self.assertEqual(fromDB.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#
+# Tests for PlaneReport.DBPool, against psycopg2's own pool with psycopg2.connect
+# replaced by fake connections, so no DB is needed.
+#
+import os
+import sys
+import argparse
+import tempfile
+import unittest
+from unittest import mock
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneReport as pr
+
+DB_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dbconfig.yaml")
+
+
+class FakeConnection(object):
+    """Just enough of a psycopg2 connection for the pools"""
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.info = mock.Mock(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        cur = mock.Mock()
+        if self.broken:
+            cur.execute.side_effect = psycopg2.OperationalError("server closed the connection")
+        return cur
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class DBPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.made = []
+        patcher = mock.patch("psycopg2.connect", side_effect=self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self, *args, **kwargs):
+        dbconn = FakeConnection()
+        self.made.append(dbconn)
+        return dbconn
+
+    def test_round_trip(self):
+        pool = pr.DBPool(DB_CONF, minconn=1, maxconn=4)
+        self.assertEqual(len(self.made), 1)
+        dbconn = pool.getconn()
+        self.assertIs(dbconn, self.made[0])
+        pool.putconn(dbconn)
+        self.assertIs(pool.getconn(), dbconn)
+        pool.putconn(dbconn)
+        self.assertFalse(dbconn.closed)
+        self.assertEqual(pool.stats["checkouts"], 2)
+
+    def test_only_new_connections_count_as_connects(self):
+        pool = pr.DBPool(DB_CONF, minconn=1, maxconn=4)
+        for i in range(5):
+            with pool.connection():
+                pass
+        self.assertEqual(pool.stats["connects"], 1)
+        first = pool.getconn()
+        second = pool.getconn()
+        self.assertEqual(pool.stats["connects"], 2)
+        pool.putconn(first)
+        pool.putconn(second)
+        self.assertEqual(len(self.made), 2)
+
+    def test_closed_connections_are_forgotten(self):
+        pool = pr.DBPool(DB_CONF, minconn=1, maxconn=4)
+        dbconn = pool.getconn()
+        pool.putconn(dbconn, close=True)
+        self.assertTrue(dbconn.closed)
+        self.assertNotIn(id(dbconn), pool._lastused)
+        self.assertIsNot(pool.getconn(), dbconn)
+
+    def test_failed_health_check_replaces_connection(self):
+        pool = pr.DBPool(DB_CONF, minconn=1, maxconn=4, healthCheckInterval=0)
+        dbconn = pool.getconn()
+        pool.putconn(dbconn)
+        dbconn.broken = True
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, dbconn)
+        self.assertTrue(dbconn.closed)
+        self.assertNotIn(id(dbconn), pool._lastused)
+        self.assertEqual(pool.stats["health_failures"], 1)
+        pool.putconn(replacement)
+
+    def test_waits_for_a_free_connection(self):
+        pool = pr.DBPool(DB_CONF, minconn=0, maxconn=2)
+        held = [pool.getconn(), pool.getconn()]
+        self.assertFalse(pool._available.acquire(blocking=False))
+        for dbconn in held:
+            pool.putconn(dbconn)
+        self.assertEqual(len(self.made), 2)
+
+    def test_pool_size_from_yaml(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as fp:
+            fp.write("adsb_logger:\n  dbhost: planedb\n  dbuser: planes\n  dbpassword: pw\n  pool_size: 7\n")
+        self.addCleanup(os.unlink, fp.name)
+        self.assertEqual(pr.DBPool(fp.name, minconn=0).maxconn, 7)
+        self.assertEqual(pr.DBPool(DB_CONF, minconn=0).maxconn, pr.DB_POOL_SIZE)
+        pool = pr.DBPool(None, minconn=0, dbuser="planes", dbhost="planedb", dbpasswd="pw")
+        self.assertEqual(pool.maxconn, pr.DB_POOL_SIZE)
+        self.assertNotIn("pool_size", pool.params)
+
+    def test_forked_worker_gets_own_pool(self):
+        with mock.patch.dict(pr.db_pools, clear=True):
+            pool = pr.getDBPool(DB_CONF, minconn=0)
+            self.assertIs(pr.getDBPool(DB_CONF), pool)
+            with mock.patch("os.getpid", return_value=pool.pid + 1):
+                self.assertIsNot(pr.getDBPool(DB_CONF), pool)
+
+    def test_report_source_returns_connection(self):
+        args = argparse.Namespace(db_conf=DB_CONF, reporter=None, start_time="2020-01-01 00:00:00",
+                                  end_time=None, hexcodes=None, flights=None, minDistance=None,
+                                  maxDistance=None, minAltitude=None, maxAltitude=None, minSpeed=None,
+                                  maxSpeed=None, minRssi=None, maxRssi=None, minNucp=None, maxNucp=None,
+                                  debug=False)
+        def query(dbconn, **kwargs):
+            cur = mock.Mock()
+            cur.fetchmany.side_effect = [[{"hex": "7c6d2a", "time": 1577836800, "isMetric": True}], []]
+            return cur
+        with mock.patch.dict(pr.db_pools, clear=True), mock.patch.object(pr, "queryReportsDB", side_effect=query):
+            for i in range(2):
+                batches, reporter = pr.readReportSource(args)
+                self.assertEqual(sum(len(batch) for batch in batches), 1)
+            pool = pr.getDBPool(DB_CONF)
+            self.assertTrue(pool._available.acquire(blocking=False))
+            pool._available.release()
+            self.assertEqual(pool.stats["connects"], 1)
+            self.assertEqual(pool.stats["checkouts"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#
+# Tests for decompressing reports files, made up of one or several compressed members.
+#
+import os
+import re
+import sys
+import bz2
+import gzip
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneReport as pr
+
+CHUNK_SIZE = 1 << 14
+
+
+def reportLines(count, seed):
+    rand = random.Random(seed)
+    return "".join('{"hex":"%06x","time":%d,"altitude":%d}\n' % (rand.randrange(1 << 24), i, rand.randrange(40000))
+                   for i in range(count)).encode()
+
+
+class DecompressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parts = [reportLines(20000, 1), reportLines(500, 2), reportLines(30000, 3)]
+        self.text = b"".join(self.parts)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+
+    def writeFile(self, name, data):
+        pathname = os.path.join(self.tmpdir, name)
+        with open(pathname, "wb") as fp:
+            fp.write(data)
+        return pathname
+
+    def checkChunks(self, chunks):
+        chunks = list(chunks)
+        self.assertTrue(all(len(chunk) <= CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(b"".join(chunks), self.text)
+
+    def test_multiple_members(self):
+        gz = b"".join(gzip.compress(part) for part in self.parts[:2]) + b"\0" * 100 + gzip.compress(self.parts[2])
+        bz = b"".join(bz2.compress(part) for part in self.parts)
+        for kind, data in (("gzip", gz), ("bzip2", bz)):
+            self.assertTrue(pr.isMultiMember(data, kind))
+            self.checkChunks(pr.parallelDecompress(data, kind, 3, chunkSize=CHUNK_SIZE))
+            pathname = self.writeFile("reports." + kind, data)
+            with open(pathname, "rb") as fp:
+                self.checkChunks(pr.streamDecompress(fp, kind, chunkSize=CHUNK_SIZE))
+            with pr.openFile(pathname, workers=3) as fp:
+                self.assertEqual(fp.read().encode("latin-1"), self.text)
+
+    def test_single_member_is_streamed(self):
+        pathname = self.writeFile("reports.gz", gzip.compress(self.text))
+        with mock.patch.object(pr, "parallelDecompress") as parallel:
+            with pr.openFile(pathname, workers=4) as fp:
+                self.assertEqual(fp.read().encode("latin-1"), self.text)
+        parallel.assert_not_called()
+
+    def test_false_starts(self):
+        data = gzip.compress(self.text)
+        with mock.patch.dict(pr.MEMBER_PATTERNS, {"gzip": re.compile(b"\x1f|\x8b")}):
+            self.assertFalse(pr.isMultiMember(data, "gzip"))
+            self.checkChunks(pr.parallelDecompress(data, "gzip", 4, chunkSize=CHUNK_SIZE))
+
+    def test_truncated(self):
+        data = b"".join(gzip.compress(part) for part in self.parts)
+        with self.assertRaises(EOFError):
+            list(pr.parallelDecompress(data[:-50], "gzip", 2))
+
+    def test_zstd_without_zstandard(self):
+        pathname = self.writeFile("reports.zst", b"\x28\xb5\x2f\xfd" + b"\0" * 16)
+        with mock.patch.object(pr, "zstandard", None), mock.patch("builtins.print"):
+            with self.assertRaises(SystemExit):
+                pr.openFile(pathname, workers=1)
+
+    def test_producer_exit_reaches_reader(self):
+        def chunks():
+            yield b"{}\n"
+            exit(-1)
+        with self.assertRaises(SystemExit):
+            pr.DecompressedStream(chunks()).read()
+
+
+if __name__ == "__main__":
+    unittest.main()
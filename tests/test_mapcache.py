@@ -0,0 +1,48 @@
+#
+# Tests for the on-disk cache of map backgrounds.
+#
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneMap as pmap
+
+PARAMS = {"width": 1000.0, "height": 1000.0}
+
+
+class MapCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.cache = pmap.MapCache(cacheDir=tmpdir.name)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.load("background", PARAMS))
+        self.cache.store("background", PARAMS, image=np.arange(12).reshape(3, 4))
+        entry = self.cache.load("background", PARAMS)
+        self.assertTrue((entry["image"] == np.arange(12).reshape(3, 4)).all())
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_truncated_entry_is_a_miss(self):
+        self.cache.store("background", PARAMS, image=np.zeros((50, 50)))
+        pathname = self.cache.pathname("background", PARAMS)
+        with open(pathname, "r+b") as fp:
+            fp.truncate(os.path.getsize(pathname) // 2)
+        self.assertIsNone(self.cache.load("background", PARAMS))
+        self.assertFalse(os.path.exists(pathname))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_entry_evicted_while_loading(self):
+        self.cache.store("background", PARAMS, image=np.zeros(4))
+        with mock.patch("os.utime", side_effect=FileNotFoundError):
+            self.assertIsNotNone(self.cache.load("background", PARAMS))
+
+
+if __name__ == "__main__":
+    unittest.main()
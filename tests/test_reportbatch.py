@@ -0,0 +1,44 @@
+#
+# Tests for writing ReportBatches out as to_JSON lines.
+#
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import PlaneReport as pr
+
+RECORDS = [
+    {"hex": "7c6d2a", "time": 1452299456.0, "track": 80.0, "vert_rate": 0.0, "lat": -35.3, "lon": 149.1,
+     "altitude": 3000, "speed": 400, "isMetric": True},
+    {"hex": "7c6d2b", "time": 1452299457.25, "track": 80.5, "vert_rate": -64, "altitude": 10000, "speed": 250,
+     "flight": "QFA123  ", "rssi": -20.5},
+]
+
+
+class ToJSONLinesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = pr.ReportBatch.fromDicts(RECORDS)
+        self.lines = self.batch.toJSONLines()
+
+    def test_whole_numbers_written_as_ints(self):
+        self.assertIn('"time":1452299456,', self.lines[0])
+        self.assertIn('"track":80,', self.lines[0])
+        self.assertIn('"vert_rate":0}', self.lines[0])
+        self.assertIn('"track":80.5,', self.lines[1])
+
+    def test_sub_second_times_kept(self):
+        self.assertIn('"time":1452299457.25,', self.lines[1])
+
+    def test_same_as_read_back(self):
+        planes = pr.readFromFile(io.StringIO("\n".join(self.lines) + "\n"))
+        self.assertEqual([plane.to_JSON() for plane in planes], self.lines)
+
+    def test_same_as_planes(self):
+        self.assertEqual([plane.to_JSON() for plane in self.batch.planes()], self.lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
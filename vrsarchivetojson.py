@@ -1,25 +1,146 @@
 #! /usr/bin/env python3
 #
+# Convert the adsbexchange daily VRS archives to our JSON format, or load them straight into the DB.
 #
+"""
+Reads VRS archive files (plain, compressed, or members of the daily .zip archive)
+across a pool of worker processes, and writes the position reports out in time order,
+either as JSON lines or bulk loaded into the database.
+"""
+import os
+import io
 import time
+import zipfile
 import argparse
+import multiprocessing
+import numpy as np
 import PlaneReport as pr
+import PlaneProfile as pp
+
+#
+# Each worker process keeps its zip archives open between files
+#
+open_archives = {}
+
+
+def listSources(filenames):
+    """
+    Expand the command line arguments into a list of (filename, zip member) pairs,
+    in name order. The member is None for ordinary files.
+    """
+    sources = []
+    for fn in filenames:
+        if zipfile.is_zipfile(fn):
+            with zipfile.ZipFile(fn) as archive:
+                members = sorted(name for name in archive.namelist() if not name.endswith('/'))
+            sources.extend((fn, member) for member in members)
+        else:
+            sources.append((fn, None))
+    return sources
+
+
+def openSource(source):
+    """Returns a text file handle for a (filename, zip member) pair"""
+    fn, member = source
+    if member is None:
+        return pr.openFile(fn, workers=1)
+    if fn not in open_archives:
+        open_archives[fn] = zipfile.ZipFile(fn)
+    return io.TextIOWrapper(open_archives[fn].open(member), encoding='latin-1')
+
+
+def convertSource(source):
+    """
+    Worker function - reads one VRS archive file.
+
+    Returns:
+        (source, ReportBatch sorted by time)
+    """
+    fh = openSource(source)
+    try:
+        batch = pr.readVRSBatchFromFile(fh)
+    finally:
+        fh.close()
+    return source, batch.sortByTime()
+
+
+def writeBatch(batch, dbconn, reporter, debug):
+    if not len(batch):
+        return
+    if reporter is not None:
+        batch.reporter[:] = reporter
+    if dbconn:
+        batch.copyToDB(dbconn, printQuery=debug)
+    else:
+        print("\n".join(batch.toJSONLines()))
 
 
 parser = argparse.ArgumentParser(
-    description="Read a bunch of VRS archive files (from unzipped daily archive) and convert them to our JSON format")
+    description="Read a bunch of VRS archive files (from unzipped daily archive, or the .zip itself) and convert them to our JSON format")
 parser.add_argument('filenames', metavar='N', nargs='+',
-                    help="A list of filenames to be opened")
+                    help="A list of filenames (or .zip archives) to be opened")
+parser.add_argument('--debug', action="store_true",
+                    dest='debug', default=False, help="Turn on debug mode")
+parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count(),
+                    help="Number of worker processes (defaults to the number of CPUs)")
+parser.add_argument('-y', '--db-conf-file', dest='db_conf',
+                    help="A yaml file containing the DB connection parameters - if given, reports are loaded into the DB rather than printed")
+parser.add_argument('-r', '--reporter', dest='reporter', default=None,
+                    help="Name to record as the reporter of the reports")
+parser.add_argument('-w', '--sort-window', dest='sortWindow', type=float, default=600.0,
+                    help="Seconds that reports are held back to be sorted against later files (default 600)")
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Converts VRS archive files to PlaneReport JSON lines, or loads them into the DB"""
+    args = parser.parse_args(argv)
+
+    if not args.filenames:
+        print("One or more files are needed!")
+        exit(-1)
+
+    dbconn = None
+    if args.db_conf:
+        dbconn = pr.connDB(args.db_conf)
+
+    sources = listSources(args.filenames)
+    if args.jobs > 1 and len(sources) > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap(convertSource, sources, chunksize=1)
+    else:
+        pool = None
+        results = map(convertSource, sources)
+
+    #
+    # Files are processed in name (and so time) order, but the trails in each can
+    # go back in time. Reports are held back until they're older than the sort
+    # window before the earliest report in the latest file.
+    #
+    pending = pr.ReportBatch.fromDicts([])
+    num_reports = 0
+    t1 = time.time()
+    for source, batch in results:
+        if args.debug:
+            print("Read", len(batch), "reports from", source)
+        pending = pr.ReportBatch.concatenate([pending, batch]).sortByTime()
+        if len(batch):
+            cutoff = np.searchsorted(pending.time, batch.time[0] - args.sortWindow)
+            writeBatch(pending[:cutoff], dbconn, args.reporter, args.debug)
+            num_reports += cutoff
+            pending = pending[cutoff:]
+    writeBatch(pending, dbconn, args.reporter, args.debug)
+    num_reports += len(pending)
 
-args = parser.parse_args()
+    if pool:
+        pool.close()
+        pool.join()
+    if dbconn:
+        dbconn.commit()
+    if args.debug:
+        print("Converted", num_reports, "reports from", len(sources), "files in", time.time() - t1, "seconds")
 
-if not args.filenames:
-    print("One or more files are needed!")
-    exit(-1)
 
-for fn in args.filenames:
-    fh = pr.openFile(fn)
-    pos_reports = pr.readVRSFromFile(fh)
-    for pl in pos_reports:
-        print(pl.to_JSON())
-    fh.close()
+if __name__ == "__main__":
+    pp.runMain(main)
@@ -10,6 +10,7 @@ from datetime import date, timedelta
 import time
 import json
 import requests
+import PlaneProfile as pp
 
 
 
@@ -51,91 +52,101 @@ parser.add_argument('--reporter', dest='reporter',
                     help="Name that record has as reporter (default adsbexchg)", default='adsbexchg')
 parser.add_argument('-u', '--url', dest='vrs_url', default="http://public-api.adsbexchange.com/VirtualRadar/AircraftList.json",
                     help="A URL presented by a machine running VRS, e.g. http://somebox/VirtualRadar/AircraftList.json")
-args = parser.parse_args()
-
-if (args.lat and not args.lon) or (args.lon and not args.lat):
-    print("Need both lon and lat arguments!")
-    exit(1)
-    
-myparams = {'fDstL': args.minDistance,  'fDstU': args.maxDistance, 'lat': -35.343135, 'lng': 149.141059}
-#urlstr = args.vrs_url + "?lat=-35.343135&trFmt=fs&trFmt=fa&lng=149.141059&fDstL=0&fDstU=100"
-
-urlstr = args.vrs_url
-
-response = requests.get(urlstr, params=myparams)
-data = json.loads(response.text)
-cur_time = time.time()
-for i in data['acList']:
-    try:
-        mytime = i['PosTime'] / 1000
-    except KeyError:
-        continue
-    try:
-        hex = i['Icao'].lower()
-    except KeyError:
-        continue
-    try:
-        altitude = i['Alt']
-    except KeyError:
-        continue
-    try:
-        speed = i['Spd']
-    except KeyError:
-        continue
-    try:
-        squawk = i['Sqk']
-    except KeyError:
-        continue
-    if 'Call' in i:
-        flight = i['Call']
-    else:
-        flight = '          '
-    try:
-        track = i['Trak']
-    except KeyError:
-        continue
-    try:
-        lon = i['Long']
-    except KeyError:
-        continue
-    try:
-        lat = i['Lat']
-    except KeyError:
-        continue
-
-    try:
-        isGnd = i['Gnd']
-    except KeyError:
-        continue
-    
-    validposition = 1
-    validtrack = 1
-    reporter  = args.reporter
-    try:
-        messages = i['CMsgs']
-    except KeyError:
-        continue
-    if 'Mlat' in i:
-        mlat = i['Mlat']
-    else:
-        mlat = False
-    if 'Vsi' in i:
-        vert_rate = i['Vsi']
-    else:
-        vert_rate = 0.0
-    isMetric = False
-    seen = seen_pos = (cur_time - mytime)
-    if args.debug:
-        print ("cur_time:", cur_time, " mytime:", mytime, " seen:", seen)
-
-
-    if seen < args.boredom_threshold:
-        planerep = pr.PlaneReport(hex=hex, time=mytime, speed=speed, squawk=squawk, flight=flight, altitude=altitude,
-                                  track=track, lon=lon, lat=lat, vert_rate=vert_rate, seen=seen,
-                                  validposition=validposition, validtrack=validtrack, reporter=reporter,
-                                  report_location=None, messages=messages, seen_pos=seen_pos, category=None)
-        print(planerep.to_JSON())
+
+pp.addProfileArgs(parser)
+
+
+def main(argv=None):
+    """Polls a VRS server for reports, and prints them"""
+    args = parser.parse_args(argv)
+
+    if (args.lat and not args.lon) or (args.lon and not args.lat):
+        print("Need both lon and lat arguments!")
+        exit(1)
+
+    myparams = {'fDstL': args.minDistance,  'fDstU': args.maxDistance, 'lat': -35.343135, 'lng': 149.141059}
+    #urlstr = args.vrs_url + "?lat=-35.343135&trFmt=fs&trFmt=fa&lng=149.141059&fDstL=0&fDstU=100"
+
+    urlstr = args.vrs_url
+
+    response = requests.get(urlstr, params=myparams)
+    data = json.loads(response.text)
+    cur_time = time.time()
+    for i in data['acList']:
+        try:
+            mytime = i['PosTime'] / 1000
+        except KeyError:
+            continue
+        try:
+            hex = i['Icao'].lower()
+        except KeyError:
+            continue
+        try:
+            altitude = i['Alt']
+        except KeyError:
+            continue
+        try:
+            speed = i['Spd']
+        except KeyError:
+            continue
+        try:
+            squawk = i['Sqk']
+        except KeyError:
+            continue
+        if 'Call' in i:
+            flight = i['Call']
+        else:
+            flight = '          '
+        try:
+            track = i['Trak']
+        except KeyError:
+            continue
+        try:
+            lon = i['Long']
+        except KeyError:
+            continue
+        try:
+            lat = i['Lat']
+        except KeyError:
+            continue
+
+        try:
+            isGnd = i['Gnd']
+        except KeyError:
+            continue
+
+        validposition = 1
+        validtrack = 1
+        reporter  = args.reporter
+        try:
+            messages = i['CMsgs']
+        except KeyError:
+            continue
+        if 'Mlat' in i:
+            mlat = i['Mlat']
+        else:
+            mlat = False
+        if 'Vsi' in i:
+            vert_rate = i['Vsi']
+        else:
+            vert_rate = 0.0
+        isMetric = False
+        seen = seen_pos = (cur_time - mytime)
         if args.debug:
-            print(i)
+            print ("cur_time:", cur_time, " mytime:", mytime, " seen:", seen)
+
+
+        if seen < args.boredom_threshold:
+            planerep = pr.PlaneReport(hex=hex, time=mytime, speed=speed, squawk=squawk, flight=flight, altitude=altitude,
+                                      track=track, lon=lon, lat=lat, vert_rate=vert_rate, seen=seen,
+                                      validposition=validposition, validtrack=validtrack, reporter=reporter,
+                                      report_location=None, messages=messages, seen_pos=seen_pos, category=None)
+            print(planerep.to_JSON())
+            if args.debug:
+                print(i)
+
+    #print(data)
+
 
-#print(data)
+if __name__ == "__main__":
+    pp.runMain(main)